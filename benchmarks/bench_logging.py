@@ -0,0 +1,136 @@
+"""
+Measures the logging overhead paid by worker threads per job.
+
+"before" replays the log calls one job used to make (eager f-strings with the full job
+dict, message body and usage block) through the previous synchronous FileHandler +
+StreamHandler setup. "after" makes the current lazy, truncated calls through the
+queue-based pipeline. Both are measured from 1 and from N threads, since the synchronous
+handlers serialize every worker on their locks.
+
+Usage:
+    python benchmarks/bench_logging.py [--jobs 2000] [--threads 8]
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from trading_view_extension.monitoring.log_pipeline import configure_logging, stop_logging, truncate
+
+JOB = {
+    "job_id": "3f1c2a9e",
+    "email_id": "user@example.com",
+    "agent": "default",
+    "asset": "AAPL",
+    "user_instructions": "Focus on the daily chart. " * 20,
+    "s3_urls": [f"https://bucket.s3.amazonaws.com/charts/{i}.png" for i in range(4)],
+    "response": "Markdown analysis of the chart setup. " * 150,
+    "result": {"asset": "AAPL", "action": "BUY", "entry_price": 150.0, "stop_loss": 145.0,
+               "take_profit": 165.0, "confidence": 8, "R2R": 3.0},
+}
+USAGE = {"prompt_tokens": 4123, "completion_tokens": 812, "total_tokens": 4935}
+
+
+def job_logs_before(logger):
+    message_body = json.dumps(JOB, default=str)
+    logger.info(f"🚀 Processing message {JOB['job_id']}")
+    logger.info(f"Processing job: {JOB}")
+    logger.info(f"model Price: 0.0245  Credits: 25 Usage: {USAGE}")
+    logger.info(f"openai/o3-mini Price: 0.0012  Credits: 1 Usage: {USAGE}")
+    logger.info(f"Message body: {message_body}")
+    logger.info(f"Message sent to SQS (processed) with MessageId: {JOB['job_id']}")
+    logger.info(f"handle_job() completed successfully for {JOB['job_id']}, result: {JOB}")
+
+
+def job_logs_after(logger):
+    message_body = json.dumps(JOB, default=str)
+    logger.info("🚀 Processing message %s", JOB["job_id"])
+    logger.info("Processing job %s: %s", JOB["job_id"], truncate(JOB))
+    logger.info("%s Price: %s  Credits: %s Usage: %s", "model", 0.0245, 25, USAGE)
+    logger.info("%s Price: %s  Credits: %s Usage: %s", "openai/o3-mini", 0.0012, 1, USAGE)
+    logger.info("Message body: %s", truncate(message_body))
+    logger.info("Message sent to SQS (%s) with MessageId: %s", "processed", JOB["job_id"])
+    logger.info("handle_job() completed successfully for %s, result: %s", JOB["job_id"], truncate(JOB))
+
+
+def _setup_sync(log_file):
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    stream = logging.StreamHandler(sys.stderr)
+    file_handler = logging.FileHandler(log_file)
+    for handler in (stream, file_handler):
+        handler.setFormatter(logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s"))
+        root.addHandler(handler)
+    root.setLevel(logging.INFO)
+    return [stream, file_handler]
+
+
+def _run(job_logs, jobs: int, threads: int) -> dict:
+    logger = logging.getLogger("bench")
+    per_thread = jobs // threads
+    cpu_seconds = []
+
+    def worker():
+        started = time.thread_time()
+        for _ in range(per_thread):
+            job_logs(logger)
+        cpu_seconds.append(time.thread_time() - started)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    total_jobs = per_thread * threads
+    return {
+        # CPU the worker threads themselves spent in log calls (what a job pays).
+        "worker_cpu_us_per_job": round(sum(cpu_seconds) * 1e6 / total_jobs, 1),
+        # Wall time until the workers were done, including waiting on handler locks.
+        "wall_us_per_job": round((time.perf_counter() - started) * 1e6 / total_jobs, 1),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--jobs", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args(argv)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        log_file = os.path.join(directory, "bench.log")
+
+        # Console output goes to /dev/null so both setups pay a real write per record
+        # without flooding the terminal.
+        sys.stderr, stderr = open(os.devnull, "w"), sys.stderr
+        try:
+            handlers = _setup_sync(log_file)
+            for threads in (1, args.threads):
+                results[f"before_{threads}_threads"] = _run(job_logs_before, args.jobs, threads)
+            for handler in handlers:
+                handler.close()
+            logging.getLogger().handlers.clear()
+
+            configure_logging(level="INFO", fmt="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+                              log_file=log_file, queue_size=1_000_000)
+            for threads in (1, args.threads):
+                results[f"after_{threads}_threads"] = _run(job_logs_after, args.jobs, threads)
+            stop_logging()
+        finally:
+            sys.stderr.close()
+            sys.stderr = stderr
+
+    print(json.dumps(results, indent=2))
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Local stand-in for the OpenRouter chat completions endpoint.
+
+Answers POST /api/v1/chat/completions after a latency drawn from a configurable
+distribution, fails a configurable fraction of requests with HTTP 500/429, and returns
+markdown analysis for the main model or a TradeSignal JSON for the extraction model.
+Runs as its own process so its CPU does not count against the worker being measured;
+the port it listens on is printed as the first line on stdout.
+
+Latency specs (milliseconds):
+    fixed:800               always 800
+    uniform:300:1500        uniform between 300 and 1500
+    lognormal:800:0.5       log-normal with median 800 and shape sigma 0.5 (long right tail)
+
+Usage:
+    python benchmarks/e2e/fake_openrouter.py --latency lognormal:800:0.5 --error-rate 0.01
+"""
+import argparse
+import json
+import math
+import random
+import sys
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+EXTRACTION_MODEL = "openai/o3-mini"
+ACTIONS = ("BUY", "SELL", "WAIT")
+
+
+def parse_latency(spec: str):
+    """Return a function that draws one latency in seconds from a latency spec."""
+    kind, *params = spec.split(":")
+    values = [float(param) for param in params]
+    if kind == "fixed" and len(values) == 1:
+        return lambda: values[0] / 1000
+    if kind == "uniform" and len(values) == 2:
+        return lambda: random.uniform(values[0], values[1]) / 1000
+    if kind == "lognormal" and len(values) == 2:
+        mu = math.log(values[0])
+        return lambda: random.lognormvariate(mu, values[1]) / 1000
+    raise ValueError(f"Invalid latency spec: {spec}")
+
+
+def _trade_signal(asset: str) -> str:
+    entry = round(random.uniform(10, 500), 2)
+    return json.dumps({
+        "asset": asset,
+        "action": random.choice(ACTIONS),
+        "entry_price": entry,
+        "stop_loss": round(entry * 0.97, 2),
+        "take_profit": round(entry * 1.09, 2),
+        "confidence": random.randint(1, 10),
+        "R2R": 3.0,
+    })
+
+
+def make_handler(args):
+    draw_latency = parse_latency(args.latency)
+    draw_extraction_latency = parse_latency(args.extraction_latency)
+    analysis = ("The chart shows a higher low above the 50-day moving average with rising volume. " *
+                (args.response_chars // 84 + 1))[:args.response_chars]
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, like the real endpoint behind the pooled session
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            request = json.loads(body or b"{}")
+            model = request.get("model")
+            extraction = model == EXTRACTION_MODEL
+            time.sleep(draw_extraction_latency() if extraction else draw_latency())
+
+            if random.random() < args.error_rate:
+                status = random.choice((500, 429))
+                self._reply(status, {"error": {"code": status, "message": "injected failure"}})
+                return
+
+            content = _trade_signal("FAKE") if extraction else analysis
+            self._reply(200, {
+                "id": f"gen-{random.getrandbits(48):012x}",
+                "model": model,
+                "choices": [{"message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": {
+                    "prompt_tokens": len(body) // 4,
+                    "completion_tokens": len(content) // 4,
+                    "total_tokens": (len(body) + len(content)) // 4,
+                },
+            })
+
+        def _reply(self, status: int, payload: dict):
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--latency", default="lognormal:800:0.5", help="Latency of the analysis model")
+    parser.add_argument("--extraction-latency", default="lognormal:300:0.3", help="Latency of the extraction model")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--response-chars", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args(argv)
+    random.seed(args.seed)
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(args))
+    server.daemon_threads = True
+    print(server.server_address[1], flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,155 @@
+"""
+In-process stand-in for the supabase-py client (PostgREST query builder over Postgres).
+
+Supports the subset of the builder the worker uses: table(), select(), insert(), update(),
+upsert(on_conflict, ignore_duplicates), delete(), eq(), in_(), order(), limit(), range() and
+execute(). Rows go through a JSON round trip in both directions, like they would over
+HTTP, and every execute() can pay a simulated round-trip latency.
+"""
+import json
+import threading
+import time
+from dataclasses import dataclass
+
+
+@dataclass
+class APIResponse:
+    data: list
+    count: int = None
+
+
+def _roundtrip(value):
+    return json.loads(json.dumps(value, default=str))
+
+
+class _Query:
+    def __init__(self, client, table: str):
+        self._client = client
+        self._table = table
+        self._operation = "select"
+        self._columns = None
+        self._payload = None
+        self._on_conflict = None
+        self._ignore_duplicates = False
+        self._filters = []
+        self._order = None
+        self._limit = None
+        self._offset = 0
+
+    def select(self, *columns):
+        self._operation = "select"
+        self._columns = [column for column in columns if column != "*"] or None
+        return self
+
+    def insert(self, rows):
+        self._operation = "insert"
+        self._payload = rows if isinstance(rows, list) else [rows]
+        return self
+
+    def upsert(self, rows, on_conflict: str = "id", ignore_duplicates: bool = False, **kwargs):
+        self._operation = "upsert"
+        self._payload = rows if isinstance(rows, list) else [rows]
+        self._on_conflict = on_conflict
+        self._ignore_duplicates = ignore_duplicates
+        return self
+
+    def update(self, values: dict):
+        self._operation = "update"
+        self._payload = values
+        return self
+
+    def delete(self):
+        self._operation = "delete"
+        return self
+
+    def eq(self, column, value):
+        self._filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def in_(self, column, values):
+        values = set(values)
+        self._filters.append(lambda row: row.get(column) in values)
+        return self
+
+    def order(self, column, desc: bool = False):
+        self._order = (column, desc)
+        return self
+
+    def limit(self, count: int):
+        self._limit = count
+        return self
+
+    def range(self, start: int, end: int):
+        self._offset = start
+        self._limit = end - start + 1
+        return self
+
+    def _matches(self, row) -> bool:
+        return all(condition(row) for condition in self._filters)
+
+    def execute(self) -> APIResponse:
+        self._client.simulate_round_trip()
+        payload = _roundtrip(self._payload) if self._payload is not None else None
+        with self._client.lock:
+            rows = self._client.tables.setdefault(self._table, [])
+            result = getattr(self, f"_execute_{self._operation}")(rows, payload)
+        return APIResponse(data=_roundtrip(result))
+
+    def _execute_select(self, rows, payload):
+        selected = [row for row in rows if self._matches(row)]
+        if self._order:
+            column, desc = self._order
+            selected.sort(key=lambda row: (row.get(column) is None, row.get(column)), reverse=desc)
+        selected = selected[self._offset:]
+        if self._limit is not None:
+            selected = selected[:self._limit]
+        if self._columns:
+            selected = [{column: row.get(column) for column in self._columns} for row in selected]
+        return selected
+
+    def _execute_insert(self, rows, payload):
+        rows.extend(payload)
+        return payload
+
+    def _execute_upsert(self, rows, payload):
+        index = {row.get(self._on_conflict): row for row in rows}
+        written = []
+        for new_row in payload:
+            existing = index.get(new_row.get(self._on_conflict))
+            if existing is None:
+                rows.append(new_row)
+                index[new_row.get(self._on_conflict)] = new_row
+                written.append(new_row)
+            elif not self._ignore_duplicates:
+                existing.update(new_row)
+                written.append(existing)
+        return written
+
+    def _execute_update(self, rows, payload):
+        updated = [row for row in rows if self._matches(row)]
+        for row in updated:
+            row.update(payload)
+        return updated
+
+    def _execute_delete(self, rows, payload):
+        deleted = [row for row in rows if self._matches(row)]
+        rows[:] = [row for row in rows if not self._matches(row)]
+        return deleted
+
+
+class FakeSupabase:
+    """Tables are lists of dicts in memory; `latency_ms` is added to every request."""
+
+    def __init__(self, latency_ms: float = 0.0):
+        self.latency_ms = latency_ms
+        self.tables = {}
+        self.lock = threading.Lock()
+        self.requests = 0
+
+    def table(self, name: str) -> _Query:
+        return _Query(self, name)
+
+    def simulate_round_trip(self):
+        self.requests += 1
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
@@ -0,0 +1,480 @@
+"""
+End-to-end throughput benchmark of the worker.
+
+Drives the real main.py wiring (SQSQueuePublisher -> SqsQueueConsumer -> AiOrchestrator ->
+analyze -> OpenRouter/Supabase -> SQSQueuePublisher) against local stand-ins:
+
+    SQS         trading_view_extension.queue.in_memory_queue.InMemoryFifoSqsClient
+    OpenRouter  benchmarks/e2e/fake_openrouter.py, in a separate process, or a recorded
+                cassette (--cassette, see services/openrouter_cassette.py)
+    Supabase    benchmarks/e2e/fake_supabase.FakeSupabase, with a simulated round trip
+
+A load generator puts new-analysis jobs (and optional watchlist batches) on the input
+queue at the profile's arrival rate; a collector reads the output queue and, per
+conversation, sends chat follow-ups after each answer plus a think time. Latency is
+measured from enqueue to the COMPLETED message appearing on the output queue.
+
+Each run appends one JSON record (git commit, profile, throughput, latency percentiles,
+CPU and memory per job) to the results file and prints the change against the previous
+run of the same profile. Memory growth includes the rows held by the fake database.
+
+Usage:
+    python benchmarks/e2e/run_benchmark.py --profile smoke
+    python benchmarks/e2e/run_benchmark.py --profile steady --max-regression 0.1
+    python benchmarks/e2e/run_benchmark.py --profile my_profile.json
+    python benchmarks/e2e/run_benchmark.py --profile steady --cassette recorded.jsonl --cassette-speed 1
+    python benchmarks/e2e/run_benchmark.py --trace jobs.jsonl --trace-speed 10
+
+--trace replays a captured job trace (trading_view_extension/queue/job_trace.py) instead
+of generated jobs; the profile then only sets the dependency latencies.
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent.parent
+sys.path.append(str(ROOT))
+sys.path.append(str(Path(__file__).resolve().parent))
+from trading_view_extension.queue.job_trace import TraceReplayer, read_trace
+
+INPUT_QUEUE_URL = "inmemory://alpha-agents-input.fifo"
+OUTPUT_QUEUE_URL = "inmemory://alpha-agents-output.fifo"
+DEFAULT_RESULTS_FILE = ROOT / "benchmarks" / "results" / "e2e.jsonl"
+
+PROFILES = {
+    # Seconds-long sanity run with near-zero dependency latency: measures the worker's own overhead.
+    "smoke": {
+        "conversations": 20, "arrival_rate": 20.0, "followups": 0, "think_time_ms": 0,
+        "batches": 0, "batch_size": 0, "images": 2, "users": 5,
+        "openrouter_latency": "fixed:20", "extraction_latency": "fixed:10", "openrouter_error_rate": 0.0,
+        "supabase_latency_ms": 1.0, "timeout_s": 60,
+    },
+    # Production-like steady traffic: one chat follow-up per conversation.
+    "steady": {
+        "conversations": 120, "arrival_rate": 3.0, "followups": 1, "think_time_ms": 2000,
+        "batches": 0, "batch_size": 0, "images": 2, "users": 40,
+        "openrouter_latency": "lognormal:800:0.5", "extraction_latency": "lognormal:300:0.3",
+        "openrouter_error_rate": 0.0, "supabase_latency_ms": 15.0, "timeout_s": 300,
+    },
+    # Everything arrives at once: queueing behaviour and tail latency.
+    "burst": {
+        "conversations": 150, "arrival_rate": 0.0, "followups": 0, "think_time_ms": 0,
+        "batches": 0, "batch_size": 0, "images": 2, "users": 150,
+        "openrouter_latency": "lognormal:800:0.5", "extraction_latency": "lognormal:300:0.3",
+        "openrouter_error_rate": 0.0, "supabase_latency_ms": 15.0, "timeout_s": 300,
+    },
+    # Steady traffic with a failing upstream: retries and backoff.
+    "flaky": {
+        "conversations": 60, "arrival_rate": 2.0, "followups": 0, "think_time_ms": 0,
+        "batches": 0, "batch_size": 0, "images": 2, "users": 20,
+        "openrouter_latency": "lognormal:800:0.5", "extraction_latency": "lognormal:300:0.3",
+        "openrouter_error_rate": 0.05, "supabase_latency_ms": 15.0, "timeout_s": 300,
+    },
+    # Watchlist scans alongside regular jobs.
+    "batch": {
+        "conversations": 30, "arrival_rate": 2.0, "followups": 0, "think_time_ms": 0,
+        "batches": 4, "batch_size": 25, "images": 1, "users": 10,
+        "openrouter_latency": "lognormal:800:0.5", "extraction_latency": "lognormal:300:0.3",
+        "openrouter_error_rate": 0.0, "supabase_latency_ms": 15.0, "timeout_s": 300,
+    },
+}
+
+
+def load_profile(name: str) -> tuple[str, dict]:
+    """A built-in profile name, or a JSON file whose keys override the smoke profile."""
+    if name in PROFILES:
+        return name, dict(PROFILES[name])
+    path = Path(name)
+    if not path.exists():
+        raise SystemExit(f"Unknown profile {name!r}; built-in profiles: {', '.join(PROFILES)}")
+    profile = dict(PROFILES["smoke"])
+    profile.update(json.loads(path.read_text()))
+    return path.stem, profile
+
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, round(fraction * len(sorted_values) + 0.5) - 1))
+    return sorted_values[rank]
+
+
+def _rss_kb() -> int:
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _git_commit() -> tuple[str, bool]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT,
+                                    capture_output=True, text=True).stdout.strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, False
+
+
+def start_fake_openrouter(profile: dict, seed: int):
+    process = subprocess.Popen(
+        [sys.executable, str(Path(__file__).resolve().parent / "fake_openrouter.py"),
+         "--latency", profile["openrouter_latency"],
+         "--extraction-latency", profile["extraction_latency"],
+         "--error-rate", str(profile["openrouter_error_rate"]),
+         "--seed", str(seed)],
+        stdout=subprocess.PIPE, text=True,
+    )
+    port = int(process.stdout.readline())
+    return process, f"http://127.0.0.1:{port}/api/v1/chat/completions"
+
+
+def configure_environment(endpoint: str, log_level: str, log_file: str):
+    """Point the worker's settings at the stand-ins; must run before the worker modules are imported."""
+    os.environ.update({
+        "OPENROUTER_ENDPOINT": endpoint,
+        "OPENROUTER_API_KEY": "bench",
+        "SQS_INPUT_QUEUE_URL": INPUT_QUEUE_URL,
+        "SQS_OUTPUT_QUEUE_URL": OUTPUT_QUEUE_URL,
+        "LOG_LEVEL": log_level,
+        "LOG_FILE": log_file,
+        "TRACE_SAMPLE_RATE": os.environ.get("TRACE_SAMPLE_RATE", "0"),
+        "IDEMPOTENCY_BACKEND": "local",
+    })
+    os.environ.setdefault("MODEL_NAME", "anthropic/claude-3.7-sonnet")
+    os.environ.setdefault("AWS_REGION", "us-east-1")
+    # create_client() validates the URL and key format; nothing is ever sent to them.
+    os.environ.setdefault("SUPABASE_URL", "https://bench.supabase.co")
+    os.environ.setdefault("SUPABASE_KEY", "eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoiYW5vbiJ9.bench")
+
+
+class LoadDriver:
+    """Feeds jobs into the input queue and tracks their completion on the output queue."""
+
+    def __init__(self, sqs_client, profile: dict, seed: int, database=None, trace: list = None,
+                 trace_speed: float = 1.0):
+        self.sqs = sqs_client
+        self.database = database
+        self.profile = profile
+        self.random = random.Random(seed)
+        self.sent_at = {}        # idempotency key -> enqueue time
+        self.latencies = {}      # idempotency key -> seconds until COMPLETED
+        self.errors = set()
+        self.partials = 0
+        self.followups_left = {}
+        self.expected = profile["conversations"] * (1 + profile["followups"]) + profile["batches"]
+        self.replayer = None
+        if trace is not None:
+            self.expected = len(trace)
+            self.replayer = TraceReplayer(trace, self._send, speed=trace_speed, wait_for_completion=True,
+                                          image_url="https://bench.local/charts/{n}.png",
+                                          seed_conversation=self._seed_conversation)
+        self.done = threading.Event()
+        self.lock = threading.Lock()
+        self.timers = []
+
+    def _job(self, conversation: int) -> dict:
+        return {
+            "job_id": str(uuid.uuid4()),
+            "email_id": f"user{conversation % self.profile['users']}@bench.local",
+            "agent": "default",
+            "asset": self.random.choice(("AAPL", "MSFT", "NVDA", "TSLA", "SPY")),
+            "user_instructions": "Focus on the daily chart.",
+            "s3_urls": [f"https://bench.local/charts/{uuid.uuid4().hex}.png" for _ in range(self.profile["images"])],
+            "is_chat": False,
+        }
+
+    def _batch_job(self, batch: int) -> dict:
+        job = self._job(batch)
+        job["job_type"] = "batch_scan"
+        job["items"] = [
+            {"asset": f"SYM{index}", "s3_urls": [f"https://bench.local/charts/{uuid.uuid4().hex}.png"]}
+            for index in range(self.profile["batch_size"])
+        ]
+        return job
+
+    def _send(self, job: dict, group: str = "analysis_tasks"):
+        key = f"{job['job_id']}:{job.get('message_id') or '-'}"
+        with self.lock:
+            self.sent_at[key] = time.time()
+        self.sqs.send_message(QueueUrl=INPUT_QUEUE_URL, MessageBody=json.dumps(job),
+                              MessageGroupId=group, MessageDeduplicationId=key)
+
+    def _seed_conversation(self, job_id: str, entry: dict):
+        """Create the conversation a traced chat continues, with its recorded history length."""
+        roles = ("user", "assistant")
+        history = [{"message_id": uuid.uuid4().hex, "role": roles[index % 2],
+                    "content": [{"type": "text", "text": "Earlier turn of the conversation."}], "show_query": True}
+                   for index in range(entry.get("history") or 2)]
+        with self.database.lock:
+            self.database.tables.setdefault("conversations", []).append({
+                "job_id": job_id, "conversation_history": history,
+                "user_email": f"{entry.get('user') or 'anonymous'}@replay.local", "symbol": entry.get("asset"),
+                "agent": entry.get("agent"),
+            })
+
+    def generate(self):
+        if self.replayer is not None:
+            self.replayer.run()
+            return
+        arrivals = [("conversation", index) for index in range(self.profile["conversations"])]
+        arrivals += [("batch", index) for index in range(self.profile["batches"])]
+        self.random.shuffle(arrivals)
+        for kind, index in arrivals:
+            if self.done.is_set():
+                return
+            job = self._batch_job(index) if kind == "batch" else self._job(index)
+            self.followups_left[job["job_id"]] = self.profile["followups"] if kind == "conversation" else 0
+            self._send(job)
+            if self.profile["arrival_rate"] > 0:
+                time.sleep(self.random.expovariate(self.profile["arrival_rate"]))
+
+    def _follow_up(self, job: dict):
+        chat = {key: job[key] for key in ("job_id", "email_id", "agent", "asset")}
+        chat.update(is_chat=True, message_id=str(uuid.uuid4()), s3_urls=[],
+                    agent_query="Has the setup changed? Where would you move the stop?")
+        self._send(chat)
+
+    def collect(self):
+        while not self.done.is_set():
+            response = self.sqs.receive_message(QueueUrl=OUTPUT_QUEUE_URL, MaxNumberOfMessages=10,
+                                                VisibilityTimeout=30, WaitTimeSeconds=1)
+            for message in response.get("Messages", []):
+                self.sqs.delete_message(QueueUrl=OUTPUT_QUEUE_URL, ReceiptHandle=message["ReceiptHandle"])
+                self._on_output(json.loads(message["Body"]))
+
+    def _on_output(self, job: dict):
+        if job.get("status") == "PARTIAL":
+            self.partials += 1
+            return
+        # REJECTED (credits) and FAILED (open circuit) are final answers too, counted as errors.
+        if job.get("status") not in ("COMPLETED", "REJECTED", "FAILED") or job.get("batch_id"):
+            return
+        key = job.get("idempotency_key")
+        with self.lock:
+            if key not in self.sent_at or key in self.latencies:
+                return
+            self.latencies[key] = time.time() - self.sent_at[key]
+            if job.get("message_id") == "error" or job.get("status") != "COMPLETED":
+                self.errors.add(key)
+            finished = len(self.latencies) >= self.expected
+        if self.replayer is not None:
+            self.replayer.completed(job["job_id"])
+
+        if self.followups_left.get(job["job_id"], 0) > 0 and job.get("message_id") != "error":
+            self.followups_left[job["job_id"]] -= 1
+            timer = threading.Timer(self.profile["think_time_ms"] / 1000, self._follow_up, args=(job,))
+            timer.daemon = True
+            self.timers.append(timer)
+            timer.start()
+        if finished:
+            self.done.set()
+
+
+def use_cassette_environment(path: Path, speed: float):
+    # Generated jobs never match recorded prompts exactly, so responses are matched by model.
+    os.environ.update({
+        "OPENROUTER_CASSETTE_MODE": "replay",
+        "OPENROUTER_CASSETTE_PATH": str(path),
+        "OPENROUTER_CASSETTE_REPLAY_SPEED": str(speed),
+        "OPENROUTER_CASSETTE_MATCH": "model",
+    })
+
+
+def run(profile_name: str, profile: dict, seed: int, log_level: str, cassette: Path = None,
+        cassette_speed: float = 1.0, trace: Path = None, trace_speed: float = 1.0) -> dict:
+    if cassette is not None:
+        fake_openrouter, endpoint = None, "http://127.0.0.1:9/unused"
+        use_cassette_environment(cassette, cassette_speed)
+    else:
+        fake_openrouter, endpoint = start_fake_openrouter(profile, seed)
+    log_file = os.path.join(os.environ.get("TMPDIR", "/tmp"), f"bench-e2e-{os.getpid()}.log")
+    configure_environment(endpoint, log_level, log_file)
+
+    import config
+    from fake_supabase import FakeSupabase
+    from trading_view_extension.database import db_utilities
+    from trading_view_extension.queue import sqs_queue_consumer
+    from trading_view_extension.queue.in_memory_queue import InMemoryFifoSqsClient
+    from trading_view_extension.queue.sqs_queue_consumer import SqsQueueConsumer
+    from trading_view_extension.queue.sqs_queue_publisher import SQSQueuePublisher
+
+    sqs = InMemoryFifoSqsClient()
+    config.input_tasks_queue.client = config.output_tasks_queue.client = sqs
+    sqs_queue_consumer.sqs_client = sqs
+    database = FakeSupabase(latency_ms=profile["supabase_latency_ms"])
+    database.tables["users"] = [
+        {"email_id": f"user{index}@bench.local", "monthly_credits": 10 ** 9, "extra_credits": 0}
+        for index in range(profile["users"])
+    ]
+    entries = None
+    if trace is not None:
+        entries = read_trace(trace)
+        database.tables["users"] += [
+            {"email_id": f"{user}@replay.local", "monthly_credits": 10 ** 9, "extra_credits": 0}
+            for user in {entry.get("user") or "anonymous" for entry in entries}
+        ]
+    db_utilities.supabase = database
+
+    driver = LoadDriver(sqs, profile, seed, database, entries, trace_speed)
+    collector = threading.Thread(target=driver.collect, name="bench-collector", daemon=True)
+    generator = threading.Thread(target=driver.generate, name="bench-generator", daemon=True)
+
+    # Same wiring as main.main(), minus the metrics server.
+    publisher = SQSQueuePublisher()
+    consumer = SqsQueueConsumer(publisher)
+
+    rss_before = _rss_kb()
+    cpu_before = time.process_time()
+    started = time.time()
+    # deduct_user_credits prints one line per job.
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        consumer.start_polling(INPUT_QUEUE_URL)
+        collector.start()
+        generator.start()
+        completed = driver.done.wait(profile["timeout_s"])
+        elapsed = time.time() - started
+        cpu_seconds = time.process_time() - cpu_before
+        rss_after = _rss_kb()
+        driver.done.set()
+        if driver.replayer is not None:
+            driver.replayer.stop()
+        for timer in driver.timers:
+            timer.cancel()
+        consumer.stop_polling()
+    if fake_openrouter is not None:
+        fake_openrouter.terminate()
+        fake_openrouter.wait()
+    with contextlib.suppress(OSError):
+        os.remove(log_file)
+
+    latencies = sorted(driver.latencies.values())
+    finished = len(latencies)
+    commit, dirty = _git_commit()
+    return {
+        "benchmark": "e2e",
+        "profile": profile_name,
+        "profile_config": profile,
+        "git_commit": commit,
+        "git_dirty": dirty,
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "seed": seed,
+        "cassette": str(cassette) if cassette is not None else None,
+        "trace": str(trace) if trace is not None else None,
+        "trace_speed": trace_speed if trace is not None else None,
+        "timed_out": not completed,
+        "jobs_expected": driver.expected,
+        "jobs_completed": finished,
+        "jobs_failed": len(driver.errors),
+        "partial_results": driver.partials,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_jobs_per_s": round(finished / elapsed, 3) if elapsed else None,
+        "latency_ms": {
+            "p50": _ms(percentile(latencies, 0.50)),
+            "p95": _ms(percentile(latencies, 0.95)),
+            "p99": _ms(percentile(latencies, 0.99)),
+            "max": _ms(latencies[-1] if latencies else None),
+            "mean": _ms(sum(latencies) / finished if finished else None),
+        },
+        "cpu_ms_per_job": round(cpu_seconds * 1000 / finished, 2) if finished else None,
+        "rss_growth_kb_per_job": round((rss_after - rss_before) / finished, 1) if finished else None,
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "supabase_requests_per_job": round(database.requests / finished, 2) if finished else None,
+    }
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 1) if seconds is not None else None
+
+
+def previous_result(results_file: Path, profile_name: str):
+    if not results_file.exists():
+        return None
+    previous = None
+    for line in results_file.read_text().splitlines():
+        if line.strip():
+            record = json.loads(line)
+            if record.get("profile") == profile_name:
+                previous = record
+    return previous
+
+
+def regressions(previous: dict, current: dict, tolerance: float) -> list[str]:
+    """Throughput drops or p95/p99/CPU increases beyond tolerance (a fraction) against previous."""
+    found = []
+    checks = [
+        ("throughput_jobs_per_s", previous.get("throughput_jobs_per_s"), current.get("throughput_jobs_per_s"), -1),
+        ("latency_ms.p95", previous["latency_ms"].get("p95"), current["latency_ms"].get("p95"), 1),
+        ("latency_ms.p99", previous["latency_ms"].get("p99"), current["latency_ms"].get("p99"), 1),
+        ("cpu_ms_per_job", previous.get("cpu_ms_per_job"), current.get("cpu_ms_per_job"), 1),
+    ]
+    for name, before, after, direction in checks:
+        if not before or after is None:
+            continue
+        change = (after - before) / before
+        print(f"  {name}: {before} -> {after} ({change:+.1%})", file=sys.stderr)
+        if change * direction > tolerance:
+            found.append(name)
+    return found
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--profile", default="smoke", help=f"One of {', '.join(PROFILES)} or a JSON file")
+    parser.add_argument("--output", type=Path, default=DEFAULT_RESULTS_FILE, help="JSON lines file to append to")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--cassette", type=Path, default=None,
+                        help="Serve OpenRouter responses from this recorded cassette instead of the fake server")
+    parser.add_argument("--cassette-speed", type=float, default=1.0,
+                        help="1 reproduces the recorded timings, 0 answers immediately")
+    parser.add_argument("--max-regression", type=float, default=None,
+                        help="Exit 1 when a key metric is worse than the previous run by more than this fraction")
+    parser.add_argument("--trace", type=Path, default=None, help="Replay this captured job trace")
+    parser.add_argument("--trace-speed", type=float, default=1.0, help="Replay the trace N times faster")
+    args = parser.parse_args(argv)
+
+    profile_name, profile = load_profile(args.profile)
+    if args.trace is not None:
+        profile_name = f"trace-{args.trace.stem}-{args.trace_speed:g}x"
+    result = run(profile_name, profile, args.seed, args.log_level, args.cassette, args.cassette_speed,
+                 args.trace, args.trace_speed)
+    print(json.dumps(result, indent=2))
+
+    previous = previous_result(args.output, profile_name)
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    with open(args.output, "a", encoding="utf-8") as results_file:
+        results_file.write(json.dumps(result) + "\n")
+
+    if result["timed_out"]:
+        print(f"Timed out: {result['jobs_completed']}/{result['jobs_expected']} jobs completed", file=sys.stderr)
+        return 1
+    if previous is not None:
+        print(f"Compared with {previous.get('git_commit', '?')[:10]} ({previous.get('timestamp')}):", file=sys.stderr)
+        worse = regressions(previous, result, args.max_regression if args.max_regression is not None else 0.1)
+        if worse and args.max_regression is not None:
+            print(f"Regression in: {', '.join(worse)}", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
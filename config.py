@@ -1,10 +1,11 @@
 import os
 import logging
 from dotenv import load_dotenv
-import boto3
 from dataclasses import dataclass
 from pathlib import Path
-from botocore.config import Config
+from typing import Any
+from trading_view_extension.monitoring.log_pipeline import configure_logging
+from trading_view_extension.services.client_registry import registry
 
 # Load environment variables from the .env file
 load_dotenv()
@@ -13,6 +14,10 @@ load_dotenv()
 # General Configuration
 # --------------------------
 PORT = int(os.getenv("PORT", 8000))
+# /admin endpoints (tracing, profiling, runtime config) have a listener of their own, see metrics_server.py
+ADMIN_HOST = os.getenv("ADMIN_HOST", "127.0.0.1")  # Anything but loopback requires ADMIN_TOKEN
+ADMIN_PORT = int(os.getenv("ADMIN_PORT", 8090))
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")  # When set, admin requests need "Authorization: Bearer <token>"
 DATABASE_URL = os.getenv("DATABASE_URL")
 
 # --------------------------
@@ -21,23 +26,39 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
 LOG_FORMAT = os.getenv("LOG_FORMAT", "%(asctime)s - %(name)s - %(levelname)s - %(message)s")
 LOG_FILE = os.getenv("LOG_FILE", "trading_view_extension.log")
-
-# Configure logging for the application
-logging.basicConfig(
+LOG_JSON = os.getenv("LOG_JSON", "false").lower() == "true"      # One JSON object per line
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", 50 * 1024 * 1024))  # Rotate the log file at this size
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", 5))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))           # Records beyond this are dropped, never block
+LOG_PAYLOAD_LIMIT = int(os.getenv("LOG_PAYLOAD_LIMIT", 1000))      # Max characters of a logged payload
+LOG_SKIP_CALLER_INFO = os.getenv("LOG_SKIP_CALLER_INFO", "false").lower() == "true"  # No file/line/function in records
+
+# Configure logging for the application: records are queued and written (file + console)
+# by a background thread so worker threads never block on log I/O.
+configure_logging(
     level=LOG_LEVEL,
-    format=LOG_FORMAT,
-    handlers=[
-        logging.FileHandler(LOG_FILE),  # Log to file
-        logging.StreamHandler(),        # Log to console
-    ],
+    fmt=LOG_FORMAT,
+    log_file=LOG_FILE,
+    json_output=LOG_JSON,
+    max_bytes=LOG_MAX_BYTES,
+    backup_count=LOG_BACKUP_COUNT,
+    queue_size=LOG_QUEUE_SIZE,
+    payload_limit=LOG_PAYLOAD_LIMIT,
+    skip_caller_info=LOG_SKIP_CALLER_INFO,
 )
 logger = logging.getLogger(__name__)
 
 # --------------------------
-# WebSocket host and port
+# WebSocket push of results (see result_push_server.py)
 # --------------------------
+# Pushed events carry a job's result. Without RESULT_PUSH_TOKEN, anyone who reaches this address and
+# knows a job_id gets them: bind to loopback or keep the port behind the gateway.
 WEBSOCKET_HOST = os.getenv("WEBSOCKET_HOST", "localhost")
-WEBSOCKET_PORT = int(os.getenv("PORT", 8080))
+WEBSOCKET_PORT = int(os.getenv("WEBSOCKET_PORT", 8080))  # PORT is the metrics server's
+RESULT_PUSH_ENABLED = os.getenv("RESULT_PUSH_ENABLED", "false").lower() == "true"  # SQS publishing stays on
+RESULT_PUSH_REPLAY_SECONDS = float(os.getenv("RESULT_PUSH_REPLAY_SECONDS", 120))  # Late subscribers get these events
+RESULT_PUSH_REPLAY_JOBS = int(os.getenv("RESULT_PUSH_REPLAY_JOBS", 5000))  # Jobs whose events are kept for them
+RESULT_PUSH_TOKEN = os.getenv("RESULT_PUSH_TOKEN")  # When set, connections need "Authorization: Bearer <token>"
 
 # --------------------------
 # Directory for uploaded files
@@ -56,20 +77,36 @@ PROJECT_ROOT = Path(__file__).parent / "trading_view_extension"
 
 DEBUG_PORT = "9223"
 
-sqs_client = boto3.client(
-    'sqs',
-    aws_access_key_id=AWS_ACCESS_KEY_ID,
-    aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
-    region_name=AWS_REGION,
-    config=Config(connect_timeout=10, read_timeout=15) 
-)
+WARMUP_TIMEOUT_SECONDS = float(os.getenv("WARMUP_TIMEOUT_SECONDS", 5))  # Startup never waits longer for warm-up
+
+
+def _boto3_client(service: str, **kwargs):
+    # boto3 is imported on first use: it is the largest part of importing this module otherwise.
+    import boto3
+    # A session per client: creating clients from the shared default session is not thread-safe.
+    return boto3.session.Session().client(
+        service,
+        aws_access_key_id=AWS_ACCESS_KEY_ID,
+        aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
+        region_name=AWS_REGION,
+        **kwargs
+    )
+
+
+def _build_sqs_client():
+    from botocore.config import Config
+    return _boto3_client('sqs', config=Config(connect_timeout=10, read_timeout=15))
 
-s3_client = boto3.client(
-    's3',
-    aws_access_key_id=AWS_ACCESS_KEY_ID,
-    aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
-    region_name=AWS_REGION
-)
+
+def _warm_sqs_client(client):
+    queue_url = os.getenv("SQS_INPUT_QUEUE_URL")
+    if queue_url:
+        client.get_queue_attributes(QueueUrl=queue_url, AttributeNames=["ApproximateNumberOfMessages"])
+
+
+# Built on first use (or by registry.warm_up() at startup), see client_registry.py
+sqs_client = registry.lazy("sqs", _build_sqs_client, warm=_warm_sqs_client)
+s3_client = registry.lazy("s3", lambda: _boto3_client('s3'))
 
 # --------------------------
 # Data Classes for AWS SQS Queues
@@ -79,7 +116,7 @@ class SQSQueue:
     name: str
     url: str
     arn: str
-    client: boto3.client
+    client: Any
 
 # Initialize separate SQSQueue objects
 input_tasks_queue = SQSQueue(
@@ -96,6 +133,23 @@ output_tasks_queue = SQSQueue(
     client=sqs_client
 )
 
+# Optional dead-letter queue for quarantined jobs (QUARANTINE_BACKEND=sqs).
+dead_letter_tasks_queue = SQSQueue(
+    name=os.getenv("SQS_DEAD_LETTER_QUEUE_NAME"),
+    url=os.getenv("SQS_DEAD_LETTER_QUEUE_URL"),
+    arn=os.getenv("SQS_DEAD_LETTER_QUEUE_ARN"),
+    client=sqs_client
+)
+
+# Optional standard queue holding jobs deferred while a dependency's circuit is open.
+# Without it such jobs fail fast with status FAILED.
+delay_tasks_queue = SQSQueue(
+    name=os.getenv("SQS_DELAY_QUEUE_NAME"),
+    url=os.getenv("SQS_DELAY_QUEUE_URL"),
+    arn=os.getenv("SQS_DELAY_QUEUE_ARN"),
+    client=sqs_client
+)
+
 # --------------------------
 # AWS S3 Configuration
 # --------------------------
@@ -111,8 +165,87 @@ SMALL_STEP = False
 CONFIDENCE_THRESHOLD = 7
 R2R_THRESHOLD = 2.5
 
+# --------------------------
+# Trade signal quality gate
+# --------------------------
+SIGNAL_GATE_MODE = os.getenv("SIGNAL_GATE_MODE", "flag").lower()  # "flag" marks failing signals, "downgrade" also turns them into WAIT
+
+# --------------------------
+# Job export (analytics/job_export.py)
+# --------------------------
+JOB_EXPORT_SPOOL_DIR = os.getenv("JOB_EXPORT_SPOOL_DIR")  # Where workers spool completed jobs; unset disables recording
+JOB_EXPORT_DIR = os.getenv("JOB_EXPORT_DIR")  # Parquet dataset the worker exports the spool into; unset leaves it to the CLI
+JOB_EXPORT_INTERVAL = float(os.getenv("JOB_EXPORT_INTERVAL", 300))  # Seconds between exports
+
 MAX_TRADES = 150
 
+# --------------------------
+# Watchlist batch scans
+# --------------------------
+BATCH_SCAN_CONCURRENCY = int(os.getenv("BATCH_SCAN_CONCURRENCY", 8))
+
+# --------------------------
+# Worker concurrency (adaptive, AIMD)
+# --------------------------
+WORKER_MIN_CONCURRENCY = int(os.getenv("WORKER_MIN_CONCURRENCY", 1))
+WORKER_MAX_CONCURRENCY = int(os.getenv("WORKER_MAX_CONCURRENCY", 32))
+WORKER_INITIAL_CONCURRENCY = int(os.getenv("WORKER_INITIAL_CONCURRENCY", 5))
+WORKER_LATENCY_TOLERANCE = float(os.getenv("WORKER_LATENCY_TOLERANCE", 2.0))  # x long-term job latency
+
+# --------------------------
+# Assistant image analysis (task_executor.py)
+# --------------------------
+IMAGE_ANALYSIS_CONCURRENCY = int(os.getenv("IMAGE_ANALYSIS_CONCURRENCY", 4))  # Images analyzed at once, all calls
+
+# --------------------------
+# Prefork mode (one SQS poller, jobs run in worker processes)
+# --------------------------
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", 0))  # 0: run jobs in threads of the polling process
+PREFORK_MAX_REDELIVERIES = int(os.getenv("PREFORK_MAX_REDELIVERIES", 1))  # Jobs of a dead process handed to another
+PREFORK_METRICS_PORT = int(os.getenv("PREFORK_METRICS_PORT", PORT + 1))  # Process i serves /metrics on this + i
+
+# --------------------------
+# Sampling profiler (SIGUSR2 or POST /admin/profile)
+# --------------------------
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")  # Where collapsed-stack profiles are written
+PROFILE_DEFAULT_SECONDS = float(os.getenv("PROFILE_DEFAULT_SECONDS", 30))  # Window of a profile started by the signal
+PROFILE_INTERVAL_SECONDS = float(os.getenv("PROFILE_INTERVAL_SECONDS", 0.02))  # Time between samples of all threads (50 Hz)
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", 20))  # Older profiles in PROFILE_DIR are deleted
+
+# --------------------------
+# Runtime tuning (services/runtime_config.py)
+# --------------------------
+RUNTIME_CONFIG_FILE = os.getenv("RUNTIME_CONFIG_FILE")  # JSON file of tuning overrides, watched for changes; unset: not watched
+RUNTIME_CONFIG_POLL_SECONDS = float(os.getenv("RUNTIME_CONFIG_POLL_SECONDS", 2))  # How often the file's mtime is checked
+
+# --------------------------
+# Fair scheduling of received jobs
+# --------------------------
+SCHEDULER_WEIGHTS = os.getenv("SCHEDULER_WEIGHTS", "chat=4,analysis=2,batch=1")  # Share per job class
+SCHEDULER_AGING_SECONDS = float(os.getenv("SCHEDULER_AGING_SECONDS", 30))  # Waited longer: served first
+SCHEDULER_PREFETCH = int(os.getenv("SCHEDULER_PREFETCH", 20))  # Messages held locally (keep << visibility timeout)
+EMPTY_RECEIVE_BACKOFF_SECONDS = float(os.getenv("EMPTY_RECEIVE_BACKOFF_SECONDS", 0.5))  # Min time between empty receives
+
+# --------------------------
+# Credit admission (1 credit = $0.001 of model usage)
+# --------------------------
+CREDIT_ADMISSION_ENABLED = os.getenv("CREDIT_ADMISSION_ENABLED", "true").lower() == "true"
+CREDIT_BALANCE_TTL_SECONDS = float(os.getenv("CREDIT_BALANCE_TTL_SECONDS", 60))  # Older: refreshed in the background
+CREDIT_BASE_COST = int(os.getenv("CREDIT_BASE_COST", 10))  # Prompt + trade signal extraction
+CREDIT_COST_PER_IMAGE = int(os.getenv("CREDIT_COST_PER_IMAGE", 5))
+CREDIT_COST_PER_1K_HISTORY_TOKENS = float(os.getenv("CREDIT_COST_PER_1K_HISTORY_TOKENS", 3))
+CREDIT_DEFAULT_HISTORY_TOKENS = int(os.getenv("CREDIT_DEFAULT_HISTORY_TOKENS", 4000))  # Chat whose history size is unknown
+
+# --------------------------
+# Circuit breakers (OpenRouter per model, Supabase)
+# --------------------------
+CIRCUIT_WINDOW = int(os.getenv("CIRCUIT_WINDOW", 20))  # Recent calls considered
+CIRCUIT_MIN_CALLS = int(os.getenv("CIRCUIT_MIN_CALLS", 5))  # Fewer calls in the window never open the circuit
+CIRCUIT_FAILURE_RATE = float(os.getenv("CIRCUIT_FAILURE_RATE", 0.5))
+CIRCUIT_RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", 30))  # Open this long before probing
+CIRCUIT_HALF_OPEN_CALLS = int(os.getenv("CIRCUIT_HALF_OPEN_CALLS", 1))  # Concurrent probes while half-open
+CIRCUIT_MAX_DEFERRALS = int(os.getenv("CIRCUIT_MAX_DEFERRALS", 5))  # Then the job fails instead of waiting again
+
 DEFAULT_PROMPT = """Your role is to analyze stock charts with exceptional expertise. You will provide your analysis, your expert opinion on if you should BUY / SELL / WAIT.
                     You will provide a confidence score of your decision (1-100%). And you will provide entry, profit target, and stop loss, for any BUY or SELL decision. 
                     You will also calculate the R:R (risk to reward ratio) when applicable.
@@ -1,15 +1,48 @@
 import asyncio
-from config import logger
+import time
+from config import (logger, WARMUP_TIMEOUT_SECONDS, WORKER_PROCESSES, RESULT_PUSH_ENABLED, JOB_EXPORT_SPOOL_DIR,
+                    JOB_EXPORT_DIR, RUNTIME_CONFIG_FILE)
 from trading_view_extension.queue.sqs_queue_consumer import SqsQueueConsumer
+from trading_view_extension.queue.prefork_consumer import PreforkConsumer
 from trading_view_extension.queue.sqs_queue_publisher import SQSQueuePublisher
+from trading_view_extension.queue.result_push_server import ResultPushServer, PushingPublisher
+from trading_view_extension.monitoring.metrics_server import start_metrics_server, start_admin_server
+from trading_view_extension.monitoring.metrics import WORKER_STARTUP_SECONDS
+from trading_view_extension.monitoring.profiler import install_signal_handler
+from trading_view_extension.services.client_registry import registry
+from trading_view_extension.analytics.job_export import JobExporter
+from trading_view_extension.services.runtime_config import runtime_config
 import os
 from dotenv import load_dotenv
 load_dotenv()
 SQS_INPUT_QUEUE_URL = os.getenv("SQS_INPUT_QUEUE_URL")
 
 async def main():
+    started = time.perf_counter()
+    start_metrics_server()
+    start_admin_server()  # /admin endpoints, on localhost unless ADMIN_TOKEN is set
+    install_signal_handler()  # kill -USR2 <pid> profiles the worker (see monitoring/profiler.py)
+    # Build the SQS/Supabase/OpenRouter clients and open their connections before the first poll.
+    # In prefork mode the worker processes warm their own Supabase and OpenRouter clients.
+    await asyncio.to_thread(registry.warm_up, ["sqs"] if WORKER_PROCESSES else None, timeout=WARMUP_TIMEOUT_SECONDS)
     iqp = SQSQueuePublisher()
-    sqs_consumer = SqsQueueConsumer(iqp)
+    # Results are also pushed to WebSocket subscribers; SQS stays the durable path.
+    push_server = ResultPushServer().start() if RESULT_PUSH_ENABLED else None
+    if push_server is not None:
+        iqp = PushingPublisher(iqp, push_server.publish)
+    if WORKER_PROCESSES:
+        sqs_consumer = PreforkConsumer(iqp, processes=WORKER_PROCESSES,
+                                       result_push=push_server.publish if push_server else None)
+        sqs_consumer.start_workers()
+    else:
+        sqs_consumer = SqsQueueConsumer(iqp)
+    if RUNTIME_CONFIG_FILE:
+        # Tuning changes in the file apply to the consumer built above (see services/runtime_config.py).
+        runtime_config.watch_file(RUNTIME_CONFIG_FILE)
+    if JOB_EXPORT_SPOOL_DIR and JOB_EXPORT_DIR:
+        # One exporter for the spool of this worker and of its worker processes.
+        JobExporter().start()
+    WORKER_STARTUP_SECONDS.set(time.perf_counter() - started)
     logger.info(f"Starting SQS Consumer loop on {SQS_INPUT_QUEUE_URL}")
 
     while True:
@@ -0,0 +1,319 @@
+import json
+import pytest
+import asyncio
+from unittest.mock import AsyncMock, Mock, patch
+import sys
+from pathlib import Path
+
+# Add parent directory to path to allow absolute import resolution
+sys.path.append(str(Path(__file__).resolve().parent.parent.parent))
+
+from trading_view_extension.orchestrators.ai_orchestrator import AiOrchestrator
+from trading_view_extension.services.job_errors import PermanentJobError
+
+
+def batch_job(count):
+    return {
+        "job_type": "batch_scan",
+        "job_id": "batch-1",
+        "agent": "default",
+        "email_id": "user@example.com",
+        "user_instructions": "",
+        "items": [{"asset": f"T{i}", "s3_urls": [f"https://example.com/{i}.png"]} for i in range(count)],
+    }
+
+
+@pytest.fixture
+def publisher():
+    return AsyncMock()
+
+
+class FakeCredits:
+    """The users table as far as credit admission sees it: one balance, reserved from atomically."""
+
+    def __init__(self, balance=10 ** 6):
+        self.balance = balance
+        self.reserve = Mock(side_effect=self._reserve)
+        self.refund = Mock(side_effect=self._refund)
+
+    def _reserve(self, email, amount):
+        if amount > self.balance:
+            return 0, 0, self.balance
+        self.balance -= amount
+        return amount, 0, self.balance
+
+    def _refund(self, email, from_extra, from_monthly):
+        self.balance += from_extra + from_monthly
+
+
+@pytest.fixture(autouse=True)
+def user_credits():
+    credits = FakeCredits()
+    with patch("trading_view_extension.database.db_utilities.reserve_user_credits", credits.reserve), \
+            patch("trading_view_extension.database.db_utilities.refund_user_credits", credits.refund):
+        yield credits
+
+
+@pytest.mark.asyncio
+async def test_handle_job_publishes_single_result(publisher):
+    orchestrator = AiOrchestrator(publisher)
+    with patch("trading_view_extension.orchestrators.ai_orchestrator.analyze",
+               AsyncMock(return_value=("text", {"action": "BUY"}, "msg-1"))):
+        assert await orchestrator.handle_job({"job_id": "1", "agent": "default", "asset": "AAPL", "s3_urls": []}) is True
+
+    published = publisher.publish_task.call_args[0][0]
+    assert published["status"] == "COMPLETED"
+    assert published["result"] == {"action": "BUY"}
+    # Progress for push subscribers goes out before the work starts, and never to SQS.
+    assert publisher.publish_progress.call_args[0][0]["status"] == "RUNNING"
+    assert [c.args[0]["status"] for c in publisher.publish_task.call_args_list] == ["COMPLETED"]
+
+
+@pytest.mark.asyncio
+async def test_batch_job_bounds_concurrency_and_ranks_results(publisher):
+    in_flight = 0
+    peak = 0
+
+    async def fake_analyze(job, image_urls):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        confidence = job["batch_index"]
+        return "text", {"asset": job["asset"], "confidence": confidence}, f"msg-{job['batch_index']}"
+
+    orchestrator = AiOrchestrator(publisher, batch_concurrency=3)
+    with patch("trading_view_extension.orchestrators.ai_orchestrator.analyze", side_effect=fake_analyze):
+        await orchestrator.handle_job(batch_job(10))
+
+    assert peak == 3
+    statuses = [c.args[0]["status"] for c in publisher.publish_task.call_args_list]
+    assert statuses.count("PARTIAL") == 10
+    assert statuses[-1] == "COMPLETED"
+
+    summary = publisher.publish_task.call_args_list[-1].args[0]
+    assert [item["asset"] for item in summary["result"]][:3] == ["T9", "T8", "T7"]
+    assert "items" not in summary
+    assert orchestrator.batch_checkpoints == {}
+
+
+@pytest.mark.asyncio
+async def test_batch_retry_processes_only_remaining_items(publisher):
+    calls = []
+
+    async def flaky_publish(job):
+        if job["status"] == "PARTIAL" and job["batch_index"] == 2 and len(calls) < 5:
+            raise RuntimeError("SQS down")
+
+    async def fake_analyze(job, image_urls):
+        calls.append(job["batch_index"])
+        return "text", {"confidence": 5}, "msg"
+
+    publisher.publish_task.side_effect = flaky_publish
+    orchestrator = AiOrchestrator(publisher, batch_concurrency=1)
+    with patch("trading_view_extension.orchestrators.ai_orchestrator.analyze", side_effect=fake_analyze):
+        with pytest.raises(RuntimeError):
+            await orchestrator.handle_job(batch_job(5))
+        assert sorted(orchestrator.batch_checkpoints["batch-1"]) == [0, 1, 3, 4]
+
+        await orchestrator.handle_job(batch_job(5))
+
+    assert calls == [0, 1, 2, 3, 4, 2]
+    assert len(publisher.publish_task.call_args_list[-1].args[0]["result"]) == 5
+
+
+@pytest.mark.asyncio
+async def test_redelivered_job_returns_stored_result_without_reprocessing(publisher):
+    analyze_mock = AsyncMock(return_value=("text", {"action": "BUY"}, "msg-1"))
+    orchestrator = AiOrchestrator(publisher)
+    job = {"job_id": "1", "message_id": "turn-1", "agent": "default", "asset": "AAPL", "s3_urls": []}
+
+    with patch("trading_view_extension.orchestrators.ai_orchestrator.analyze", analyze_mock):
+        assert await orchestrator.handle_job(dict(job)) is True
+        stored = await orchestrator.handle_job(dict(job))
+
+    analyze_mock.assert_awaited_once()
+    publisher.publish_task.assert_awaited_once()
+    assert stored["status"] == "COMPLETED"
+    assert stored["idempotency_key"] == "1:turn-1"
+
+
+@pytest.mark.asyncio
+async def test_chat_turns_without_message_id_are_not_duplicates(publisher):
+    analyze_mock = AsyncMock(return_value=("text", {"action": "WAIT"}, "msg-1"))
+    orchestrator = AiOrchestrator(publisher)
+    first = {"job_id": "1", "agent": "default", "asset": "AAPL", "is_chat": True, "agent_query": "And the weekly?", "s3_urls": []}
+    second = dict(first, agent_query="Where would you put the stop?")
+
+    with patch("trading_view_extension.orchestrators.ai_orchestrator.analyze", analyze_mock):
+        await orchestrator.handle_job({"job_id": "1", "agent": "default", "asset": "AAPL", "s3_urls": []})
+        await orchestrator.handle_job(dict(first))
+        await orchestrator.handle_job(dict(second))
+        await orchestrator.handle_job(dict(second))  # Redelivered
+
+    assert analyze_mock.await_count == 3
+    keys = [c.args[0]["idempotency_key"] for c in publisher.publish_task.call_args_list]
+    assert len(keys) == len(set(keys)) == 3
+
+
+@pytest.mark.asyncio
+async def test_failed_job_releases_claim_for_retry(publisher):
+    publisher.publish_task.side_effect = [RuntimeError("SQS down"), None]
+    orchestrator = AiOrchestrator(publisher)
+    job = {"job_id": "1", "agent": "default", "asset": "AAPL", "s3_urls": []}
+
+    with patch("trading_view_extension.orchestrators.ai_orchestrator.analyze",
+               AsyncMock(return_value=("text", {}, "msg-1"))):
+        with pytest.raises(RuntimeError):
+            await orchestrator.handle_job(dict(job))
+        assert await orchestrator.handle_job(dict(job)) is True
+
+    assert publisher.publish_task.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_job_the_user_cannot_afford_is_rejected_before_any_model_call(publisher, user_credits):
+    user_credits.balance = 12
+    analyze_mock = AsyncMock(return_value=("text", {}, "msg-1"))
+    orchestrator = AiOrchestrator(publisher)
+    job = {"job_id": "1", "agent": "default", "asset": "AAPL", "email_id": "broke@example.com", "s3_urls": ["a.png", "b.png"]}
+
+    with patch("trading_view_extension.orchestrators.ai_orchestrator.analyze", analyze_mock):
+        assert await orchestrator.handle_job(job) is True
+
+    analyze_mock.assert_not_awaited()
+    rejected = publisher.publish_task.call_args[0][0]
+    assert rejected["status"] == "REJECTED"
+    assert rejected["credits_required"] > rejected["credits_available"] == 12
+
+
+@pytest.mark.asyncio
+async def test_reservation_is_reconciled_with_actual_usage(publisher, user_credits):
+    user_credits.balance = 100
+
+    async def fake_analyze(job, image_urls):
+        job["credits_used"] = 30
+        return "text", {}, "msg-1"
+
+    orchestrator = AiOrchestrator(publisher)
+    with patch("trading_view_extension.orchestrators.ai_orchestrator.analyze", side_effect=fake_analyze):
+        await orchestrator.handle_job({"job_id": "1", "agent": "default", "asset": "AAPL", "email_id": "u@example.com", "s3_urls": []})
+
+    assert user_credits.balance == 100  # The reservation is given back; deduct_user_credits charges the 30
+    reserved = user_credits.reserve.call_args.args[1]
+    user_credits.refund.assert_called_once_with("u@example.com", reserved, 0)
+    assert orchestrator.credit_admission._balances["u@example.com"][0] == 70
+
+
+@pytest.mark.asyncio
+async def test_open_circuit_fails_job_fast_without_retries(publisher):
+    from trading_view_extension.services.circuit_breaker import CircuitOpen
+
+    analyze_mock = AsyncMock(side_effect=CircuitOpen("openrouter:model", 12.4))
+    orchestrator = AiOrchestrator(publisher)
+    with patch("trading_view_extension.orchestrators.ai_orchestrator.analyze", analyze_mock), \
+         patch("trading_view_extension.orchestrators.ai_orchestrator.delay_tasks_queue.url", None):
+        assert await orchestrator.handle_job({"job_id": "1", "agent": "default", "asset": "AAPL", "s3_urls": []}) is True
+
+    analyze_mock.assert_awaited_once()
+    failed = publisher.publish_task.call_args[0][0]
+    assert failed["status"] == "FAILED" and failed["retry_after"] == 12
+    assert orchestrator.idempotency_store.claim("1:-") is None  # A retry is not a duplicate
+
+
+@pytest.mark.asyncio
+async def test_open_circuit_defers_job_to_delay_queue(publisher):
+    from trading_view_extension.services.circuit_breaker import CircuitOpen
+
+    orchestrator = AiOrchestrator(publisher)
+    job = {"job_id": "1", "agent": "default", "asset": "AAPL", "s3_urls": [], "deferrals": 1}
+    with patch("trading_view_extension.orchestrators.ai_orchestrator.analyze",
+               AsyncMock(side_effect=CircuitOpen("supabase", 30))), \
+         patch("trading_view_extension.orchestrators.ai_orchestrator.delay_tasks_queue.url", "https://sqs/delay"):
+        await orchestrator.handle_job(job)
+
+    deferred, delay = publisher.defer_task.call_args[0]
+    assert deferred == {"job_id": "1", "agent": "default", "asset": "AAPL", "s3_urls": [], "deferrals": 2}
+    assert delay == 30
+    publisher.publish_task.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_deferred_chat_turn_is_not_written_twice_on_rerun(publisher):
+    from trading_view_extension.services.circuit_breaker import CircuitOpen
+
+    stored = [{"message_id": "s", "role": "system", "content": [{"type": "text", "text": "prompt"}]},
+              {"message_id": "a", "role": "assistant", "content": [{"type": "text", "text": "WAIT"}]}]
+    model = Mock(side_effect=[CircuitOpen("openrouter:model", 30), ("Still WAIT", 5)])
+
+    orchestrator = AiOrchestrator(publisher)
+    job = {"job_id": "1", "message_id": "turn-2", "agent": "default", "asset": "AAPL", "email_id": "u@example.com",
+           "is_chat": True, "agent_query": "And now?", "s3_urls": []}
+    target = "trading_view_extension.services"
+    with patch(f"{target}.alpha_agent_analyzer.get_conversation_by_id", side_effect=lambda job_id: [dict(m) for m in stored]), \
+         patch(f"{target}.generate_reasoning.add_message", side_effect=lambda job_id, message: stored.append(message)), \
+         patch(f"{target}.generate_reasoning.remove_messages",
+               side_effect=lambda job_id, ids: stored.__setitem__(slice(None), [m for m in stored if m["message_id"] not in ids])), \
+         patch(f"{target}.generate_reasoning.query_openrouter", model), \
+         patch(f"{target}.generate_reasoning.get_structured_trade_signal", return_value=(None, 0)), \
+         patch(f"{target}.generate_reasoning.update_trade_signal"), \
+         patch(f"{target}.generate_reasoning.deduct_user_credits"), \
+         patch("trading_view_extension.orchestrators.ai_orchestrator.delay_tasks_queue.url", "https://sqs/delay"):
+        await orchestrator.handle_job(dict(job))
+        assert len(stored) == 2
+        deferred, _ = publisher.defer_task.call_args[0]
+        await orchestrator.handle_job(deferred)
+
+    assert [m["role"] for m in model.call_args.args[0]] == ["system", "assistant", "user"]
+    assert [m["role"] for m in stored] == ["system", "assistant", "user", "assistant"]
+    assert stored[2]["message_id"] == "turn-2"
+    assert publisher.publish_task.call_args[0][0]["status"] == "COMPLETED"
+
+
+@pytest.fixture
+def quarantine(tmp_path):
+    from trading_view_extension.queue.quarantine import QuarantineStore
+    return QuarantineStore(backend="file", path=str(tmp_path / "quarantine.jsonl"))
+
+
+@pytest.mark.asyncio
+async def test_invalid_job_is_quarantined_before_any_io(publisher, quarantine, user_credits):
+    analyze_mock = AsyncMock()
+    orchestrator = AiOrchestrator(publisher, quarantine=quarantine)
+    with patch("trading_view_extension.orchestrators.ai_orchestrator.analyze", analyze_mock):
+        assert await orchestrator.handle_job({"job_id": "1", "agent": None, "email_id": "u@example.com"}) is True
+
+    analyze_mock.assert_not_awaited()
+    user_credits.reserve.assert_not_called()
+    [record] = quarantine.recent()
+    assert record["reason"] == "invalid_job" and "agent" in record["error"]
+    assert publisher.publish_task.call_args[0][0]["status"] == "FAILED"
+    with open(quarantine.path) as quarantine_file:
+        assert json.loads(quarantine_file.readline())["job_id"] == "1"
+
+
+@pytest.mark.asyncio
+async def test_permanent_error_skips_retries_and_is_not_run_again(publisher, quarantine):
+    analyze_mock = AsyncMock(side_effect=PermanentJobError("conversation_not_found", "No conversation found for job_id 1"))
+    orchestrator = AiOrchestrator(publisher, quarantine=quarantine)
+    job = {"job_id": "1", "message_id": "turn-2", "agent": "default", "asset": "AAPL", "is_chat": True, "agent_query": "?"}
+
+    with patch("trading_view_extension.orchestrators.ai_orchestrator.analyze", analyze_mock):
+        await orchestrator.handle_job(dict(job))
+        stored = await orchestrator.handle_job(dict(job))
+
+    analyze_mock.assert_awaited_once()
+    assert stored["status"] == "FAILED"
+    assert quarantine.recent()[0]["job"] == job
+
+
+@pytest.mark.asyncio
+async def test_transient_errors_are_still_retried(publisher):
+    analyze_mock = AsyncMock(side_effect=[ConnectionError("reset"), ("text", {}, "msg-1")])
+    orchestrator = AiOrchestrator(publisher)
+    with patch("trading_view_extension.orchestrators.ai_orchestrator.analyze", analyze_mock):
+        await orchestrator.handle_job({"job_id": "1", "agent": "default", "asset": "AAPL", "s3_urls": []})
+
+    assert analyze_mock.await_count == 2
+    assert publisher.publish_task.call_args[0][0]["status"] == "COMPLETED"
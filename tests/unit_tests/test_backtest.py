@@ -0,0 +1,163 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parent.parent.parent))
+
+from trading_view_extension.analytics.backtest import simulate, summarize, signals_from_rows, main
+
+
+def bars(asset, rows):
+    """Hourly bars from (open, high, low, close) tuples, starting at 2024-01-01 01:00."""
+    times = pd.date_range("2024-01-01 01:00", periods=len(rows), freq="h", tz="UTC")
+    frame = pd.DataFrame(rows, columns=["open", "high", "low", "close"])
+    frame.insert(0, "time", times)
+    frame.insert(0, "asset", asset)
+    return frame
+
+
+def signal(action, entry, stop, target, asset="AAA", agent="a", time="2024-01-01 00:30"):
+    return {"asset": asset, "agent": agent, "time": time, "action": action,
+            "entry_price": entry, "stop_loss": stop, "take_profit": target}
+
+
+@pytest.fixture
+def prices():
+    return pd.concat([
+        # Rises from 100 to 112
+        bars("AAA", [(100, 101, 99, 100), (100, 104, 99.5, 103), (103, 108, 102, 107), (107, 112, 106, 111)]),
+        # Falls from 50, then gaps up through 55
+        bars("BBB", [(50, 50.5, 48, 49), (49, 49.5, 47, 48), (58, 60, 57, 59), (59, 59, 58, 58)]),
+    ], ignore_index=True)
+
+
+def test_simulate_outcomes(prices):
+    signals = pd.DataFrame([
+        signal("BUY", 100, 98, 106),              # Filled on bar 0, target on bar 2
+        signal("SELL", 100, 102, 90),             # Filled on bar 0, stopped on bar 1
+        signal("SELL", 49, 55, 40, asset="BBB"),  # Stop gapped through: fills at the open (58)
+        signal("BUY", 90, 85, 120),               # Entry never touched
+        signal("BUY", 100, 105, 110),             # Stop above the entry
+        signal("BUY", 100, 95, 130),              # Still open after the last bar
+        signal("WAIT", None, None, None),
+        signal("BUY", 100, 95, 110, asset="ZZZ"),
+    ])
+
+    trades = simulate(signals, prices)
+
+    assert trades["outcome"].tolist() == ["target", "stop", "stop", "not_filled", "invalid", "time_exit",
+                                          "no_trade", "no_prices"]
+    assert trades["exit_price"].tolist()[:3] == [106, 102, 58]
+    assert trades["exit_price"][5] == 111
+    assert trades["r_multiple"].tolist()[:3] == [3.0, -1.0, pytest.approx(-1.5)]
+    assert trades["r_multiple"][5] == pytest.approx(11 / 5)
+    assert trades["r_multiple"][3:5].isna().all()
+    assert trades["entry_time"][0] == pd.Timestamp("2024-01-01 01:00", tz="UTC")
+    assert trades["exit_time"][0] == pd.Timestamp("2024-01-01 03:00", tz="UTC")
+    assert pd.isna(trades["exit_time"][3])
+
+
+def test_simulate_limits_bars(prices):
+    signals = pd.DataFrame([
+        signal("BUY", 100, 98, 106),
+        signal("BUY", 107.5, 100, 130),  # Touched on bar 2 only
+    ])
+
+    trades = simulate(signals, prices, max_bars=2, entry_bars=2)
+
+    assert trades["outcome"].tolist() == ["time_exit", "not_filled"]
+    assert trades["exit_price"][0] == 103
+
+
+def test_stop_wins_when_a_bar_touches_both():
+    prices = bars("AAA", [(100, 100.5, 99.5, 100), (100, 110, 90, 100)])
+    trades = simulate(pd.DataFrame([signal("BUY", 100, 95, 105)]), prices)
+    assert trades["outcome"][0] == "stop"
+    assert trades["exit_price"][0] == 95
+
+
+def test_simulate_matches_bar_by_bar_walk():
+    rng = np.random.default_rng(7)
+    closes = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, 300)))
+    opens = np.r_[100, closes[:-1]]
+    rows = list(zip(opens, np.maximum(opens, closes) * 1.003, np.minimum(opens, closes) * 0.997, closes))
+    prices = bars("AAA", rows)
+    picks = rng.integers(0, 280, 200)
+    buys = rng.random(200) < 0.5
+    signals = pd.DataFrame({
+        "asset": "AAA", "agent": "a", "action": np.where(buys, "BUY", "SELL"),
+        "time": prices["time"].to_numpy()[picks],
+        "entry_price": closes[picks],
+        "stop_loss": np.where(buys, closes[picks] * 0.98, closes[picks] * 1.02),
+        "take_profit": np.where(buys, closes[picks] * 1.03, closes[picks] * 0.97),
+    })
+
+    trades = simulate(signals, prices, max_bars=60)
+
+    for i, row in signals.iterrows():
+        side = 1 if row["action"] == "BUY" else -1
+        window = rows[picks[i] + 1:picks[i] + 61]
+        filled, expected = False, ("not_filled", None)
+        for k, (o, h, l, c) in enumerate(window):
+            if not filled:
+                filled = l <= row["entry_price"] <= h
+                first = filled
+                if not filled:
+                    continue
+            if (l <= row["stop_loss"]) if side > 0 else (h >= row["stop_loss"]):
+                gap = min(o, row["stop_loss"]) if side > 0 else max(o, row["stop_loss"])
+                expected = ("stop", row["stop_loss"] if first else gap)
+                break
+            if (h >= row["take_profit"]) if side > 0 else (l <= row["take_profit"]):
+                expected = ("target", row["take_profit"])
+                break
+            first = False
+        else:
+            if filled:
+                expected = ("time_exit", window[-1][3])
+        assert trades["outcome"][i] == expected[0]
+        if expected[1] is not None:
+            assert trades["exit_price"][i] == pytest.approx(expected[1])
+
+
+def test_summarize_per_agent(prices):
+    signals = pd.DataFrame([
+        signal("BUY", 100, 98, 106, agent="a"),   # +3R
+        signal("SELL", 100, 102, 90, agent="a"),  # -1R
+        signal("SELL", 100, 102, 90, agent="a", time="2024-01-01 02:30"),  # Entry not touched again
+        signal("BUY", 100, 98, 106, agent="b"),
+    ])
+
+    report = summarize(simulate(signals, prices), by=["agent"]).set_index("agent")
+
+    assert report.loc["a", "signals"] == 3
+    assert report.loc["a", "trades"] == 2
+    assert report.loc["a", "fill_rate"] == pytest.approx(2 / 3)
+    assert report.loc["a", "win_rate"] == 0.5
+    assert report.loc["a", "expectancy_r"] == 1.0
+    assert report.loc["a", "total_r"] == 2.0
+    # The stop (bar 1) comes before the target (bar 2): the curve goes to -1R first.
+    assert report.loc["a", "max_drawdown_r"] == 1.0
+    assert report.loc["b", "max_drawdown_r"] == 0.0
+
+
+def test_signals_from_conversation_rows(tmp_path, prices):
+    rows = [
+        {"job_id": "j1", "symbol": "aaa", "agent": "a", "created_at": "2024-01-01T00:30:00Z",
+         "trade_signal": '{"action": "BUY", "entry_price": 100, "stop_loss": 98, "take_profit": 106, "R2R": 3}'},
+        {"job_id": "j2", "symbol": "AAA", "agent": "a", "created_at": "2024-01-01T00:30:00Z", "trade_signal": None},
+    ]
+    signals = signals_from_rows(rows)
+    assert signals["signal_id"].tolist() == ["j1"]
+    assert signals["asset"][0] == "AAA"
+    assert signals["model"][0] == "unknown"
+
+    signals.to_csv(tmp_path / "signals.csv", index=False)
+    prices.to_csv(tmp_path / "prices.csv", index=False)
+    report = main(["--prices", str(tmp_path / "prices.csv"), "--signals", str(tmp_path / "signals.csv"),
+                   "--output", str(tmp_path / "report.csv")])
+    assert report["total_r"].tolist() == [3.0]
+    assert (tmp_path / "report.csv").exists()
@@ -0,0 +1,75 @@
+import sys
+from pathlib import Path
+import pytest
+
+# Add parent directory to path to allow absolute import resolution
+sys.path.append(str(Path(__file__).resolve().parent.parent.parent))
+
+from trading_view_extension.services.circuit_breaker import CircuitBreaker, CircuitOpen, CLOSED, HALF_OPEN, OPEN
+from trading_view_extension.monitoring.metrics import REGISTRY
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def call(breaker, fail=False, error=RuntimeError):
+    with breaker.guard(lambda e: not isinstance(e, ValueError)):
+        if fail:
+            raise error("boom")
+
+
+def trip(breaker):
+    for _ in range(breaker.min_calls):
+        with pytest.raises(RuntimeError):
+            call(breaker, fail=True)
+
+
+def test_opens_on_failure_rate_and_fails_fast():
+    clock = FakeClock()
+    breaker = CircuitBreaker("test-dep", window=10, min_calls=4, failure_rate=0.5, reset_seconds=30, clock=clock)
+    call(breaker)
+    call(breaker)
+    with pytest.raises(RuntimeError):
+        call(breaker, fail=True)
+    assert breaker.state == CLOSED  # 1 of 3 calls failed
+    with pytest.raises(RuntimeError):
+        call(breaker, fail=True)
+    assert breaker.state == OPEN  # 2 of 4
+
+    clock.now = 10
+    with pytest.raises(CircuitOpen) as refused:
+        call(breaker)
+    assert refused.value.retry_after == 20
+    assert 'circuit_state{dependency="test-dep"} 2' in REGISTRY.render()
+
+
+def test_errors_that_are_not_failures_do_not_open_the_circuit():
+    breaker = CircuitBreaker("test-not-found", min_calls=2, clock=FakeClock())
+    for _ in range(5):
+        with pytest.raises(ValueError):
+            call(breaker, fail=True, error=ValueError)
+    assert breaker.state == CLOSED
+
+
+def test_half_open_probe_closes_or_reopens():
+    clock = FakeClock()
+    breaker = CircuitBreaker("test-probe", min_calls=2, reset_seconds=30, half_open_calls=1, clock=clock)
+    trip(breaker)
+
+    clock.now = 31
+    assert breaker.state == HALF_OPEN
+    breaker.before_call()  # The probe
+    with pytest.raises(CircuitOpen):
+        breaker.before_call()  # Only one probe at a time
+    breaker.record(failed=True)
+    assert breaker.state == OPEN and breaker.retry_after() == 30
+
+    clock.now = 62
+    call(breaker)
+    assert breaker.state == CLOSED
+    call(breaker)
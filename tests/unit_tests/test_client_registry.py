@@ -0,0 +1,100 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import patch
+
+# Add parent directory to path to allow absolute import resolution
+sys.path.append(str(Path(__file__).resolve().parent.parent.parent))
+
+from trading_view_extension.services.client_registry import ClientRegistry
+
+ROOT = Path(__file__).resolve().parent.parent.parent
+
+
+def test_client_is_built_once_on_first_use():
+    registry = ClientRegistry()
+    built = []
+
+    def factory():
+        time.sleep(0.05)
+        built.append(1)
+        return {"name": "client"}
+
+    client = registry.lazy("dep", factory)
+    assert not registry.is_created("dep") and built == []
+
+    threads = [threading.Thread(target=lambda: client.get("name")) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert built == [1]
+    assert client.get("name") == "client"
+
+
+def test_warm_up_runs_in_parallel_and_survives_failures():
+    registry = ClientRegistry()
+    warmed = []
+
+    def slow_warm(client):
+        time.sleep(0.2)
+        warmed.append(client)
+
+    def broken_factory():
+        raise ConnectionError("down")
+
+    registry.register("a", lambda: "a", warm=slow_warm)
+    registry.register("b", lambda: "b", warm=slow_warm)
+    registry.register("broken", broken_factory)
+
+    started = time.perf_counter()
+    durations = registry.warm_up(timeout=2)
+
+    assert time.perf_counter() - started < 0.35
+    assert sorted(warmed) == ["a", "b"]
+    assert set(durations) == {"a", "b"}
+
+
+def test_warm_up_does_not_wait_past_its_timeout():
+    registry = ClientRegistry()
+    registry.register("hanging", lambda: "client", warm=lambda client: time.sleep(1))
+
+    started = time.perf_counter()
+    assert registry.warm_up(timeout=0.1) == {}
+    assert time.perf_counter() - started < 0.5
+
+
+def test_patching_a_lazy_client_does_not_build_it():
+    registry = ClientRegistry()
+
+    def factory():
+        raise AssertionError("client built")
+
+    dependencies = SimpleNamespace(client=registry.lazy("dep", factory))
+    with patch.object(dependencies, "client") as client:
+        client.table.return_value = "mocked"
+        assert dependencies.client.table() == "mocked"
+
+    assert not registry.is_created("dep")
+
+
+def test_worker_imports_without_building_clients():
+    probe = (
+        "import sys\n"
+        "import main\n"
+        "from trading_view_extension.services.client_registry import registry\n"
+        "print(sorted(name for name in registry._factories if registry.is_created(name)))\n"
+        "print(sorted(name for name in ('boto3', 'supabase', 'botocore') if name in sys.modules))\n"
+    )
+    env = dict(os.environ, SUPABASE_URL="https://x.supabase.co", SUPABASE_KEY="key", LOG_FILE=os.devnull)
+    output = subprocess.run([sys.executable, "-c", probe], cwd=ROOT, env=env, capture_output=True, text=True,
+                            check=True).stdout.splitlines()
+
+    # What keeps the import fast: no client is built and the heavy SDKs are not even imported.
+    assert output[-2] == "[]"
+    assert output[-1] == "[]"
@@ -0,0 +1,108 @@
+import sys
+from pathlib import Path
+import pytest
+
+# Add parent directory to path to allow absolute import resolution
+sys.path.append(str(Path(__file__).resolve().parent.parent.parent))
+
+from trading_view_extension.queue.concurrency_limiter import AimdConcurrencyLimiter
+from trading_view_extension.monitoring.metrics import REGISTRY
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class SimulatedBackend:
+    """
+    An upstream with `capacity` concurrent requests: beyond it requests queue (latency grows
+    linearly), and beyond twice the capacity the excess is rejected (429s, timeouts).
+    """
+
+    def __init__(self, capacity: int, base_latency: float = 1.0):
+        self.capacity = capacity
+        self.base_latency = base_latency
+
+    def latency(self, concurrency: int) -> float:
+        return self.base_latency * max(1.0, concurrency / self.capacity)
+
+    def failures(self, concurrency: int) -> int:
+        return max(0, concurrency - 2 * self.capacity)
+
+
+def run_rounds(limiter, clock, backend, rounds):
+    """Each round starts as many jobs as the limiter allows and finishes them together."""
+    limits = []
+    for _ in range(rounds):
+        started = clock.now
+        concurrency = limiter.available()
+        for _ in range(concurrency):
+            limiter.acquire()
+        clock.now += backend.latency(concurrency)
+        failures = backend.failures(concurrency)
+        for index in range(concurrency):
+            limiter.release(started, failed=index < failures)
+        limits.append(limiter.limit)
+    return limits
+
+
+def test_limit_grows_on_fast_backend_and_shrinks_when_it_degrades():
+    clock = FakeClock()
+    limiter = AimdConcurrencyLimiter(min_limit=1, max_limit=32, initial_limit=5, clock=clock)
+
+    fast = run_rounds(limiter, clock, SimulatedBackend(capacity=64), rounds=40)
+    assert fast[-1] == 32  # Additive increase up to the configured bound
+    assert "worker_concurrency_limit 32" in REGISTRY.render()
+
+    degraded = run_rounds(limiter, clock, SimulatedBackend(capacity=4), rounds=40)
+    # Multiplicative decrease brings the limit down within a few round trips...
+    assert min(degraded[:6]) <= 10
+    # ...and it then hovers around what the backend can take without rejecting work.
+    steady = degraded[10:]
+    assert max(steady) <= 10 and min(steady) >= 2
+
+    recovered = run_rounds(limiter, clock, SimulatedBackend(capacity=64), rounds=60)
+    assert recovered[-1] == 32
+
+
+def test_one_decrease_per_round_trip():
+    clock = FakeClock()
+    limiter = AimdConcurrencyLimiter(min_limit=1, max_limit=32, initial_limit=20, clock=clock)
+    for _ in range(20):
+        limiter.acquire()
+    clock.now = 1.0
+    for _ in range(20):
+        limiter.release(0.0, failed=True)
+
+    assert limiter.limit == 14  # 20 * 0.7 once, not 0.7 ** 20
+
+
+def test_limit_does_not_grow_while_underused():
+    clock = FakeClock()
+    limiter = AimdConcurrencyLimiter(initial_limit=5, clock=clock)
+    for _ in range(100):
+        limiter.acquire()
+        clock.now += 1.0
+        limiter.release(clock.now - 1.0)
+
+    assert limiter.limit == 5
+
+
+def test_limit_never_drops_below_minimum():
+    clock = FakeClock()
+    limiter = AimdConcurrencyLimiter(min_limit=2, initial_limit=3, clock=clock)
+    for _ in range(10):
+        limiter.acquire()
+        clock.now += 1.0
+        limiter.release(clock.now - 0.5, failed=True)
+
+    assert limiter.limit == 2
+
+
+def test_invalid_bounds_are_rejected():
+    with pytest.raises(ValueError):
+        AimdConcurrencyLimiter(min_limit=5, max_limit=2)
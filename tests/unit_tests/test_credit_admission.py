@@ -0,0 +1,151 @@
+import asyncio
+import sys
+import threading
+from pathlib import Path
+from unittest.mock import Mock, patch
+import pytest
+
+# Add parent directory to path to allow absolute import resolution
+sys.path.append(str(Path(__file__).resolve().parent.parent.parent))
+
+from trading_view_extension.services.credit_admission import CreditAdmission, InsufficientCredits, Reservation, estimate_tokens
+from config import CREDIT_BASE_COST, CREDIT_COST_PER_IMAGE
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def job(images=1, **fields):
+    return {"job_id": "job-1", "email_id": "u@example.com", "s3_urls": ["x.png"] * images, **fields}
+
+
+def test_estimate_grows_with_images_and_history():
+    admission = CreditAdmission()
+    assert admission.estimate(job(images=2)) == CREDIT_BASE_COST + 2 * CREDIT_COST_PER_IMAGE
+    assert admission.estimate(job(is_chat=True, history_tokens=20000)) > admission.estimate(job(is_chat=True, history_tokens=1000))
+    batch = {"job_type": "batch_scan", "items": [{"s3_urls": ["a.png"]}] * 3}
+    assert admission.estimate(batch) == 3 * admission.estimate(job(images=1))
+
+
+def test_estimate_tokens_counts_text_blocks_only():
+    messages = [{"role": "user", "content": [{"type": "text", "text": "x" * 400}, {"type": "image_url", "image_url": {"url": "u"}}]}]
+    assert estimate_tokens(messages) == 100
+
+
+class FakeCredits:
+    """A users row shared by every admission, reserved from atomically like reserve_user_credits."""
+
+    def __init__(self, balance):
+        self.balance = balance
+        self.lock = threading.Lock()
+        self.reserve = Mock(side_effect=self._reserve)
+        self.refund = Mock(side_effect=self._refund)
+
+    def _reserve(self, email, amount):
+        with self.lock:
+            if amount > self.balance:
+                return 0, 0, self.balance
+            self.balance -= amount
+            return amount, 0, self.balance
+
+    def _refund(self, email, from_extra, from_monthly):
+        with self.lock:
+            self.balance += from_extra + from_monthly
+
+    def patched(self):
+        db = "trading_view_extension.database.db_utilities"
+        return patch.multiple(db, reserve_user_credits=self.reserve, refund_user_credits=self.refund)
+
+
+@pytest.mark.asyncio
+async def test_reservations_hold_across_admissions_of_different_processes():
+    workers = [CreditAdmission(), CreditAdmission()]
+    cost = workers[0].estimate(job())
+    credits = FakeCredits(2 * cost)
+    with credits.patched():
+        first = await workers[0].admit(job())
+        second = await workers[1].admit(job())
+        with pytest.raises(InsufficientCredits):
+            await CreditAdmission().admit(job())  # Nothing cached: refused by the database itself
+
+        await workers[0].settle(first, {"credits_used": 0})  # Given back without spending anything
+        third = await workers[0].admit(job())
+
+        credits.balance -= 2 * cost  # deduct_user_credits charging both jobs
+        await workers[1].settle(second, {"credits_used": cost})
+        await workers[0].settle(third, {"credits_used": cost})
+        with pytest.raises(InsufficientCredits):  # The balance itself is spent now
+            await CreditAdmission().admit(job())
+    assert credits.balance == 0
+
+
+@pytest.mark.asyncio
+async def test_cached_balance_rejects_without_a_database_round_trip():
+    admission = CreditAdmission()
+    credits = FakeCredits(admission.estimate(job()))
+    with credits.patched():
+        await admission.admit(job())
+        with pytest.raises(InsufficientCredits) as rejected:
+            await admission.admit(job(images=3))
+    assert rejected.value.available == 0
+    credits.reserve.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_stale_balance_is_used_while_refreshing_in_background():
+    clock = FakeClock()
+    admission = CreditAdmission(ttl_seconds=60, clock=clock)
+    credits = FakeCredits(1000)
+    admitted, refreshed = threading.Event(), threading.Event()
+
+    def fetch(email):
+        admitted.wait(2)
+        credits.balance = 0  # Spent by another worker in the meantime
+        refreshed.set()
+        return 0
+
+    with credits.patched(), \
+            patch("trading_view_extension.database.db_utilities.get_user_credits", side_effect=fetch):
+        await admission.settle(await admission.admit(job()), {})
+        clock.now = 61
+        await admission.admit(job())  # Admitted on the stale balance
+        admitted.set()
+        assert await asyncio.to_thread(refreshed.wait, 2)
+        await asyncio.sleep(0.05)
+        with pytest.raises(InsufficientCredits):
+            await admission.admit(job())
+
+
+@pytest.mark.asyncio
+async def test_unknown_user_is_rejected_and_unreachable_database_admits_unchecked():
+    admission = CreditAdmission()
+    with patch("trading_view_extension.database.db_utilities.reserve_user_credits", side_effect=ValueError("No user")):
+        with pytest.raises(InsufficientCredits):
+            await admission.admit(job())
+    with patch("trading_view_extension.database.db_utilities.reserve_user_credits", side_effect=ConnectionError("down")):
+        assert (await admission.admit(job())).amount == 0
+
+
+@pytest.mark.asyncio
+async def test_failed_refund_is_not_counted_back_into_the_cached_balance():
+    admission = CreditAdmission()
+    credits = FakeCredits(100)
+    with credits.patched():
+        reservation = await admission.admit(job())
+    with patch("trading_view_extension.database.db_utilities.refund_user_credits", side_effect=ConnectionError("down")):
+        await admission.settle(reservation, {"credits_used": 0})
+    assert admission._balances["u@example.com"][0] == credits.balance == 100 - reservation.amount
+
+
+@pytest.mark.asyncio
+async def test_settle_remembers_history_size_for_the_next_chat_turn():
+    admission = CreditAdmission()
+    unknown = admission.estimate(job(is_chat=True))
+    await admission.settle(Reservation("u@example.com", 0), {"job_id": "job-1", "history_tokens": 100, "response": "y" * 400})
+    assert admission._history_tokens["job-1"] == 200
+    assert admission.estimate(job(is_chat=True)) < unknown
@@ -0,0 +1,79 @@
+import sys
+from collections import Counter
+from pathlib import Path
+
+# Add parent directory to path to allow absolute import resolution
+sys.path.append(str(Path(__file__).resolve().parent.parent.parent))
+
+from trading_view_extension.queue.fair_scheduler import FairScheduler, parse_weights, CHAT, ANALYSIS, BATCH
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def drain(scheduler, count=None):
+    popped = []
+    while count is None or len(popped) < count:
+        scheduled = scheduler.pop()
+        if scheduled is None:
+            break
+        popped.append(scheduled[0])
+    return popped
+
+
+def test_a_burst_from_one_user_does_not_delay_other_users():
+    scheduler = FairScheduler(clock=FakeClock())
+    for index in range(50):
+        scheduler.push(f"bulk-{index}", "bulk@example.com")
+    scheduler.push("alice-1", "alice@example.com")
+    scheduler.push("bob-1", "bob@example.com")
+
+    order = drain(scheduler)
+
+    assert order.index("alice-1") <= 2 and order.index("bob-1") <= 3
+    assert len(order) == 52 and len(scheduler) == 0
+
+
+def test_classes_are_served_in_proportion_to_their_weights():
+    scheduler = FairScheduler(weights={CHAT: 4, ANALYSIS: 2, BATCH: 1}, clock=FakeClock())
+    for index in range(100):
+        scheduler.push((CHAT, index), "u1", CHAT)
+        scheduler.push((ANALYSIS, index), "u2", ANALYSIS)
+        scheduler.push((BATCH, index), "u3", BATCH)
+
+    served = Counter(job_class for job_class, _ in drain(scheduler, count=70))
+
+    assert served[CHAT] == 40 and served[ANALYSIS] == 20 and served[BATCH] == 10
+
+
+def test_chat_turn_outranks_waiting_analyses():
+    scheduler = FairScheduler(clock=FakeClock())
+    for index in range(5):
+        scheduler.push(f"analysis-{index}", f"user{index}@example.com", ANALYSIS)
+    scheduler.push("chat", "late@example.com", CHAT)
+
+    assert drain(scheduler, count=1) == ["chat"]
+
+
+def test_aged_job_is_served_first():
+    clock = FakeClock()
+    scheduler = FairScheduler(weights={CHAT: 1000, BATCH: 1}, aging_seconds=30, clock=clock)
+    scheduler.push("old-batch", "u1", BATCH)
+    scheduler.pop()  # Advance virtual time past the batch flow's first job
+    scheduler.push("starving-batch", "u1", BATCH)
+    clock.now = 31
+    for index in range(20):
+        scheduler.push(f"chat-{index}", f"user{index}", CHAT)
+
+    item, job_class, waited = scheduler.pop()
+    assert item == "starving-batch" and job_class == BATCH and waited == 31
+    assert drain(scheduler) == [f"chat-{index}" for index in range(20)]
+
+
+def test_parse_weights_overrides_defaults():
+    assert parse_weights("chat=8, batch=0.5") == {CHAT: 8.0, ANALYSIS: 2.0, BATCH: 0.5}
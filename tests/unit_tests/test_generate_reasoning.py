@@ -0,0 +1,116 @@
+import pytest
+import threading
+import time
+from unittest.mock import MagicMock, patch
+import sys
+from pathlib import Path
+
+# Add parent directory to path to allow absolute import resolution
+sys.path.append(str(Path(__file__).resolve().parent.parent.parent))
+
+from trading_view_extension.services.generate_reasoning import generate_response
+
+
+@pytest.fixture
+def mock_io():
+    """
+    Mocks the OpenRouter and Supabase calls used by generate_response.
+    Every call is recorded in order together with the thread that made it.
+    """
+    calls = []
+
+    def record(name, delay=0.0, result=None):
+        def _call(*args, **kwargs):
+            calls.append(("start", name))
+            time.sleep(delay)
+            calls.append(("end", name))
+            return result
+        return _call
+
+    with patch("trading_view_extension.services.generate_reasoning.add_message", side_effect=record("add_message", 0.05)) as add_message, \
+         patch("trading_view_extension.services.generate_reasoning.query_openrouter", side_effect=record("query_openrouter", 0.05, ("BUY AAPL", 3))), \
+         patch("trading_view_extension.services.generate_reasoning.get_structured_trade_signal", side_effect=record("extract", 0.0, (dict(SIGNAL), 1))), \
+         patch("trading_view_extension.services.generate_reasoning.update_trade_signal", side_effect=record("update_trade_signal")) as update_trade_signal, \
+         patch("trading_view_extension.services.generate_reasoning.deduct_user_credits", side_effect=record("deduct_user_credits")) as deduct, \
+         patch("trading_view_extension.services.generate_reasoning.remove_messages") as remove_messages:
+        yield {
+            "calls": calls,
+            "add_message": add_message,
+            "update_trade_signal": update_trade_signal,
+            "deduct_user_credits": deduct,
+            "remove_messages": remove_messages,
+        }
+
+
+JOB = {"job_id": "job-1", "asset": "AAPL", "email_id": "user@example.com"}
+SIGNAL = {"asset": "AAPL", "action": "BUY", "entry_price": 100.0, "stop_loss": 95.0, "take_profit": 115.0,
+          "confidence": 8.0, "R2R": 3.0}
+
+
+@pytest.mark.asyncio
+async def test_model_call_starts_before_prompt_writes_finish(mock_io):
+    response, trade_signal, response_message_id = await generate_response(
+        dict(JOB), "system prompt", "query", [], True, ["https://example.com/a.png"]
+    )
+
+    calls = mock_io["calls"]
+    assert response == "BUY AAPL"
+    assert trade_signal == dict(SIGNAL, quality={"passed": True, "issues": [], "reported_R2R": 3.0})
+    assert response_message_id is not None
+    # The model call is issued while the first prompt write is still in flight.
+    assert calls.index(("start", "query_openrouter")) < calls.index(("end", "add_message"))
+    mock_io["remove_messages"].assert_not_called()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("refused", ["query_openrouter", "get_structured_trade_signal"])
+async def test_open_circuit_takes_the_written_messages_back(mock_io, refused):
+    from trading_view_extension.services.circuit_breaker import CircuitOpen
+
+    with patch(f"trading_view_extension.services.generate_reasoning.{refused}",
+               side_effect=CircuitOpen("openrouter:model", 30)):
+        with pytest.raises(CircuitOpen):
+            await generate_response(dict(JOB), "system prompt", "query", [], True, message_id="turn-1")
+
+    written = [c.args[1]["message_id"] for c in mock_io["add_message"].call_args_list]
+    assert "turn-1" in written
+    job_id, removed = mock_io["remove_messages"].call_args.args
+    assert job_id == "job-1" and set(written) <= set(removed)
+    mock_io["deduct_user_credits"].assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_messages_are_written_in_order_and_joined(mock_io):
+    await generate_response(dict(JOB), "system prompt", "query", [], True)
+
+    roles = [c.args[1]["role"] for c in mock_io["add_message"].call_args_list]
+    assert roles == ["system", "user", "assistant"]
+    # The stored signal is the gated one.
+    assert mock_io["update_trade_signal"].call_args.args[1]["quality"]["passed"] is True
+    mock_io["update_trade_signal"].assert_called_once()
+    mock_io["deduct_user_credits"].assert_called_once_with("user@example.com", 4)
+
+
+@pytest.mark.asyncio
+async def test_writes_wait_for_conversation_row(mock_io):
+    created = threading.Event()
+
+    async def conversation_ready():
+        created.set()
+
+    def add_message(*args, **kwargs):
+        assert created.is_set()
+
+    mock_io["add_message"].side_effect = add_message
+    await generate_response(dict(JOB), "system prompt", "query", [], True, conversation_ready=conversation_ready())
+    assert mock_io["add_message"].call_count == 3
+
+
+@pytest.mark.asyncio
+async def test_model_error_still_joins_prompt_writes(mock_io):
+    with patch("trading_view_extension.services.generate_reasoning.query_openrouter", side_effect=Exception("boom")):
+        result = await generate_response(dict(JOB), "system prompt", "query", [], True)
+
+    assert result == ("Error occurred during processing.", None, None)
+    assert mock_io["add_message"].call_count == 2
+    mock_io["deduct_user_credits"].assert_not_called()
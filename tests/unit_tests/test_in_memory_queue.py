@@ -0,0 +1,68 @@
+import sys
+import time
+from pathlib import Path
+
+# Add parent directory to path to allow absolute import resolution
+sys.path.append(str(Path(__file__).resolve().parent.parent.parent))
+
+from trading_view_extension.queue.in_memory_queue import InMemoryFifoSqsClient
+
+QUEUE_URL = "inmemory://test.fifo"
+
+
+def _bodies(response):
+    return [message["Body"] for message in response.get("Messages", [])]
+
+
+def test_messages_of_a_group_are_received_in_order():
+    client = InMemoryFifoSqsClient()
+    for body in ("a", "b", "c"):
+        client.send_message(QueueUrl=QUEUE_URL, MessageBody=body, MessageGroupId="g")
+
+    response = client.receive_message(QueueUrl=QUEUE_URL, MaxNumberOfMessages=10)
+
+    assert _bodies(response) == ["a", "b", "c"]
+    assert response["Messages"][0]["Attributes"]["SentTimestamp"].isdigit()
+
+
+def test_group_is_locked_until_in_flight_messages_are_deleted():
+    client = InMemoryFifoSqsClient()
+    client.send_message(QueueUrl=QUEUE_URL, MessageBody="a", MessageGroupId="g")
+    first = client.receive_message(QueueUrl=QUEUE_URL)
+    client.send_message(QueueUrl=QUEUE_URL, MessageBody="b", MessageGroupId="g")
+    client.send_message(QueueUrl=QUEUE_URL, MessageBody="x", MessageGroupId="other")
+
+    # "b" waits behind the in-flight "a"; other groups are not blocked.
+    assert _bodies(client.receive_message(QueueUrl=QUEUE_URL, MaxNumberOfMessages=10)) == ["x"]
+
+    client.delete_message(QueueUrl=QUEUE_URL, ReceiptHandle=first["Messages"][0]["ReceiptHandle"])
+    assert _bodies(client.receive_message(QueueUrl=QUEUE_URL, MaxNumberOfMessages=10)) == ["b"]
+
+
+def test_undeleted_message_is_redelivered_after_visibility_timeout():
+    client = InMemoryFifoSqsClient()
+    client.send_message(QueueUrl=QUEUE_URL, MessageBody="a", MessageGroupId="g")
+    client.receive_message(QueueUrl=QUEUE_URL, VisibilityTimeout=0.05)
+
+    assert client.receive_message(QueueUrl=QUEUE_URL) == {}
+    time.sleep(0.06)
+    redelivered = client.receive_message(QueueUrl=QUEUE_URL)
+
+    assert _bodies(redelivered) == ["a"]
+    assert redelivered["Messages"][0]["Attributes"]["ApproximateReceiveCount"] == "2"
+
+
+def test_duplicate_deduplication_id_is_dropped():
+    client = InMemoryFifoSqsClient()
+    client.send_message(QueueUrl=QUEUE_URL, MessageBody="a", MessageGroupId="g", MessageDeduplicationId="k")
+    client.send_message(QueueUrl=QUEUE_URL, MessageBody="a", MessageGroupId="g", MessageDeduplicationId="k")
+
+    assert _bodies(client.receive_message(QueueUrl=QUEUE_URL, MaxNumberOfMessages=10)) == ["a"]
+
+
+def test_receive_waits_for_a_message():
+    client = InMemoryFifoSqsClient()
+
+    started = time.perf_counter()
+    assert client.receive_message(QueueUrl=QUEUE_URL, WaitTimeSeconds=0.1) == {}
+    assert time.perf_counter() - started >= 0.1
@@ -0,0 +1,92 @@
+import json
+import os
+import time
+from unittest.mock import AsyncMock, patch
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parent.parent.parent))
+
+from trading_view_extension.analytics import job_export
+from trading_view_extension.analytics.job_export import JobSpool, export_spool, read_export
+from trading_view_extension.monitoring.job_telemetry import add_usage
+from trading_view_extension.orchestrators.ai_orchestrator import AiOrchestrator
+
+SIGNAL = {"asset": "AAPL", "action": "BUY", "entry_price": 100.0, "stop_loss": 95.0, "take_profit": 115.0,
+          "confidence": 8.0, "R2R": 3.0, "quality": {"passed": True, "issues": []}}
+
+
+def spool_lines(directory):
+    return [json.loads(line) for path in sorted(Path(directory).glob("jobs-*.jsonl"))
+            for line in path.read_text().splitlines()]
+
+
+@pytest.mark.asyncio
+async def test_completed_jobs_are_spooled_with_usage_and_stages(tmp_path):
+    async def fake_analyze(job, image_urls):
+        add_usage("model-a", {"prompt_tokens": 1200, "completion_tokens": 300}, 0.5)
+        add_usage("model-b", {"prompt_tokens": 100, "completion_tokens": 20}, 0.1)
+        job["credits_used"] = 7
+        return "text", dict(SIGNAL), "msg-1"
+
+    spool = JobSpool(str(tmp_path), flush_interval=60)
+    orchestrator = AiOrchestrator(AsyncMock(), job_spool=spool)
+    with patch("trading_view_extension.database.db_utilities.get_user_credits", return_value=10 ** 6), \
+            patch("trading_view_extension.orchestrators.ai_orchestrator.analyze", fake_analyze):
+        await orchestrator.handle_job({"job_id": "1", "agent": "default", "asset": "AAPL", "s3_urls": []})
+    assert spool_lines(tmp_path) == []  # Nothing is written on the job's path
+    spool.flush()
+
+    [row] = spool_lines(tmp_path)
+    assert row["job_id"] == "1"
+    assert (row["asset"], row["agent"], row["model"], row["models"]) == ("AAPL", "default", "model-a", "model-a,model-b")
+    assert (row["action"], row["entry_price"], row["R2R"], row["gate_passed"]) == ("BUY", 100.0, 3.0, True)
+    assert (row["prompt_tokens"], row["completion_tokens"], row["model_calls"], row["credits_used"]) == (1300, 320, 2, 7)
+    assert row["openrouter_seconds"] == pytest.approx(0.6)
+    assert row["total_seconds"] >= row["analyze_seconds"]
+    assert "publish_seconds" in row
+
+
+def test_export_reads_only_new_lines(tmp_path, monkeypatch):
+    written = []
+    monkeypatch.setattr(job_export, "_write_partitions", lambda rows, output, name: written.append((name, rows)))
+    spool_dir, output = tmp_path / "spool", tmp_path / "export"
+    spool_dir.mkdir()
+    current = spool_dir / f"jobs-{job_export._hour(time.time())}-1.jsonl"
+    old = spool_dir / "jobs-2020010100-1.jsonl"
+    old.write_text('{"job_id": "old"}\n')
+    current.write_text('{"job_id": "a"}\n{"job_id": "b"}\n{"job_id": "c"')  # The last line is still being written
+
+    assert export_spool(str(spool_dir), str(output)) == 3
+    assert [row["job_id"] for _, rows in written for row in rows] == ["old", "a", "b"]
+    assert not old.exists()  # Exported completely and an hour old
+    with open(current, "a") as spool_file:
+        spool_file.write('}\n{"job_id": "d"}\n')
+
+    assert export_spool(str(spool_dir), str(output)) == 2
+    assert written[-1][1] == [{"job_id": "c"}, {"job_id": "d"}]
+    assert export_spool(str(spool_dir), str(output)) == 0
+    # File names follow the spool offset, so a repeated run overwrites instead of duplicating.
+    second_start = len('{"job_id": "a"}\n{"job_id": "b"}\n')
+    assert written[-1][0] == f"{current.stem}-{second_start:012d}"
+    watermark = json.loads((output / job_export.WATERMARK_FILE).read_text())
+    assert watermark["offsets"] == {current.name: os.path.getsize(current)}
+
+
+def test_exported_days_read_back(tmp_path):
+    pytest.importorskip("pyarrow")
+    spool_dir, output = tmp_path / "spool", tmp_path / "export"
+    spool_dir.mkdir()
+    rows = [
+        {"completed_at": "2026-09-30T23:59:00+00:00", "job_id": "a", "asset": "AAPL", "R2R": 3.0},
+        {"completed_at": "2026-10-01T00:01:00+00:00", "job_id": "b", "asset": "MSFT", "R2R": None},
+    ]
+    (spool_dir / "jobs-2026100100-1.jsonl").write_text("".join(json.dumps(row) + "\n" for row in rows))
+
+    assert export_spool(str(spool_dir), str(output)) == 2
+
+    assert sorted(path.name for path in output.glob("date=*")) == ["date=2026-09-30", "date=2026-10-01"]
+    assert read_export(str(output))["job_id"].tolist() == ["a", "b"]
+    assert read_export(str(output), start="2026-10-01")["asset"].tolist() == ["MSFT"]
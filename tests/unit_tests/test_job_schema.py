@@ -0,0 +1,73 @@
+import json
+import sys
+from pathlib import Path
+from unittest.mock import MagicMock
+import pytest
+import requests
+
+# Add parent directory to path to allow absolute import resolution
+sys.path.append(str(Path(__file__).resolve().parent.parent.parent))
+
+from trading_view_extension.queue.job_schema import validate_job
+from trading_view_extension.services.job_errors import PermanentJobError, classify_error, error_reason, PERMANENT, TRANSIENT
+
+VALID = {
+    "job_id": "job-1",
+    "email_id": "user@example.com",
+    "agent": "default",
+    "asset": "AAPL",
+    "user_instructions": "",
+    "s3_urls": ["https://example.com/a.png"],
+    "is_chat": False,
+    "extra_field": {"kept": True},
+}
+
+
+def test_valid_jobs_pass():
+    validate_job(VALID)
+    validate_job({**VALID, "is_chat": True, "message_id": "m-1", "agent_query": ""})
+    validate_job({**VALID, "job_type": "batch_scan", "items": [{"asset": "MSFT", "s3_urls": []}], "asset": None})
+
+
+@pytest.mark.parametrize("change, problem", [
+    ({"agent": None}, "agent"),
+    ({"s3_urls": "https://example.com/a.png"}, "s3_urls"),
+    ({"s3_urls": [None]}, "s3_urls.0"),
+    ({"is_chat": "yes"}, "is_chat"),
+    ({"agent": "custom"}, "custom agent"),
+    ({"is_chat": True}, "agent_query"),
+    ({"job_type": "batch_scan"}, "items"),
+    ({"job_type": "batch_scan", "items": [{"s3_urls": []}]}, "items.0.asset"),
+    ({"job_id": ""}, "job_id"),
+    ({"asset": None}, "needs an asset"),
+    ({"is_chat": True, "agent_query": "?", "asset": ""}, "needs an asset"),
+])
+def test_invalid_jobs_are_permanent_errors(change, problem):
+    with pytest.raises(PermanentJobError, match=problem) as raised:
+        validate_job({**VALID, **change})
+    assert raised.value.reason == "invalid_job"
+
+
+def test_non_object_body_is_rejected():
+    with pytest.raises(PermanentJobError):
+        validate_job(["not", "a", "job"])
+
+
+def _http_error(status):
+    response = MagicMock(status_code=status)
+    return requests.HTTPError(response=response)
+
+
+def test_classification_separates_permanent_from_transient_errors():
+    assert classify_error(PermanentJobError("conversation_not_found", "No conversation found for job_id 1")) == PERMANENT
+    # Unknown errors may succeed on a retry, e.g. an OpenRouter error body without "usage".
+    assert classify_error(KeyError("usage")) == TRANSIENT
+    assert classify_error(ValueError("unexpected")) == TRANSIENT
+    assert classify_error(_http_error(400)) == PERMANENT
+    assert classify_error(_http_error(429)) == TRANSIENT
+    assert classify_error(_http_error(503)) == TRANSIENT
+    assert classify_error(requests.Timeout()) == TRANSIENT
+    assert classify_error(requests.exceptions.JSONDecodeError("truncated", "{", 1)) == TRANSIENT
+    assert classify_error(RuntimeError("unknown")) == TRANSIENT
+    assert error_reason(_http_error(400)) == "http_400"
+    assert error_reason(json.JSONDecodeError("bad", "{", 0)) == "invalid_json"
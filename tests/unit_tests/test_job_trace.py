@@ -0,0 +1,80 @@
+import json
+import sys
+import time
+from pathlib import Path
+
+# Add parent directory to path to allow absolute import resolution
+sys.path.append(str(Path(__file__).resolve().parent.parent.parent))
+
+from trading_view_extension.queue.job_trace import JobTraceRecorder, TraceReplayer, read_trace, scrub
+
+JOB = {
+    "job_id": "job-1",
+    "email_id": "trader@example.com",
+    "agent": "Default",
+    "asset": "AAPL",
+    "user_instructions": "My account number is 12345, focus on the daily chart",
+    "s3_urls": ["https://bucket.s3.amazonaws.com/user/chart1.png", "https://bucket.s3.amazonaws.com/user/chart2.png"],
+    "is_chat": False,
+}
+
+
+def test_scrub_keeps_shape_but_no_identifying_data():
+    entry = scrub(JOB, arrival=1000.0, salt="s")
+    serialized = json.dumps(entry)
+
+    assert entry["images"] == 2
+    assert entry["instructions_chars"] == len(JOB["user_instructions"])
+    assert entry["agent"] == "default" and entry["chat"] is False
+    for secret in ("job-1", "trader@example.com", "12345", "bucket"):
+        assert secret not in serialized
+    # Same job/user under the same salt map to the same pseudonyms.
+    assert scrub(dict(JOB, is_chat=True), 1001.0, salt="s")["conv"] == entry["conv"]
+
+
+def test_recorder_writes_arrival_time_and_history_length(tmp_path):
+    recorder = JobTraceRecorder(str(tmp_path / "trace.jsonl"), salt="s")
+    entry = recorder.start(dict(JOB), {"Attributes": {"SentTimestamp": "1700000000123"}})
+    recorder.finish(entry, {"history_length": 4})
+    recorder.close()
+
+    [written] = read_trace(str(tmp_path / "trace.jsonl"))
+    assert written["ts"] == 1700000000.123
+    assert written["history"] == 4
+
+
+def _entry(ts, conv, chat=False):
+    return {"ts": ts, "conv": conv, "user": "u", "agent": "default", "chat": chat, "images": 1}
+
+
+def test_replayer_preserves_inter_arrival_times_at_speed():
+    sent = []
+    entries = [_entry(100.0, "a"), _entry(100.4, "b"), _entry(100.8, "c")]
+    replayer = TraceReplayer(entries, lambda job, group: sent.append(time.monotonic()), speed=4.0)
+
+    assert replayer.run() == 3
+    gaps = [later - earlier for earlier, later in zip(sent, sent[1:])]
+    assert all(0.08 <= gap < 0.2 for gap in gaps)
+
+
+def test_replayer_holds_chats_until_previous_turn_completed():
+    sent = []
+    entries = [_entry(0.0, "a"), _entry(0.0, "a", chat=True), _entry(0.0, "b")]
+    replayer = TraceReplayer(entries, lambda job, group: sent.append((job, group)), wait_for_completion=True)
+
+    replayer.run()
+    assert [job["is_chat"] for job, _ in sent] == [False, False]
+
+    first_job, first_group = sent[0]
+    replayer.completed(first_job["job_id"])
+    chat, chat_group = sent[2]
+    assert chat["is_chat"] and chat["job_id"] == first_job["job_id"] and chat["message_id"]
+    assert chat_group == first_group
+
+
+def test_replayer_seeds_conversations_that_started_before_the_trace():
+    seeded = []
+    replayer = TraceReplayer([_entry(0.0, "a", chat=True)], lambda job, group: None,
+                             seed_conversation=lambda job_id, entry: seeded.append(job_id))
+    replayer.run()
+    assert len(seeded) == 1
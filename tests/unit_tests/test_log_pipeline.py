@@ -0,0 +1,95 @@
+import json
+import logging
+import queue
+import pytest
+import sys
+from pathlib import Path
+
+# Add parent directory to path to allow absolute import resolution
+sys.path.append(str(Path(__file__).resolve().parent.parent.parent))
+
+import config
+from trading_view_extension.monitoring import log_pipeline
+from trading_view_extension.monitoring.log_pipeline import (
+    JsonFormatter,
+    configure_logging,
+    stop_logging,
+    truncate,
+    LOG_RECORDS_DROPPED,
+)
+
+
+@pytest.fixture
+def restore_logging():
+    yield
+    configure_logging(level=config.LOG_LEVEL, fmt=config.LOG_FORMAT, log_file=config.LOG_FILE)
+
+
+def test_truncate_limits_long_strings():
+    text = str(truncate("x" * 5000, limit=100))
+    assert text.startswith("x" * 100)
+    assert text.endswith("... [5000 chars]")
+    assert str(truncate("short", limit=100)) == "short"
+
+
+def test_truncate_bounds_large_containers():
+    history = [{"role": "user", "content": "y" * 10000} for _ in range(1000)]
+    text = str(truncate(history, limit=300))
+    assert len(text) <= 303
+
+
+def test_json_formatter_includes_extra_fields():
+    record = logging.LogRecord("worker", logging.INFO, __file__, 1, "job %s done", ("42",), None)
+    record.job_id = "42"
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry["message"] == "job 42 done"
+    assert entry["level"] == "INFO"
+    assert entry["job_id"] == "42"
+
+
+def test_queue_handler_drops_instead_of_blocking():
+    handler = log_pipeline._DroppingQueueHandler(queue.SimpleQueue(), max_size=1)
+    before = LOG_RECORDS_DROPPED._default.get()
+    for _ in range(3):
+        handler.emit(logging.LogRecord("worker", logging.INFO, __file__, 1, "msg", (), None))
+    assert handler.queue.qsize() == 1
+    assert LOG_RECORDS_DROPPED._default.get() == before + 2
+
+
+def test_pipeline_writes_json_and_rotates(tmp_path, restore_logging):
+    log_file = tmp_path / "worker.log"
+    configure_logging(level="INFO", log_file=str(log_file), json_output=True, max_bytes=2000, backup_count=2)
+
+    logger = logging.getLogger("worker")
+    for index in range(50):
+        logger.info("processed job %d", index, extra={"job_id": index})
+    stop_logging()
+
+    lines = log_file.read_text().splitlines()
+    assert json.loads(lines[-1])["job_id"] == 49
+    assert (tmp_path / "worker.log.1").exists()
+
+
+def test_only_mutable_arguments_are_rendered_in_the_calling_thread():
+    handler = log_pipeline._DroppingQueueHandler(queue.SimpleQueue(), max_size=0)
+    job = {"status": "RUNNING"}
+    handler.emit(logging.LogRecord("worker", logging.INFO, __file__, 1, "job %s took %.1fs", ("42", 1.25), None))
+    handler.emit(logging.LogRecord("worker", logging.INFO, __file__, 1, "job %s", (job,), None))
+    job["status"] = "COMPLETED"
+
+    deferred, rendered = handler.queue.get(), handler.queue.get()
+    assert deferred.args == ("42", 1.25) and deferred.getMessage() == "job 42 took 1.2s"
+    assert rendered.args is None and rendered.getMessage() == "job {'status': 'RUNNING'}"
+
+
+def test_caller_info_is_kept_unless_skipped(tmp_path, restore_logging):
+    log_file = tmp_path / "worker.log"
+    configure_logging(level="INFO", fmt="%(filename)s:%(lineno)d %(message)s", log_file=str(log_file))
+    logging.getLogger("worker").info("here")
+    stop_logging()
+    assert log_file.read_text().startswith("test_log_pipeline.py:")
+
+    configure_logging(level="INFO", fmt="%(filename)s %(message)s", log_file=str(log_file), skip_caller_info=True)
+    logging.getLogger("worker").info("skipped")
+    stop_logging()
+    assert log_file.read_text().splitlines()[-1] == "(unknown file) skipped"
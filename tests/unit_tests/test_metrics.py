@@ -0,0 +1,105 @@
+import urllib.error
+import urllib.request
+import sys
+from pathlib import Path
+
+import pytest
+
+# Add parent directory to path to allow absolute import resolution
+sys.path.append(str(Path(__file__).resolve().parent.parent.parent))
+
+from trading_view_extension.monitoring.metrics import Counter, Gauge, Histogram, MetricsRegistry
+from trading_view_extension.monitoring.metrics_server import start_metrics_server, start_admin_server
+from trading_view_extension.monitoring import tracing
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = MetricsRegistry()
+    histogram = Histogram("latency_seconds", "Latency", ["call"], buckets=(0.1, 1.0), registry=registry)
+    histogram.labels(call="add_message").observe(0.05)
+    histogram.labels(call="add_message").observe(0.5)
+    histogram.labels(call="add_message").observe(5)
+
+    text = registry.render()
+
+    assert "# TYPE latency_seconds histogram" in text
+    assert 'latency_seconds_bucket{call="add_message",le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{call="add_message",le="1"} 2' in text
+    assert 'latency_seconds_bucket{call="add_message",le="+Inf"} 3' in text
+    assert 'latency_seconds_count{call="add_message"} 3' in text
+    assert 'latency_seconds_sum{call="add_message"} 5.55' in text
+
+
+def test_counter_and_gauge_render():
+    registry = MetricsRegistry()
+    counter = Counter("jobs_total", "Jobs", ["outcome"], registry=registry)
+    gauge = Gauge("in_flight", "In flight", registry=registry)
+    counter.labels(outcome='say "hi"').inc(2)
+    gauge.inc()
+    gauge.inc()
+    gauge.dec()
+
+    text = registry.render()
+
+    assert 'jobs_total{outcome="say \\"hi\\""} 2' in text
+    assert "in_flight 1" in text
+
+
+def test_gauge_function_is_read_at_scrape_time():
+    registry = MetricsRegistry()
+    gauge = Gauge("limit", "Limit", registry=registry)
+    values = iter([3, 7])
+    gauge.set_function(lambda: next(values))
+    assert "limit 3" in registry.render()
+    assert "limit 7" in registry.render()
+
+
+def test_metrics_endpoint_serves_prometheus_text():
+    server = start_metrics_server(port=0, host="127.0.0.1")
+    try:
+        port = server.server_address[1]
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as response:
+            body = response.read().decode()
+            assert response.headers["Content-Type"].startswith("text/plain")
+        assert "# TYPE sqs_receive_seconds histogram" in body
+        assert "# TYPE openrouter_ttfb_seconds histogram" in body
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def _status(url, method="GET", token=None):
+    request = urllib.request.Request(url, method=method, data=b"" if method == "POST" else None)
+    if token:
+        request.add_header("Authorization", f"Bearer {token}")
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def test_admin_routes_are_only_served_by_the_admin_server():
+    metrics = start_metrics_server(port=0, host="127.0.0.1")
+    admin = start_admin_server(port=0, host="127.0.0.1", token="s3cret")
+    rate = tracing.get_sample_rate()
+    try:
+        metrics_url = f"http://127.0.0.1:{metrics.server_address[1]}"
+        admin_url = f"http://127.0.0.1:{admin.server_address[1]}"
+        assert _status(f"{metrics_url}/admin/tracing?sample_rate=1", "POST") == 404
+        assert _status(f"{admin_url}/admin/tracing?sample_rate=1", "POST") == 401
+        assert _status(f"{admin_url}/admin/tracing?sample_rate=1", "POST", token="wrong") == 401
+        assert tracing.get_sample_rate() == rate
+        assert _status(f"{admin_url}/admin/tracing?sample_rate=0.5", "POST", token="s3cret") == 200
+        assert tracing.get_sample_rate() == 0.5
+        assert _status(f"{admin_url}/metrics", token="s3cret") == 404
+    finally:
+        tracing.set_sample_rate(rate)
+        for server in (metrics, admin):
+            server.shutdown()
+            server.server_close()
+
+
+def test_admin_server_needs_a_token_off_localhost():
+    with pytest.raises(ValueError, match="ADMIN_TOKEN"):
+        start_admin_server(port=0, host="0.0.0.0", token=None)
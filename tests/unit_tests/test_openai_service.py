@@ -0,0 +1,118 @@
+import asyncio
+import json
+import random
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parent.parent.parent))
+
+from trading_view_extension.services.openai_service import AsyncOpenAIService
+
+
+def assistant_message(run_id):
+    text = SimpleNamespace(value=json.dumps({"run": run_id}))
+    return SimpleNamespace(role="assistant", content=[SimpleNamespace(type="text", text=text)])
+
+
+class FakeStream:
+    def __init__(self, api, run_id, fail_after_start):
+        self.api = api
+        self.current_run = SimpleNamespace(id=run_id, status="in_progress")
+        self.fail_after_start = fail_after_start
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def until_done(self):
+        if self.fail_after_start:
+            raise ConnectionError("stream dropped")
+        await asyncio.sleep(self.api.durations[self.current_run.id])
+
+    async def get_final_run(self):
+        return SimpleNamespace(id=self.current_run.id, status="completed")
+
+    async def get_final_messages(self):
+        return [assistant_message(self.current_run.id)]
+
+
+class FakeAssistantsApi:
+    """Local stand-in for client.beta.threads: runs finish `durations[run_id]` seconds after creation."""
+
+    def __init__(self, durations, fail_streams=False):
+        self.durations = durations
+        self.fail_streams = fail_streams
+        self.created = {}
+        self.calls = Counter()
+        self.list_arguments = []
+        self.runs = SimpleNamespace(retrieve=self.retrieve, stream=self.stream)
+        self.messages = SimpleNamespace(list=self.list)
+        self.beta = SimpleNamespace(threads=SimpleNamespace(runs=self.runs, messages=self.messages))
+
+    def start(self, run_id):
+        self.created[run_id] = time.monotonic()
+
+    async def retrieve(self, thread_id, run_id):
+        self.calls["retrieve"] += 1
+        done = time.monotonic() - self.created[run_id] >= self.durations[run_id]
+        return SimpleNamespace(id=run_id, status="completed" if done else "in_progress")
+
+    def stream(self, thread_id, **kwargs):
+        self.calls["stream"] += 1
+        run_id = thread_id.replace("thread", "run")
+        self.start(run_id)
+        return FakeStream(self, run_id, self.fail_streams)
+
+    async def list(self, thread_id, **kwargs):
+        self.calls["list"] += 1
+        self.list_arguments.append(kwargs)
+        return SimpleNamespace(data=[assistant_message(kwargs.get("run_id"))])
+
+
+@pytest.fixture
+def api():
+    generator = random.Random(7)
+    return FakeAssistantsApi({f"run-{i}": generator.uniform(0.05, 0.5) for i in range(100)})
+
+
+@pytest.mark.asyncio
+async def test_waits_for_100_runs_with_few_status_checks(api):
+    service = AsyncOpenAIService(client=api, poll_initial=0.02, poll_factor=2, poll_max=0.2)
+    for run_id in api.durations:
+        api.start(run_id)
+
+    started = time.monotonic()
+    results = await service.wait_for_runs([(run_id, f"thread-{i}") for i, run_id in enumerate(api.durations)])
+
+    assert results == [{"run": run_id} for run_id in api.durations]
+    assert time.monotonic() - started < 2  # Concurrently, not one after another
+    # Backoff: at most ~log2(0.5 / 0.02) + 2 checks per run; a fixed 20 ms poll would need ~1400.
+    assert api.calls["retrieve"] <= 100 * 7
+    assert api.calls["list"] == 100
+    assert all(arguments["order"] == "desc" and arguments["limit"] == 1 for arguments in api.list_arguments)
+
+
+@pytest.mark.asyncio
+async def test_streamed_runs_need_no_polling(api):
+    service = AsyncOpenAIService(client=api)
+
+    results = await asyncio.gather(*(service.run_text(f"thread-{i}", "asst", 100) for i in range(100)))
+
+    assert results == [{"run": f"run-{i}"} for i in range(100)]
+    assert api.calls == Counter(stream=100)
+
+
+@pytest.mark.asyncio
+async def test_broken_stream_falls_back_to_polling(api):
+    api.fail_streams = True
+    service = AsyncOpenAIService(client=api, poll_initial=0.02, poll_factor=2, poll_max=0.2)
+
+    assert await service.run_text("thread-3", "asst", 100) == {"run": "run-3"}
+    assert api.calls["retrieve"] >= 1
@@ -0,0 +1,102 @@
+import json
+import sys
+import time
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+import pytest
+
+# Add parent directory to path to allow absolute import resolution
+sys.path.append(str(Path(__file__).resolve().parent.parent.parent))
+
+from trading_view_extension.services import openrouter_client
+from trading_view_extension.services.openrouter_client import query_openrouter, get_structured_trade_signal
+from trading_view_extension.services.runtime_config import current as current_tuning
+from trading_view_extension.services.openrouter_cassette import (
+    CassetteMiss, RECORD, REPLAY, fingerprint, use_cassette
+)
+
+SIGNAL_RESPONSE = {
+    "choices": [{"message": {"content": '{"asset": "AAPL", "action": "BUY", "entry_price": 150.0, "confidence": 8}'}}],
+    "usage": {"prompt_tokens": 100, "completion_tokens": 50},
+}
+TEXT_RESPONSE = {
+    "choices": [{"message": {"content": "Bullish flag on the daily chart."}}],
+    "usage": {"prompt_tokens": 300, "completion_tokens": 80},
+}
+MESSAGES = [{"role": "user", "content": [{"type": "text", "text": "Analyze AAPL"}]}]
+
+
+def _http_response(body):
+    response = MagicMock()
+    response.ok = True
+    response.json.return_value = body
+    response.raise_for_status.return_value = None
+    return response
+
+
+@pytest.fixture
+def recorded_cassette(tmp_path):
+    path = tmp_path / "cassette.jsonl"
+    responses = [_http_response(TEXT_RESPONSE), _http_response(SIGNAL_RESPONSE)]
+    with patch.object(openrouter_client.http_session, "post", side_effect=responses) as post:
+        with use_cassette(path, RECORD):
+            query_openrouter(MESSAGES)
+            get_structured_trade_signal("Buy AAPL at 150", asset="AAPL")
+    assert post.call_count == 2
+    return path
+
+
+def test_record_stores_fingerprint_response_and_latency_but_not_the_prompt(recorded_cassette):
+    lines = recorded_cassette.read_text().splitlines()
+    header, first, second = (json.loads(line) for line in lines)
+
+    assert header["cassette"] == 1
+    assert first["fp"] == fingerprint({"model": openrouter_client.MODEL_NAME, "messages": MESSAGES,
+                                       "max_tokens": current_tuning().max_tokens})
+    assert first["response"]["usage"] == TEXT_RESPONSE["usage"]
+    assert second["model"] == "openai/o3-mini"
+    assert first["total_ms"] >= first["ttfb_ms"] >= 0
+    assert "Analyze AAPL" not in recorded_cassette.read_text()
+
+
+def test_replay_serves_recorded_responses_offline(recorded_cassette):
+    with patch.object(openrouter_client.http_session, "post") as post:
+        with use_cassette(recorded_cassette, REPLAY) as cassette:
+            content, credits = query_openrouter(MESSAGES)
+            signal, _ = get_structured_trade_signal("Buy AAPL at 150", asset="AAPL")
+
+    post.assert_not_called()
+    assert len(cassette) == 2
+    assert content == "Bullish flag on the daily chart."
+    assert isinstance(credits, int)
+    assert signal["action"] == "BUY"
+
+
+def test_replay_miss_is_not_retried(recorded_cassette):
+    other = [{"role": "user", "content": [{"type": "text", "text": "Analyze MSFT"}]}]
+    with use_cassette(recorded_cassette, REPLAY):
+        started = time.perf_counter()
+        with pytest.raises(CassetteMiss):
+            query_openrouter(other)
+    assert time.perf_counter() - started < 1
+
+
+def test_model_matching_falls_back_to_recordings_of_the_same_model(recorded_cassette):
+    other = [{"role": "user", "content": [{"type": "text", "text": "Analyze MSFT"}]}]
+    with use_cassette(recorded_cassette, REPLAY, match="model"):
+        content, _ = query_openrouter(other)
+    assert content == "Bullish flag on the daily chart."
+
+
+def test_replay_speed_reproduces_recorded_timing(tmp_path):
+    path = tmp_path / "cassette.jsonl"
+    path.write_text(
+        json.dumps({"cassette": 1}) + "\n" +
+        json.dumps({"fp": "x", "model": openrouter_client.MODEL_NAME, "ttfb_ms": 100.0, "total_ms": 200.0,
+                    "response": TEXT_RESPONSE}) + "\n"
+    )
+    with use_cassette(path, REPLAY, replay_speed=2.0, match="model"):
+        started = time.perf_counter()
+        query_openrouter(MESSAGES)
+        elapsed = time.perf_counter() - started
+    assert 0.1 <= elapsed < 0.5
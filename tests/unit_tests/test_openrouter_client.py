@@ -28,7 +28,7 @@ MOCK_RESPONSE_JSON = {
 
 class TestOpenRouterClient(unittest.TestCase):
 
-    @patch("trading_view_extension.services.openrouter_client.requests.post")
+    @patch("trading_view_extension.services.openrouter_client.http_session.post")
     def test_query_openrouter_returns_expected_content_and_credits(self, mock_post):
         mock_response = MagicMock()
         mock_response.json.return_value = MOCK_RESPONSE_JSON
@@ -41,7 +41,7 @@ class TestOpenRouterClient(unittest.TestCase):
         self.assertIn("AAPL", content)
         self.assertIsInstance(credits, int)
 
-    @patch("trading_view_extension.services.openrouter_client.requests.post")
+    @patch("trading_view_extension.services.openrouter_client.http_session.post")
     def test_get_structured_trade_signal_success(self, mock_post):
         mock_response = MagicMock()
         mock_response.json.return_value = MOCK_RESPONSE_JSON
@@ -57,7 +57,7 @@ class TestOpenRouterClient(unittest.TestCase):
         self.assertEqual(data["entry_price"], 150.0)
         self.assertIsInstance(credits, int)
 
-    @patch("trading_view_extension.services.openrouter_client.requests.post")
+    @patch("trading_view_extension.services.openrouter_client.http_session.post")
     def test_query_conversation_constructs_message_and_calls_api(self, mock_post):
         mock_response = MagicMock()
         mock_response.json.return_value = MOCK_RESPONSE_JSON
@@ -76,7 +76,7 @@ class TestOpenRouterClient(unittest.TestCase):
         self.assertIn("AAPL", content)
         self.assertIsInstance(credits, int)
 
-    @patch("trading_view_extension.services.openrouter_client.requests.post")
+    @patch("trading_view_extension.services.openrouter_client.http_session.post")
     def test_get_consensus_filters_and_calls_api(self, mock_post):
         mock_response = MagicMock()
         mock_response.json.return_value = MOCK_RESPONSE_JSON
@@ -0,0 +1,134 @@
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parent.parent.parent))
+
+from trading_view_extension.queue.prefork_consumer import PreforkConsumer, _PipePublisher, _WorkerProcess
+from trading_view_extension.monitoring.metrics import WORKER_PROCESS_RESTARTS
+
+
+def fake_worker(slot, connection, max_jobs, log_queue=None):
+    """Stands in for worker_main: speaks the pipe protocol without running real jobs."""
+    while True:
+        try:
+            message = connection.recv()
+        except EOFError:
+            return
+        if message[0] == "stop":
+            return
+        _, task_id, sqs_message = message
+        body = sqs_message["Body"]
+        if body == "crash":
+            os._exit(3)
+        if body == "publish":
+            connection.send(("send", 7, {"QueueUrl": "output", "MessageBody": "result"}))
+            reply = connection.recv()
+            assert reply == ("sent", 7, {"MessageId": "published-1"}, None)
+        connection.send(("done", task_id, "error" if body == "fail" else "ok", False, False))
+
+
+def wait_until(predicate, timeout=20):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not reached")
+        time.sleep(0.02)
+
+
+@pytest.fixture
+def sqs_client():
+    client = MagicMock()
+    client.send_message.return_value = {"MessageId": "published-1"}
+    with patch("trading_view_extension.queue.sqs_queue_consumer.sqs_client", client), \
+         patch("trading_view_extension.queue.sqs_queue_consumer.AiOrchestrator", return_value=AsyncMock()):
+        yield client
+
+
+@pytest.fixture
+def consumer(sqs_client):
+    consumer = PreforkConsumer(MagicMock(), processes=2, worker_target=fake_worker, max_redeliveries=1)
+    consumer.start_workers()
+    yield consumer
+    consumer.stop_polling()
+
+
+def message(message_id, body):
+    return {"MessageId": message_id, "ReceiptHandle": f"rh-{message_id}", "Body": body}
+
+
+def run(consumer, messages):
+    consumer._buffer("input", messages)
+
+    def drained():
+        consumer._dispatch()  # The polling loop's job: start more as the limit allows
+        return len(consumer.scheduler) == 0 and consumer._running == 0
+    wait_until(drained)
+
+
+def test_jobs_run_in_worker_processes_and_are_acked(consumer, sqs_client):
+    run(consumer, [message(str(index), "{}") for index in range(6)] + [message("bad", "fail")])
+
+    assert sqs_client.delete_message.call_count == 7
+    assert list(consumer.local_safe_store) == ["bad"]
+    assert consumer.limiter.in_flight == 0
+    assert consumer.orchestrator is None  # The supervisor runs no jobs itself
+
+
+def test_results_are_sent_by_the_supervisor(consumer, sqs_client):
+    run(consumer, [message("1", "publish")])
+
+    sqs_client.send_message.assert_called_once_with(QueueUrl="output", MessageBody="result")
+    assert consumer.local_safe_store == {}
+
+
+def test_dead_worker_is_restarted_and_its_job_handed_on_once(consumer, sqs_client):
+    restarts = WORKER_PROCESS_RESTARTS._default.get()
+    run(consumer, [message("poison", "crash")])
+
+    # Delivered twice, killed a process each time, then left for manual recovery.
+    assert list(consumer.local_safe_store) == ["poison"]
+    assert WORKER_PROCESS_RESTARTS._default.get() - restarts == 2
+    wait_until(lambda: all(worker.process.is_alive() for worker in consumer._workers.values()))
+
+    run(consumer, [message("after", "{}")])
+    assert "after" not in consumer.local_safe_store
+
+
+def test_safe_store_is_replayed_through_the_worker_processes(consumer, sqs_client):
+    consumer.local_safe_store.update({"m": message("m", "{}"), "bad": message("bad", "not json")})
+
+    consumer.replay_safe_store()
+    wait_until(lambda: consumer._running == 0)
+
+    assert consumer.local_safe_store == {}
+    assert consumer.limiter.in_flight == 0
+    sqs_client.delete_message.assert_not_called()  # Deleted on their first delivery
+
+
+def test_worker_quarantines_a_body_that_does_not_parse():
+    with patch("trading_view_extension.queue.prefork_consumer.AiOrchestrator") as orchestrator:
+        worker = _WorkerProcess(0, MagicMock(), max_jobs=1)
+    worker.job_trace = None
+
+    assert worker.process_message_body(message("bad", "not json")) is None
+    assert orchestrator.return_value.quarantine.add.call_args.kwargs == {"message_id": "bad"}
+    worker.executor.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_pipe_publisher_encodes_the_message_and_hands_the_call_over():
+    worker = MagicMock()
+    worker.request.return_value = {"MessageId": "m-1"}
+    publisher = _PipePublisher(worker)
+
+    await publisher.publish_task({"status": "COMPLETED", "action_type": "processed", "job_id": "j-1"})
+
+    request = worker.request.call_args.args[0]
+    assert request["MessageGroupId"] == "processed_tasks"
+    assert json.loads(request["MessageBody"])["job_id"] == "j-1"
@@ -0,0 +1,122 @@
+import os
+import signal
+import threading
+import time
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parent.parent.parent))
+
+from trading_view_extension.monitoring import profiler as profiler_module
+from trading_view_extension.monitoring.profiler import SamplingProfiler, ProfileRunning, profile_route
+
+
+def wait_on(lock):
+    with lock:
+        pass
+
+
+def spin(stop):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+@pytest.fixture
+def busy_threads():
+    lock, stop = threading.Lock(), threading.Event()
+    lock.acquire()
+    threads = [threading.Thread(target=wait_on, args=(lock,), name="blocked on lock"),
+               threading.Thread(target=spin, args=(stop,), name="spinner")]
+    for thread in threads:
+        thread.start()
+    yield
+    lock.release()
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+
+def parse(text):
+    return {line.rsplit(" ", 1)[0]: int(line.rsplit(" ", 1)[1]) for line in text.splitlines()}
+
+
+def test_samples_every_thread_as_collapsed_stacks(busy_threads):
+    stacks = SamplingProfiler(interval=0.005).sample(0.2)
+
+    blocked = [stack for stack in stacks if stack.startswith("blocked_on_lock;")]
+    spinning = [stack for stack in stacks if stack.startswith("spinner;")]
+    assert blocked and all(stack.split(";")[-1].startswith("wait_on (test_profiler.py:") for stack in blocked)
+    assert any("spin (test_profiler.py:" in stack for stack in spinning)
+    assert all(";_bootstrap (threading.py:" in stack for stack in blocked + spinning)
+    # About 40 samples of each thread; the sampling thread does not sample itself.
+    assert 20 <= sum(stacks[stack] for stack in blocked) <= 41
+    assert not any("sample (profiler.py:" in stack for stack in stacks)
+
+
+def test_profile_is_written_once_at_a_time(tmp_path, busy_threads):
+    profiler = SamplingProfiler(str(tmp_path), interval=0.005)
+
+    state = profiler.start(0.1)
+    with pytest.raises(ProfileRunning):
+        profiler.start(0.1)
+    state = profiler.wait(5)
+
+    assert state["running"] is False and state["samples"] > 0
+    assert Path(state["path"]).parent == tmp_path
+    counts = parse(Path(state["path"]).read_text())
+    assert sum(counts.values()) == state["samples"]
+    assert profiler.start(0.05)["running"] is True  # A new one can start once the last finished
+    profiler.wait(5)
+
+
+def test_admin_route_returns_the_profile(tmp_path, monkeypatch, busy_threads):
+    monkeypatch.setattr(profiler_module, "profiler", SamplingProfiler(str(tmp_path), interval=0.005))
+
+    status, content_type, payload = profile_route({"seconds": ["0.1"], "wait": ["1"]}, b"")
+
+    assert status == 200 and content_type.startswith("text/plain")
+    assert any(stack.startswith("spinner;") for stack in parse(payload))
+
+
+@pytest.mark.skipif(profiler_module.PROFILE_SIGNAL is None, reason="No SIGUSR2")
+def test_signal_starts_a_profile(tmp_path, monkeypatch):
+    profiler = SamplingProfiler(str(tmp_path), interval=0.005)
+    monkeypatch.setattr(profiler_module, "profiler", profiler)
+    monkeypatch.setattr(profiler_module, "PROFILE_DEFAULT_SECONDS", 0.05)
+    previous = signal.getsignal(signal.SIGUSR2)
+    try:
+        assert profiler_module.install_signal_handler()
+        with profiler_module.profile_signal_blocked():
+            # Sent to this thread: sent to the process, another thread could take it.
+            signal.pthread_kill(threading.get_ident(), signal.SIGUSR2)
+            time.sleep(0.05)
+            assert profiler.state["running"] is False  # Held back while blocked
+        state = profiler.wait(5)
+    finally:
+        signal.signal(signal.SIGUSR2, previous)
+
+    assert Path(state["path"]).exists()
+
+
+def test_only_the_newest_profiles_are_kept(tmp_path):
+    for index in range(3):
+        old = tmp_path / f"profile-1-2026010{index}-000000.folded"
+        old.write_text("main;run 1\n")
+        os.utime(old, (1000 + index, 1000 + index))
+    (tmp_path / "notes.txt").write_text("not a profile")
+    profiler = SamplingProfiler(str(tmp_path), interval=0.005, keep=2)
+
+    state = profiler.start(0.02, path=str(tmp_path / "profile-1-20261019-120000.folded"))
+    profiler.wait(5)
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "notes.txt", "profile-1-20260102-000000.folded", Path(state["path"]).name]
+
+
+def test_profile_routes_are_admin_only():
+    from trading_view_extension.monitoring import metrics_server
+
+    assert ("POST", "/admin/profile") in metrics_server._admin_routes
+    assert ("POST", "/admin/profile") not in metrics_server._routes
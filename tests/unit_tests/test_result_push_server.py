@@ -0,0 +1,106 @@
+import asyncio
+import json
+import sys
+from pathlib import Path
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from websockets.asyncio.client import connect
+
+sys.path.append(str(Path(__file__).resolve().parent.parent.parent))
+
+from trading_view_extension.queue.result_push_server import ResultPushServer, PushingPublisher
+
+
+@pytest.fixture
+def server():
+    server = ResultPushServer(host="127.0.0.1", port=0).start()
+    yield server
+    server.stop()
+
+
+def event(job_id, status):
+    return json.dumps({"job_id": job_id, "status": status})
+
+
+async def receive(connection):
+    return json.loads(await asyncio.wait_for(connection.recv(), timeout=5))
+
+
+@pytest.mark.asyncio
+async def test_subscribers_of_a_job_receive_its_events_in_order(server):
+    async with connect(f"ws://127.0.0.1:{server.port}/jobs/job-1") as first, \
+            connect(f"ws://127.0.0.1:{server.port}") as second:
+        await second.send(json.dumps({"subscribe": "job-1"}))
+        await asyncio.sleep(0.1)  # Let the subscription land before publishing
+
+        server.publish("job-2", event("job-2", "RUNNING"))
+        server.publish("job-1", event("job-1", "RUNNING"))
+        server.publish("job-1", event("job-1", "COMPLETED"))
+
+        for connection in (first, second):
+            assert [(await receive(connection))["status"] for _ in range(2)] == ["RUNNING", "COMPLETED"]
+
+
+@pytest.mark.asyncio
+async def test_late_subscriber_gets_recent_events(server):
+    server.publish("job-1", event("job-1", "RUNNING"))
+    server.publish("job-1", event("job-1", "COMPLETED"))
+    await asyncio.sleep(0.1)
+
+    async with connect(f"ws://127.0.0.1:{server.port}/jobs/job-1") as connection:
+        assert (await receive(connection))["status"] == "RUNNING"
+        assert (await receive(connection))["status"] == "COMPLETED"
+
+
+@pytest.mark.asyncio
+async def test_unknown_request_gets_an_error(server):
+    async with connect(f"ws://127.0.0.1:{server.port}") as connection:
+        await connection.send("hello")
+        assert "error" in await receive(connection)
+
+
+@pytest.mark.asyncio
+async def test_pushing_publisher_pushes_before_publishing_durably():
+    calls = []
+    publisher = AsyncMock()
+    publisher.publish_task.side_effect = lambda job: calls.append("sqs")
+    push = MagicMock(side_effect=lambda job_id, encoded: calls.append(("push", job_id, json.loads(encoded)["status"])))
+    pushing = PushingPublisher(publisher, push)
+
+    await pushing.publish_progress({"job_id": "j", "status": "RUNNING"})
+    await pushing.publish_task({"job_id": "j", "status": "COMPLETED"})
+
+    assert calls == [("push", "j", "RUNNING"), ("push", "j", "COMPLETED"), "sqs"]
+
+
+@pytest.mark.asyncio
+async def test_pushed_events_carry_the_result_only_and_reach_the_batch():
+    push = MagicMock()
+    pushing = PushingPublisher(AsyncMock(), push)
+
+    await pushing.publish_task({"job_id": "batch-1-2", "batch_id": "batch-1", "batch_index": 2, "status": "PARTIAL",
+                                "result": {"action": "BUY"}, "email_id": "user@example.com", "prompt": "secret",
+                                "s3_urls": ["https://example.com/a.png"]})
+
+    assert [c.args[0] for c in push.call_args_list] == ["batch-1-2", "batch-1"]
+    pushed = json.loads(push.call_args.args[1])
+    assert pushed == {"job_id": "batch-1-2", "batch_id": "batch-1", "batch_index": 2, "status": "PARTIAL",
+                      "result": {"action": "BUY"}}
+
+
+@pytest.mark.asyncio
+async def test_token_is_required_when_configured():
+    from websockets.exceptions import InvalidStatus
+
+    server = ResultPushServer(host="127.0.0.1", port=0, token="s3cret").start()
+    try:
+        with pytest.raises(InvalidStatus):
+            async with connect(f"ws://127.0.0.1:{server.port}/jobs/job-1"):
+                pass
+        server.publish("job-1", event("job-1", "COMPLETED"))
+        async with connect(f"ws://127.0.0.1:{server.port}/jobs/job-1",
+                           additional_headers={"Authorization": "Bearer s3cret"}) as connection:
+            assert (await receive(connection))["status"] == "COMPLETED"
+    finally:
+        server.stop()
@@ -0,0 +1,151 @@
+import json
+import os
+import threading
+import time
+from unittest.mock import AsyncMock, MagicMock, patch
+import sys
+from pathlib import Path
+
+import pytest
+import requests
+from tenacity import RetryError
+
+sys.path.append(str(Path(__file__).resolve().parent.parent.parent))
+
+from trading_view_extension.services import openrouter_client
+from trading_view_extension.services.runtime_config import (
+    runtime_config, current, InvalidConfig, config_route, config_state_route,
+)
+from trading_view_extension.services.signal_gate import check_signal
+from trading_view_extension.queue.sqs_queue_consumer import SqsQueueConsumer
+from trading_view_extension.monitoring.metrics import RUNTIME_CONFIG_UPDATES
+
+
+@pytest.fixture(autouse=True)
+def restore_config():
+    yield
+    runtime_config.replace({}, source="test")
+
+
+def wait_until(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not reached")
+        time.sleep(0.01)
+
+
+def test_update_is_validated_as_a_whole_and_audited():
+    before = current()
+    rejected = RUNTIME_CONFIG_UPDATES.labels(outcome="rejected").get()
+
+    with pytest.raises(InvalidConfig, match="min_concurrency must not exceed max_concurrency"):
+        runtime_config.update({"max_tokens": 2000, "min_concurrency": 8, "max_concurrency": 4}, source="test")
+    with pytest.raises(InvalidConfig, match="max_token: Extra inputs are not permitted"):
+        runtime_config.update({"max_token": 2000}, source="test")
+    with pytest.raises(InvalidConfig, match="receive_max_messages"):
+        runtime_config.update({"receive_max_messages": "5"}, source="test")
+    assert current() is before
+    assert RUNTIME_CONFIG_UPDATES.labels(outcome="rejected").get() == rejected + 3
+
+    tuning = runtime_config.update({"max_tokens": 2000, "retry_attempts": 3}, source="test")
+
+    assert current() is tuning and tuning.max_tokens == 2000
+    assert runtime_config.overrides() == {"max_tokens": 2000, "retry_attempts": 3}
+    last = runtime_config.history()[-1]
+    assert last["source"] == "test"
+    assert last["changes"] == {"max_tokens": [before.max_tokens, 2000], "retry_attempts": [before.retry_attempts, 3]}
+
+
+def test_admin_route_changes_settings_or_says_why_not():
+    status, _, payload = config_route({}, b'{"signal_gate_mode": "downgrade"}')
+    assert status == 200 and json.loads(payload)["config"]["signal_gate_mode"] == "downgrade"
+
+    status, _, payload = config_route({}, b'{"signal_gate_mode": "strict"}')
+    assert status == 400 and "signal_gate_mode" in json.loads(payload)["error"]
+    status, _, payload = config_route({}, b"[1]")
+    assert status == 400
+
+    state = json.loads(config_state_route({}, b"")[2])
+    assert state["overrides"] == {"signal_gate_mode": "downgrade"}
+    assert state["history"][-1]["source"] == "POST /admin/config"
+
+
+def test_config_routes_are_admin_only():
+    from trading_view_extension.monitoring import metrics_server
+
+    assert ("POST", "/admin/config") in metrics_server._admin_routes
+    # Worker processes in prefork mode only serve these; their changes come from the supervisor.
+    assert not any(path.startswith("/admin/") for _, path in metrics_server._routes)
+
+
+def test_watched_file_is_applied_and_an_invalid_one_ignored(tmp_path):
+    path = tmp_path / "tuning.json"
+    path.write_text('{"prefetch": 50, "http_timeout_seconds": 30}')
+    runtime_config.watch_file(str(path), interval=0.01)
+    assert (current().prefetch, current().http_timeout_seconds) == (50, 30)  # Applied before watching
+
+    path.write_text('{"prefetch": 0}')
+    os.utime(path, ns=(time.time_ns(), time.time_ns() + 10 ** 9))  # A distinct mtime on coarse clocks
+    time.sleep(0.1)
+    assert current().prefetch == 50
+
+    path.write_text('{"prefetch": 40}')
+    os.utime(path, ns=(time.time_ns(), time.time_ns() + 2 * 10 ** 9))
+    wait_until(lambda: current().prefetch == 40)
+    assert current().http_timeout_seconds == runtime_config.defaults.http_timeout_seconds  # Left out: back to default
+
+
+@pytest.fixture
+def consumer():
+    with patch("trading_view_extension.queue.sqs_queue_consumer.sqs_client", MagicMock()), \
+            patch("trading_view_extension.queue.sqs_queue_consumer.AiOrchestrator", return_value=AsyncMock()):
+        consumer = SqsQueueConsumer(MagicMock(), visibility_timeout=600)
+        yield consumer
+        consumer.executor.shutdown(wait=True)
+
+
+def test_consumer_follows_changes_without_dropping_running_jobs(consumer):
+    release = threading.Event()
+    running = consumer._submit(release.wait, 5)
+    old_pool = consumer.executor
+
+    runtime_config.update({"receive_max_messages": 4, "receive_wait_seconds": 10, "prefetch": 7,
+                           "min_concurrency": 2, "max_concurrency": 6}, source="test")
+
+    assert (consumer.max_messages, consumer.wait_time, consumer.prefetch) == (4, 10, 7)
+    assert consumer.visibility_timeout == 600  # Given to the constructor, and not changed since
+    assert (consumer.limiter.min_limit, consumer.limiter.max_limit) == (2, 6)
+    assert consumer.executor is not old_pool and consumer.max_workers == 6
+    assert not running.done()  # Still running in the old pool
+    release.set()
+    assert running.result(timeout=5) is True
+
+    runtime_config.update({"visibility_timeout": 120}, source="test")
+    consumer.receive_messages("queue")
+    request = consumer.sqs_client.receive_message.call_args.kwargs
+    assert (request["MaxNumberOfMessages"], request["WaitTimeSeconds"], request["VisibilityTimeout"]) == (4, 10, 120)
+
+
+def test_openrouter_calls_read_tokens_timeout_and_retries_per_call():
+    runtime_config.update({"max_tokens": 321, "http_timeout_seconds": 4.5, "retry_attempts": 2,
+                           "retry_wait_min": 0, "retry_wait_max": 0}, source="test")
+    with patch.object(openrouter_client.http_session, "post",
+                      side_effect=requests.ConnectionError("connection reset")) as post:
+        with pytest.raises(RetryError):
+            openrouter_client.query_openrouter([{"role": "user", "content": "hi"}], specified_model="test-retries")
+
+    assert post.call_count == 2
+    assert post.call_args.kwargs["json"]["max_tokens"] == 321
+    assert post.call_args.kwargs["timeout"] == 4.5
+
+
+def test_signal_gate_uses_the_current_thresholds():
+    signal = {"asset": "AAPL", "action": "BUY", "entry_price": 100.0, "stop_loss": 95.0, "take_profit": 112.0,
+              "confidence": 8.0, "R2R": 2.4}
+    assert check_signal(signal)["quality"]["passed"] is False  # R2R 2.4 < 2.5
+
+    runtime_config.update({"r2r_threshold": 2.0, "signal_gate_mode": "downgrade"}, source="test")
+    assert check_signal(signal)["quality"]["passed"] is True
+    runtime_config.update({"confidence_threshold": 9}, source="test")
+    assert check_signal(signal)["action"] == "WAIT"
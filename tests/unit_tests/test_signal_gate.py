@@ -0,0 +1,70 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parent.parent.parent))
+
+from trading_view_extension.services.signal_gate import (
+    check_signal, check_signals, evaluate, issue_names, LOW_R2R, STOP_WRONG_SIDE, TARGET_WRONG_SIDE,
+)
+
+
+def trade(action="BUY", entry=100.0, stop=95.0, target=115.0, confidence=8, r2r=3.0):
+    return {"asset": "AAPL", "action": action, "entry_price": entry, "stop_loss": stop, "take_profit": target,
+            "confidence": confidence, "R2R": r2r}
+
+
+def test_passing_signal_gets_computed_r2r():
+    gated = check_signal(trade(r2r=9.0), mode="downgrade")
+
+    assert gated["action"] == "BUY"
+    assert gated["R2R"] == 3.0
+    assert gated["quality"] == {"passed": True, "issues": ["r2r_mismatch"], "reported_R2R": 9.0}
+
+
+@pytest.mark.parametrize("signal, issues", [
+    (trade(stop=101), ["stop_wrong_side"]),
+    (trade(action="SELL"), ["stop_wrong_side", "target_wrong_side"]),
+    (trade(target=105, r2r=1.0), ["low_r2r"]),
+    (trade(confidence=None), ["low_confidence"]),
+    (trade(confidence=6.5), ["low_confidence"]),
+    (trade(stop=None), ["missing_prices"]),
+])
+def test_failing_signals(signal, issues):
+    flagged = check_signal(signal, mode="flag")
+    downgraded = check_signal(signal, mode="downgrade")
+
+    assert flagged["quality"]["issues"] == issues
+    assert flagged["quality"]["passed"] is False
+    assert flagged["action"] == signal["action"]
+    assert downgraded["action"] == "WAIT"
+    assert downgraded["quality"]["original_action"] == signal["action"]
+    assert signal["action"] in ("BUY", "SELL")  # The input is not modified
+
+
+def test_wait_signals_and_failed_extractions_pass_through():
+    wait = {"asset": "AAPL", "action": "WAIT", "entry_price": None, "stop_loss": None, "take_profit": None,
+            "confidence": 3, "R2R": None}
+
+    gated = check_signals([wait, None], mode="downgrade")
+
+    assert gated[0]["quality"]["passed"] is True
+    assert gated[0]["R2R"] is None
+    assert gated[1] is None
+
+
+def test_evaluate_checks_whole_columns():
+    r2r, issues = evaluate(
+        np.array(["BUY", "SELL", "SELL", "WAIT"]),
+        entry=np.array([100.0, 100.0, 100.0, np.nan]),
+        stop=np.array([98.0, 102.0, 99.0, np.nan]),
+        target=np.array([110.0, 96.0, 90.0, np.nan]),
+        confidence=np.array([9.0, 9.0, 9.0, np.nan]),
+    )
+
+    assert r2r[:2].tolist() == [5.0, 2.0]
+    assert np.isnan(r2r[2:]).all()
+    assert issues.tolist() == [0, LOW_R2R, STOP_WRONG_SIDE, 0]
+    assert issue_names(STOP_WRONG_SIDE | TARGET_WRONG_SIDE) == ["stop_wrong_side", "target_wrong_side"]
@@ -115,3 +115,66 @@ def test_replay_safe_store(mock_dependencies):
     consumer.replay_safe_store()
 
     assert '1' not in consumer.local_safe_store  # Message should be removed after successful replay
+
+
+def test_polling_loop_starts_only_what_the_concurrency_limit_allows(mock_dependencies):
+    from trading_view_extension.queue.concurrency_limiter import AimdConcurrencyLimiter
+
+    consumer = SqsQueueConsumer(mock_dependencies['publisher'], limiter=AimdConcurrencyLimiter(initial_limit=2),
+                                prefetch=8)
+    consumer.executor = MagicMock()
+
+    def receive_once(**kwargs):
+        consumer.shutdown_event.set()
+        return {'Messages': [{'MessageId': str(i), 'Body': '{}'} for i in range(5)]}
+    mock_dependencies['sqs_client'].receive_message.side_effect = receive_once
+
+    consumer._polling_loop("dummy-queue")
+    consumer._dispatch()
+
+    assert mock_dependencies['sqs_client'].receive_message.call_args.kwargs['MaxNumberOfMessages'] == 8
+    assert consumer.limiter.in_flight == 2
+    assert consumer.executor.submit.call_count == 2
+    assert len(consumer.scheduler) == 3  # The rest waits for capacity
+
+
+def test_empty_receives_without_long_polling_back_off(mock_dependencies):
+    consumer = SqsQueueConsumer(mock_dependencies['publisher'], wait_time=0)
+    mock_dependencies['sqs_client'].receive_message.return_value = {}
+    threading.Timer(0.3, consumer.shutdown_event.set).start()
+
+    consumer._polling_loop("dummy-queue")
+
+    assert mock_dependencies['sqs_client'].receive_message.call_count == 1
+
+
+def test_chat_turn_is_dispatched_before_queued_analyses(mock_dependencies):
+    from trading_view_extension.queue.concurrency_limiter import AimdConcurrencyLimiter
+
+    consumer = SqsQueueConsumer(mock_dependencies['publisher'], limiter=AimdConcurrencyLimiter(initial_limit=1))
+    consumer.executor = MagicMock()
+    bulk = [{'MessageId': f'bulk-{i}', 'Body': '{"email_id": "bulk@example.com"}'} for i in range(10)]
+    chat = {'MessageId': 'chat', 'Body': '{"email_id": "chat@example.com", "is_chat": true}'}
+    consumer._buffer("dummy-queue", bulk + [chat])
+
+    consumer._dispatch()
+
+    queue_url, submitted = consumer.executor.submit.call_args.args[1:]
+    assert queue_url == "dummy-queue" and submitted['MessageId'] == 'chat'
+
+
+def test_polling_pauses_while_a_circuit_is_open(mock_dependencies):
+    from trading_view_extension.services.circuit_breaker import get_breaker, reset_all
+
+    consumer = SqsQueueConsumer(mock_dependencies['publisher'])
+    breaker = get_breaker("openrouter:test-model")
+    try:
+        for _ in range(breaker.min_calls):
+            breaker.record(failed=True)
+        threading.Timer(0.2, consumer.shutdown_event.set).start()
+
+        consumer._polling_loop("dummy-queue")
+
+        mock_dependencies['sqs_client'].receive_message.assert_not_called()
+    finally:
+        reset_all()
@@ -163,3 +163,23 @@ async def test_publish_task_error_handling(mock_config):
         await publisher.publish_task(job)
 
     mock_config["logger"].exception.assert_called_once_with("Failed to publish message to SQS.")
+
+
+@pytest.mark.asyncio
+async def test_publish_task_uses_deterministic_deduplication_id(mock_config):
+    """
+    Tests that jobs carrying an idempotency key are published with a stable deduplication id.
+    """
+    mock_client = MagicMock()
+    mock_config["output"].client = mock_client
+    mock_config["output"].url = "output-url"
+    mock_config["input"].client = MagicMock()
+
+    publisher = SQSQueuePublisher()
+    job = {"status": "COMPLETED", "action_type": "processed", "idempotency_key": "job-1:-"}
+
+    await publisher.publish_task(dict(job))
+    await publisher.publish_task(dict(job))
+
+    first, second = [c.kwargs["MessageDeduplicationId"] for c in mock_client.send_message.call_args_list]
+    assert first == second
@@ -9,13 +9,22 @@ from trading_view_extension.database.db_utilities import (
     update_trade_signal,
     get_conversation_by_id,
     add_message,
+    remove_messages,
     add_conversation,
-    deduct_user_credits
+    deduct_user_credits,
+    get_user_credits,
+    reserve_user_credits,
+    refund_user_credits,
+    dehydrate_message,
+    rehydrate_history,
+    content_hash,
+    _content_cache,
 )
 
 # Patch the global supabase client
 @pytest.fixture(autouse=True)
 def mock_supabase():
+    _content_cache.clear()
     with patch("trading_view_extension.database.db_utilities.supabase") as mock:
         yield mock
 
@@ -67,6 +76,14 @@ def test_add_message_no_conversation(mock_supabase):
         add_message("abc", "msg")
 
 
+def test_remove_messages_keeps_the_others(mock_supabase):
+    mock_supabase.table().select().eq().limit().execute.return_value.data = [{
+        "conversation_history": [{"message_id": "s"}, {"message_id": "u"}, {"message_id": "a"}]
+    }]
+    remove_messages("abc", ["u", "a", "never-written"])
+    mock_supabase.table().update.assert_called_once_with({"conversation_history": [{"message_id": "s"}]})
+
+
 def test_add_conversation_new(mock_supabase):
     mock_supabase.table().select().eq().limit().execute.return_value.data = []
     add_conversation("job123", ["hello"], "test@example.com", "AAPL", "agentX")
@@ -103,7 +120,108 @@ def test_deduct_user_credits_split_credits(mock_supabase):
     })
 
 
+def test_get_user_credits_ignores_negative_monthly_balance(mock_supabase):
+    mock_supabase.table().select().eq().limit().execute.return_value.data = [{
+        "monthly_credits": -15,
+        "extra_credits": 40
+    }]
+    assert get_user_credits("test@example.com") == 40
+
+
 def test_deduct_user_credits_user_not_found(mock_supabase):
     mock_supabase.table().select().eq().limit().execute.return_value.data = []
     with pytest.raises(ValueError, match="No user found with email: test@example.com"):
         deduct_user_credits("test@example.com", 10)
+
+
+def test_deduct_user_credits_retries_when_the_row_changed_underneath(mock_supabase):
+    mock_supabase.table().select().eq().limit().execute.side_effect = [
+        MagicMock(data=[{"monthly_credits": 100, "extra_credits": None}]),
+        MagicMock(data=[{"monthly_credits": 90, "extra_credits": None}]),  # Another worker charged 10
+    ]
+    written = mock_supabase.table().update().eq()
+    written.eq().is_().execute.side_effect = [MagicMock(data=[]), MagicMock(data=[{}])]
+    deduct_user_credits("test@example.com", 10)
+    assert mock_supabase.table().update.call_args_list[-1].args == ({"extra_credits": 0, "monthly_credits": 80},)
+    assert written.eq.call_args_list[-1].args == ("monthly_credits", 90)
+    written.eq().is_.assert_called_with("extra_credits", "null")
+
+
+def test_reserve_user_credits_takes_extra_credits_first(mock_supabase):
+    mock_supabase.table().select().eq().limit().execute.return_value.data = [{
+        "monthly_credits": 100,
+        "extra_credits": 10
+    }]
+    assert reserve_user_credits("test@example.com", 30) == (10, 20, 80)
+    mock_supabase.table().update.assert_called_once_with({
+        "extra_credits": 0,
+        "monthly_credits": 80
+    })
+
+
+def test_reserve_user_credits_takes_nothing_the_user_cannot_spend(mock_supabase):
+    mock_supabase.table().select().eq().limit().execute.return_value.data = [{
+        "monthly_credits": -15,
+        "extra_credits": 10
+    }]
+    assert reserve_user_credits("test@example.com", 20) == (0, 0, 10)
+    mock_supabase.table().update.assert_not_called()
+
+
+def test_refund_user_credits_returns_them_where_they_came_from(mock_supabase):
+    mock_supabase.table().select().eq().limit().execute.return_value.data = [{
+        "monthly_credits": 80,
+        "extra_credits": 0
+    }]
+    refund_user_credits("test@example.com", 10, 20)
+    mock_supabase.table().update.assert_called_once_with({
+        "extra_credits": 10,
+        "monthly_credits": 100
+    })
+
+
+LONG_PROMPT = {"type": "text", "text": "Analyze the chart. " * 40}
+IMAGE_BLOCK = {"type": "image_url", "image_url": {"url": "https://example.com/chart.png"}}
+
+
+def test_dehydrate_message_externalizes_large_and_image_blocks(mock_supabase):
+    message = {"role": "user", "content": [{"type": "text", "text": "short"}, LONG_PROMPT, IMAGE_BLOCK]}
+
+    result = dehydrate_message(message)
+
+    assert result["content"][0] == {"type": "text", "text": "short"}
+    assert result["content"][1] == {"type": "content_ref", "hash": content_hash(LONG_PROMPT)}
+    assert result["content"][2] == {"type": "content_ref", "hash": content_hash(IMAGE_BLOCK)}
+    mock_supabase.table().upsert.assert_called_once()
+    assert len(mock_supabase.table().upsert.call_args[0][0]) == 2
+
+
+def test_dehydrate_message_skips_known_blocks(mock_supabase):
+    dehydrate_message({"role": "system", "content": [LONG_PROMPT]})
+    dehydrate_message({"role": "system", "content": [LONG_PROMPT]})
+    mock_supabase.table().upsert.assert_called_once()
+
+
+def test_rehydrate_history_fetches_missing_blocks_in_one_query(mock_supabase):
+    history = [
+        {"role": "system", "content": [{"type": "content_ref", "hash": content_hash(LONG_PROMPT)}]},
+        {"role": "user", "content": [{"type": "text", "text": "hi"}, {"type": "content_ref", "hash": content_hash(IMAGE_BLOCK)}]},
+    ]
+    mock_supabase.table().select().in_().execute.return_value.data = [
+        {"hash": content_hash(LONG_PROMPT), "block": LONG_PROMPT},
+        {"hash": content_hash(IMAGE_BLOCK), "block": IMAGE_BLOCK},
+    ]
+    mock_supabase.table().select().in_().execute.reset_mock()
+
+    result = rehydrate_history(history)
+
+    assert result[0]["content"] == [LONG_PROMPT]
+    assert result[1]["content"] == [{"type": "text", "text": "hi"}, IMAGE_BLOCK]
+    mock_supabase.table().select().in_().execute.assert_called_once()
+
+
+def test_rehydrate_history_without_refs_does_not_query(mock_supabase):
+    history = [{"role": "user", "content": [{"type": "text", "text": "hi"}]}]
+    mock_supabase.table().select().in_().execute.reset_mock()
+    assert rehydrate_history(history) == history
+    mock_supabase.table().select().in_().execute.assert_not_called()
@@ -0,0 +1,77 @@
+import asyncio
+import sys
+import threading
+import time
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parent.parent.parent))
+
+from trading_view_extension.orchestrators import task_executor
+
+
+class FakeRunStream:
+    """Streams the image URL back as the analysis after a delay that shrinks with the image index."""
+    active = 0
+    peak = 0
+    lock = threading.Lock()
+
+    def __init__(self, thread, event_handler, **kwargs):
+        content = thread["messages"][0]["content"]
+        self.url = content[1]["image_url"]["url"]
+        self.index = int(content[0]["text"].split("#")[1].split()[0])
+        self.event_handler = event_handler
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def until_done(self):
+        with FakeRunStream.lock:
+            FakeRunStream.active += 1
+            FakeRunStream.peak = max(FakeRunStream.peak, FakeRunStream.active)
+        time.sleep(0.05 / self.index)  # Later images finish first
+        with FakeRunStream.lock:
+            FakeRunStream.active -= 1
+        self.event_handler.on_text_delta(MagicMock(value=f" analysis of {self.url} "), None)
+
+
+@pytest.fixture
+def openai_client():
+    FakeRunStream.peak = 0
+    client = MagicMock()
+    client.beta.threads.create_and_run_stream.side_effect = FakeRunStream
+    task_executor._clients.clear()
+    with patch.object(task_executor, "OpenAI", return_value=client) as factory:
+        yield factory
+    task_executor._clients.clear()
+
+
+def test_analyze_images_runs_concurrently_in_input_order(openai_client):
+    urls = [f"https://example.com/{i}.png" for i in range(8)]
+
+    results = task_executor.analyze_images("asst", urls, "key")
+
+    assert [result["image_url"] for result in results] == urls
+    assert results[0]["analysis"] == "analysis of https://example.com/0.png"
+    assert 1 < FakeRunStream.peak <= task_executor.IMAGE_ANALYSIS_CONCURRENCY
+
+
+def test_client_is_reused_across_calls(openai_client):
+    task_executor.analyze_images("asst", ["https://example.com/a.png"], "key")
+    task_executor.analyze_images("asst", ["https://example.com/b.png"], "key")
+
+    openai_client.assert_called_once_with(api_key="key")
+
+
+@pytest.mark.asyncio
+async def test_analyze_images_async(openai_client):
+    urls = ["https://example.com/a.png", "https://example.com/b.png"]
+
+    results = await task_executor.analyze_images_async("asst", urls, "key")
+
+    assert [result["image_url"] for result in results] == urls
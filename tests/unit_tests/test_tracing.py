@@ -0,0 +1,143 @@
+import asyncio
+import json
+import os
+import pytest
+import sys
+import time
+from pathlib import Path
+
+# Add parent directory to path to allow absolute import resolution
+sys.path.append(str(Path(__file__).resolve().parent.parent.parent))
+
+from trading_view_extension.monitoring import tracing
+from trading_view_extension.monitoring.tracing import span, current_span, FileSpanExporter
+
+
+class ListExporter:
+    def __init__(self):
+        self.spans = []
+
+    def export(self, finished):
+        self.spans.append(finished)
+
+
+@pytest.fixture
+def exporter():
+    previous_rate, previous_exporter = tracing.get_sample_rate(), tracing._exporter
+    exporter = ListExporter()
+    tracing.set_exporter(exporter)
+    tracing.set_sample_rate(1.0)
+    yield exporter
+    tracing.set_exporter(previous_exporter)
+    tracing.set_sample_rate(previous_rate)
+
+
+def test_spans_propagate_across_coroutines_and_threads(exporter):
+    def blocking_call():
+        with span("supabase.add_message") as child:
+            child.set_attribute("rows", 1)
+
+    async def job():
+        with span("analyze"):
+            await asyncio.gather(asyncio.to_thread(blocking_call), asyncio.to_thread(blocking_call))
+
+    with span("sqs.process_message", message_id="m-1") as root:
+        asyncio.run(job())
+
+    by_name = {}
+    for finished in exporter.spans:
+        by_name.setdefault(finished.name, []).append(finished)
+
+    analyze = by_name["analyze"][0]
+    assert analyze.parent_id == root.span_id
+    assert [child.parent_id for child in by_name["supabase.add_message"]] == [analyze.span_id] * 2
+    assert {finished.trace_id for finished in exporter.spans} == {root.trace_id}
+    assert by_name["supabase.add_message"][0].attributes["rows"] == 1
+
+
+def test_unsampled_traces_record_nothing(exporter):
+    tracing.set_sample_rate(0.0)
+    with span("sqs.process_message") as root:
+        with span("analyze") as child:
+            child.set_attribute("ignored", True)
+    assert root.recording is False
+    assert exporter.spans == []
+
+
+def test_errors_and_counters_are_recorded(exporter):
+    with pytest.raises(ValueError):
+        with span("orchestrator.handle_job"):
+            current_span().increment("openrouter_retries")
+            current_span().increment("openrouter_retries")
+            raise ValueError("No conversation found")
+
+    finished = exporter.spans[0]
+    assert finished.attributes["openrouter_retries"] == 2
+    assert finished.attributes["error"] == "ValueError: No conversation found"
+
+
+def test_set_sample_rate_validates_range():
+    with pytest.raises(ValueError):
+        tracing.set_sample_rate(1.5)
+
+
+def test_file_exporter_writes_chrome_trace_events(tmp_path, exporter):
+    path = tmp_path / "trace.json"
+    file_exporter = FileSpanExporter(str(path), flush_interval=60)
+    tracing.set_exporter(file_exporter)
+
+    with span("sqs.process_message"):
+        with span("analyze", asset="AAPL"):
+            pass
+    file_exporter.flush()
+
+    # The file is left open-ended for appending; closing it must give valid JSON.
+    events = json.loads(path.read_text().rstrip().rstrip(",") + "]")
+    complete = [event for event in events if event["ph"] == "X"]
+    assert [event["name"] for event in complete] == ["analyze", "sqs.process_message"]
+    assert complete[0]["args"]["asset"] == "AAPL"
+    assert any(event["ph"] == "M" and event["name"] == "thread_name" for event in events)
+
+
+def test_file_exporter_rotates_at_max_bytes(tmp_path, exporter):
+    path = tmp_path / "trace.json"
+    file_exporter = FileSpanExporter(str(path), flush_interval=60, max_bytes=500, backup_count=2)
+    tracing.set_exporter(file_exporter)
+
+    for index in range(20):
+        with span("sqs.process_message", index=index):
+            pass
+        file_exporter.flush()
+
+    assert sorted(file.name for file in tmp_path.iterdir()) == ["trace.json", "trace.json.1", "trace.json.2"]
+    for file in tmp_path.iterdir():
+        events = json.loads(file.read_text().rstrip().rstrip(",") + "]")
+        assert events[0]["ph"] == "M"  # Each file names its threads
+        assert os.path.getsize(file) < 1000
+
+
+def test_exporter_survives_write_errors_and_bounds_its_buffer(tmp_path, exporter):
+    path = tmp_path / "missing" / "trace.json"
+    file_exporter = FileSpanExporter(str(path), flush_interval=0.01, buffer_size=2)
+    tracing.set_exporter(file_exporter)
+    dropped = tracing.SPANS_DROPPED._default.get()
+
+    for index in range(3):
+        with span("sqs.process_message", index=index):
+            pass
+    time.sleep(0.1)  # Several failed writes
+
+    assert tracing.SPANS_DROPPED._default.get() - dropped == 3  # One when full, the rest when the write failed
+    assert file_exporter._thread.is_alive()
+    path.parent.mkdir()
+    with span("sqs.process_message"):
+        pass
+    deadline = time.monotonic() + 5
+    while not path.exists():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_each_process_gets_a_trace_file_of_its_own():
+    assert tracing.process_trace_file("worker-1", "/var/log/traces.json") == "/var/log/traces.worker-1.json"
+    assert tracing.process_trace_file("worker-1", "traces") == "traces.worker-1"
@@ -0,0 +1,374 @@
+"""
+Backtest of stored trade signals against historical OHLC bars.
+
+Signals (one row per TradeSignal: asset, time, action, entry_price, stop_loss,
+take_profit, plus agent / model / confidence / R2R) are loaded in bulk, from
+conversations.trade_signal in Supabase or from a CSV / JSON lines / parquet export. Bars
+are read from a directory of per-asset files (AAPL.csv, ...) or a single file with an
+asset column; columns time, open, high, low, close.
+
+Fills are simulated for all signals at once with NumPy, in chunks of signals x bars:
+
+- entry: a limit order at entry_price, filled by the first bar after the signal whose
+  range touches it (within entry_bars bars, if given);
+- exit: the first bar from the entry bar on that touches the stop or the target; when
+  one bar touches both, the stop is assumed (conservative). A stop gapped through fills
+  at the bar's open. Trades still open after max_bars exit at the last close.
+
+Results are in R (multiples of the risk entry-stop). The report has, per asset, agent and
+model: signals, trades, fill rate, win rate, expectancy (mean R), total R and the
+maximum drawdown of the cumulative R curve.
+
+Usage:
+    python -m trading_view_extension.analytics.backtest --prices prices/ [--signals signals.csv]
+        [--max-bars 500] [--entry-bars 20] [--apply-thresholds] [--by asset,agent,model] [--output report.csv]
+
+Without --signals the signals are read from Supabase. --apply-thresholds keeps only the
+signals the quality gate passes (services/signal_gate.py): confidence >=
+CONFIDENCE_THRESHOLD and an R2R, computed from the prices, >= R2R_THRESHOLD.
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+sys.path.append(str(Path(__file__).resolve().parent.parent.parent))
+
+from config import CONFIDENCE_THRESHOLD, R2R_THRESHOLD
+from trading_view_extension.services.signal_gate import evaluate, price_geometry, FAILING_ISSUES, MISSING_PRICES
+
+SIGNAL_COLUMNS = ["signal_id", "asset", "agent", "model", "time", "action", "entry_price", "stop_loss",
+                  "take_profit", "confidence", "R2R"]
+PRICE_COLUMNS = ["asset", "time", "open", "high", "low", "close"]
+CHUNK_ELEMENTS = 4_000_000  # Signals x bars evaluated at once (~32 MB per float array)
+FIRST_BLOCK_BARS = 16       # Bars scanned for every signal; each following block is twice as long
+
+# Outcomes of a signal
+NO_TRADE = "no_trade"        # WAIT / EXIT or missing prices in the signal
+INVALID = "invalid"          # Stop and target on the wrong side of the entry
+NO_PRICES = "no_prices"      # No bars after the signal time
+NOT_FILLED = "not_filled"    # Entry never touched
+STOP = "stop"
+TARGET = "target"
+TIME_EXIT = "time_exit"
+
+
+def _read_table(path: Path) -> pd.DataFrame:
+    if path.suffix == ".parquet":
+        return pd.read_parquet(path)
+    if path.suffix in (".jsonl", ".json"):
+        return pd.read_json(path, lines=path.suffix == ".jsonl")
+    return pd.read_csv(path)
+
+
+def signals_from_rows(rows) -> pd.DataFrame:
+    """
+    Flatten conversation rows ({job_id, symbol, agent, created_at, trade_signal, [model]})
+    into one signal per row. trade_signal may be a dict or its JSON text.
+    """
+    records = []
+    for row in rows:
+        signal = row.get("trade_signal")
+        if isinstance(signal, str):
+            try:
+                signal = json.loads(signal)
+            except json.JSONDecodeError:
+                signal = None
+        if not isinstance(signal, dict):
+            continue
+        records.append({
+            "signal_id": row.get("job_id"),
+            "asset": signal.get("asset") or row.get("symbol"),
+            "agent": row.get("agent"),
+            "model": row.get("model") or signal.get("model"),
+            "time": row.get("created_at"),
+            "action": signal.get("action"),
+            "entry_price": signal.get("entry_price"),
+            "stop_loss": signal.get("stop_loss"),
+            "take_profit": signal.get("take_profit"),
+            "confidence": signal.get("confidence"),
+            "R2R": signal.get("R2R"),
+        })
+    return normalize_signals(pd.DataFrame(records, columns=SIGNAL_COLUMNS))
+
+
+def normalize_signals(signals: pd.DataFrame) -> pd.DataFrame:
+    signals = signals.copy()
+    for column in SIGNAL_COLUMNS:
+        if column not in signals:
+            signals[column] = None
+    if signals["signal_id"].isna().all():
+        signals["signal_id"] = np.arange(len(signals))
+    signals["asset"] = signals["asset"].astype(str).str.upper()
+    signals["agent"] = signals["agent"].fillna("unknown").astype(str)
+    signals["model"] = signals["model"].fillna("unknown").astype(str)
+    signals["action"] = signals["action"].fillna("").astype(str).str.upper()
+    signals["time"] = pd.to_datetime(signals["time"], utc=True)
+    for column in ("entry_price", "stop_loss", "take_profit", "confidence", "R2R"):
+        signals[column] = pd.to_numeric(signals[column], errors="coerce")
+    return signals
+
+
+def fetch_signals(page_size: int = 1000) -> pd.DataFrame:
+    """All stored trade signals from Supabase, read page by page."""
+    from trading_view_extension.database.db_utilities import supabase
+    rows, start = [], 0
+    while True:
+        response = supabase.table("conversations").select("job_id", "symbol", "agent", "created_at", "trade_signal") \
+            .not_.is_("trade_signal", "null").order("job_id").range(start, start + page_size - 1).execute()
+        rows.extend(response.data)
+        if len(response.data) < page_size:
+            return signals_from_rows(rows)
+        start += page_size
+
+
+def load_signals(path) -> pd.DataFrame:
+    return normalize_signals(_read_table(Path(path)))
+
+
+def load_prices(path) -> pd.DataFrame:
+    """Bars from one file with an asset column, or a directory of <ASSET>.<csv|parquet|jsonl> files."""
+    path = Path(path)
+    if path.is_dir():
+        frames = []
+        for file in sorted(path.iterdir()):
+            if file.suffix not in (".csv", ".parquet", ".jsonl", ".json"):
+                continue
+            frame = _read_table(file)
+            if "asset" not in frame:
+                frame["asset"] = file.stem
+            frames.append(frame)
+        prices = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=PRICE_COLUMNS)
+    else:
+        prices = _read_table(path)
+    prices = prices[PRICE_COLUMNS].copy()
+    prices["asset"] = prices["asset"].astype(str).str.upper()
+    prices["time"] = pd.to_datetime(prices["time"], utc=True)
+    return prices
+
+
+def apply_thresholds(signals: pd.DataFrame, min_confidence: float = CONFIDENCE_THRESHOLD,
+                     min_r2r: float = R2R_THRESHOLD) -> pd.DataFrame:
+    """Signals the quality gate passes: sane prices, confidence and the R2R computed from the prices."""
+    _, issues = evaluate(signals["action"], signals["entry_price"], signals["stop_loss"], signals["take_profit"],
+                         signals["confidence"], min_confidence=min_confidence, min_r2r=min_r2r)
+    return signals[(issues & FAILING_ISSUES) == 0]
+
+
+def _scan_block(batch, offsets, start, end, entry, stop, target, direction, entry_bars,
+                entry_k, opens, highs, lows, outcome, entry_index, exit_index, exit_price) -> np.ndarray:
+    """
+    Look for entry fills and stop/target hits of the signals in `batch` in the bars at
+    `offsets` after each signal. Records decided trades and returns which ones were decided.
+    """
+    bars = start[batch, None] + offsets[None, :]
+    in_window = bars < end[batch, None]
+    bars = np.minimum(bars, len(highs) - 1)
+    high, low = highs[bars], lows[bars]
+    e, s, t = entry[batch, None], stop[batch, None], target[batch, None]
+    longs = direction[batch, None] > 0
+
+    k = entry_k[batch]
+    touched = in_window & (k[:, None] < 0) & (low <= e) & (high >= e)
+    if entry_bars is not None:
+        touched &= offsets[None, :] < entry_bars
+    newly_filled = touched.any(axis=1)
+    k = np.where(newly_filled, offsets[0] + touched.argmax(axis=1), k)
+    entry_k[batch] = k
+
+    active = in_window & (k[:, None] >= 0) & (offsets[None, :] >= k[:, None])
+    stop_hit = active & np.where(longs, low <= s, high >= s)
+    target_hit = active & np.where(longs, high >= t, low <= t)
+    width = len(offsets)
+    stop_at = _first_true(stop_hit, width)
+    target_at = _first_true(target_hit, width)
+    stopped = (stop_at < width) & (stop_at <= target_at)  # Both in one bar: assume the stop
+    targeted = ~stopped & (target_at < width)
+
+    exit_k = offsets[0] + np.where(stopped, stop_at, target_at)
+    exit_bars = np.minimum(start[batch] + exit_k, end[batch] - 1)
+    gap_open = opens[exit_bars]
+    stops = stop[batch]
+    stop_fill = np.where(direction[batch] > 0, np.minimum(gap_open, stops), np.maximum(gap_open, stops))
+    # Only a bar after the entry bar can gap through the stop.
+    stop_fill = np.where(exit_k > k, stop_fill, stops)
+
+    decided = stopped | targeted
+    rows = batch[decided]
+    outcome[batch[stopped]] = STOP
+    outcome[batch[targeted]] = TARGET
+    entry_index[rows] = start[rows] + k[decided]
+    exit_index[rows] = exit_bars[decided]
+    exit_price[rows] = np.where(stopped, stop_fill, target[batch])[decided]
+    return decided
+
+
+def _first_true(mask: np.ndarray, default: int) -> np.ndarray:
+    """Column of the first True in each row, `default` for rows without one."""
+    return np.where(mask.any(axis=1), mask.argmax(axis=1), default)
+
+
+def simulate(signals: pd.DataFrame, prices: pd.DataFrame, max_bars: int = 500, entry_bars: int = None) -> pd.DataFrame:
+    """
+    One row per signal with its outcome, entry/exit bar times, exit price, r_multiple and
+    return_pct (r_multiple and return_pct are NaN for signals that did not trade).
+    """
+    signals = normalize_signals(signals).reset_index(drop=True)
+    prices = prices.sort_values(["asset", "time"], kind="stable").reset_index(drop=True)
+
+    n = len(signals)
+    outcome = np.full(n, NO_TRADE, dtype=object)
+    entry_index = np.full(n, -1, dtype=np.int64)
+    exit_index = np.full(n, -1, dtype=np.int64)
+    exit_price = np.full(n, np.nan)
+
+    action = signals["action"].to_numpy()
+    entry = signals["entry_price"].to_numpy(dtype=float)
+    stop = signals["stop_loss"].to_numpy(dtype=float)
+    target = signals["take_profit"].to_numpy(dtype=float)
+    direction = np.where(action == "BUY", 1.0, np.where(action == "SELL", -1.0, 0.0))
+
+    geometry = price_geometry(direction, entry, stop, target)
+    tradable = (direction != 0) & ((geometry & MISSING_PRICES) == 0)
+    valid = (direction != 0) & (geometry == 0)
+    outcome[tradable & ~valid] = INVALID
+
+    # First bar after each signal: bars are grouped by asset, so search each asset's slice.
+    asset_codes, asset_names = pd.factorize(prices["asset"], sort=False)
+    bounds = np.searchsorted(asset_codes, np.arange(len(asset_names) + 1))  # codes are ascending after the sort
+    bar_times = prices["time"].to_numpy(dtype="datetime64[ns]").view(np.int64)
+    signal_times = signals["time"].to_numpy(dtype="datetime64[ns]").view(np.int64)
+    signal_codes = pd.Index(asset_names).get_indexer(signals["asset"])
+    start = np.zeros(n, dtype=np.int64)
+    end = np.zeros(n, dtype=np.int64)
+    candidates = np.flatnonzero(valid & (signal_codes >= 0))
+    for code in np.unique(signal_codes[candidates]):
+        members = candidates[signal_codes[candidates] == code]
+        lo, hi = bounds[code], bounds[code + 1]
+        start[members] = lo + np.searchsorted(bar_times[lo:hi], signal_times[members], side="right")
+        end[members] = hi
+    has_bars = valid & (signal_codes >= 0) & (start < end)
+    outcome[valid & ~has_bars] = NO_PRICES
+
+    opens = prices["open"].to_numpy(dtype=float)
+    highs = prices["high"].to_numpy(dtype=float)
+    lows = prices["low"].to_numpy(dtype=float)
+    closes = prices["close"].to_numpy(dtype=float)
+
+    # Most trades are decided within a few bars, so bars are scanned in growing blocks and
+    # only the still undecided signals go on to the next block.
+    entry_k = np.full(n, -1, dtype=np.int64)  # Bar offset of the entry fill, -1 while not filled
+    span_bars = np.minimum(end - start, max_bars)  # Bars each signal can use
+    pending = np.flatnonzero(has_bars)
+    block_start, block_size = 0, FIRST_BLOCK_BARS
+    while len(pending) and block_start < max_bars:
+        block_end = min(max_bars, block_start + block_size)
+        offsets = np.arange(block_start, block_end)
+        chunk = max(1, CHUNK_ELEMENTS // len(offsets))
+        decided = np.zeros(n, dtype=bool)
+        for first in range(0, len(pending), chunk):
+            batch = pending[first:first + chunk]
+            decided[batch] = _scan_block(batch, offsets, start, end, entry, stop, target, direction, entry_bars,
+                                         entry_k, opens, highs, lows, outcome, entry_index, exit_index, exit_price)
+        # Signals whose bars (or entry window) ran out are decided as well.
+        exhausted = span_bars[pending] <= block_end
+        if entry_bars is not None:
+            exhausted |= (entry_k[pending] < 0) & (entry_bars <= block_end)
+        pending = pending[~decided[pending] & ~exhausted]
+        block_start, block_size = block_end, block_size * 2
+
+    undecided = has_bars & (outcome == NO_TRADE)
+    unfilled = undecided & (entry_k < 0)
+    outcome[unfilled] = NOT_FILLED
+    timed = undecided & (entry_k >= 0)
+    outcome[timed] = TIME_EXIT
+    entry_index[timed] = start[timed] + entry_k[timed]
+    exit_index[timed] = start[timed] + span_bars[timed] - 1
+    exit_price[timed] = closes[exit_index[timed]]
+
+    traded = exit_index >= 0
+    risk = np.abs(entry - stop)
+    pnl = (exit_price - entry) * direction
+    trades = signals[["signal_id", "asset", "agent", "model", "time", "action", "entry_price", "stop_loss",
+                      "take_profit", "confidence", "R2R"]].copy()
+    trades["outcome"] = outcome
+    trades["entry_time"] = _bar_times(prices, entry_index)
+    trades["exit_time"] = _bar_times(prices, exit_index)
+    trades["exit_price"] = exit_price
+    trades["r_multiple"] = np.where(traded, pnl / risk, np.nan)
+    trades["return_pct"] = np.where(traded, pnl / entry * 100, np.nan)
+    return trades
+
+
+def _bar_times(prices: pd.DataFrame, index: np.ndarray) -> pd.Series:
+    """Times of the bars at `index` (NaT where index is -1)."""
+    if not len(prices):
+        return pd.Series(pd.NaT, index=range(len(index)), dtype="datetime64[ns, UTC]")
+    return prices["time"].take(np.maximum(index, 0)).reset_index(drop=True).where(index >= 0)
+
+
+def summarize(trades: pd.DataFrame, by=("asset", "agent", "model")) -> pd.DataFrame:
+    """Win rate, expectancy (mean R), total R and max drawdown (in R) per group."""
+    by = list(by)
+    signals = trades.groupby(by, sort=True).size().rename("signals")
+    filled = trades[trades["r_multiple"].notna()].sort_values("exit_time", kind="stable")
+    if filled.empty:
+        report = signals.to_frame()
+        for column in ("trades", "fill_rate", "win_rate", "expectancy_r", "total_r", "avg_return_pct", "max_drawdown_r"):
+            report[column] = 0.0 if column in ("trades", "fill_rate") else np.nan
+        return report.reset_index()
+
+    keys = [filled[column] for column in by]
+    groups = filled.groupby(keys, sort=True)
+    equity = groups["r_multiple"].cumsum()
+    # Drawdown from the running peak of the R curve, which starts at 0.
+    peak = equity.groupby(keys).cummax().clip(lower=0)
+    drawdown = (peak - equity).groupby(keys).max()
+
+    report = pd.DataFrame({
+        "trades": groups.size(),
+        "win_rate": (filled["r_multiple"] > 0).groupby(keys).mean(),
+        "expectancy_r": groups["r_multiple"].mean(),
+        "total_r": groups["r_multiple"].sum(),
+        "avg_return_pct": groups["return_pct"].mean(),
+        "max_drawdown_r": drawdown,
+    })
+    report = signals.to_frame().join(report, how="left")
+    report["trades"] = report["trades"].fillna(0).astype(int)
+    report["fill_rate"] = report["trades"] / report["signals"]
+    columns = ["signals", "trades", "fill_rate", "win_rate", "expectancy_r", "total_r", "avg_return_pct", "max_drawdown_r"]
+    return report[columns].reset_index()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Backtest stored trade signals against OHLC bars.")
+    parser.add_argument("--prices", required=True, help="Directory of per-asset files, or one file with an asset column")
+    parser.add_argument("--signals", help="CSV / JSON lines / parquet export; defaults to Supabase")
+    parser.add_argument("--max-bars", type=int, default=500, help="Bars a trade may stay open")
+    parser.add_argument("--entry-bars", type=int, default=None, help="Bars the entry order stays open")
+    parser.add_argument("--apply-thresholds", action="store_true",
+                        help="Only signals meeting CONFIDENCE_THRESHOLD and R2R_THRESHOLD")
+    parser.add_argument("--by", default="asset,agent,model", help="Comma separated report grouping")
+    parser.add_argument("--trades", help="Also write the per-signal results to this CSV")
+    parser.add_argument("--output", help="Write the report to this CSV instead of printing it")
+    args = parser.parse_args(argv)
+
+    signals = load_signals(args.signals) if args.signals else fetch_signals()
+    if args.apply_thresholds:
+        signals = apply_thresholds(signals)
+    trades = simulate(signals, load_prices(args.prices), max_bars=args.max_bars, entry_bars=args.entry_bars)
+    report = summarize(trades, by=[column.strip() for column in args.by.split(",") if column.strip()])
+
+    if args.trades:
+        trades.to_csv(args.trades, index=False)
+    if args.output:
+        report.to_csv(args.output, index=False)
+    else:
+        print(report.to_string(index=False))
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+"""
+Incremental columnar export of completed jobs, for analytics that should not query the
+live conversations table.
+
+Workers record one row per completed job (asset, agent, model, the TradeSignal fields and
+its quality gate result, token usage, credits and per-stage seconds, see job_row) when
+JOB_EXPORT_SPOOL_DIR is set. Recording only appends to an in-memory buffer; a daemon
+thread appends the buffered rows once a second to an hourly spool file per process,
+jobs-<YYYYMMDDHH>-<pid>.jsonl.
+
+The exporter turns the spool into a parquet dataset partitioned by day:
+
+    <JOB_EXPORT_DIR>/date=2026-10-19/part-jobs-2026101914-4242-000000081920.parquet
+
+The watermark (<JOB_EXPORT_DIR>/_watermark.json) holds the byte offset up to which each
+spool file was exported, so a run only reads the lines added since the last one and
+writes them in one file per day. File names derive from the spool file and the start
+offset, so a run that crashed before saving the watermark is repeated by overwriting the
+same files. Spool files more than an hour old are deleted once fully exported. Run one
+exporter per spool directory: the worker does when JOB_EXPORT_DIR is set as well.
+
+Usage:
+    python -m trading_view_extension.analytics.job_export [--spool spool/] [--output export/]
+        [--interval 300]
+
+Without --interval the spool is exported once. read_export() loads a date range back:
+
+    jobs = read_export("export/", start="2026-09-01", end="2026-09-30")
+
+Writing parquet needs pyarrow.
+"""
+import argparse
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent.parent))
+
+from config import logger, JOB_EXPORT_SPOOL_DIR, JOB_EXPORT_DIR, JOB_EXPORT_INTERVAL
+from trading_view_extension.monitoring.metrics import JOB_EXPORT_ROWS, JOB_EXPORT_SECONDS
+
+SPOOL_FLUSH_INTERVAL = 1.0
+SPOOL_PATTERN = "jobs-*.jsonl"
+WATERMARK_FILE = "_watermark.json"
+SIGNAL_FIELDS = ("action", "entry_price", "stop_loss", "take_profit", "confidence", "R2R")
+
+
+def _hour(timestamp: float) -> str:
+    return time.strftime("%Y%m%d%H", time.gmtime(timestamp))
+
+
+def job_row(job: dict, telemetry=None) -> dict:
+    """The exported row of a finished job; telemetry is its JobTelemetry, if collected."""
+    signal = job.get("result") if isinstance(job.get("result"), dict) else {}
+    models = telemetry.models if telemetry is not None else []
+    row = {
+        "completed_at": datetime.now(timezone.utc).isoformat(),
+        "job_id": job.get("job_id"),
+        "batch_id": job.get("batch_id"),
+        "job_type": job.get("job_type", "analysis"),
+        "status": job.get("status"),
+        "asset": job.get("asset") or signal.get("asset"),
+        "agent": job.get("agent"),
+        "model": models[0] if models else None,
+        "models": ",".join(models) or None,
+    }
+    for field in SIGNAL_FIELDS:
+        row[field] = signal.get(field)
+    row["gate_passed"] = (signal.get("quality") or {}).get("passed")
+    row["credits_used"] = job.get("credits_used")
+    if telemetry is not None:
+        row["prompt_tokens"] = telemetry.prompt_tokens
+        row["completion_tokens"] = telemetry.completion_tokens
+        row["model_calls"] = telemetry.model_calls
+        for name, seconds in telemetry.stages.items():
+            row[f"{name}_seconds"] = round(seconds, 4)
+    return row
+
+
+class JobSpool:
+    """Buffers job rows and appends them to the spool from a daemon thread."""
+
+    def __init__(self, directory: str = JOB_EXPORT_SPOOL_DIR, flush_interval: float = SPOOL_FLUSH_INTERVAL):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.flush_interval = flush_interval
+        self._buffer = deque()
+        self._write_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="job-spool", daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def record(self, job: dict, telemetry=None) -> None:
+        # deque.append is thread safe, so recording never waits for the file.
+        self._buffer.append(job_row(job, telemetry))
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.warning("Could not write the job spool: %s", e)
+
+    def flush(self) -> None:
+        with self._write_lock:
+            if not self._buffer:
+                return
+            lines = []
+            while self._buffer:
+                lines.append(json.dumps(self._buffer.popleft(), default=str))
+            path = self.directory / f"jobs-{_hour(time.time())}-{os.getpid()}.jsonl"
+            with open(path, "a", encoding="utf-8") as spool_file:
+                spool_file.write("\n".join(lines) + "\n")
+
+
+def _load_watermark(output: Path) -> dict:
+    try:
+        with open(output / WATERMARK_FILE, encoding="utf-8") as watermark_file:
+            return json.load(watermark_file)
+    except FileNotFoundError:
+        return {"offsets": {}}
+
+
+def _save_watermark(output: Path, watermark: dict) -> None:
+    temporary = output / (WATERMARK_FILE + ".tmp")
+    with open(temporary, "w", encoding="utf-8") as watermark_file:
+        json.dump(watermark, watermark_file, indent=1, sort_keys=True)
+    os.replace(temporary, output / WATERMARK_FILE)
+
+
+def _write_partitions(rows: list, output: Path, name: str) -> None:
+    import pandas as pd  # Only the exporter needs pandas; workers just append to the spool.
+    frame = pd.DataFrame(rows)
+    frame["completed_at"] = pd.to_datetime(frame["completed_at"], utc=True, format="ISO8601")
+    for date, part in frame.groupby(frame["completed_at"].dt.strftime("%Y-%m-%d")):
+        directory = output / f"date={date}"
+        directory.mkdir(parents=True, exist_ok=True)
+        target = directory / f"part-{name}.parquet"
+        temporary = directory / f".part-{name}.tmp"
+        part.to_parquet(temporary, index=False)
+        os.replace(temporary, target)
+
+
+def export_spool(spool_dir: str = JOB_EXPORT_SPOOL_DIR, output_dir: str = JOB_EXPORT_DIR) -> int:
+    """Export the spool lines added since the last run; returns the number of rows written."""
+    spool, output = Path(spool_dir), Path(output_dir)
+    output.mkdir(parents=True, exist_ok=True)
+    watermark = _load_watermark(output)
+    offsets = watermark.setdefault("offsets", {})
+    expired = _hour(time.time() - 3600)
+    written = 0
+
+    paths = sorted(spool.glob(SPOOL_PATTERN))
+    for path in paths:
+        start = offsets.get(path.name, 0)
+        with open(path, "rb") as spool_file:
+            spool_file.seek(start)
+            data = spool_file.read()
+        # A line the spool is still writing waits for the next run.
+        end = data.rfind(b"\n") + 1
+        if end:
+            rows = [json.loads(line) for line in data[:end].splitlines() if line.strip()]
+            if rows:
+                _write_partitions(rows, output, f"{path.stem}-{start:012d}")
+                written += len(rows)
+            offsets[path.name] = start + end
+            _save_watermark(output, watermark)
+        if path.stem.split("-")[1] < expired and end == len(data):
+            path.unlink()
+            offsets.pop(path.name, None)
+
+    names = {path.name for path in paths if path.exists()}
+    for name in list(offsets):
+        if name not in names:
+            del offsets[name]
+    _save_watermark(output, watermark)
+    JOB_EXPORT_ROWS.inc(written)
+    return written
+
+
+def read_export(output_dir: str = JOB_EXPORT_DIR, start: str = None, end: str = None):
+    """Exported rows of the days start..end (YYYY-MM-DD, inclusive; open ended when None) as a DataFrame."""
+    import pandas as pd
+    frames = []
+    for directory in sorted(Path(output_dir).glob("date=*")):
+        date = directory.name.split("=", 1)[1]
+        if (start and date < start) or (end and date > end):
+            continue
+        frames.extend(pd.read_parquet(file) for file in sorted(directory.glob("*.parquet")))
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+
+class JobExporter:
+    """Runs export_spool every `interval` seconds in a daemon thread."""
+
+    def __init__(self, spool_dir: str = JOB_EXPORT_SPOOL_DIR, output_dir: str = JOB_EXPORT_DIR,
+                 interval: float = JOB_EXPORT_INTERVAL):
+        self.spool_dir = spool_dir
+        self.output_dir = output_dir
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def run_once(self) -> int:
+        with JOB_EXPORT_SECONDS.time():
+            written = export_spool(self.spool_dir, self.output_dir)
+        if written:
+            logger.info("Exported %d job rows to %s", written, self.output_dir)
+        return written
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error("Job export failed: %s", e)
+
+    def start(self) -> "JobExporter":
+        self._thread = threading.Thread(target=self._run, name="job-exporter", daemon=True)
+        self._thread.start()
+        logger.info("Exporting %s to %s every %.0fs", self.spool_dir, self.output_dir, self.interval)
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export spooled job rows to a partitioned parquet dataset.")
+    parser.add_argument("--spool", default=JOB_EXPORT_SPOOL_DIR, help="Spool directory (JOB_EXPORT_SPOOL_DIR)")
+    parser.add_argument("--output", default=JOB_EXPORT_DIR, help="Dataset directory (JOB_EXPORT_DIR)")
+    parser.add_argument("--interval", type=float, default=None, help="Keep exporting every this many seconds")
+    args = parser.parse_args(argv)
+    if not args.spool or not args.output:
+        parser.error("--spool and --output are required when JOB_EXPORT_SPOOL_DIR / JOB_EXPORT_DIR are not set")
+
+    exporter = JobExporter(args.spool, args.output, args.interval or 0)
+    written = exporter.run_once()
+    while args.interval:
+        time.sleep(args.interval)
+        written += exporter.run_once()
+    print(f"Exported {written} rows to {args.output}")
+    return written
+
+
+if __name__ == "__main__":
+    main()
@@ -1,81 +1,339 @@
-from supabase import create_client, Client
+import hashlib
 import json
 import os
+import threading
+import time
+from functools import wraps
+from cachetools import LRUCache
 from dotenv import load_dotenv
+from trading_view_extension.monitoring.metrics import SUPABASE_CALL_SECONDS, SUPABASE_ERRORS
+from trading_view_extension.monitoring.tracing import span, current_span
+from trading_view_extension.services.circuit_breaker import get_breaker
+from trading_view_extension.services.client_registry import registry
+from trading_view_extension.services.job_errors import PermanentJobError
 load_dotenv()
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 
+
+def _build_supabase_client():
+    # Imported on first use: supabase and its HTTP stack take longer to import than the rest of the worker.
+    from supabase import create_client
+    return create_client(SUPABASE_URL, SUPABASE_KEY)
+
+
+def _warm_supabase_client(client):
+    client.table("users").select("email_id").limit(1).execute()
+
+
+supabase = registry.lazy("supabase", _build_supabase_client, warm=_warm_supabase_client)
+
+
+def _is_supabase_failure(error: Exception) -> bool:
+    # Helpers raise ValueError for missing rows; that says nothing about Supabase's health.
+    return not isinstance(error, ValueError)
+
+
+def _instrumented(function):
+    """
+    Record latency, failures and a trace span of a Supabase helper under its function name.
+    Calls go through the "supabase" circuit breaker, so an outage fails fast with CircuitOpen.
+    """
+    latency = SUPABASE_CALL_SECONDS.labels(call=function.__name__)
+    errors = SUPABASE_ERRORS.labels(call=function.__name__)
+    span_name = f"supabase.{function.__name__}"
+    breaker = get_breaker("supabase")
+
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            with span(span_name), breaker.guard(_is_supabase_failure):
+                return function(*args, **kwargs)
+        except Exception:
+            errors.inc()
+            raise
+        finally:
+            latency.observe(time.perf_counter() - started)
+    return wrapper
+
+# --------------------------
+# Content-addressed message storage
+# --------------------------
+# Large text blocks (system prompts, long answers) and image blocks are stored once in
+# CONTENT_TABLE keyed by their sha256 and referenced from conversation_history as
+# {"type": "content_ref", "hash": ...}. Blocks are immutable, so they are safe to cache.
+CONTENT_TABLE = "message_contents"
+CONTENT_REF_TYPE = "content_ref"
+CONTENT_INLINE_LIMIT = int(os.getenv("CONTENT_INLINE_LIMIT", 256))
+CONTENT_CACHE_SIZE = int(os.getenv("CONTENT_CACHE_SIZE", 2048))
+
+_content_cache = LRUCache(maxsize=CONTENT_CACHE_SIZE)
+_content_cache_lock = threading.Lock()
+
+
+def content_hash(block: dict) -> str:
+    canonical = json.dumps(block, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def _should_externalize(block) -> bool:
+    if not isinstance(block, dict):
+        return False
+    if block.get("type") == "image_url":
+        return True
+    return block.get("type") == "text" and len(block.get("text") or "") >= CONTENT_INLINE_LIMIT
+
+
+def _is_content_ref(block) -> bool:
+    return isinstance(block, dict) and block.get("type") == CONTENT_REF_TYPE
+
+
+def dehydrate_message(message, store: bool = True):
+    """
+    Move large or repeated content blocks of a message into the content table.
+
+    Returns a copy of the message whose externalized blocks are replaced by content refs.
+    Blocks already known to this process are not written again. With store=False the
+    refs are computed without writing anything.
+    """
+    if not isinstance(message, dict) or not isinstance(message.get("content"), list):
+        return message
+
+    content = []
+    pending = {}
+    for block in message["content"]:
+        if not _should_externalize(block):
+            content.append(block)
+            continue
+        digest = content_hash(block)
+        with _content_cache_lock:
+            known = digest in _content_cache
+        if not known:
+            pending[digest] = block
+        content.append({"type": CONTENT_REF_TYPE, "hash": digest})
+
+    if pending and store:
+        supabase.table(CONTENT_TABLE).upsert(
+            [{"hash": digest, "block": block} for digest, block in pending.items()],
+            on_conflict="hash",
+            ignore_duplicates=True,
+        ).execute()
+        with _content_cache_lock:
+            _content_cache.update(pending)
+
+    return {**message, "content": content}
+
+
+def rehydrate_history(conversation_history):
+    """
+    Replace content refs in a conversation history with the stored blocks.
+    All refs missing from the local cache are fetched with a single query.
+    """
+    digests = {
+        block["hash"]
+        for message in conversation_history if isinstance(message, dict)
+        for block in (message.get("content") if isinstance(message.get("content"), list) else [])
+        if _is_content_ref(block)
+    }
+    if not digests:
+        return conversation_history
+
+    blocks = {}
+    with _content_cache_lock:
+        for digest in digests:
+            if digest in _content_cache:
+                blocks[digest] = _content_cache[digest]
+
+    missing = [digest for digest in digests if digest not in blocks]
+    if missing:
+        response = supabase.table(CONTENT_TABLE).select("hash", "block").in_("hash", missing).execute()
+        fetched = {row["hash"]: row["block"] for row in response.data}
+        with _content_cache_lock:
+            _content_cache.update(fetched)
+        blocks.update(fetched)
+
+    rehydrated = []
+    for message in conversation_history:
+        if not isinstance(message, dict) or not isinstance(message.get("content"), list):
+            rehydrated.append(message)
+            continue
+        content = []
+        for block in message["content"]:
+            if _is_content_ref(block):
+                if block["hash"] not in blocks:
+                    raise ValueError(f"Missing content block {block['hash']}")
+                block = blocks[block["hash"]]
+            content.append(block)
+        rehydrated.append({**message, "content": content})
+    return rehydrated
+
+
+@_instrumented
 def conversation_exists(job_id):
     response = supabase.table("conversations").select("job_id").eq("job_id", job_id).limit(1).execute()
     return len(response.data) > 0
 
+@_instrumented
 def update_trade_signal(job_id, trade_signal):
     if conversation_exists(job_id):
         supabase.table("conversations").update({
             "trade_signal": trade_signal
         }).eq("job_id", job_id).execute()
 
+@_instrumented
 def get_conversation_by_id(job_id):
     response = supabase.table("conversations").select("conversation_history").eq("job_id", job_id).limit(1).execute()
 
     if not response.data:
-        raise ValueError(f"No conversation found for job_id {job_id}")
+        raise PermanentJobError("conversation_not_found", f"No conversation found for job_id {job_id}")
 
-    return response.data[0]["conversation_history"]
+    conversation_history = response.data[0]["conversation_history"]
+    current_span().set_attribute("history_messages", len(conversation_history))
+    return rehydrate_history(conversation_history)
 
+@_instrumented
 def add_message(job_id, new_message):
     response = supabase.table("conversations").select("conversation_history").eq("job_id", job_id).limit(1).execute()
 
     if not response.data:
-        raise ValueError(f"No conversation found for job_id {job_id}")
+        raise PermanentJobError("conversation_not_found", f"No conversation found for job_id {job_id}")
 
     conversation_history = response.data[0]["conversation_history"]
-    conversation_history.append(new_message)
+    conversation_history.append(dehydrate_message(new_message))
+    current_span().set_attribute("history_messages", len(conversation_history))
 
     supabase.table("conversations").update({
         "conversation_history": conversation_history
     }).eq("job_id", job_id).execute()
 
+@_instrumented
+def remove_messages(job_id, message_ids):
+    """Take the messages with these ids out of a conversation again; missing ones are ignored."""
+    response = supabase.table("conversations").select("conversation_history").eq("job_id", job_id).limit(1).execute()
+
+    if not response.data:
+        return
+
+    conversation_history = response.data[0]["conversation_history"]
+    kept = [message for message in conversation_history
+            if not (isinstance(message, dict) and message.get("message_id") in message_ids)]
+    if len(kept) == len(conversation_history):
+        return
+
+    supabase.table("conversations").update({
+        "conversation_history": kept
+    }).eq("job_id", job_id).execute()
+
+@_instrumented
 def add_conversation(job_id, conversation_history, user_email, symbol, agent):
     if conversation_exists(job_id):
         return
 
     supabase.table("conversations").insert({
         "job_id": job_id,
-        "conversation_history": conversation_history,
+        "conversation_history": [dehydrate_message(message) for message in conversation_history],
         "user_email": user_email,
         "symbol": symbol,
         "agent": agent
     }).execute()
 
-def deduct_user_credits(email: str, amount: int):
-    # Fetch user by email
+# --------------------------
+# User credits
+# --------------------------
+# Several workers charge and reserve the same user's credits at once, so every change is a
+# conditional update: it only applies if the row still holds the values it was computed
+# from, and is recomputed from a fresh read otherwise.
+CREDIT_UPDATE_ATTEMPTS = int(os.getenv("CREDIT_UPDATE_ATTEMPTS", 5))
+
+
+def _read_credits(email: str):
     response = supabase.table("users").select("monthly_credits", "extra_credits").eq("email_id", email).limit(1).execute()
 
     if not response.data:
         raise ValueError(f"No user found with email: {email}")
 
-    user = response.data[0]
-    monthly_credits = int(user.get("monthly_credits", 0))
-    extra_credits = int(user.get("extra_credits") or 0)
-
-    # Deduction logic using integers only
-    to_deduct = amount
-
-    if extra_credits >= to_deduct:
-        extra_credits -= to_deduct
-        to_deduct = 0
-    else:
-        to_deduct -= extra_credits
-        extra_credits = 0
-        monthly_credits -= to_deduct  # can go negative
-
-    # Update in DB
-    supabase.table("users").update({
-        "extra_credits": extra_credits,
-        "monthly_credits": monthly_credits
-    }).eq("email_id", email).execute()
+    return response.data[0]
+
+
+def _matching(query, column, value):
+    return query.is_(column, "null") if value is None else query.eq(column, value)
+
+
+def _update_credits(email: str, change):
+    """
+    Apply change(monthly, extra) -> (monthly, extra) to a user's credits atomically.
+    Returns the credits written, or the current ones when change returns None.
+    """
+    for _ in range(CREDIT_UPDATE_ATTEMPTS):
+        user = _read_credits(email)
+        monthly_credits = int(user.get("monthly_credits") or 0)
+        extra_credits = int(user.get("extra_credits") or 0)
+        changed = change(monthly_credits, extra_credits)
+        if changed is None:
+            return monthly_credits, extra_credits
+
+        query = supabase.table("users").update({
+            "extra_credits": changed[1],
+            "monthly_credits": changed[0]
+        }).eq("email_id", email)
+        query = _matching(query, "monthly_credits", user.get("monthly_credits"))
+        query = _matching(query, "extra_credits", user.get("extra_credits"))
+        if query.execute().data:
+            return changed
+    raise RuntimeError(f"Credits of {email} kept changing, gave up after {CREDIT_UPDATE_ATTEMPTS} attempts")
+
+
+def _spendable(monthly_credits: int, extra_credits: int) -> int:
+    return max(monthly_credits, 0) + extra_credits
+
+
+@_instrumented
+def get_user_credits(email: str) -> int:
+    """Spendable credits of a user: extra credits plus what is left of the monthly allowance."""
+    user = _read_credits(email)
+    return _spendable(int(user.get("monthly_credits") or 0), int(user.get("extra_credits") or 0))
+
+@_instrumented
+def reserve_user_credits(email: str, amount: int):
+    """
+    Take amount credits (extra credits first) if the user can spend them, never going negative.
+    Returns (taken from extra, taken from monthly, credits left); nothing is taken when they cannot.
+    """
+    taken = []
+
+    def reserve(monthly_credits, extra_credits):
+        taken.clear()
+        if amount > _spendable(monthly_credits, extra_credits):
+            return None
+        from_extra = min(extra_credits, amount)
+        taken.extend((from_extra, amount - from_extra))
+        return monthly_credits - taken[1], extra_credits - from_extra
+
+    monthly_credits, extra_credits = _update_credits(email, reserve)
+    from_extra, from_monthly = taken or (0, 0)
+    return from_extra, from_monthly, _spendable(monthly_credits, extra_credits)
+
+@_instrumented
+def refund_user_credits(email: str, from_extra: int, from_monthly: int):
+    """Give back credits taken by reserve_user_credits to the balances they came from."""
+    _update_credits(email, lambda monthly_credits, extra_credits: (monthly_credits + from_monthly, extra_credits + from_extra))
+
+@_instrumented
+def deduct_user_credits(email: str, amount: int):
+    def deduct(monthly_credits, extra_credits):
+        # Deduction logic using integers only
+        to_deduct = amount
+
+        if extra_credits >= to_deduct:
+            extra_credits -= to_deduct
+            to_deduct = 0
+        else:
+            to_deduct -= extra_credits
+            extra_credits = 0
+            monthly_credits -= to_deduct  # can go negative
+        return monthly_credits, extra_credits
+
+    monthly_credits, extra_credits = _update_credits(email, deduct)
 
     print(f"[{email}] - {amount} credits → extra: {extra_credits}, monthly: {monthly_credits}")
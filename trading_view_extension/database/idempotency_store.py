@@ -0,0 +1,147 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from cachetools import TTLCache
+from dotenv import load_dotenv
+from trading_view_extension.database import db_utilities
+load_dotenv()
+
+# "local" keeps records in process memory, "supabase" also shares them through the
+# job_executions table so duplicates are caught across workers:
+#
+#     create table if not exists job_executions (
+#         key text primary key,
+#         state text not null,
+#         result jsonb,
+#         updated_at timestamptz not null default now()
+#     );
+IDEMPOTENCY_BACKEND = os.getenv("IDEMPOTENCY_BACKEND", "local").lower()
+IDEMPOTENCY_TABLE = "job_executions"
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", 24 * 3600))
+IDEMPOTENCY_MAX_ENTRIES = int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", 10000))
+# An IN_PROGRESS claim older than this is considered abandoned (matches the SQS visibility timeout).
+IDEMPOTENCY_LEASE_SECONDS = int(os.getenv("IDEMPOTENCY_LEASE_SECONDS", 300))
+
+IN_PROGRESS = "IN_PROGRESS"
+COMPLETED = "COMPLETED"
+
+
+# Job fields that change between deliveries of the same turn (set when a job is deferred).
+_DELIVERY_FIELDS = ("deferrals",)
+
+
+def make_key(job_id, message_id=None, job: dict = None) -> str:
+    """
+    Idempotency key of one unit of work: the job plus the chat turn (message_id) it answers.
+    A chat turn sent without a message_id is keyed by a hash of its body instead, so each
+    follow-up is its own unit of work while a redelivery of the same message is still one.
+    """
+    if message_id:
+        return f"{job_id}:{message_id}"
+    if job is not None and job.get("is_chat"):
+        body = {field: value for field, value in job.items() if field not in _DELIVERY_FIELDS}
+        digest = hashlib.sha256(json.dumps(body, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+        return f"{job_id}:body-{digest[:16]}"
+    return f"{job_id}:-"
+
+
+def deduplication_id(key: str, status: str) -> str:
+    """Deterministic SQS MessageDeduplicationId for the message published with this status."""
+    return hashlib.sha256(f"{key}:{status}".encode("utf-8")).hexdigest()
+
+
+class IdempotencyStore:
+    """
+    Records the completion state and result of every (job_id, message_id).
+
+    Usage:
+        record = store.claim(key)
+        if record is None:      # we own the work
+            ... process ...
+            store.complete(key, result)   # or store.release(key) on failure
+        elif record["state"] == COMPLETED:
+            return record["result"]
+    """
+
+    def __init__(self, backend: str = IDEMPOTENCY_BACKEND, ttl_seconds: int = IDEMPOTENCY_TTL_SECONDS,
+                 lease_seconds: int = IDEMPOTENCY_LEASE_SECONDS, max_entries: int = IDEMPOTENCY_MAX_ENTRIES):
+        self.use_database = backend == "supabase"
+        self.lease_seconds = lease_seconds
+        self._records = TTLCache(maxsize=max_entries, ttl=ttl_seconds)
+        self._lock = threading.Lock()
+
+    def claim(self, key: str):
+        """
+        Try to take ownership of key. Returns None when the caller now owns the work,
+        otherwise the existing record ({"state": ..., "result": ...}).
+        """
+        now = time.time()
+        with self._lock:
+            record = self._records.get(key)
+            if record is not None and not self._is_stale(record, now):
+                return record
+            self._records[key] = {"state": IN_PROGRESS, "result": None, "updated_at": now}
+
+        if self.use_database:
+            record = self._claim_in_database(key, now)
+            if record is not None:
+                with self._lock:
+                    if record["state"] == COMPLETED:
+                        self._records[key] = record
+                    else:
+                        self._records.pop(key, None)
+                return record
+        return None
+
+    def complete(self, key: str, result) -> None:
+        record = {"state": COMPLETED, "result": result, "updated_at": time.time()}
+        with self._lock:
+            self._records[key] = record
+        if self.use_database:
+            db_utilities.supabase.table(IDEMPOTENCY_TABLE).update({
+                "state": COMPLETED,
+                "result": json.loads(json.dumps(result, default=str)),
+                "updated_at": datetime.now(timezone.utc).isoformat(),
+            }).eq("key", key).execute()
+
+    def release(self, key: str) -> None:
+        """Drop an IN_PROGRESS claim so a retry can run the job again."""
+        with self._lock:
+            record = self._records.get(key)
+            if record is not None and record["state"] == IN_PROGRESS:
+                self._records.pop(key, None)
+        if self.use_database:
+            db_utilities.supabase.table(IDEMPOTENCY_TABLE).delete() \
+                .eq("key", key).eq("state", IN_PROGRESS).execute()
+
+    def get(self, key: str):
+        with self._lock:
+            return self._records.get(key)
+
+    def _is_stale(self, record, now) -> bool:
+        return record["state"] == IN_PROGRESS and now - record["updated_at"] > self.lease_seconds
+
+    def _claim_in_database(self, key: str, now: float):
+        table = db_utilities.supabase.table(IDEMPOTENCY_TABLE)
+        inserted = table.upsert(
+            {"key": key, "state": IN_PROGRESS, "updated_at": datetime.now(timezone.utc).isoformat()},
+            on_conflict="key",
+            ignore_duplicates=True,
+        ).execute()
+        if inserted.data:
+            return None
+
+        response = table.select("state", "result", "updated_at").eq("key", key).limit(1).execute()
+        if not response.data:
+            return None
+        row = response.data[0]
+        updated_at = datetime.fromisoformat(row["updated_at"]).timestamp()
+        record = {"state": row["state"], "result": row.get("result"), "updated_at": updated_at}
+        if self._is_stale(record, now):
+            # Abandoned by a crashed worker: take it over.
+            table.update({"updated_at": datetime.now(timezone.utc).isoformat()}).eq("key", key).execute()
+            return None
+        return record
@@ -0,0 +1,131 @@
+"""
+Migrates existing conversation rows to content-addressed message storage.
+
+Every message in conversations.conversation_history is passed through dehydrate_message,
+so large text blocks and image blocks move into the message_contents table and the row
+keeps only {"type": "content_ref", "hash": ...} references. Rows that are already
+migrated are left untouched.
+
+The content table must exist before running the migration:
+
+    create table if not exists message_contents (
+        hash text primary key,
+        block jsonb not null,
+        created_at timestamptz not null default now()
+    );
+
+Usage:
+    python -m trading_view_extension.database.migrate_content_store [--dry-run] [--page-size 200]
+                                                                     [--sample 20] [--report report.json]
+
+The report contains total/average row size before and after, and read latency of
+get_conversation_by_id for a sample of rows measured before and after the migration.
+"""
+import argparse
+import json
+import statistics
+import sys
+import time
+from itertools import islice
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent.parent))
+from trading_view_extension.database import db_utilities
+from trading_view_extension.database.db_utilities import supabase, dehydrate_message, get_conversation_by_id
+
+
+def _row_size(conversation_history) -> int:
+    return len(json.dumps(conversation_history, separators=(",", ":")).encode("utf-8"))
+
+
+def _iter_conversations(page_size: int):
+    start = 0
+    while True:
+        response = supabase.table("conversations").select("job_id", "conversation_history") \
+            .order("job_id").range(start, start + page_size - 1).execute()
+        if not response.data:
+            return
+        yield from response.data
+        if len(response.data) < page_size:
+            return
+        start += page_size
+
+
+def _measure_reads(job_ids) -> dict:
+    timings = []
+    for job_id in job_ids:
+        started = time.perf_counter()
+        get_conversation_by_id(job_id)
+        timings.append((time.perf_counter() - started) * 1000)
+    if not timings:
+        return {"samples": 0}
+    return {
+        "samples": len(timings),
+        "mean_ms": round(statistics.mean(timings), 3),
+        "median_ms": round(statistics.median(timings), 3),
+        "max_ms": round(max(timings), 3),
+    }
+
+
+def migrate(page_size: int = 200, dry_run: bool = False, sample: int = 20) -> dict:
+    rows = before_bytes = after_bytes = migrated = 0
+    sample_ids = []
+
+    for row in _iter_conversations(page_size):
+        rows += 1
+        history = row.get("conversation_history") or []
+        if len(sample_ids) < sample:
+            sample_ids.append(row["job_id"])
+
+        dehydrated = [dehydrate_message(message, store=not dry_run) for message in history]
+        before_bytes += _row_size(history)
+        after_bytes += _row_size(dehydrated)
+
+        if dehydrated != history:
+            migrated += 1
+            if not dry_run:
+                supabase.table("conversations").update({
+                    "conversation_history": dehydrated
+                }).eq("job_id", row["job_id"]).execute()
+
+    return {
+        "rows": rows,
+        "rows_migrated": migrated,
+        "dry_run": dry_run,
+        "bytes_before": before_bytes,
+        "bytes_after": after_bytes,
+        "avg_row_bytes_before": round(before_bytes / rows) if rows else 0,
+        "avg_row_bytes_after": round(after_bytes / rows) if rows else 0,
+        "sample_job_ids": sample_ids,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Migrate conversation rows to content-addressed storage.")
+    parser.add_argument("--page-size", type=int, default=200)
+    parser.add_argument("--sample", type=int, default=20, help="Rows used for read latency measurement")
+    parser.add_argument("--dry-run", action="store_true", help="Only measure, do not rewrite rows")
+    parser.add_argument("--report", help="Write the JSON report to this path")
+    args = parser.parse_args(argv)
+
+    # The migration samples the first rows it visits, so measure the same rows beforehand.
+    first_rows = islice(_iter_conversations(max(args.sample, 1)), args.sample)
+    read_before = _measure_reads([row["job_id"] for row in first_rows])
+
+    report = migrate(page_size=args.page_size, dry_run=args.dry_run, sample=args.sample)
+
+    # Drop cached blocks so the "after" reads pay for the bulk rehydration query.
+    with db_utilities._content_cache_lock:
+        db_utilities._content_cache.clear()
+    report["read_latency_before"] = read_before
+    report["read_latency_after"] = _measure_reads(report["sample_job_ids"])
+
+    output = json.dumps(report, indent=2)
+    if args.report:
+        Path(args.report).write_text(output)
+    print(output)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Per-job usage and stage timings, for the job export (analytics/job_export.py).
+
+collect_telemetry() opens a fresh record for a job; like the tracing span it lives in a
+contextvar, so model calls and stages running in asyncio.to_thread add to the record of
+the job that started them without it being passed around. Outside collect_telemetry()
+the helpers do nothing.
+
+Usage:
+    with collect_telemetry() as telemetry:
+        with stage("analyze"):
+            ...
+        telemetry.stages["total"]
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+
+class JobTelemetry:
+    __slots__ = ("prompt_tokens", "completion_tokens", "model_calls", "models", "stages")
+
+    def __init__(self):
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.model_calls = 0
+        self.models = []  # In order of first use; the first one is the analysis model
+        self.stages = {}  # Stage name -> seconds, summed over repeated stages
+
+    def add_usage(self, model: str, usage: dict, seconds: float) -> None:
+        self.prompt_tokens += (usage or {}).get("prompt_tokens") or 0
+        self.completion_tokens += (usage or {}).get("completion_tokens") or 0
+        self.model_calls += 1
+        if model not in self.models:
+            self.models.append(model)
+        self.add_stage("openrouter", seconds)
+
+    def add_stage(self, name: str, seconds: float) -> None:
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+
+_current: ContextVar = ContextVar("job_telemetry", default=None)
+
+
+@contextmanager
+def collect_telemetry():
+    telemetry = JobTelemetry()
+    token = _current.set(telemetry)
+    started = time.perf_counter()
+    try:
+        yield telemetry
+    finally:
+        telemetry.stages["total"] = time.perf_counter() - started
+        _current.reset(token)
+
+
+def current_telemetry():
+    """The record of the running job, or None."""
+    return _current.get()
+
+
+def add_usage(model: str, usage: dict, seconds: float) -> None:
+    telemetry = _current.get()
+    if telemetry is not None:
+        telemetry.add_usage(model, usage, seconds)
+
+
+@contextmanager
+def stage(name: str):
+    telemetry = _current.get()
+    if telemetry is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        telemetry.add_stage(name, time.perf_counter() - started)
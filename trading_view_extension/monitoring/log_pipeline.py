@@ -0,0 +1,209 @@
+"""
+Non-blocking logging for the worker hot path.
+
+Log calls only build the record and put it on a bounded in-memory queue; a single
+background listener thread does the formatting (plain or JSON) and the file/console I/O,
+with size-based rotation of the log file. Worker threads therefore never contend on
+handler locks or wait for the disk. When the queue is full, records are dropped and
+counted instead of blocking the caller.
+
+Messages whose arguments are all immutable (str, numbers, None) are interpolated by the
+listener too. Other arguments could change after the call returns, so those messages,
+and the traceback of exc_info, are still rendered in the calling thread.
+
+With skip_caller_info=True the records leave out the caller's file, line and function
+and the process name and id. Those fields then read as "(unknown file)", 0, "(unknown
+function)" and None for every logger in the process, in exchange for cheaper log calls.
+
+Large payloads (job dicts, message bodies, usage blocks) should be passed through
+truncate(), which renders them lazily and with bounded cost:
+
+    logger.info("Processing job %s: %s", job_id, truncate(job))
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import reprlib
+from datetime import datetime, timezone
+from trading_view_extension.monitoring.metrics import Counter
+
+LOG_RECORDS_DROPPED = Counter("log_records_dropped_total", "Log records dropped because the log queue was full")
+
+DEFAULT_PAYLOAD_LIMIT = 1000
+
+# Attributes every LogRecord has; anything else was passed through `extra=` and is
+# emitted as a field by the JSON formatter.
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class _Truncated:
+    """Defers rendering of a payload until the record is actually formatted."""
+    __slots__ = ("payload", "limit")
+
+    _repr = reprlib.Repr()
+    _repr.maxlevel = 3
+    _repr.maxdict = 20
+    _repr.maxlist = 20
+    _repr.maxstring = 200
+    _repr.maxother = 200
+
+    def __init__(self, payload, limit: int):
+        self.payload = payload
+        self.limit = limit
+
+    def __str__(self):
+        if isinstance(self.payload, (str, bytes)):
+            text = self.payload if isinstance(self.payload, str) else self.payload.decode("utf-8", "replace")
+            total = len(text)
+        elif isinstance(self.payload, (dict, list, tuple)) and len(self.payload) > self._repr.maxdict:
+            # reprlib bounds the work for large containers instead of rendering them fully.
+            text = self._repr.repr(self.payload)
+            total = None
+        else:
+            text = repr(self.payload)
+            total = len(text)
+        if len(text) <= self.limit:
+            return text
+        suffix = f"... [{total} chars]" if total is not None else "..."
+        return text[:self.limit] + suffix
+
+
+_payload_limit = DEFAULT_PAYLOAD_LIMIT
+
+
+def truncate(payload, limit: int = None):
+    return _Truncated(payload, limit or _payload_limit)
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line with timestamp, level, logger, message and any `extra` fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+# Arguments that cannot change between the log call and the listener formatting the record.
+_IMMUTABLE_ARGS = (str, bytes, int, float, bool, type(None))
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands records to the listener with as little work as possible in the calling thread:
+    only messages with mutable arguments and tracebacks are rendered here; the format
+    string, interpolation of immutable arguments, timestamps and JSON encoding are left
+    to the listener.
+    """
+
+    def __init__(self, log_queue, max_size: int):
+        super().__init__(log_queue)
+        self.max_size = max_size
+
+    def prepare(self, record):
+        # This handler is the only one on the root logger, so the record can be reused
+        # instead of copied.
+        # A single dict argument becomes record.args itself, and the dict may still change.
+        args = record.args or ()
+        if (not isinstance(record.msg, str) or isinstance(args, dict)
+                or not all(isinstance(arg, _IMMUTABLE_ARGS) for arg in args)):
+            record.msg = record.getMessage()
+            record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        # SimpleQueue is lock-free for producers; the bound is enforced approximately.
+        if self.max_size and self.queue.qsize() >= self.max_size:
+            LOG_RECORDS_DROPPED.inc()
+            return
+        self.queue.put_nowait(record)
+
+
+_listener = None
+_SRCFILE = logging._srcfile
+
+
+def configure_logging(level="INFO", fmt=None, log_file=None, json_output=False,
+                      max_bytes=50 * 1024 * 1024, backup_count=5, queue_size=10000,
+                      payload_limit=DEFAULT_PAYLOAD_LIMIT, skip_caller_info=False):
+    """
+    Route all logging through a queue to a background writer thread.
+    Calling it again replaces the previous pipeline.
+    """
+    global _listener, _payload_limit
+    stop_logging()
+    _payload_limit = payload_limit
+
+    formatter = JsonFormatter() if json_output else logging.Formatter(fmt)
+    # Finding the caller is the most expensive part of creating a record ("Optimization"
+    # in the logging HOWTO). Skipping it applies to every logger, so it is opt-in.
+    logging._srcfile = None if skip_caller_info else _SRCFILE
+    logging.logMultiprocessing = logging.logProcesses = not skip_caller_info
+    handlers = [logging.StreamHandler()]
+    if log_file:
+        handlers.append(logging.handlers.RotatingFileHandler(
+            log_file, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8", delay=True
+        ))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_DroppingQueueHandler(log_queue, queue_size))
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def forward_logging(log_queue, level="INFO"):
+    """
+    Send this process's records to another process (a multiprocessing.Queue read by
+    relay_logging() there) instead of writing them here, so one process owns the log file
+    and its rotation. Records are pickled by the queue's feeder thread, not the caller.
+    """
+    stop_logging()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    # Unbounded: multiprocessing queues cannot report their size on every platform.
+    root.addHandler(_DroppingQueueHandler(log_queue, max_size=0))
+    root.setLevel(level)
+
+
+def relay_logging(log_queue) -> logging.handlers.QueueListener:
+    """Write records forwarded by other processes through this process's pipeline."""
+    listener = logging.handlers.QueueListener(log_queue, *logging.getLogger().handlers)
+    listener.start()
+    return listener
+
+
+def stop_logging():
+    """Flush queued records and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+atexit.register(stop_logging)
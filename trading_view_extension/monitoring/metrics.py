@@ -0,0 +1,274 @@
+"""
+Lightweight in-process metrics: counters, gauges and histograms rendered in the
+Prometheus text exposition format.
+
+Recording is a dictionary lookup for the label set, a bisect over the bucket bounds and
+a few integer updates under a per-series lock, so one observation costs under a
+microsecond (see benchmarks/bench_metrics.py).
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _format_labels(labelnames, labelvalues, extra=None) -> str:
+    pairs = list(zip(labelnames, labelvalues))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._children_lock = threading.Lock()
+        if not self.labelnames:
+            self._default = self._new_child()
+            self._children[()] = self._default
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def labels(self, *labelvalues, **labelkwargs):
+        if labelkwargs:
+            if len(labelkwargs) == 1:
+                labelvalues = tuple(labelkwargs.values())
+            else:
+                labelvalues = tuple(map(labelkwargs.__getitem__, self.labelnames))
+        child = self._children.get(labelvalues)
+        if child is None:
+            with self._children_lock:
+                child = self._children.setdefault(labelvalues, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def collect(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        for labelvalues, child in sorted(self._children.items()):
+            lines.extend(self._render_child(labelvalues, child))
+        return lines
+
+    def _render_child(self, labelvalues, child):
+        return [f"{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(child.get())}"]
+
+
+class _CounterChild:
+    __slots__ = ("_value", "_lock")
+
+    def __init__(self):
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self._value += amount
+
+    def get(self) -> float:
+        return self._value
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self._default.inc(amount)
+
+
+class _GaugeChild:
+    __slots__ = ("_value", "_lock", "_function")
+
+    def __init__(self):
+        self._value = 0.0
+        self._lock = threading.Lock()
+        self._function = None
+
+    def set(self, value: float):
+        self._value = value
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount: float = 1.0):
+        with self._lock:
+            self._value -= amount
+
+    def set_function(self, function):
+        """Read the value from function() at scrape time instead of storing it."""
+        self._function = function
+
+    def get(self) -> float:
+        return float(self._function()) if self._function is not None else self._value
+
+
+class Gauge(_Metric):
+    type_name = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value: float):
+        self._default.set(value)
+
+    def inc(self, amount: float = 1.0):
+        self._default.inc(amount)
+
+    def dec(self, amount: float = 1.0):
+        self._default.dec(amount)
+
+    def set_function(self, function):
+        self._default.set_function(function)
+
+
+class _HistogramChild:
+    __slots__ = ("_upper_bounds", "_counts", "_sum", "_lock")
+
+    def __init__(self, upper_bounds):
+        self._upper_bounds = upper_bounds
+        self._counts = [0] * (len(upper_bounds) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect_left(self._upper_bounds, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    @contextmanager
+    def time(self):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+    def snapshot(self):
+        with self._lock:
+            return list(self._counts), self._sum
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS, registry=None):
+        self._upper_bounds = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramChild(self._upper_bounds)
+
+    def observe(self, value: float):
+        child = self._default
+        index = bisect_left(child._upper_bounds, value)
+        with child._lock:
+            child._counts[index] += 1
+            child._sum += value
+
+    def time(self):
+        return self._default.time()
+
+    def _render_child(self, labelvalues, child):
+        counts, total = child.snapshot()
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self._upper_bounds + (float("inf"),), counts):
+            cumulative += count
+            labels = _format_labels(self.labelnames, labelvalues, ("le", _format_value(float(bound))))
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, labelvalues)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+
+    def get(self, name: str):
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+# --------------------------
+# Service metrics
+# --------------------------
+SQS_RECEIVE_SECONDS = Histogram("sqs_receive_seconds", "Latency of SQS receive_message calls")
+SQS_MESSAGES_RECEIVED = Counter("sqs_messages_received_total", "Messages received from the input queue")
+SQS_DELETE_SECONDS = Histogram("sqs_delete_seconds", "Latency of SQS delete_message calls")
+SQS_PUBLISH_SECONDS = Histogram("sqs_publish_seconds", "Latency of publishing a job message", ["status"])
+QUEUE_WAIT_SECONDS = Histogram(
+    "queue_wait_seconds", "Time between a message being sent and a worker starting it",
+    buckets=(0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0),
+)
+
+SUPABASE_CALL_SECONDS = Histogram("supabase_call_seconds", "Latency of Supabase helper calls", ["call"])
+SUPABASE_ERRORS = Counter("supabase_errors_total", "Supabase helper calls that raised", ["call"])
+
+OPENROUTER_TTFB_SECONDS = Histogram("openrouter_ttfb_seconds", "Time to first byte (response headers) of OpenRouter calls", ["model"])
+OPENROUTER_REQUEST_SECONDS = Histogram("openrouter_request_seconds", "Total latency of OpenRouter calls", ["model"])
+OPENROUTER_REQUESTS = Counter("openrouter_requests_total", "OpenRouter HTTP requests", ["model", "outcome"])
+
+TRADE_SIGNAL_EXTRACTION_SECONDS = Histogram("trade_signal_extraction_seconds", "Latency of structured trade signal extraction")
+TRADE_SIGNALS_GATED = Counter("trade_signals_gated_total", "Extracted trade signals checked by the quality gate", ["result"])
+
+JOB_SECONDS = Histogram("job_seconds", "End-to-end processing time of a job inside the worker", ["outcome"])
+EXECUTOR_IN_FLIGHT = Gauge("executor_in_flight", "Messages currently being processed by the worker pool")
+EXECUTOR_MAX_WORKERS = Gauge("executor_max_workers", "Size of the worker pool")
+WORKER_CONCURRENCY_LIMIT = Gauge("worker_concurrency_limit", "Current adaptive limit on jobs in flight")
+SCHEDULER_QUEUED = Gauge("scheduler_queued", "Received messages waiting in the fair scheduler")
+SCHEDULER_WAIT_SECONDS = Histogram(
+    "scheduler_wait_seconds", "Time a received message waited in the fair scheduler", ["job_class"]
+)
+CREDIT_ADMISSIONS = Counter("credit_admissions_total", "Jobs checked against the user's credit balance", ["outcome"])
+CIRCUIT_STATE = Gauge("circuit_state", "Circuit breaker state per dependency (0 closed, 1 half-open, 2 open)", ["dependency"])
+CIRCUIT_REJECTED_CALLS = Counter("circuit_rejected_calls_total", "Calls refused by an open circuit", ["dependency"])
+JOBS_SHED = Counter("jobs_shed_total", "Jobs not run because a dependency's circuit was open", ["dependency", "action"])
+JOBS_QUARANTINED = Counter("jobs_quarantined_total", "Jobs set aside without retries because they can never succeed", ["reason"])
+RESULT_PUSH_CONNECTIONS = Gauge("result_push_connections", "Open WebSocket connections of result push clients")
+RESULT_PUSH_MESSAGES = Counter("result_push_messages_total", "Job events written to subscribed WebSocket clients")
+WORKER_PROCESSES_ALIVE = Gauge("worker_processes_alive", "Worker processes running jobs in prefork mode")
+WORKER_PROCESS_RESTARTS = Counter("worker_process_restarts_total", "Worker processes restarted after dying in prefork mode")
+JOB_EXPORT_ROWS = Counter("job_export_rows_total", "Job rows written to the columnar export")
+JOB_EXPORT_SECONDS = Histogram("job_export_seconds", "Duration of a job export run")
+RUNTIME_CONFIG_UPDATES = Counter("runtime_config_updates_total", "Runtime tuning updates by outcome (applied, rejected)", ["outcome"])
+WORKER_STARTUP_SECONDS = Gauge("worker_startup_seconds", "Time from main() to the first poll, including client warm-up")
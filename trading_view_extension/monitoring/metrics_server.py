@@ -0,0 +1,126 @@
+"""
+HTTP endpoints of a worker, on two listeners:
+
+    start_metrics_server()   PORT, all interfaces: GET /metrics (Prometheus) and /healthz
+    start_admin_server()     ADMIN_HOST:ADMIN_PORT, localhost by default: the /admin routes,
+                             which change how the worker runs
+
+With ADMIN_TOKEN set every admin request needs "Authorization: Bearer <token>"; the admin
+listener refuses to bind anything but a loopback address without one. In prefork mode only
+the supervisor serves the admin routes.
+"""
+import hmac
+import ipaddress
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from config import logger, PORT, ADMIN_HOST, ADMIN_PORT, ADMIN_TOKEN
+from trading_view_extension.monitoring.metrics import REGISTRY
+from trading_view_extension.monitoring import tracing
+from trading_view_extension.monitoring.profiler import profile_route, profile_state_route
+from trading_view_extension.services.runtime_config import config_route, config_state_route
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# (method, path) -> handler(query: dict, body: bytes) -> (status, content_type, payload)
+_routes = {}
+_admin_routes = {}
+
+
+def register_route(method: str, path: str, handler) -> None:
+    """Expose an extra read-only endpoint on the metrics server."""
+    _routes[(method.upper(), path)] = handler
+
+
+def register_admin_route(method: str, path: str, handler) -> None:
+    """Expose an endpoint on the admin server only."""
+    _admin_routes[(method.upper(), path)] = handler
+
+
+def _metrics_route(query, body):
+    return 200, PROMETHEUS_CONTENT_TYPE, REGISTRY.render()
+
+
+def _trace_sample_rate_route(query, body):
+    """POST /admin/tracing?sample_rate=0.25 changes the trace sampling rate at runtime."""
+    if "sample_rate" in query:
+        rate = float(query["sample_rate"][0])
+        tracing.set_sample_rate(rate)
+        logger.info(f"Trace sample rate set to {rate}")
+    return 200, "application/json", f'{{"sample_rate": {tracing.get_sample_rate()}}}\n'
+
+
+register_route("GET", "/metrics", _metrics_route)
+register_admin_route("GET", "/admin/tracing", lambda query, body: _trace_sample_rate_route({}, body))
+register_admin_route("POST", "/admin/tracing", _trace_sample_rate_route)
+register_admin_route("GET", "/admin/profile", profile_state_route)
+register_admin_route("POST", "/admin/profile", profile_route)
+register_admin_route("GET", "/admin/config", config_state_route)
+register_admin_route("POST", "/admin/config", config_route)
+register_route("GET", "/healthz", lambda query, body: (200, "text/plain", "ok\n"))
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def _dispatch(self, method):
+        url = urlparse(self.path)
+        token = getattr(self.server, "admin_token", None)
+        if token and not hmac.compare_digest(self.headers.get("Authorization") or "", f"Bearer {token}"):
+            self.send_error(401)
+            return
+        handler = self.server.routes.get((method, url.path))
+        if handler is None:
+            self.send_error(404)
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        try:
+            status, content_type, payload = handler(parse_qs(url.query), body)
+        except Exception as e:
+            logger.exception(f"Metrics server handler for {url.path} failed")
+            status, content_type, payload = 500, "text/plain", f"{e}\n"
+        data = payload.encode("utf-8") if isinstance(payload, str) else payload
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def log_message(self, format, *args):
+        # Scrapes every few seconds would otherwise flood the logs.
+        pass
+
+
+def _serve(name: str, routes: dict, host: str, port: int, admin_token: str = None) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    server.routes = routes
+    server.admin_token = admin_token
+    thread = threading.Thread(target=server.serve_forever, name=name, daemon=True)
+    thread.start()
+    logger.info(f"{name} listening on {host}:{server.server_address[1]}")
+    return server
+
+
+def start_metrics_server(port: int = PORT, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """Serve /metrics (Prometheus text format) from a daemon thread."""
+    return _serve("metrics-server", _routes, host, port)
+
+
+def _is_loopback(host: str) -> bool:
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return host == "localhost"
+
+
+def start_admin_server(port: int = ADMIN_PORT, host: str = ADMIN_HOST, token: str = ADMIN_TOKEN) -> ThreadingHTTPServer:
+    """Serve the /admin routes from a daemon thread; raises ValueError for a public address without a token."""
+    if not token and not _is_loopback(host):
+        raise ValueError(f"ADMIN_TOKEN is required to serve the admin endpoints on {host}")
+    return _serve("admin-server", _admin_routes, host, port, admin_token=token)
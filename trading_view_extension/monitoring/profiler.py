@@ -0,0 +1,233 @@
+"""
+On-demand sampling profiler for a running worker.
+
+A profile samples the Python stack of every thread (poller, executor workers, event
+loop, exporters) every PROFILE_INTERVAL_SECONDS for a window, then writes the samples as
+collapsed stacks, one line per distinct stack with its sample count:
+
+    ThreadPoolExecutor-0_3;_worker (thread.py:89);run_job (sqs_queue_consumer.py:190);dumps (__init__.py:231) 42
+
+which flamegraph.pl, speedscope and inferno read directly. Threads blocked on a lock or
+on I/O are sampled too, so waiting on SqsQueueConsumer.lock or a socket shows up as the
+line that waits. Sampling holds the GIL only for the time it takes to walk the frames.
+
+Start a profile with either:
+    kill -USR2 <pid>      PROFILE_DEFAULT_SECONDS, written to PROFILE_DIR; a prefork
+                          supervisor passes the signal on to its worker processes
+    curl -X POST 'localhost:8090/admin/profile?seconds=30'          written to PROFILE_DIR
+    curl -X POST 'localhost:8090/admin/profile?seconds=10&wait=1' > worker.folded
+
+The /admin routes are served by the admin listener (ADMIN_PORT, localhost unless
+ADMIN_TOKEN is set, see metrics_server.py). One profile runs at a time per process;
+GET /admin/profile shows the state. Only the newest PROFILE_KEEP profiles in PROFILE_DIR
+are kept.
+"""
+import json
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from config import logger, PROFILE_DIR, PROFILE_DEFAULT_SECONDS, PROFILE_INTERVAL_SECONDS, PROFILE_KEEP
+
+PROFILE_SIGNAL = getattr(signal, "SIGUSR2", None)  # None on Windows
+MAX_PROFILE_SECONDS = 600
+MAX_STACK_DEPTH = 128
+
+
+class ProfileRunning(Exception):
+    pass
+
+
+def _frame_label(code, line: int) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{line})".replace(";", ":")
+
+
+def collapse(frame, thread_name: str) -> str:
+    """The collapsed stack of a frame, root first, with the thread name as the root."""
+    return _join(thread_name, _walk(frame), {})
+
+
+def _walk(frame) -> tuple:
+    """(code, line) of the frames of a stack, innermost first."""
+    stack = []
+    while frame is not None and len(stack) < MAX_STACK_DEPTH:
+        stack.append((frame.f_code, frame.f_lineno))
+        frame = frame.f_back
+    return tuple(stack)
+
+
+def _join(thread_name: str, stack: tuple, labels: dict) -> str:
+    parts = [thread_name.replace(";", ":").replace(" ", "_")]
+    for key in reversed(stack):
+        label = labels.get(key)
+        if label is None:
+            label = labels[key] = _frame_label(*key)
+        parts.append(label)
+    return ";".join(parts)
+
+
+class SamplingProfiler:
+    def __init__(self, directory: str = PROFILE_DIR, interval: float = PROFILE_INTERVAL_SECONDS,
+                 keep: int = PROFILE_KEEP):
+        self.directory = directory
+        self.interval = interval
+        self.keep = keep
+        self._lock = threading.Lock()
+        self._thread = None
+        self._done = None
+        self.state = {"running": False}
+
+    def start(self, seconds: float = PROFILE_DEFAULT_SECONDS, path: str = None) -> dict:
+        """Start sampling in a background thread; raises ProfileRunning if a profile is active."""
+        seconds = min(max(float(seconds), self.interval), MAX_PROFILE_SECONDS)
+        if path is None:
+            stamp = time.strftime("%Y%m%d-%H%M%S", time.gmtime())
+            path = os.path.join(self.directory, f"profile-{os.getpid()}-{stamp}.folded")
+        with self._lock:
+            if self.state["running"]:
+                raise ProfileRunning(f"A profile is running until {self.state['until']}")
+            self.state = {"running": True, "path": path, "seconds": seconds,
+                          "until": time.strftime("%H:%M:%S", time.localtime(time.time() + seconds))}
+            self._done = threading.Event()
+            self._thread = threading.Thread(target=self._run, args=(seconds, path, self._done),
+                                            name="sampling-profiler", daemon=True)
+            self._thread.start()
+        logger.info("Profiling for %.0fs into %s", seconds, path)
+        return dict(self.state)
+
+    def wait(self, timeout: float = None) -> dict:
+        done = self._done
+        if done is not None:
+            done.wait(timeout)
+        return dict(self.state)
+
+    def sample(self, seconds: float) -> Counter:
+        """Sample all other threads for `seconds`; returns collapsed stack -> samples."""
+        # Samples are counted as raw (code, line) stacks; they become text once at the end.
+        samples = Counter()
+        own = threading.get_ident()
+        deadline = time.monotonic() + seconds
+        next_sample = time.monotonic()
+        while next_sample < deadline:
+            for ident, frame in sys._current_frames().items():
+                if ident != own:
+                    samples[ident, _walk(frame)] += 1
+            frame = None  # Do not keep the sampled frames alive until the next sample
+            next_sample += self.interval
+            delay = next_sample - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_sample = time.monotonic()  # Behind schedule: do not burst to catch up
+
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        labels, stacks = {}, Counter()
+        for (ident, stack), count in samples.items():
+            stacks[_join(names.get(ident, f"thread-{ident}"), stack, labels)] += count
+        return stacks
+
+    def _run(self, seconds: float, path: str, done: threading.Event):
+        try:
+            stacks = self.sample(seconds)
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            temporary = path + ".tmp"
+            with open(temporary, "w", encoding="utf-8") as profile_file:
+                for stack, count in stacks.most_common():
+                    profile_file.write(f"{stack} {count}\n")
+            os.replace(temporary, path)
+            self._prune(os.path.dirname(path) or ".")
+            samples = sum(stacks.values())
+            logger.info("Profile written to %s (%d samples, %d stacks)", path, samples, len(stacks))
+            self.state = dict(self.state, running=False, samples=samples, stacks=len(stacks))
+        except Exception as e:
+            logger.error("Profiling failed: %s", e)
+            self.state = dict(self.state, running=False, error=str(e))
+        finally:
+            done.set()
+
+
+    def _prune(self, directory: str) -> None:
+        """Delete all but the newest `keep` profiles of the directory."""
+        profiles = [entry for entry in os.scandir(directory)
+                    if entry.name.startswith("profile-") and entry.name.endswith(".folded")]
+        profiles.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+        for entry in profiles[self.keep:]:
+            try:
+                os.remove(entry.path)
+            except OSError as e:
+                logger.warning("Could not delete old profile %s: %s", entry.path, e)
+
+
+profiler = SamplingProfiler()
+_signal_listeners = []
+
+
+def add_signal_listener(listener) -> None:
+    """Call listener() whenever the profile signal arrives (e.g. to pass it on to child processes)."""
+    _signal_listeners.append(listener)
+
+
+def _on_signal(signum, frame):
+    # Runs in the main thread between bytecodes: only start the sampler thread here.
+    try:
+        profiler.start(PROFILE_DEFAULT_SECONDS)
+    except ProfileRunning as e:
+        logger.info("Ignoring profile signal: %s", e)
+    for listener in _signal_listeners:
+        try:
+            listener()
+        except Exception as e:
+            logger.warning("Profile signal listener failed: %s", e)
+
+
+def install_signal_handler() -> bool:
+    """Start a profile on SIGUSR2. Only possible from the main thread, and not on Windows."""
+    if PROFILE_SIGNAL is None or threading.current_thread() is not threading.main_thread():
+        return False
+    signal.signal(PROFILE_SIGNAL, _on_signal)
+    if hasattr(signal, "pthread_sigmask"):
+        # Delivered now if it arrived while blocked (see profile_signal_blocked).
+        signal.pthread_sigmask(signal.SIG_UNBLOCK, {PROFILE_SIGNAL})
+    return True
+
+
+@contextmanager
+def profile_signal_blocked():
+    """
+    Block the profile signal in the calling thread. Processes started meanwhile inherit the
+    block, so the signal waits until they installed the handler instead of killing them.
+    """
+    if PROFILE_SIGNAL is None or not hasattr(signal, "pthread_sigmask"):
+        yield
+        return
+    previous = signal.pthread_sigmask(signal.SIG_BLOCK, {PROFILE_SIGNAL})
+    try:
+        yield
+    finally:
+        signal.pthread_sigmask(signal.SIG_SETMASK, previous)
+
+
+def profile_route(query, body):
+    """
+    POST /admin/profile?seconds=30 starts a profile written to PROFILE_DIR; with &wait=1 the
+    response is the collapsed stacks.
+    """
+    try:
+        state = profiler.start(float(query.get("seconds", [PROFILE_DEFAULT_SECONDS])[0]))
+    except ProfileRunning as e:
+        return 409, "application/json", json.dumps({"error": str(e)}) + "\n"
+    if query.get("wait", ["0"])[0] not in ("1", "true"):
+        return 202, "application/json", json.dumps(state) + "\n"
+    state = profiler.wait()
+    if "error" in state:
+        return 500, "application/json", json.dumps(state) + "\n"
+    with open(state["path"], encoding="utf-8") as profile_file:
+        return 200, "text/plain; charset=utf-8", profile_file.read()
+
+
+def profile_state_route(query, body):
+    """GET /admin/profile returns the state of the current or last profile."""
+    return 200, "application/json", json.dumps(profiler.state) + "\n"
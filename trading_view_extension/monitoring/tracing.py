@@ -0,0 +1,248 @@
+"""
+Span-based tracing of individual jobs.
+
+The active span lives in a contextvar, so it follows coroutines, asyncio tasks and
+asyncio.to_thread calls without being passed around. The sampling decision is made once
+per root span; unsampled traces only pay for a contextvar lookup per span.
+
+Finished spans are written by a background thread to TRACE_FILE in the Chrome trace
+event format (JSON array, one complete "X" event per line), which opens directly in
+chrome://tracing, Perfetto (ui.perfetto.dev) or speedscope. The file is rotated at
+TRACE_MAX_BYTES into TRACE_BACKUP_COUNT older files (traces.json.1, ...), each a trace
+of its own. Every process rotates its file on its own, so processes sharing TRACE_FILE
+(prefork workers) each write to a file of their own, see process_trace_file().
+
+Usage:
+    with span("orchestrator.handle_job", job_id=job_id) as current:
+        ...
+        current.set_attribute("attempts", attempt)
+"""
+import atexit
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dotenv import load_dotenv
+from trading_view_extension.monitoring.metrics import Counter
+load_dotenv()
+
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.json")
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", 0.01))
+TRACE_FLUSH_INTERVAL = float(os.getenv("TRACE_FLUSH_INTERVAL", 1.0))
+TRACE_MAX_BYTES = int(os.getenv("TRACE_MAX_BYTES", 100 * 1024 * 1024))
+TRACE_BACKUP_COUNT = int(os.getenv("TRACE_BACKUP_COUNT", 3))
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", 100000))  # Finished spans held until the next write
+
+SPANS_DROPPED = Counter("trace_spans_dropped_total", "Finished spans dropped because the trace buffer was full or its file could not be written")
+
+logger = logging.getLogger(__name__)
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "start_ns", "end_ns", "attributes", "thread_id")
+    recording = True
+
+    def __init__(self, name: str, trace_id: str, parent_id, attributes: dict):
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = attributes
+        self.thread_id = threading.get_ident()
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+
+    def set_attribute(self, key: str, value) -> None:
+        self.attributes[key] = value
+
+    def increment(self, key: str, amount: int = 1) -> None:
+        self.attributes[key] = self.attributes.get(key, 0) + amount
+
+    def to_event(self, pid: int) -> dict:
+        args = dict(self.attributes)
+        args.update(trace_id=self.trace_id, span_id=self.span_id, parent_id=self.parent_id)
+        return {
+            "name": self.name,
+            "cat": self.name.split(".", 1)[0],
+            "ph": "X",
+            "ts": self.start_ns // 1000,
+            "dur": max(1, (self.end_ns - self.start_ns) // 1000),
+            "pid": pid,
+            "tid": self.thread_id,
+            "args": args,
+        }
+
+
+class _NonRecordingSpan:
+    """Stand-in for spans of unsampled traces; children inherit the decision."""
+    recording = False
+    trace_id = span_id = None
+
+    def set_attribute(self, key: str, value) -> None:
+        pass
+
+    def increment(self, key: str, amount: int = 1) -> None:
+        pass
+
+
+NON_RECORDING_SPAN = _NonRecordingSpan()
+
+_current_span: ContextVar = ContextVar("current_span", default=None)
+
+
+class FileSpanExporter:
+    """Buffers finished spans and appends them to a Chrome trace JSON file from a daemon thread."""
+
+    def __init__(self, path: str = TRACE_FILE, flush_interval: float = TRACE_FLUSH_INTERVAL,
+                 max_bytes: int = TRACE_MAX_BYTES, backup_count: int = TRACE_BACKUP_COUNT,
+                 buffer_size: int = TRACE_BUFFER_SIZE):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        # Bounded, so spans cannot pile up while the file cannot be written; the oldest go first.
+        self._buffer = deque(maxlen=buffer_size)
+        self._named_threads = set()
+        self._pid = os.getpid()
+        self._write_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def export(self, finished: Span) -> None:
+        # deque.append is thread safe, so recording never blocks on file I/O.
+        if len(self._buffer) == self._buffer.maxlen:
+            SPANS_DROPPED.inc()
+        self._buffer.append(finished)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                # Keep the thread alive: the next interval tries again (e.g. after disk space is freed).
+                logger.error("Could not write spans to %s: %s", self.path, e)
+
+    def flush(self) -> None:
+        with self._write_lock:
+            if not self._buffer:
+                return
+            if self.max_bytes and os.path.exists(self.path) and os.path.getsize(self.path) >= self.max_bytes:
+                self._rotate()
+            lines = []
+            thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+            spans = 0
+            while self._buffer:
+                finished = self._buffer.popleft()
+                spans += 1
+                if finished.thread_id not in self._named_threads:
+                    self._named_threads.add(finished.thread_id)
+                    lines.append(json.dumps({
+                        "name": "thread_name", "ph": "M", "pid": self._pid, "tid": finished.thread_id,
+                        "args": {"name": thread_names.get(finished.thread_id, str(finished.thread_id))},
+                    }))
+                lines.append(json.dumps(finished.to_event(self._pid), default=str))
+
+            try:
+                new_file = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+                with open(self.path, "a", encoding="utf-8") as trace_file:
+                    if new_file:
+                        # The closing bracket is optional in the trace event format, so the file
+                        # stays valid while it is appended to.
+                        trace_file.write("[\n")
+                    trace_file.write(",\n".join(lines) + ",\n")
+            except OSError:
+                SPANS_DROPPED.inc(spans)
+                self._named_threads.clear()  # Their names were not written either
+                raise
+
+    def _rotate(self) -> None:
+        # Called with the write lock held, like RotatingFileHandler.doRollover.
+        if self.backup_count > 0:
+            for index in range(self.backup_count - 1, 0, -1):
+                if os.path.exists(f"{self.path}.{index}"):
+                    os.replace(f"{self.path}.{index}", f"{self.path}.{index + 1}")
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._named_threads.clear()  # The new file needs its own thread names
+
+
+def process_trace_file(name: str, path: str = TRACE_FILE) -> str:
+    """The trace file of one process among several, e.g. traces.worker-1.json."""
+    root, extension = os.path.splitext(path)
+    return f"{root}.{name}{extension}"
+
+
+_sample_rate = TRACE_SAMPLE_RATE
+_exporter = None
+_exporter_lock = threading.Lock()
+
+
+def set_sample_rate(rate: float) -> None:
+    """Change the fraction of new traces that are recorded (0.0 - 1.0) at runtime."""
+    global _sample_rate
+    if not 0.0 <= rate <= 1.0:
+        raise ValueError("Sample rate must be between 0 and 1")
+    _sample_rate = rate
+
+
+def get_sample_rate() -> float:
+    return _sample_rate
+
+
+def set_exporter(exporter) -> None:
+    """Replace the span exporter (anything with an export(span) method)."""
+    global _exporter
+    _exporter = exporter
+
+
+def _get_exporter():
+    global _exporter
+    if _exporter is None:
+        with _exporter_lock:
+            if _exporter is None:
+                _exporter = FileSpanExporter()
+    return _exporter
+
+
+def current_span():
+    return _current_span.get() or NON_RECORDING_SPAN
+
+
+@contextmanager
+def span(name: str, **attributes):
+    parent = _current_span.get()
+    if parent is None:
+        if _sample_rate <= 0.0 or random.random() >= _sample_rate:
+            token = _current_span.set(NON_RECORDING_SPAN)
+            try:
+                yield NON_RECORDING_SPAN
+            finally:
+                _current_span.reset(token)
+            return
+        current = Span(name, f"{random.getrandbits(128):032x}", None, attributes)
+    elif not parent.recording:
+        yield parent
+        return
+    else:
+        current = Span(name, parent.trace_id, parent.span_id, attributes)
+
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.set_attribute("error", f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        current.end_ns = time.time_ns()
+        _current_span.reset(token)
+        _get_exporter().export(current)
@@ -1,36 +1,313 @@
-from config import logger
+import asyncio
+from config import logger, MAX_TRADES, BATCH_SCAN_CONCURRENCY, CREDIT_ADMISSION_ENABLED, CIRCUIT_MAX_DEFERRALS, delay_tasks_queue, \
+    JOB_EXPORT_SPOOL_DIR
 from trading_view_extension.queue.sqs_queue_publisher import SQSQueuePublisher
 from trading_view_extension.services.alpha_agent_analyzer import analyze
+from trading_view_extension.services.credit_admission import CreditAdmission, InsufficientCredits
+from trading_view_extension.services.circuit_breaker import CircuitOpen
+from trading_view_extension.services.job_errors import PermanentJobError, is_permanent, error_reason
+from trading_view_extension.queue.job_schema import validate_job
+from trading_view_extension.queue.quarantine import QuarantineStore
+from trading_view_extension.database.idempotency_store import IdempotencyStore, COMPLETED, make_key
+from trading_view_extension.monitoring.tracing import span, current_span
+from trading_view_extension.monitoring.log_pipeline import truncate
+from trading_view_extension.monitoring.metrics import JOBS_SHED
+from trading_view_extension.monitoring.job_telemetry import collect_telemetry, stage
+from trading_view_extension.analytics.job_export import JobSpool
+
+BATCH_JOB_TYPE = "batch_scan"
+
 
 class AiOrchestrator:
-    def __init__(self, sqs_queue_publisher: SQSQueuePublisher):
+    def __init__(self, sqs_queue_publisher: SQSQueuePublisher, batch_concurrency: int = BATCH_SCAN_CONCURRENCY,
+                 idempotency_store: IdempotencyStore = None, credit_admission: CreditAdmission = None,
+                 quarantine: QuarantineStore = None, job_spool: JobSpool = None):
         self.sqs_queue_publisher = sqs_queue_publisher
+        self.idempotency_store = idempotency_store or IdempotencyStore()
+        self.quarantine = quarantine or QuarantineStore()
+        # Completed jobs are recorded for the columnar export when a spool directory is configured.
+        self.job_spool = job_spool or (JobSpool() if JOB_EXPORT_SPOOL_DIR else None)
+        # None disables the credit check (CREDIT_ADMISSION_ENABLED=false).
+        self.credit_admission = credit_admission or (CreditAdmission() if CREDIT_ADMISSION_ENABLED else None)
+        self.batch_concurrency = batch_concurrency
+        # batch job_id -> {item index: item summary} for items that already completed.
+        # A retried batch (e.g. from the consumer safe store) only processes the remainder.
+        self.batch_checkpoints = {}
         logger.info("AiOrchestrator initialized.")
 
     async def handle_job(self, job):
-        logger.info(f"Processing job: {job}")
+        """
+        Run a job exactly once per (job_id, message_id). Redelivered or replayed jobs get the
+        stored result back without another model call, charge or publish. Jobs the user cannot
+        afford are rejected before any model call, and jobs that hit an open circuit are
+        deferred or failed (see _shed) instead of retried. Invalid jobs and permanent errors
+        skip all retries and go to quarantine.
+        """
+        try:
+            validate_job(job)
+        except PermanentJobError as e:
+            await self._quarantine(job, e)
+            return True
+
+        key = make_key(job.get("job_id"), job.get("message_id"), job)
+        with span("orchestrator.handle_job", job_id=job.get("job_id"), job_type=job.get("job_type", "analysis"),
+                  agent=job.get("agent"), is_chat=bool(job.get("is_chat"))) as job_span:
+            record = self.idempotency_store.claim(key)
+            if record is not None:
+                job_span.set_attribute("duplicate", record["state"])
+                if record["state"] == COMPLETED:
+                    logger.info("Job %s already completed, returning stored result", key)
+                    return record["result"]
+                logger.info("Job %s is already being processed, skipping duplicate", key)
+                return True
+
+            submitted = dict(job)
+            # Publishes of this job use deduplication ids derived from the key.
+            job["idempotency_key"] = key
+            try:
+                reservation, rejected = None, False
+                if self.credit_admission is not None:
+                    try:
+                        reservation = await self.credit_admission.admit(job)
+                    except InsufficientCredits as e:
+                        await self._reject(job, e)
+                        rejected = True
+                if not rejected:
+                    await self.sqs_queue_publisher.publish_progress(self._running_event(job))
+                    try:
+                        if job.get("job_type") == BATCH_JOB_TYPE:
+                            await self.handle_batch_job(job)
+                        else:
+                            await self._handle_single_job(job)
+                    finally:
+                        if reservation is not None:
+                            await self.credit_admission.settle(reservation, job)
+            except CircuitOpen as e:
+                self.idempotency_store.release(key)
+                job_span.set_attribute("circuit_open", e.dependency)
+                await self._shed(submitted, job, e)
+                return True
+            except Exception as e:
+                if not is_permanent(e):
+                    self.idempotency_store.release(key)
+                    raise
+                # Redeliveries get the failure back instead of running into the same error again.
+                job_span.set_attribute("error", str(e))
+                await self._quarantine(submitted, e, reply=job)
+                self.idempotency_store.complete(key, dict(job))
+                return True
+            except BaseException:
+                self.idempotency_store.release(key)
+                raise
+
+            self.idempotency_store.complete(key, dict(job))
+            return True
+
+    async def _reject(self, job, error: InsufficientCredits):
+        logger.info("Rejecting job %s: %s", job.get("job_id"), error)
+        current_span().set_attribute("rejected", "insufficient_credits")
+        job["status"] = "REJECTED"
+        job["action_type"] = "insufficient_credits"
+        job["response"] = "Not enough credits to run this analysis."
+        job["result"] = None
+        job["credits_required"] = error.required
+        job["credits_available"] = error.available
+        job.pop("items", None)
+        await self.sqs_queue_publisher.publish_task(job)
+
+    async def _quarantine(self, job, error: Exception, reply: dict = None):
+        """Record a job that can never succeed and tell the client it failed."""
+        await asyncio.to_thread(self.quarantine.add, job, error)
+        current_span().set_attribute("quarantined", error_reason(error))
+        reply = reply if reply is not None else job
+        if not isinstance(reply, dict) or not isinstance(reply.get("job_id"), str):
+            return  # Nobody to answer
+        reply["status"] = "FAILED"
+        reply["action_type"] = "invalid_job"
+        reply["response"] = "This request could not be processed."
+        reply["result"] = None
+        reply["error"] = error_reason(error)
+        reply.pop("items", None)
+        await self.sqs_queue_publisher.publish_task(reply)
+
+    async def _shed(self, submitted, job, error: CircuitOpen):
+        """
+        Take a job off this worker while a dependency's circuit is open: with a delay queue
+        configured it comes back once the circuit may have recovered (at most
+        CIRCUIT_MAX_DEFERRALS times), otherwise it fails right away with status FAILED.
+        """
+        deferrals = int(submitted.get("deferrals") or 0)
+        if delay_tasks_queue.url and deferrals < CIRCUIT_MAX_DEFERRALS:
+            logger.warning("Deferring job %s for %.0fs: %s", job.get("job_id"), error.retry_after, error)
+            await self.sqs_queue_publisher.defer_task(dict(submitted, deferrals=deferrals + 1), error.retry_after)
+            JOBS_SHED.labels(dependency=error.dependency, action="deferred").inc()
+            return
+
+        logger.warning("Failing job %s: %s", job.get("job_id"), error)
+        job["status"] = "FAILED"
+        job["action_type"] = "dependency_unavailable"
+        job["response"] = "The analysis service is temporarily unavailable, please try again shortly."
+        job["result"] = None
+        job["retry_after"] = round(error.retry_after)
+        job.pop("items", None)
+        await self.sqs_queue_publisher.publish_task(job)
+        JOBS_SHED.labels(dependency=error.dependency, action="failed").inc()
+
+    async def _handle_single_job(self, job):
+        logger.info("Processing job %s: %s", job.get("job_id"), truncate(job))
         image_urls = job.get("s3_urls", [])
 
         if not isinstance(image_urls, list):
             raise ValueError("image_urls must be a list")
 
+        with collect_telemetry() as telemetry:
+            with stage("analyze"):
+                consensus_response, trade_signal, response_message_id = await self._analyze_with_retries(job, image_urls)
+
+            job["status"] = "COMPLETED"
+            job["response"] = consensus_response
+            job["result"] = trade_signal
+            job["action_type"] = "processed"
+            job["message_id"] = response_message_id
+
+            with stage("publish"):
+                await self.sqs_queue_publisher.publish_task(job)
+        self._record(job, telemetry)
+
+    def _record(self, job, telemetry):
+        if self.job_spool is None:
+            return
+        try:
+            self.job_spool.record(job, telemetry)
+        except Exception as e:
+            logger.warning("Could not record job %s for export: %s", job.get("job_id"), e)
+
+    async def _analyze_with_retries(self, job, image_urls):
         max_retries = 3
         for attempt in range(max_retries):
+            current_span().set_attribute("attempts", attempt + 1)
             try:
-                consensus_response, trade_signal, response_message_id = await analyze(job, image_urls)
-                break
+                with span("analyze", job_id=job.get("job_id"), asset=job.get("asset"), attempt=attempt + 1,
+                          image_count=len(image_urls)):
+                    return await analyze(job, image_urls)
+            except CircuitOpen:
+                raise
             except Exception as e:
-                logger.warning(f"Retry {attempt+1}/{max_retries} failed for job {job}: {e}")
-                if attempt == max_retries - 1:
-                    consensus_response, trade_signal, response_message_id = "AI Error", "Unknown", "error"
+                if is_permanent(e):
+                    # Same input, same failure: retrying only burns time and credits.
+                    raise
+                logger.warning("Retry %d/%d failed for job %s: %s", attempt + 1, max_retries, job.get("job_id"), e)
+        return "AI Error", "Unknown", "error"
+
+    async def handle_batch_job(self, job):
+        """
+        Scan a watchlist: analyze every (asset, chart URLs) item of the batch with bounded
+        concurrency, publish each item result as soon as it finishes (status PARTIAL) and
+        finish with a COMPLETED summary ranked by confidence.
+
+        Expected job fields besides the usual agent/email_id/user_instructions:
+            items (list): [{"asset": "AAPL", "s3_urls": [...]}, ...]
+        """
+        batch_id = job.get("job_id")
+        items = job.get("items", [])
+
+        if not isinstance(items, list):
+            raise ValueError("items must be a list")
+        if len(items) > MAX_TRADES:
+            logger.warning(f"Batch {batch_id} has {len(items)} items, only the first {MAX_TRADES} are scanned")
+            items = items[:MAX_TRADES]
+
+        completed = self.batch_checkpoints.setdefault(batch_id, {})
+        remaining = [(index, item) for index, item in enumerate(items) if index not in completed]
+        logger.info("Processing batch %s: %d/%d items remaining", batch_id, len(remaining), len(items))
+
+        semaphore = asyncio.Semaphore(self.batch_concurrency)
+        failed = {}
+
+        async def run_item(index, item):
+            async with semaphore:
+                item_job = self._batch_item_job(job, index, item)
+                image_urls = item_job.get("s3_urls", [])
+                if not isinstance(image_urls, list):
+                    raise ValueError(f"s3_urls of batch item {index} must be a list")
+
+                with collect_telemetry() as telemetry:
+                    try:
+                        with stage("analyze"):
+                            response, trade_signal, response_message_id = await self._analyze_with_retries(item_job, image_urls)
+                    except Exception as e:
+                        if not is_permanent(e):
+                            raise
+                        # One bad item fails on its own instead of taking the whole scan with it.
+                        logger.warning("Batch %s item %d failed permanently: %s", batch_id, index, e)
+                        response, trade_signal, response_message_id = f"AI Error: {error_reason(e)}", None, "error"
+                    job["credits_used"] = job.get("credits_used", 0) + item_job.get("credits_used", 0)
+
+                    item_job["status"] = "PARTIAL"
+                    item_job["response"] = response
+                    item_job["result"] = trade_signal
+                    item_job["action_type"] = "processed"
+                    item_job["message_id"] = response_message_id
+                    with stage("publish"):
+                        await self.sqs_queue_publisher.publish_task(item_job)
+                if response_message_id != "error":
+                    self._record(item_job, telemetry)
+
+                summary = {
+                    "index": index,
+                    "job_id": item_job["job_id"],
+                    "asset": item_job.get("asset"),
+                    "message_id": response_message_id,
+                    "result": trade_signal if isinstance(trade_signal, dict) else None,
+                }
+                if response_message_id == "error":
+                    failed[index] = summary
+                else:
+                    completed[index] = summary
+
+        results = await asyncio.gather(*(run_item(index, item) for index, item in remaining), return_exceptions=True)
+        errors = [result for result in results if isinstance(result, BaseException)]
+        circuit_open = next((error for error in errors if isinstance(error, CircuitOpen)), None)
+        if circuit_open is not None:
+            raise circuit_open
+        if errors:
+            # Completed items stay checkpointed, so a retry only redoes the rest.
+            raise RuntimeError(f"Batch {batch_id}: {len(errors)} item(s) crashed, first error: {errors[0]}")
 
         job["status"] = "COMPLETED"
-        job["response"] = consensus_response
-        job["result"] = trade_signal
         job["action_type"] = "processed"
-        job["message_id"] = response_message_id
+        job["result"] = self._rank_by_confidence(list(completed.values()))
+        job["failed"] = sorted(failed.values(), key=lambda summary: summary["index"])
+        job.pop("items", None)
 
         await self.sqs_queue_publisher.publish_task(job)
-
-        #Critical — Return Success Flag
+        self.batch_checkpoints.pop(batch_id, None)
         return True
+
+    @staticmethod
+    def _running_event(job):
+        return {
+            "job_id": job.get("job_id"),
+            "message_id": job.get("message_id"),
+            "status": "RUNNING",
+            "action_type": "running",
+            "job_type": job.get("job_type", "analysis"),
+        }
+
+    @staticmethod
+    def _batch_item_job(job, index, item):
+        item_job = {key: value for key, value in job.items() if key not in ("items", "job_type", "credits_used")}
+        item_job.update(item)
+        item_job["job_id"] = item.get("job_id") or f"{job.get('job_id')}-{index}"
+        item_job["batch_id"] = job.get("job_id")
+        item_job["batch_index"] = index
+        item_job["is_chat"] = False
+        item_job["idempotency_key"] = make_key(item_job["job_id"])
+        return item_job
+
+    @staticmethod
+    def _rank_by_confidence(summaries):
+        def confidence(summary):
+            value = (summary.get("result") or {}).get("confidence")
+            return value if isinstance(value, (int, float)) else float("-inf")
+        return sorted(summaries, key=confidence, reverse=True)
@@ -1,7 +1,19 @@
-import openai
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from openai import OpenAI, AssistantEventHandler
 from typing_extensions import override
 from typing import List, Dict
+from config import IMAGE_ANALYSIS_CONCURRENCY
+
+# One client per API key for the life of the process: the client keeps a pool of
+# connections, so later calls skip the TCP/TLS handshakes.
+_clients: Dict[str, OpenAI] = {}
+_clients_lock = threading.Lock()
+
+# Shared by all calls, so IMAGE_ANALYSIS_CONCURRENCY bounds the runs in flight process-wide.
+_executor = ThreadPoolExecutor(max_workers=IMAGE_ANALYSIS_CONCURRENCY, thread_name_prefix="image-analysis")
+
 
 class ImageAnalysisEventHandler(AssistantEventHandler):
     """
@@ -21,66 +33,79 @@ class ImageAnalysisEventHandler(AssistantEventHandler):
         return self._accumulated_text
 
 
+def get_client(openai_api_key: str) -> OpenAI:
+    client = _clients.get(openai_api_key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(openai_api_key)
+            if client is None:
+                client = _clients[openai_api_key] = OpenAI(api_key=openai_api_key)
+    return client
+
+
+def analyze_image(assistant_id: str, image_url: str, index: int, openai_api_key: str) -> Dict[str, str]:
+    """
+    Analyzes one image in its own Thread, so images of a call can run side by side
+    (a Thread allows one active run at a time). Creating the thread, adding the message
+    and starting the run is a single request.
+    """
+    client = get_client(openai_api_key)
+    event_handler = ImageAnalysisEventHandler()
+    with client.beta.threads.create_and_run_stream(
+        assistant_id=assistant_id,
+        thread={
+            "messages": [{
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": f"Please describe image #{index} in detail."
+                    },
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": image_url,
+                            "detail": "auto"  # can be "high", "low", or "auto"
+                        }
+                    }
+                ]
+            }]
+        },
+        event_handler=event_handler
+    ) as run_stream:
+        # Wait for the run to finish
+        run_stream.until_done()
+
+    return {
+        "image_url": image_url,
+        "analysis": event_handler.get_final_text().strip()
+    }
+
+
 def analyze_images(
     assistant_id: str,
     image_urls: List[str],
     openai_api_key: str
 ) -> List[Dict[str, str]]:
     """
-    Analyzes a list of images using an Assistant with vision capabilities.
-    Returns a list of { "image_url": ..., "analysis": ... } dictionaries.
+    Analyzes a list of images using an Assistant with vision capabilities, concurrently.
+    Returns a list of { "image_url": ..., "analysis": ... } dictionaries in the order of
+    image_urls. If an image fails, the error of the first failed one is raised.
     """
+    futures = [
+        _executor.submit(analyze_image, assistant_id, url, idx, openai_api_key)
+        for idx, url in enumerate(image_urls, start=1)
+    ]
+    return [future.result() for future in futures]
 
-    # 1) Set up the client
-    openai.api_key = openai_api_key
-    client = OpenAI(api_key = openai_api_key)
-
-    # 2) Create a brand new Thread
-    thread = client.beta.threads.create()
 
-    # 3) Prepare a container for the results
-    results = []
-
-    # 4) Iterate over each image
-    for idx, url in enumerate(image_urls, start=1):
-        # Add the user message referencing the image
-        user_message = client.beta.threads.messages.create(
-            thread_id=thread.id,
-            role="user",
-            content=[
-                {
-                    "type": "text",
-                    "text": f"Please describe image #{idx} in detail."
-                },
-                {
-                    "type": "image_url",
-                    "image_url": {
-                        "url": url,
-                        "detail": "auto"  # can be "high", "low", or "auto"
-                    }
-                }
-            ]
-        )
-
-        # 5) Create an event handler to gather the final text from the assistant
-        event_handler = ImageAnalysisEventHandler()
-
-        # 6) Create a Run to get the Assistant's response, streaming behind the scenes
-        with client.beta.threads.runs.stream(
-            thread_id=thread.id,
-            assistant_id=assistant_id,
-            event_handler=event_handler
-        ) as run_stream:
-            # Wait for the run to finish
-            run_stream.until_done()
-
-        # 7) Get the final assembled text from the event handler
-        final_analysis = event_handler.get_final_text()
-
-        # 8) Append to results
-        results.append({
-            "image_url": url,
-            "analysis": final_analysis.strip()
-        })
-
-    return results
\ No newline at end of file
+async def analyze_images_async(
+    assistant_id: str,
+    image_urls: List[str],
+    openai_api_key: str
+) -> List[Dict[str, str]]:
+    """analyze_images() for the event loop: awaits the shared pool without blocking it."""
+    return list(await asyncio.gather(*(
+        asyncio.wrap_future(_executor.submit(analyze_image, assistant_id, url, idx, openai_api_key))
+        for idx, url in enumerate(image_urls, start=1)
+    )))
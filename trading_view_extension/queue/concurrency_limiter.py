@@ -0,0 +1,114 @@
+import math
+import threading
+import time
+from trading_view_extension.monitoring.metrics import WORKER_CONCURRENCY_LIMIT
+
+
+class AimdConcurrencyLimiter:
+    """
+    Adaptive limit on the number of jobs in flight (additive increase, multiplicative decrease).
+
+    Every finished job is a feedback sample:
+      * it failed, or its latency exceeds `latency_tolerance` times the long-term average
+        latency (the backend is queueing our requests): the limit is multiplied by `backoff`.
+        Only jobs started after the previous decrease can trigger another one, so a single
+        slow period shrinks the limit once per round trip rather than once per job.
+      * otherwise, if the limit was actually reached since it last changed, it grows by
+        1/limit, i.e. by about one job per round trip of a full window.
+
+    The limit stays within [min_limit, max_limit] and is exported as the
+    worker_concurrency_limit gauge.
+
+    Usage (poller / worker):
+        capacity = limiter.available()
+        limiter.acquire()                   # per submitted job
+        limiter.release(started, failed)    # when the job finished
+    """
+
+    def __init__(self, min_limit: int = 1, max_limit: int = 32, initial_limit: int = 5, backoff: float = 0.7,
+                 latency_tolerance: float = 2.0, short_alpha: float = 0.2, long_alpha: float = 0.02,
+                 clock=time.perf_counter):
+        if not 1 <= min_limit <= max_limit:
+            raise ValueError("Need 1 <= min_limit <= max_limit")
+        if not 0 < backoff < 1:
+            raise ValueError("backoff must be between 0 and 1")
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.short_alpha = short_alpha
+        self.long_alpha = long_alpha
+        self.clock = clock
+        self.in_flight = 0
+        self._peak_in_flight = 0    # highest in_flight since the (integer) limit last changed
+        self._limit = float(min(max(initial_limit, min_limit), max_limit))
+        self._short_latency = None  # EWMA over the last few jobs
+        self._long_latency = None   # EWMA over the last ~50 jobs: what latency normally is
+        self._last_decrease = float("-inf")
+        self._condition = threading.Condition()
+        WORKER_CONCURRENCY_LIMIT.set(self.limit)
+
+    def set_bounds(self, min_limit: int, max_limit: int) -> None:
+        """Change [min_limit, max_limit] at runtime; the current limit is moved into the new range."""
+        if not 1 <= min_limit <= max_limit:
+            raise ValueError("Need 1 <= min_limit <= max_limit")
+        with self._condition:
+            previous_limit = self.limit
+            self.min_limit = min_limit
+            self.max_limit = max_limit
+            self._limit = min(max(self._limit, min_limit), max_limit)
+            if self.limit != previous_limit:
+                self._peak_in_flight = self.in_flight
+            WORKER_CONCURRENCY_LIMIT.set(self.limit)
+            self._condition.notify_all()
+
+    @property
+    def limit(self) -> int:
+        return math.floor(self._limit)
+
+    def available(self) -> int:
+        with self._condition:
+            return max(0, self.limit - self.in_flight)
+
+    def wait_for_capacity(self, timeout: float) -> bool:
+        """Block until at least one more job may start (or timeout); returns whether it may."""
+        with self._condition:
+            return self._condition.wait_for(lambda: self.in_flight < self.limit, timeout)
+
+    def acquire(self) -> None:
+        with self._condition:
+            self.in_flight += 1
+            self._peak_in_flight = max(self._peak_in_flight, self.in_flight)
+
+    def release(self, started: float, failed: bool = False, observe_latency: bool = True) -> None:
+        """
+        Finish a job that started at `started` (a value of the limiter's clock).
+        observe_latency=False keeps jobs that are long by nature (batch scans) out of the latency signal.
+        """
+        now = self.clock()
+        latency = now - started
+        with self._condition:
+            previous_limit = self.limit
+            self.in_flight = max(0, self.in_flight - 1)
+
+            if observe_latency:
+                if self._long_latency is None:
+                    self._short_latency = self._long_latency = latency
+                else:
+                    self._short_latency += self.short_alpha * (latency - self._short_latency)
+                    self._long_latency += self.long_alpha * (latency - self._long_latency)
+            congested = failed or (
+                self._long_latency is not None and self._short_latency > self.latency_tolerance * self._long_latency
+            )
+
+            if congested:
+                if started >= self._last_decrease:
+                    self._limit = max(self.min_limit, self._limit * self.backoff)
+                    self._last_decrease = now
+            elif self._peak_in_flight >= previous_limit:
+                self._limit = min(self.max_limit, self._limit + 1 / self._limit)
+
+            if self.limit != previous_limit:
+                self._peak_in_flight = self.in_flight
+            WORKER_CONCURRENCY_LIMIT.set(self.limit)
+            self._condition.notify_all()
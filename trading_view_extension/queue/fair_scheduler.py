@@ -0,0 +1,99 @@
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+
+CHAT = "chat"
+ANALYSIS = "analysis"
+BATCH = "batch"
+
+DEFAULT_WEIGHTS = {CHAT: 4.0, ANALYSIS: 2.0, BATCH: 1.0}
+
+
+def parse_weights(spec: str) -> dict:
+    """"chat=4,analysis=2,batch=1" -> {"chat": 4.0, "analysis": 2.0, "batch": 1.0}"""
+    weights = dict(DEFAULT_WEIGHTS)
+    for part in filter(None, (part.strip() for part in (spec or "").split(","))):
+        name, _, value = part.partition("=")
+        weights[name.strip()] = float(value)
+    return weights
+
+
+class _Entry:
+    __slots__ = ("item", "job_class", "arrival", "served")
+
+    def __init__(self, item, job_class, arrival):
+        self.item = item
+        self.job_class = job_class
+        self.arrival = arrival
+        self.served = False
+
+
+class FairScheduler:
+    """
+    Start-time fair queuing over flows of (job class, user).
+
+    Every user gets their own flow per job class, so one user's burst only delays that
+    user's later jobs. Flows are served in proportion to the weight of their class (chat
+    turns outrank new analyses, which outrank batch scans) and ties go to the class with the
+    higher weight. A job that has waited longer than `aging_seconds` is served before
+    anything else, oldest first, so no class can be starved.
+
+    Not a queue of its own: the consumer pushes received messages and pops one whenever
+    the concurrency limiter has room.
+    """
+
+    def __init__(self, weights: dict = None, aging_seconds: float = 30.0, clock=time.monotonic):
+        self.weights = dict(weights or DEFAULT_WEIGHTS)
+        self.aging_seconds = aging_seconds
+        self.clock = clock
+        self._heap = []                 # (start tag, -weight, sequence, entry)
+        self._arrivals = deque()        # entries in arrival order, for aging
+        self._finish_tags = {}          # flow -> finish tag of its last queued job
+        self._virtual_time = 0.0
+        self._sequence = itertools.count()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._size
+
+    def push(self, item, user, job_class: str = ANALYSIS, cost: float = 1.0) -> None:
+        weight = self.weights.get(job_class, 1.0)
+        entry = _Entry(item, job_class, self.clock())
+        with self._lock:
+            flow = (job_class, user)
+            start = max(self._virtual_time, self._finish_tags.get(flow, 0.0))
+            self._finish_tags[flow] = start + cost / weight
+            heapq.heappush(self._heap, (start, -weight, next(self._sequence), entry))
+            self._arrivals.append(entry)
+            self._size += 1
+
+    def pop(self):
+        """The next item to run, or None when empty. Returns (item, job_class, seconds waited)."""
+        with self._lock:
+            entry = self._pop_aged() or self._pop_fair()
+            if entry is None:
+                return None
+            entry.served = True
+            self._size -= 1
+            if not self._size:
+                # Idle: forget old flows so their tags do not leak into the next busy period.
+                self._finish_tags.clear()
+            return entry.item, entry.job_class, self.clock() - entry.arrival
+
+    def _pop_aged(self):
+        while self._arrivals and self._arrivals[0].served:
+            self._arrivals.popleft()
+        if self._arrivals and self.clock() - self._arrivals[0].arrival > self.aging_seconds:
+            return self._arrivals.popleft()
+        return None
+
+    def _pop_fair(self):
+        while self._heap:
+            start, _, _, entry = heapq.heappop(self._heap)
+            if not entry.served:
+                self._virtual_time = max(self._virtual_time, start)
+                return entry
+        return None
@@ -0,0 +1,142 @@
+import threading
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass, field
+
+
+@dataclass
+class _StoredMessage:
+    message_id: str
+    body: str
+    group_id: str
+    sent_timestamp_ms: int
+    receive_count: int = 0
+    receipt_handle: str = None
+    visible_at: float = 0.0
+    attributes: dict = field(default_factory=dict)
+
+
+class _FifoQueue:
+    def __init__(self):
+        self.messages = deque()
+        self.in_flight = {}          # receipt handle -> message
+        self.locked_groups = set()   # groups with a message in flight
+        self.dedup_ids = {}          # deduplication id -> expiry
+
+
+class InMemoryFifoSqsClient:
+    """
+    In-process stand-in for a boto3 SQS client talking to FIFO queues.
+
+    Implements the calls the worker uses (send_message, receive_message, delete_message,
+    get_queue_attributes) with FIFO semantics: per-MessageGroupId ordering, a group stays
+    locked while one of its messages is in flight, invisible messages reappear after the
+    visibility timeout, and MessageDeduplicationId is honoured for five minutes.
+    Queues are created on first use, keyed by QueueUrl.
+    """
+
+    DEDUP_WINDOW_SECONDS = 300
+
+    def __init__(self):
+        self._queues = {}
+        self._condition = threading.Condition()
+
+    def _queue(self, queue_url: str) -> _FifoQueue:
+        queue = self._queues.get(queue_url)
+        if queue is None:
+            queue = self._queues[queue_url] = _FifoQueue()
+        return queue
+
+    def send_message(self, QueueUrl, MessageBody, MessageGroupId="default", MessageDeduplicationId=None, **kwargs):
+        now = time.time()
+        with self._condition:
+            queue = self._queue(QueueUrl)
+            if MessageDeduplicationId:
+                queue.dedup_ids = {key: expiry for key, expiry in queue.dedup_ids.items() if expiry > now}
+                if MessageDeduplicationId in queue.dedup_ids:
+                    return {"MessageId": None, "Duplicate": True}
+                queue.dedup_ids[MessageDeduplicationId] = now + self.DEDUP_WINDOW_SECONDS
+
+            message = _StoredMessage(
+                message_id=str(uuid.uuid4()),
+                body=MessageBody,
+                group_id=MessageGroupId,
+                sent_timestamp_ms=int(now * 1000),
+                visible_at=now + kwargs.get("DelaySeconds", 0),
+            )
+            queue.messages.append(message)
+            self._condition.notify_all()
+        return {"MessageId": message.message_id}
+
+    def receive_message(self, QueueUrl, MaxNumberOfMessages=1, VisibilityTimeout=30, WaitTimeSeconds=0, **kwargs):
+        deadline = time.time() + WaitTimeSeconds
+        with self._condition:
+            while True:
+                messages = self._take(QueueUrl, MaxNumberOfMessages, VisibilityTimeout)
+                remaining = deadline - time.time()
+                if messages or remaining <= 0:
+                    return {"Messages": messages} if messages else {}
+                self._condition.wait(min(remaining, 0.05))
+
+    def _take(self, queue_url, max_messages, visibility_timeout):
+        now = time.time()
+        queue = self._queue(queue_url)
+        self._expire_in_flight(queue, now)
+
+        # Like SQS, one receive may return several messages of a group (in order); the group
+        # is then locked for later receives until they are deleted or become visible again.
+        locked = set(queue.locked_groups)
+        taken = []
+        for message in list(queue.messages):
+            if len(taken) >= max_messages:
+                break
+            if message.group_id in locked:
+                continue
+            if message.visible_at > now:
+                # Later messages of the group must not overtake a delayed one.
+                locked.add(message.group_id)
+                continue
+            queue.messages.remove(message)
+            message.receive_count += 1
+            message.receipt_handle = uuid.uuid4().hex
+            message.visible_at = now + visibility_timeout
+            queue.in_flight[message.receipt_handle] = message
+            queue.locked_groups.add(message.group_id)
+            taken.append({
+                "MessageId": message.message_id,
+                "ReceiptHandle": message.receipt_handle,
+                "Body": message.body,
+                "Attributes": {
+                    "SentTimestamp": str(message.sent_timestamp_ms),
+                    "ApproximateReceiveCount": str(message.receive_count),
+                    "MessageGroupId": message.group_id,
+                },
+                "MessageAttributes": {},
+            })
+        return taken
+
+    @staticmethod
+    def _expire_in_flight(queue, now):
+        for handle, message in list(queue.in_flight.items()):
+            if message.visible_at <= now:
+                del queue.in_flight[handle]
+                queue.locked_groups.discard(message.group_id)
+                queue.messages.appendleft(message)
+
+    def delete_message(self, QueueUrl, ReceiptHandle, **kwargs):
+        with self._condition:
+            queue = self._queue(QueueUrl)
+            message = queue.in_flight.pop(ReceiptHandle, None)
+            if message is not None:
+                queue.locked_groups.discard(message.group_id)
+                self._condition.notify_all()
+        return {}
+
+    def get_queue_attributes(self, QueueUrl, AttributeNames=None, **kwargs):
+        with self._condition:
+            queue = self._queue(QueueUrl)
+            return {"Attributes": {
+                "ApproximateNumberOfMessages": str(len(queue.messages)),
+                "ApproximateNumberOfMessagesNotVisible": str(len(queue.in_flight)),
+            }}
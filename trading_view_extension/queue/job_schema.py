@@ -0,0 +1,60 @@
+from typing import Literal, Optional
+from pydantic import BaseModel, ConfigDict, StrictBool, StrictStr, ValidationError, model_validator
+from trading_view_extension.services.job_errors import PermanentJobError
+
+
+class _Schema(BaseModel):
+    # Jobs carry more fields than the worker reads (and gain more on the way); only what is read is checked.
+    model_config = ConfigDict(extra="allow")
+
+
+class BatchItem(_Schema):
+    asset: StrictStr
+    s3_urls: list[StrictStr] = []
+    job_id: Optional[StrictStr] = None
+
+
+class Job(_Schema):
+    job_id: StrictStr
+    agent: StrictStr
+    job_type: Optional[Literal["analysis", "batch_scan"]] = None
+    email_id: Optional[StrictStr] = None
+    asset: Optional[StrictStr] = None
+    is_chat: Optional[StrictBool] = None
+    message_id: Optional[StrictStr] = None
+    s3_urls: list[StrictStr] = []
+    user_instructions: Optional[StrictStr] = None
+    agent_query: Optional[StrictStr] = None
+    prompt: Optional[StrictStr] = None
+    items: Optional[list[BatchItem]] = None
+
+    @model_validator(mode="after")
+    def _check_job_kind(self):
+        if not self.job_id:
+            raise ValueError("job_id must not be empty")
+        if self.job_type == "batch_scan" and self.items is None:
+            raise ValueError("a batch_scan job needs items")
+        if self.job_type != "batch_scan" and not self.asset:
+            # Read once the analysis is back; missing then, it would fail after a paid model call.
+            raise ValueError("a job needs an asset (batch_scan jobs have one per item)")
+        if self.agent.lower() == "custom" and (self.prompt is None or self.agent_query is None):
+            raise ValueError("a custom agent job needs prompt and agent_query")
+        if self.is_chat and self.agent_query is None:
+            raise ValueError("a chat job needs agent_query")
+        return self
+
+
+def validate_job(job) -> None:
+    """
+    Check the fields the worker relies on before any I/O. Raises PermanentJobError with
+    reason "invalid_job" and the first problem found, e.g. "s3_urls: Input should be a valid list".
+    """
+    if not isinstance(job, dict):
+        raise PermanentJobError("invalid_job", f"job must be a JSON object, got {type(job).__name__}")
+    try:
+        Job.model_validate(job)
+    except ValidationError as e:
+        error = e.errors()[0]
+        location = ".".join(str(part) for part in error["loc"])
+        message = error["msg"].removeprefix("Value error, ")
+        raise PermanentJobError("invalid_job", f"{location}: {message}" if location else message) from None
@@ -0,0 +1,208 @@
+"""
+Capture and replay of the input job stream.
+
+When JOB_TRACE_FILE is set, the consumer appends one line per received job describing
+its shape and arrival time, with everything identifying scrubbed:
+
+    {"ts": 1760890000.123, "conv": "9f2c61d0a4b3e8f1", "user": "04aa1c7e93d2b5f6",
+     "type": "analysis", "agent": "default", "chat": true, "images": 2, "history": 6,
+     "instructions_chars": 120, "query_chars": 42, "asset": "AAPL"}
+
+job_id and email_id are replaced by salted hashes (JOB_TRACE_SALT, random per process
+when unset) so conversations and users stay linkable within a trace; prompts,
+instructions, queries and chart URLs are reduced to lengths and counts.
+
+TraceReplayer turns a trace back into jobs and sends them at the original inter-arrival
+times divided by `speed`. Jobs of one conversation are never reordered; when completions
+can be observed (see completed()), a conversation's next job is also held back until the
+previous one finished, like a user waiting for the answer. replay_job_trace.py pushes a
+trace into a real queue, benchmarks/e2e/run_benchmark.py --trace into a local one.
+"""
+import hashlib
+import json
+import os
+import secrets
+import threading
+import time
+import uuid
+from dotenv import load_dotenv
+load_dotenv()
+
+JOB_TRACE_FILE = os.getenv("JOB_TRACE_FILE")
+JOB_TRACE_SALT = os.getenv("JOB_TRACE_SALT") or secrets.token_hex(16)
+
+_TEXT_SIZES = {"instructions_chars": "user_instructions", "query_chars": "agent_query", "prompt_chars": "prompt"}
+
+
+def _pseudonym(value, salt: str):
+    if value is None:
+        return None
+    return hashlib.sha256(f"{salt}:{value}".encode("utf-8")).hexdigest()[:16]
+
+
+def scrub(job: dict, arrival: float, salt: str = JOB_TRACE_SALT) -> dict:
+    """The trace entry of a job: arrival time, pseudonymous ids and sizes only."""
+    entry = {
+        "ts": round(arrival, 3),
+        "conv": _pseudonym(job.get("job_id"), salt),
+        "user": _pseudonym(job.get("email_id"), salt),
+        "type": job.get("job_type", "analysis"),
+        "agent": (job.get("agent") or "").lower(),
+        "chat": bool(job.get("is_chat")),
+        "images": len(job.get("s3_urls") or []),
+        "history": None,
+        "asset": job.get("asset"),
+    }
+    for size_key, field in _TEXT_SIZES.items():
+        if job.get(field):
+            entry[size_key] = len(job[field])
+    if isinstance(job.get("items"), list):
+        entry["items"] = len(job["items"])
+        entry["item_images"] = sum(len(item.get("s3_urls") or []) for item in job["items"])
+    return entry
+
+
+class JobTraceRecorder:
+    """Appends scrubbed trace entries to a line-delimited file (thread safe)."""
+
+    def __init__(self, path: str, salt: str = JOB_TRACE_SALT):
+        self.path = path
+        self.salt = salt
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def start(self, job: dict, message: dict) -> dict:
+        """Scrub a job as it arrives, before processing mutates it."""
+        sent_timestamp = (message.get("Attributes") or {}).get("SentTimestamp")
+        arrival = int(sent_timestamp) / 1000 if sent_timestamp else time.time()
+        return scrub(job, arrival, self.salt)
+
+    def finish(self, entry: dict, job: dict) -> None:
+        """Write the entry once processing has filled in the conversation history length."""
+        entry["history"] = job.get("history_length")
+        line = json.dumps(entry, separators=(",", ":")) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+def default_recorder():
+    return JobTraceRecorder(JOB_TRACE_FILE) if JOB_TRACE_FILE else None
+
+
+def read_trace(path: str) -> list[dict]:
+    with open(path, encoding="utf-8") as trace_file:
+        entries = [json.loads(line) for line in trace_file if line.strip()]
+    return sorted(entries, key=lambda entry: entry["ts"])
+
+
+def synthesize_job(entry: dict, job_id: str, image_url: str = "https://replay.local/charts/{n}.png") -> dict:
+    """A job with the shape of a trace entry; texts are filler of the recorded lengths."""
+    def images(count):
+        return [image_url.format(n=uuid.uuid4().hex) for _ in range(count)]
+
+    job = {
+        "job_id": job_id,
+        "email_id": f"{entry.get('user') or 'anonymous'}@replay.local",
+        "agent": entry.get("agent") or "default",
+        "asset": entry.get("asset") or "SPY",
+        "is_chat": entry.get("chat", False),
+        "s3_urls": images(entry.get("images", 0)),
+        "user_instructions": "x" * entry.get("instructions_chars", 0),
+    }
+    if entry.get("query_chars"):
+        job["agent_query"] = "x" * entry["query_chars"]
+    elif job["is_chat"]:
+        job["agent_query"] = ""
+    if entry.get("prompt_chars"):
+        job["prompt"] = "x" * entry["prompt_chars"]
+    if job["is_chat"]:
+        job["message_id"] = str(uuid.uuid4())
+    if entry.get("type") and entry["type"] != "analysis":
+        job["job_type"] = entry["type"]
+        per_item = entry.get("item_images", 0) // max(1, entry.get("items", 1))
+        job["items"] = [{"asset": f"SYM{index}", "s3_urls": images(per_item)} for index in range(entry.get("items", 0))]
+    return job
+
+
+class TraceReplayer:
+    """
+    Sends the jobs of a trace through send(job, message_group_id).
+
+    wait_for_completion=True holds a conversation's next job until completed(job_id) was
+    called for the previous one (the caller watches the output queue).
+    seed_conversation(job_id, entry) is called for chats whose conversation started before
+    the trace, so the caller can create the conversation they continue.
+    """
+
+    def __init__(self, entries: list[dict], send, speed: float = 1.0, wait_for_completion: bool = False,
+                 image_url: str = "https://replay.local/charts/{n}.png", seed_conversation=None):
+        if speed <= 0:
+            raise ValueError("speed must be positive")
+        self.entries = entries
+        self.send = send
+        self.speed = speed
+        self.wait_for_completion = wait_for_completion
+        self.image_url = image_url
+        self.seed_conversation = seed_conversation
+        self.sent = 0
+        self._job_ids = {}        # conversation -> job_id
+        self._conversations = {}  # job_id -> conversation
+        self._in_flight = set()   # conversations waiting for a completion
+        self._deferred = {}       # conversation -> [jobs]
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    def _job(self, entry: dict) -> tuple[str, dict]:
+        conversation = entry.get("conv") or uuid.uuid4().hex
+        if not entry.get("chat") or conversation not in self._job_ids:
+            self._job_ids[conversation] = str(uuid.uuid4())
+            if entry.get("chat") and self.seed_conversation is not None:
+                self.seed_conversation(self._job_ids[conversation], entry)
+        job_id = self._job_ids[conversation]
+        self._conversations[job_id] = conversation
+        return conversation, synthesize_job(entry, job_id, self.image_url)
+
+    def _send(self, conversation: str, job: dict) -> None:
+        # One message group per conversation keeps its jobs in order on a FIFO queue.
+        self.send(job, f"conv-{conversation}")
+        with self._lock:
+            self.sent += 1
+
+    def run(self) -> int:
+        """Replay the whole trace; returns once every job was sent or deferred."""
+        if not self.entries:
+            return 0
+        origin = self.entries[0]["ts"]
+        started = time.monotonic()
+        for entry in self.entries:
+            delay = started + (entry["ts"] - origin) / self.speed - time.monotonic()
+            if delay > 0 and self._stopped.wait(delay):
+                break
+            with self._lock:
+                conversation, job = self._job(entry)
+                if self.wait_for_completion and conversation in self._in_flight:
+                    self._deferred.setdefault(conversation, []).append(job)
+                    continue
+                if self.wait_for_completion:
+                    self._in_flight.add(conversation)
+            self._send(conversation, job)
+        return self.sent
+
+    def completed(self, job_id: str) -> None:
+        """Release the next deferred job of the conversation job_id belongs to."""
+        with self._lock:
+            conversation = self._conversations.get(job_id)
+            deferred = self._deferred.get(conversation)
+            if not deferred:
+                self._in_flight.discard(conversation)
+                return
+            job = deferred.pop(0)
+        self._send(conversation, job)
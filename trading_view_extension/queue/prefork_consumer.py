@@ -0,0 +1,451 @@
+"""
+Prefork mode: one process polls SQS, the jobs run in WORKER_PROCESSES worker processes.
+
+A single process is bound by the GIL for the CPU side of a job (JSON of large histories,
+validation, log formatting). In prefork mode the supervisor keeps everything that has to
+be global: receiving, fair scheduling, the concurrency limit over all processes, deletes
+and the safe store. Each worker process builds its own orchestrator and clients and runs
+the jobs it is handed in threads, the same way the threaded consumer does.
+
+The supervisor and each worker talk over a duplex pipe:
+
+    supervisor -> worker   ("job", task_id, message)           SQS message to run
+                           ("sent", request_id, response, error)
+                           ("config", overrides)               runtime tuning overrides, see runtime_config.py
+                           ("stop",)
+    worker -> supervisor   ("done", task_id, outcome, degraded, batch)
+                           ("send", request_id, request)       send_message() arguments
+                           ("push", job_id, event)             encoded job event for result push
+
+Results are encoded in the worker and sent by the supervisor, which owns the SQS client.
+A worker that dies is restarted; the jobs it was running are handed to another process
+up to PREFORK_MAX_REDELIVERIES times and then stay in the safe store.
+"""
+import asyncio
+import itertools
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from multiprocessing.connection import wait
+from config import (
+    logger,
+    LOG_LEVEL,
+    WORKER_PROCESSES,
+    PREFORK_MAX_REDELIVERIES,
+    PREFORK_METRICS_PORT,
+    WARMUP_TIMEOUT_SECONDS,
+    RESULT_PUSH_ENABLED,
+)
+from trading_view_extension.queue.sqs_queue_consumer import SqsQueueConsumer
+from trading_view_extension.queue.sqs_queue_publisher import SQSQueuePublisher
+from trading_view_extension.queue import job_trace
+from trading_view_extension.queue.result_push_server import PushingPublisher
+from trading_view_extension.orchestrators.ai_orchestrator import AiOrchestrator
+from trading_view_extension.monitoring.metrics import WORKER_PROCESSES_ALIVE, WORKER_PROCESS_RESTARTS, EXECUTOR_IN_FLIGHT
+from trading_view_extension.monitoring.metrics_server import start_metrics_server
+from trading_view_extension.monitoring import profiler
+from trading_view_extension.monitoring.log_pipeline import forward_logging, relay_logging
+from trading_view_extension.monitoring.tracing import span, set_exporter, FileSpanExporter, process_trace_file
+from trading_view_extension.services.client_registry import registry
+from trading_view_extension.services.runtime_config import runtime_config, InvalidConfig
+
+PUBLISH_TIMEOUT_SECONDS = 60  # A worker waits this long for the supervisor to send a message for it
+DRAIN_TIMEOUT_SECONDS = 30    # stop_polling() waits this long for running jobs
+RESTART_BACKOFF_SECONDS = 1   # Pause before restarting a process that died right after starting
+
+
+class _Task:
+    __slots__ = ("queue_url", "message", "started", "deliveries")
+
+    def __init__(self, queue_url: str, message: dict, started: float):
+        self.queue_url = queue_url
+        self.message = message
+        self.started = started
+        self.deliveries = 0
+
+
+class _WorkerHandle:
+    """Supervisor side of a worker process."""
+
+    def __init__(self, slot: int, process, connection):
+        self.slot = slot
+        self.process = process
+        self.connection = connection
+        self.started = time.monotonic()
+        self.tasks = set()
+        self._send_lock = threading.Lock()
+
+    def send(self, *message):
+        with self._send_lock:
+            self.connection.send(message)
+
+
+class PreforkConsumer(SqsQueueConsumer):
+    """
+    SqsQueueConsumer whose jobs run in worker processes. Polling, scheduling and the
+    concurrency limit are inherited unchanged; the limit counts jobs over all processes.
+    """
+
+    def __init__(self, sqs_queue_publisher, processes: int = WORKER_PROCESSES, worker_target=None,
+                 max_redeliveries: int = PREFORK_MAX_REDELIVERIES, start_method: str = "spawn",
+                 result_push=None, **kwargs):
+        super().__init__(sqs_queue_publisher, **kwargs)
+        # push(job_id, event) of the result push server, fed with the workers' job events
+        self.result_push = result_push
+        self.processes = max(1, processes)
+        self.worker_target = worker_target or worker_main
+        self.max_redeliveries = max_redeliveries
+        # spawn: the supervisor already runs threads (logging, metrics), which fork does not copy safely.
+        self._context = multiprocessing.get_context(start_method)
+        self._log_queue = self._context.Queue()
+        self._log_relay = None
+        self._workers = {}  # slot -> _WorkerHandle
+        self._tasks = {}    # task id -> _Task, handed to a worker and not done yet
+        self._task_ids = itertools.count()
+        self._running = 0   # Dispatched and not finished, including hand-offs not delivered yet
+        self._stopping = threading.Event()
+        self._supervisor_thread = None
+
+    def _create_orchestrator(self):
+        # Jobs run in the worker processes, each on its own orchestrator and credit admission.
+        return None
+
+    def start_workers(self):
+        if self._workers:
+            return
+        self._log_relay = relay_logging(self._log_queue)
+        profiler.add_signal_listener(self._profile_workers)
+        with self.lock:
+            for slot in range(self.processes):
+                self._spawn(slot)
+        self._supervisor_thread = threading.Thread(target=self._supervise, name="prefork-supervisor", daemon=True)
+        self._supervisor_thread.start()
+        logger.info("Started %d worker processes", self.processes)
+
+    def start_polling(self, queue_url: str):
+        self.start_workers()
+        super().start_polling(queue_url)
+
+    def _spawn(self, slot: int):
+        # Called with self.lock held
+        connection, child_connection = self._context.Pipe()
+        process = self._context.Process(
+            target=self.worker_target,
+            args=(slot, child_connection, self.max_workers, self._log_queue),
+            name=f"job-worker-{slot}",
+            daemon=True,
+        )
+        with profiler.profile_signal_blocked():
+            process.start()
+        child_connection.close()  # So a dead worker shows up as EOF on our end
+        worker = _WorkerHandle(slot, process, connection)
+        self._workers[slot] = worker
+        WORKER_PROCESSES_ALIVE.set(len(self._workers))
+        overrides = runtime_config.overrides()
+        if overrides:
+            # A new process starts from the environment; bring it up to date with the changes since.
+            worker.send("config", overrides)
+
+    def apply_tuning(self, tuning, previous=None):
+        super().apply_tuning(tuning, previous)
+        # max_tokens, retries and thresholds are read in the worker processes, which also size their pools.
+        overrides = runtime_config.overrides()
+        with self.lock:
+            workers = list(self._workers.values())
+        for worker in workers:
+            try:
+                worker.send("config", overrides)
+            except OSError:
+                pass  # A restarted process gets the overrides when it is spawned
+
+    def _profile_workers(self):
+        # Called from the signal handler, so no lock: the handles are only read.
+        for worker in list(self._workers.values()):
+            if worker.process.pid is not None and worker.process.is_alive():
+                os.kill(worker.process.pid, profiler.PROFILE_SIGNAL)
+
+    def _start(self, queue_url: str, message: dict):
+        task_id, task = next(self._task_ids), _Task(queue_url, message, time.perf_counter())
+        with self.lock:
+            self.local_safe_store[message.get("MessageId")] = message
+            self._tasks[task_id] = task
+            self._running += 1
+        self._observe_queue_wait(message)
+        self._submit(self._hand_off, task_id, task)
+
+    def _hand_off(self, task_id: int, task: _Task):
+        # Delete right away to avoid FIFO blocking, as the threaded consumer does.
+        asyncio.run(self.delete_message(task.queue_url, task.message))
+        self._deliver(task_id, task)
+
+    def replay_safe_store(self):
+        """
+        Hand the messages left in the safe store to the worker processes again. They were
+        deleted from SQS when first dispatched, so they skip the delete; a body that does not
+        parse is quarantined by the worker's orchestrator like on its first run.
+        """
+        logger.warning("Starting manual recovery from safe store (for crashed messages)")
+        self.start_workers()
+        with self.lock:
+            running = {task.message.get("MessageId") for task in self._tasks.values()}
+            replayed = [message for message_id, message in self.local_safe_store.items() if message_id not in running]
+            tasks = [(next(self._task_ids), _Task(None, message, time.perf_counter())) for message in replayed]
+            self._tasks.update(tasks)
+            self._running += len(tasks)
+        for task_id, task in tasks:
+            # Counted like a dispatched job, so _complete() settles it the same way.
+            self.limiter.acquire()
+            EXECUTOR_IN_FLIGHT.inc()
+            self._deliver(task_id, task)
+        logger.info("Handed %d messages from the safe store to the worker processes", len(tasks))
+
+    def _deliver(self, task_id: int, task: _Task):
+        with self.lock:
+            workers = list(self._workers.values())
+            alive = [worker for worker in workers if worker.process.is_alive()] or workers
+            worker = min(alive, key=lambda candidate: len(candidate.tasks))
+            worker.tasks.add(task_id)
+            self._tasks[task_id] = task
+        try:
+            worker.send("job", task_id, task.message)
+        except OSError as e:
+            # The supervisor thread notices the dead process and hands its jobs on.
+            logger.warning("Could not hand message %s to worker process %d: %s",
+                           task.message.get("MessageId"), worker.slot, e)
+
+    def _finish(self, started: float, outcome: str, degraded: bool, batch: bool):
+        with self.lock:
+            self._running -= 1
+        super()._finish(started, outcome, degraded, batch)
+
+    def _supervise(self):
+        while not self._stopping.is_set():
+            with self.lock:
+                workers = list(self._workers.values())
+            ready = wait([worker.connection for worker in workers], timeout=0.5)
+            for worker in workers:
+                if worker.connection in ready:
+                    try:
+                        message = worker.connection.recv()
+                    except (EOFError, OSError):
+                        self._restart(worker)
+                        continue
+                    self._handle(worker, message)
+                elif not worker.process.is_alive():
+                    self._restart(worker)
+
+    def _handle(self, worker: _WorkerHandle, message: tuple):
+        kind = message[0]
+        if kind == "done":
+            _, task_id, outcome, degraded, batch = message
+            self._complete(worker, task_id, outcome, degraded, batch)
+        elif kind == "send":
+            self._submit(self._send_for, worker, *message[1:])
+        elif kind == "push":
+            if self.result_push is not None:
+                self.result_push(message[1], message[2])
+        else:
+            logger.warning("Unknown message %r from worker process %d", kind, worker.slot)
+
+    def _complete(self, worker: _WorkerHandle, task_id: int, outcome: str, degraded: bool, batch: bool):
+        with self.lock:
+            worker.tasks.discard(task_id)
+            task = self._tasks.pop(task_id, None)
+            if task is None:
+                return
+            message_id = task.message.get("MessageId")
+            if outcome == "ok":
+                self.local_safe_store.pop(message_id, None)
+        if outcome != "ok":
+            logger.error("⚠️ Message %s will stay in safe store for manual recovery.", message_id)
+        self._finish(task.started, outcome, degraded, batch)
+
+    def _send_for(self, worker: _WorkerHandle, request_id: int, request: dict):
+        try:
+            response = self.sqs_client.send_message(**request)
+            reply = ("sent", request_id, {"MessageId": response.get("MessageId")}, None)
+        except Exception as e:
+            reply = ("sent", request_id, None, f"{type(e).__name__}: {e}")
+        try:
+            worker.send(*reply)
+        except OSError:
+            pass  # The worker died; its jobs are handed on
+
+    def _restart(self, worker: _WorkerHandle):
+        with self.lock:
+            if self._workers.get(worker.slot) is not worker:
+                return
+            orphaned = [(task_id, self._tasks.pop(task_id)) for task_id in worker.tasks if task_id in self._tasks]
+        worker.connection.close()
+        worker.process.join(timeout=1)
+        if self._stopping.is_set():
+            return
+        logger.error("Worker process %d (pid %s) exited with code %s while running %d jobs, restarting it",
+                     worker.slot, worker.process.pid, worker.process.exitcode, len(orphaned))
+        WORKER_PROCESS_RESTARTS.inc()
+        if time.monotonic() - worker.started < RESTART_BACKOFF_SECONDS:
+            self._stopping.wait(RESTART_BACKOFF_SECONDS)
+        with self.lock:
+            self._spawn(worker.slot)
+
+        for task_id, task in orphaned:
+            task.deliveries += 1
+            if task.deliveries > self.max_redeliveries:
+                logger.error("⚠️ Message %s lost its worker process %d times, it will stay in safe store "
+                             "for manual recovery.", task.message.get("MessageId"), task.deliveries)
+                self._finish(task.started, "error", False, False)
+            else:
+                self._deliver(task_id, task)
+
+    def stop_polling(self):
+        self.shutdown_event.set()
+        if self.polling_thread:
+            self.polling_thread.join(timeout=5)
+        deadline = time.monotonic() + DRAIN_TIMEOUT_SECONDS
+        while self._running and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+        self._stopping.set()
+        if self._supervisor_thread:
+            self._supervisor_thread.join(timeout=5)
+        with self.lock:
+            workers = list(self._workers.values())
+            self._workers.clear()
+        for worker in workers:
+            try:
+                worker.send("stop")
+            except OSError:
+                pass
+        for worker in workers:
+            worker.process.join(timeout=5)
+            if worker.process.is_alive():
+                worker.process.terminate()
+            worker.connection.close()
+        WORKER_PROCESSES_ALIVE.set(0)
+        self.executor.shutdown(wait=True)
+        if self._log_relay is not None:
+            self._log_relay.stop()
+        logger.info("Stopped polling and shut down %d worker processes.", len(workers))
+
+
+class _PipePublisher(SQSQueuePublisher):
+    """Builds messages like SQSQueuePublisher; the supervisor makes the SQS call."""
+
+    def __init__(self, worker: "_WorkerProcess"):
+        super().__init__()
+        self.worker = worker
+
+    def _send_message(self, client, **request) -> dict:
+        return self.worker.request(request)
+
+
+class _WorkerProcess:
+    """Worker side: runs the jobs the supervisor hands over, in threads."""
+
+    # The threaded consumer's job path, on this process's own orchestrator.
+    run_job = SqsQueueConsumer.run_job
+    process_message_body = SqsQueueConsumer.process_message_body
+
+    def __init__(self, slot: int, connection, max_jobs: int):
+        self.slot = slot
+        self.connection = connection
+        self._send_lock = threading.Lock()
+        self._replies = {}
+        self._request_ids = itertools.count()
+        self.executor = ThreadPoolExecutor(max_workers=max_jobs, thread_name_prefix=f"job-worker-{slot}")
+        publisher = _PipePublisher(self)
+        if RESULT_PUSH_ENABLED:
+            # The push server runs in the supervisor, next to the SQS client.
+            publisher = PushingPublisher(publisher, lambda job_id, event: self.send("push", job_id, event))
+        self.orchestrator = AiOrchestrator(publisher)
+        self.job_trace = job_trace.default_recorder()
+
+    def send(self, *message):
+        with self._send_lock:
+            self.connection.send(message)
+
+    def request(self, request: dict) -> dict:
+        """Have the supervisor call send_message(**request); raises RuntimeError if that failed."""
+        future = Future()
+        request_id = next(self._request_ids)
+        self._replies[request_id] = future
+        self.send("send", request_id, request)
+        return future.result(timeout=PUBLISH_TIMEOUT_SECONDS)
+
+    def run(self):
+        while True:
+            try:
+                message = self.connection.recv()
+            except (EOFError, OSError):
+                logger.warning("Supervisor went away, worker process %d exiting", self.slot)
+                break
+            kind = message[0]
+            if kind == "job":
+                self.executor.submit(self._run, message[1], message[2])
+            elif kind == "sent":
+                _, request_id, response, error = message
+                future = self._replies.pop(request_id, None)
+                if future is None:
+                    continue
+                if error:
+                    future.set_exception(RuntimeError(error))
+                else:
+                    future.set_result(response)
+            elif kind == "config":
+                self._configure(message[1])
+            elif kind == "stop":
+                break
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def _configure(self, overrides: dict):
+        previous = runtime_config.current()
+        try:
+            tuning = runtime_config.replace(overrides, source="supervisor")
+        except InvalidConfig as e:
+            logger.error("Worker process %d keeps its runtime config: %s", self.slot, e)
+            return
+        if tuning.max_concurrency != previous.max_concurrency:
+            # Only run() submits, so the pool can be swapped here; running jobs finish in the old one.
+            pool = self.executor
+            self.executor = ThreadPoolExecutor(max_workers=tuning.max_concurrency,
+                                               thread_name_prefix=f"job-worker-{self.slot}")
+            pool.shutdown(wait=False)
+
+    def _run(self, task_id: int, message: dict):
+        message_id = message.get("MessageId")
+        outcome, degraded, batch = "ok", False, False
+        with span("sqs.process_message", message_id=message_id, worker_process=self.slot,
+                  body_bytes=len(message.get("Body") or "")) as root:
+            try:
+                degraded, batch = self.run_job(message)
+            except Exception as e:
+                outcome = "error"
+                root.set_attribute("error", str(e))
+                logger.error("Processing crashed for message %s: %s", message_id, e)
+        try:
+            self.send("done", task_id, outcome, degraded, batch)
+        except OSError:
+            pass  # Supervisor gone; run() exits on EOF
+
+
+def worker_main(slot: int, connection, max_jobs: int, log_queue=None):
+    """Entry point of a worker process."""
+    # Ctrl-C reaches the whole process group; the supervisor decides when workers stop.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    profiler.install_signal_handler()
+    if log_queue is not None:
+        forward_logging(log_queue, LOG_LEVEL)
+    # One trace file per slot: processes sharing one would each rotate it under the others.
+    set_exporter(FileSpanExporter(process_trace_file(f"worker-{slot}")))
+    try:
+        start_metrics_server(PREFORK_METRICS_PORT + slot)
+    except OSError as e:
+        logger.warning("Worker process %d serves no metrics: %s", slot, e)
+    worker = _WorkerProcess(slot, connection, max_jobs)
+    # SQS calls are made by the supervisor.
+    registry.warm_up(["supabase", "openrouter"], timeout=WARMUP_TIMEOUT_SECONDS)
+    logger.info("Worker process %d ready", slot)
+    worker.run()
@@ -0,0 +1,63 @@
+import json
+import os
+import threading
+from collections import deque
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+from config import logger, dead_letter_tasks_queue
+from trading_view_extension.monitoring.metrics import JOBS_QUARANTINED
+from trading_view_extension.services.job_errors import error_reason
+load_dotenv()
+
+# Where jobs that can never succeed are set aside, with the reason:
+#   "file": one JSON line per job in QUARANTINE_FILE
+#   "sqs":  the SQS_DEAD_LETTER_QUEUE_URL queue (redrive them once the cause is fixed)
+QUARANTINE_BACKEND = os.getenv("QUARANTINE_BACKEND", "file").lower()
+QUARANTINE_FILE = os.getenv("QUARANTINE_FILE", "quarantine.jsonl")
+QUARANTINE_ERROR_LIMIT = 1000  # Characters of the error message kept
+
+
+class QuarantineStore:
+    """
+    Dead-letter store for poison messages: jobs that failed validation or hit a permanent
+    error. Each record keeps the original job (or raw body) so it can be inspected and
+    resubmitted, plus the reason it was set aside.
+
+    The last `keep_recent` records are also kept in memory (see recent()).
+    """
+
+    def __init__(self, backend: str = QUARANTINE_BACKEND, path: str = QUARANTINE_FILE, keep_recent: int = 100):
+        if backend == "sqs" and not dead_letter_tasks_queue.url:
+            logger.warning("QUARANTINE_BACKEND=sqs without SQS_DEAD_LETTER_QUEUE_URL, using %s", path)
+            backend = "file"
+        self.backend = backend
+        self.path = path
+        self._recent = deque(maxlen=keep_recent)
+        self._lock = threading.Lock()
+
+    def add(self, job, error: BaseException, message_id: str = None) -> dict:
+        """Record a job (dict, or the raw message body when it is not valid JSON) that is not retried."""
+        reason = error_reason(error)
+        record = {
+            "quarantined_at": datetime.now(timezone.utc).isoformat(),
+            "reason": reason,
+            "error": str(error)[:QUARANTINE_ERROR_LIMIT],
+            "message_id": message_id,
+            "job_id": job.get("job_id") if isinstance(job, dict) else None,
+            "job": job,
+        }
+        line = json.dumps(record, default=str)
+        if self.backend == "sqs":
+            dead_letter_tasks_queue.client.send_message(QueueUrl=dead_letter_tasks_queue.url, MessageBody=line)
+        else:
+            with self._lock, open(self.path, "a", encoding="utf-8") as quarantine_file:
+                quarantine_file.write(line + "\n")
+        with self._lock:
+            self._recent.append(record)
+        JOBS_QUARANTINED.labels(reason=reason).inc()
+        logger.warning("Quarantined job %s (%s): %s", record["job_id"] or message_id, reason, record["error"])
+        return record
+
+    def recent(self) -> list:
+        with self._lock:
+            return list(self._recent)
@@ -0,0 +1,55 @@
+"""
+Replays a captured job trace (see job_trace.py) into an SQS FIFO queue.
+
+Jobs are sent at the recorded inter-arrival times divided by --speed, one message group
+per conversation so each conversation stays in order. Completions are not observed here,
+so at high speeds a chat can reach a worker before the answer it follows was stored;
+benchmarks/e2e/run_benchmark.py --trace replays locally and waits for them.
+
+Usage:
+    python -m trading_view_extension.queue.replay_job_trace trace.jsonl [--speed 10]
+        [--queue-url URL] [--limit 500] [--image-url "https://bucket/charts/sample.png"] [--dry-run]
+
+--image-url may contain {n}, replaced by a unique id per image.
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent.parent))
+from trading_view_extension.queue.job_trace import read_trace, TraceReplayer
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a captured job trace into an SQS queue.")
+    parser.add_argument("trace")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay N times faster than recorded")
+    parser.add_argument("--queue-url", help="Defaults to the worker's input queue (SQS_INPUT_QUEUE_URL)")
+    parser.add_argument("--limit", type=int, default=None, help="Replay only the first N jobs")
+    parser.add_argument("--image-url", default="https://replay.local/charts/{n}.png")
+    parser.add_argument("--dry-run", action="store_true", help="Print the jobs instead of sending them")
+    args = parser.parse_args(argv)
+
+    entries = read_trace(args.trace)[:args.limit]
+
+    if args.dry_run:
+        def send(job, group):
+            print(json.dumps({"group": group, "job": job}))
+    else:
+        from config import sqs_client, input_tasks_queue, logger
+        queue_url = args.queue_url or input_tasks_queue.url
+
+        def send(job, group):
+            key = f"{job['job_id']}:{job.get('message_id') or '-'}"
+            sqs_client.send_message(QueueUrl=queue_url, MessageBody=json.dumps(job),
+                                    MessageGroupId=group, MessageDeduplicationId=key)
+        logger.info("Replaying %d jobs into %s at %sx", len(entries), queue_url, args.speed)
+
+    sent = TraceReplayer(entries, send, speed=args.speed, image_url=args.image_url).run()
+    print(f"Sent {sent} jobs", file=sys.stderr)
+    return sent
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+"""
+Direct push of job events to clients over WebSocket.
+
+Results normally reach clients through the output FIFO queue and another consumer,
+which costs at least one more long-poll cycle. With RESULT_PUSH_ENABLED the worker also
+writes every event of a job (RUNNING, PARTIAL batch items, COMPLETED / REJECTED / FAILED)
+to the WebSocket clients subscribed to its job_id, as soon as the orchestrator produces
+it. SQS publishing is unchanged and stays the durable path.
+
+Clients subscribe by connecting to /jobs/<job_id>, or by sending
+{"subscribe": "<job_id>"} (and {"unsubscribe": ...}) on any connection. Each event holds
+the result fields of the document published to SQS (PUSH_EVENT_FIELDS), not the user's
+email, prompts or chart URLs. Item events of a batch scan go to the subscribers of the
+item and of the batch. Events of the last RESULT_PUSH_REPLAY_SECONDS are kept, so a
+client that subscribes after the job finished still gets them.
+
+With RESULT_PUSH_TOKEN set, a connection needs "Authorization: Bearer <token>" (added by
+the gateway). Without it the job_id is the only credential, so the server should only be
+reachable through the gateway; a warning is logged when it listens on a public address.
+
+The server runs its own event loop in a daemon thread; publish() may be called from any
+thread. Fan-out encodes an event once and writes it to every subscriber without waiting
+for slow clients (websockets.broadcast skips a client whose write buffer is full).
+"""
+import asyncio
+import hmac
+import ipaddress
+import json
+import threading
+from http import HTTPStatus
+from cachetools import TTLCache
+from config import (
+    logger,
+    WEBSOCKET_HOST,
+    WEBSOCKET_PORT,
+    RESULT_PUSH_REPLAY_SECONDS,
+    RESULT_PUSH_REPLAY_JOBS,
+    RESULT_PUSH_TOKEN,
+)
+from trading_view_extension.queue.sqs_queue_publisher_interface import IQueuePublisher
+from trading_view_extension.monitoring.metrics import RESULT_PUSH_CONNECTIONS, RESULT_PUSH_MESSAGES
+
+JOB_PATH_PREFIX = "/jobs/"
+MAX_REPLAY_EVENTS = 200  # Per job; a batch scan publishes one event per item
+# What a subscriber gets of a job event: its identity, status and result.
+PUSH_EVENT_FIELDS = (
+    "job_id", "batch_id", "batch_index", "message_id", "job_type", "status", "action_type", "asset",
+    "response", "result", "error", "retry_after", "credits_required", "credits_available",
+)
+
+
+class ResultPushServer:
+    def __init__(self, host: str = WEBSOCKET_HOST, port: int = WEBSOCKET_PORT,
+                 replay_seconds: float = RESULT_PUSH_REPLAY_SECONDS, replay_jobs: int = RESULT_PUSH_REPLAY_JOBS,
+                 token: str = RESULT_PUSH_TOKEN):
+        self.host = host
+        self.port = port
+        self.token = token
+        # Only touched from the server's event loop, so no locks.
+        self._subscribers = {}  # job_id -> set of connections
+        self._recent = TTLCache(maxsize=replay_jobs, ttl=replay_seconds)  # job_id -> events pushed so far
+        self._loop = None
+        self._server = None
+        self._thread = None
+
+    def start(self) -> "ResultPushServer":
+        started = threading.Event()
+        failure = []
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            try:
+                self._server = self._loop.run_until_complete(self._serve())
+            except Exception as e:
+                failure.append(e)
+                started.set()
+                return
+            started.set()
+            self._loop.run_forever()
+            self._loop.close()
+
+        self._thread = threading.Thread(target=run, name="result-push-server", daemon=True)
+        self._thread.start()
+        started.wait()
+        if failure:
+            raise failure[0]
+        logger.info("Result push server listening on ws://%s:%d", self.host, self.port)
+        if not self.token and not _is_loopback(self.host):
+            logger.warning("Result push server on %s has no RESULT_PUSH_TOKEN: anyone who can reach it and "
+                           "knows a job_id gets its results", self.host)
+        return self
+
+    async def _serve(self):
+        # Imported on first use, like the other optional clients.
+        from websockets.asyncio.server import serve
+        # No per-message compression: it would run once per subscriber instead of once per event.
+        server = await serve(self._handle_connection, self.host, self.port, compression=None,
+                             process_request=self._authorize)
+        self.port = server.sockets[0].getsockname()[1]
+        return server
+
+    def _authorize(self, connection, request):
+        """Refuse the handshake (401) without the bearer token, when one is configured."""
+        if not self.token:
+            return None
+        supplied = request.headers.get("Authorization", "")
+        if hmac.compare_digest(supplied.encode(), f"Bearer {self.token}".encode()):
+            return None
+        return connection.respond(HTTPStatus.UNAUTHORIZED, "Unauthorized\n")
+
+    def publish(self, job_id: str, event: str) -> None:
+        """Push an encoded event of a job to its subscribers. Thread-safe and never blocks."""
+        loop = self._loop
+        if loop is None or not isinstance(job_id, str):
+            return
+        try:
+            loop.call_soon_threadsafe(self._fan_out, job_id, event)
+        except RuntimeError:
+            pass  # Server stopped
+
+    def _fan_out(self, job_id: str, event: str):
+        from websockets.asyncio.server import broadcast
+        events = self._recent.get(job_id)
+        if events is None:
+            events = self._recent[job_id] = []
+        if len(events) < MAX_REPLAY_EVENTS:
+            events.append(event)
+        connections = self._subscribers.get(job_id)
+        if connections:
+            broadcast(connections, event)
+            RESULT_PUSH_MESSAGES.inc(len(connections))
+
+    async def _handle_connection(self, connection):
+        RESULT_PUSH_CONNECTIONS.inc()
+        subscriptions = set()
+        try:
+            path = connection.request.path if connection.request else ""
+            if path.startswith(JOB_PATH_PREFIX) and len(path) > len(JOB_PATH_PREFIX):
+                self._subscribe(connection, path[len(JOB_PATH_PREFIX):], subscriptions)
+            async for message in connection:
+                try:
+                    request = json.loads(message)
+                except (TypeError, ValueError):
+                    request = None
+                if isinstance(request, dict) and isinstance(request.get("subscribe"), str):
+                    self._subscribe(connection, request["subscribe"], subscriptions)
+                elif isinstance(request, dict) and isinstance(request.get("unsubscribe"), str):
+                    self._unsubscribe(connection, request["unsubscribe"], subscriptions)
+                else:
+                    await connection.send(json.dumps({"error": 'expected {"subscribe": "<job_id>"}'}))
+        except Exception as e:
+            # Connections closed by the client end the iteration with ConnectionClosed.
+            logger.debug("Result push connection ended: %s", e)
+        finally:
+            for job_id in list(subscriptions):
+                self._unsubscribe(connection, job_id, subscriptions)
+            RESULT_PUSH_CONNECTIONS.dec()
+
+    def _subscribe(self, connection, job_id: str, subscriptions: set):
+        from websockets.asyncio.server import broadcast
+        if job_id in subscriptions:
+            return
+        # Replayed without awaiting, so no new event of the job can be written in between.
+        for event in self._recent.get(job_id, ()):
+            broadcast([connection], event)
+        subscriptions.add(job_id)
+        self._subscribers.setdefault(job_id, set()).add(connection)
+
+    def _unsubscribe(self, connection, job_id: str, subscriptions: set):
+        subscriptions.discard(job_id)
+        connections = self._subscribers.get(job_id)
+        if connections is not None:
+            connections.discard(connection)
+            if not connections:
+                del self._subscribers[job_id]
+
+    def stop(self):
+        if self._loop is None:
+            return
+
+        async def close():
+            self._server.close()
+            await self._server.wait_closed()
+            self._loop.stop()
+
+        asyncio.run_coroutine_threadsafe(close(), self._loop)
+        self._thread.join(timeout=5)
+        self._loop = None
+
+
+def _is_loopback(host: str) -> bool:
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return host == "localhost"
+
+
+class PushingPublisher(IQueuePublisher):
+    """
+    Publisher that hands every job event to push(job_id, encoded_event) before publishing
+    it with the wrapped publisher, which stays the durable path. Batch item events are
+    pushed under the item's job_id and under the batch's.
+    """
+
+    def __init__(self, publisher: IQueuePublisher, push):
+        self.publisher = publisher
+        self.push = push
+
+    def _push(self, job: dict):
+        try:
+            event = json.dumps({field: job[field] for field in PUSH_EVENT_FIELDS if field in job}, default=str)
+            self.push(job.get("job_id"), event)
+            batch_id = job.get("batch_id")
+            if batch_id is not None and batch_id != job.get("job_id"):
+                self.push(batch_id, event)
+        except Exception as e:
+            logger.warning("Could not push event of job %s: %s", job.get("job_id"), e)
+
+    async def publish_task(self, job: dict) -> None:
+        self._push(job)
+        await self.publisher.publish_task(job)
+
+    async def defer_task(self, job: dict, delay_seconds: float) -> None:
+        await self.publisher.defer_task(job, delay_seconds)
+
+    async def publish_progress(self, job: dict) -> None:
+        self._push(job)
@@ -4,31 +4,124 @@ import json
 import ssl
 import threading
 import time
-from config import logger, sqs_client
+from config import (
+    logger,
+    sqs_client,
+    WORKER_INITIAL_CONCURRENCY,
+    WORKER_LATENCY_TOLERANCE,
+    SCHEDULER_WEIGHTS,
+    SCHEDULER_AGING_SECONDS,
+    EMPTY_RECEIVE_BACKOFF_SECONDS,
+    delay_tasks_queue,
+)
 from trading_view_extension.queue.sqs_queue_consumer_interface import IQueueConsumer
-from trading_view_extension.orchestrators.ai_orchestrator import AiOrchestrator
+from trading_view_extension.orchestrators.ai_orchestrator import AiOrchestrator, BATCH_JOB_TYPE
+from trading_view_extension.monitoring.metrics import (
+    SQS_RECEIVE_SECONDS,
+    SQS_MESSAGES_RECEIVED,
+    SQS_DELETE_SECONDS,
+    QUEUE_WAIT_SECONDS,
+    JOB_SECONDS,
+    EXECUTOR_IN_FLIGHT,
+    EXECUTOR_MAX_WORKERS,
+    SCHEDULER_QUEUED,
+    SCHEDULER_WAIT_SECONDS,
+)
+from trading_view_extension.monitoring.tracing import span
+from trading_view_extension.monitoring.log_pipeline import truncate
+from trading_view_extension.queue import job_trace
+from trading_view_extension.queue.concurrency_limiter import AimdConcurrencyLimiter
+from trading_view_extension.queue.fair_scheduler import FairScheduler, parse_weights, CHAT, ANALYSIS, BATCH
+from trading_view_extension.services.circuit_breaker import open_circuits
+from trading_view_extension.services.runtime_config import runtime_config
 
 class SqsQueueConsumer(IQueueConsumer):
-    def __init__(self, sqs_queue_publisher, max_messages=5, visibility_timeout=300, wait_time=1):
+    # (attribute, TuningConfig field) taken over when the runtime config changes
+    TUNED_ATTRIBUTES = (
+        ("max_messages", "receive_max_messages"),
+        ("visibility_timeout", "visibility_timeout"),
+        ("wait_time", "receive_wait_seconds"),
+        ("prefetch", "prefetch"),
+    )
+
+    def __init__(self, sqs_queue_publisher, max_messages=None, visibility_timeout=None, wait_time=None, limiter=None,
+                 scheduler=None, prefetch=None):
+        # Settings not given default to the runtime config and follow its changes (see apply_tuning).
+        tuning = runtime_config.current()
         self.sqs_client = sqs_client
         self.sqs_queue_publisher = sqs_queue_publisher
-        self.max_messages = max_messages
-        self.visibility_timeout = visibility_timeout
-        self.wait_time = wait_time
+        # Per receive call (SQS allows at most 10)
+        self.max_messages = tuning.receive_max_messages if max_messages is None else max_messages
+        self.visibility_timeout = tuning.visibility_timeout if visibility_timeout is None else visibility_timeout
+        self.wait_time = tuning.receive_wait_seconds if wait_time is None else wait_time
 
-        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=5)  # 5 workers, adjust if needed
-        self.orchestrator = AiOrchestrator(self.sqs_queue_publisher)
+        # Jobs in flight are bounded by an adaptive limit; the pool only has to be large enough for its maximum.
+        self.limiter = limiter or AimdConcurrencyLimiter(
+            min_limit=tuning.min_concurrency,
+            max_limit=tuning.max_concurrency,
+            initial_limit=WORKER_INITIAL_CONCURRENCY,
+            latency_tolerance=WORKER_LATENCY_TOLERANCE,
+        )
+        # Received messages wait here until the limiter has room; the scheduler decides which runs next.
+        self.scheduler = scheduler or FairScheduler(parse_weights(SCHEDULER_WEIGHTS), SCHEDULER_AGING_SECONDS)
+        self.prefetch = tuning.prefetch if prefetch is None else prefetch
+        SCHEDULER_QUEUED.set_function(lambda: len(self.scheduler))
+        self.max_workers = self.limiter.max_limit
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers)
+        self._executor_lock = threading.Lock()  # The pool is replaced when max_concurrency changes
+        EXECUTOR_MAX_WORKERS.set(self.max_workers)
+        self.orchestrator = self._create_orchestrator()
+        # Scrubbed record of the input job stream for load replay (JOB_TRACE_FILE)
+        self.job_trace = job_trace.default_recorder()
 
         self.local_safe_store = {}  # Safe store for crash recovery (in-memory for now, can be moved to Redis)
         self.lock = threading.Lock()
 
-        self.main_event_loop = asyncio.get_event_loop()
+        try:
+            self.main_event_loop = asyncio.get_event_loop()
+        except RuntimeError:
+            # No loop in this thread (e.g. constructed from a worker thread or after a loop was closed)
+            self.main_event_loop = None
 
         self.shutdown_event = threading.Event()
         self.polling_thread = None
 
+        runtime_config.subscribe(self.apply_tuning)
         logger.info("SqsQueueConsumer initialized with Immediate Delete + Safe Store strategy")
 
+    def _create_orchestrator(self):
+        return AiOrchestrator(self.sqs_queue_publisher)
+
+    def apply_tuning(self, tuning, previous=None):
+        """
+        Take over changed runtime settings (runtime_config subscriber). Receive settings apply
+        from the next receive call; a new pool size applies to jobs started from now on.
+        """
+        def changed(*fields):
+            return previous is None or any(getattr(previous, field) != getattr(tuning, field) for field in fields)
+
+        for attribute, field in self.TUNED_ATTRIBUTES:
+            if changed(field):
+                setattr(self, attribute, getattr(tuning, field))
+        if changed("min_concurrency", "max_concurrency"):
+            self.limiter.set_bounds(tuning.min_concurrency, tuning.max_concurrency)
+            if self.limiter.max_limit != self.max_workers:
+                self._resize_executor(self.limiter.max_limit)
+
+    def _resize_executor(self, max_workers: int):
+        with self._executor_lock:
+            previous = self.executor
+            self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+            self.max_workers = max_workers
+        EXECUTOR_MAX_WORKERS.set(max_workers)
+        # Jobs already running in the old pool finish there; its threads exit afterwards.
+        previous.shutdown(wait=False)
+        logger.info("Worker pool resized to %d threads", max_workers)
+
+    def _submit(self, fn, *args):
+        with self._executor_lock:
+            return self.executor.submit(fn, *args)
+
     def start_polling(self, queue_url: str):
         if self.polling_thread and self.polling_thread.is_alive():
             logger.warning("Polling thread already running, skipping duplicate start_polling() call.")
@@ -40,69 +133,171 @@ class SqsQueueConsumer(IQueueConsumer):
 
     def _polling_loop(self, queue_url: str):
         while not self.shutdown_event.is_set():
-            messages = self.receive_messages(queue_url)
+            # Shed load while a dependency's circuit is open: jobs stay in SQS instead of failing here.
+            blocked = open_circuits()
+            if blocked:
+                self.shutdown_event.wait(min(1.0, max(0.05, min(breaker.retry_after() for breaker in blocked))))
+                continue
 
-            for message in messages:
-                self.executor.submit(self.safe_process_message, queue_url, message)
+            self._dispatch()
 
-            time.sleep(0.5)  # Poll every 500ms, regardless of processing
+            # Hold at most `prefetch` messages locally; the rest stay in SQS for other workers.
+            buffered = len(self.scheduler)
+            room = self.prefetch - buffered
+            if room > 0:
+                polled = time.monotonic()
+                # Long-poll only when nothing is waiting locally, so buffered jobs start as soon as there is room.
+                self._buffer(queue_url, self.receive_messages(queue_url, max_messages=min(room, self.max_messages),
+                                                              wait_time=0 if buffered else None))
+                room = self.prefetch - len(self.scheduler)
+                if delay_tasks_queue.url and room > 0:
+                    # Jobs deferred while a circuit was open, once their delay has passed.
+                    self._buffer(delay_tasks_queue.url, self.receive_messages(
+                        delay_tasks_queue.url, max_messages=min(room, self.max_messages), wait_time=0))
+                if not buffered:
+                    if not len(self.scheduler):
+                        # Nothing came back, and quickly if the receive did not long-poll (receive_wait_seconds=0)
+                        # or failed: wait out the rest of the interval instead of spinning on receive calls.
+                        self.shutdown_event.wait(max(0.0, EMPTY_RECEIVE_BACKOFF_SECONDS - (time.monotonic() - polled)))
+                    continue
+
+            if self.limiter.available() == 0:
+                self.limiter.wait_for_capacity(timeout=0.5)
+
+    def _buffer(self, queue_url: str, messages):
+        for message in messages:
+            self.scheduler.push((queue_url, message), *self._classify(message))
+
+    def _dispatch(self):
+        """Start scheduled messages while the concurrency limit allows."""
+        while self.limiter.available() > 0:
+            scheduled = self.scheduler.pop()
+            if scheduled is None:
+                return
+            (queue_url, message), job_class, waited = scheduled
+            SCHEDULER_WAIT_SECONDS.labels(job_class=job_class).observe(waited)
+            self.limiter.acquire()
+            EXECUTOR_IN_FLIGHT.inc()
+            self._start(queue_url, message)
+
+    def _start(self, queue_url: str, message: dict):
+        """Run a dispatched message; the limiter slot is already taken and freed by _finish()."""
+        self._submit(self.safe_process_message, queue_url, message)
+
+    @staticmethod
+    def _classify(message: dict):
+        """(user, job class) of a message for fair scheduling."""
+        try:
+            job = json.loads(message.get("Body") or "{}")
+        except json.JSONDecodeError:
+            return None, ANALYSIS  # Rejected by process_message_body anyway
+        if not isinstance(job, dict):
+            return None, ANALYSIS
+        if job.get("is_chat"):
+            return job.get("email_id"), CHAT
+        if job.get("job_type") == BATCH_JOB_TYPE:
+            return job.get("email_id"), BATCH
+        return job.get("email_id"), ANALYSIS
 
     def safe_process_message(self, queue_url, message):
         message_id = message.get("MessageId")
+        started = time.perf_counter()
+        outcome = "ok"
+        degraded = False
+        batch = False
 
         with self.lock:
             self.local_safe_store[message_id] = message  # Save message to safe store immediately
 
-        try:
-            # Delete message right away to avoid FIFO blocking
-            asyncio.run(self.delete_message(queue_url, message))
+        with span("sqs.process_message", message_id=message_id, body_bytes=len(message.get("Body") or "")) as root:
+            queue_wait = self._observe_queue_wait(message)
+            if queue_wait is not None:
+                root.set_attribute("queue_wait_ms", round(queue_wait * 1000, 1))
+            try:
+                # Delete message right away to avoid FIFO blocking
+                asyncio.run(self.delete_message(queue_url, message))
 
-            # Process message body (actual work)
-            self.process_message_body(message)
+                # Process message body (actual work)
+                degraded, batch = self.run_job(message)
 
-            # If processing succeeds, remove from safe store
-            with self.lock:
-                self.local_safe_store.pop(message_id, None)
+                # If processing succeeds, remove from safe store
+                with self.lock:
+                    self.local_safe_store.pop(message_id, None)
 
-        except Exception as e:
-            logger.error(f"Processing crashed for message {message_id}: {e}")
-            logger.error(f"⚠️ Message {message_id} will stay in safe store for manual recovery.")
+            except Exception as e:
+                outcome = "error"
+                root.set_attribute("error", str(e))
+                logger.error("Processing crashed for message %s: %s", message_id, e)
+                logger.error("⚠️ Message %s will stay in safe store for manual recovery.", message_id)
+            finally:
+                self._finish(started, outcome, degraded, batch)
+
+    def _finish(self, started: float, outcome: str, degraded: bool, batch: bool):
+        EXECUTOR_IN_FLIGHT.dec()
+        JOB_SECONDS.labels(outcome=outcome).observe(time.perf_counter() - started)
+        self.limiter.release(started, failed=outcome == "error" or degraded, observe_latency=not batch)
+
+    def run_job(self, message: dict):
+        """Process a message; returns (degraded, batch) for the concurrency limiter."""
+        job = self.process_message_body(message)
+        # All analysis attempts failed: the job "succeeded" but tells us the backend is struggling.
+        degraded = isinstance(job, dict) and job.get("message_id") == "error"
+        batch = isinstance(job, dict) and job.get("job_type") == BATCH_JOB_TYPE
+        return degraded, batch
+
+    @staticmethod
+    def _observe_queue_wait(message: dict):
+        sent_timestamp = message.get("Attributes", {}).get("SentTimestamp")
+        if not sent_timestamp:
+            return None
+        queue_wait = max(0.0, time.time() - int(sent_timestamp) / 1000)
+        QUEUE_WAIT_SECONDS.observe(queue_wait)
+        return queue_wait
 
     def process_message_body(self, message: dict):
         message_id = message.get("MessageId")
         body = message.get("Body", "{}")
 
-        logger.info(f"🚀 Processing message {message_id}")
+        logger.info("🚀 Processing message %s", message_id)
 
         try:
             job_data = json.loads(body)
-        except json.JSONDecodeError:
+        except json.JSONDecodeError as e:
             logger.error(f"Invalid JSON format in message {message_id}")
+            self.orchestrator.quarantine.add(body, e, message_id=message_id)
             return
 
         # future = asyncio.run_coroutine_threadsafe(self.orchestrator.handle_job(job_data), self.main_event_loop)
         # result = future.result(timeout=300)
 
+        trace_entry = self.job_trace.start(job_data, message) if self.job_trace else None
+
         new_loop = asyncio.new_event_loop()
         asyncio.set_event_loop(new_loop)
-        result = new_loop.run_until_complete(self.orchestrator.handle_job(job_data))
+        try:
+            result = new_loop.run_until_complete(self.orchestrator.handle_job(job_data))
+        finally:
+            if trace_entry is not None:
+                self.job_trace.finish(trace_entry, job_data)
         new_loop.close()
 
         if result is None:
             raise ValueError(f"handle_job() returned None for message {message_id}")
 
-        logger.info(f"handle_job() completed successfully for {message_id}, result: {result}")
+        logger.info("handle_job() completed successfully for %s, result: %s", message_id, truncate(result))
+        return job_data
 
-    def receive_messages(self, queue_url: str):
+    def receive_messages(self, queue_url: str, max_messages: int = None, wait_time: int = None):
         try:
-            response = self.sqs_client.receive_message(
-                QueueUrl=queue_url,
-                MaxNumberOfMessages=self.max_messages,
-                VisibilityTimeout=self.visibility_timeout,
-                WaitTimeSeconds=self.wait_time,
-                AttributeNames=["All"],
-                MessageAttributeNames=["All"]
-            )
+            with SQS_RECEIVE_SECONDS.time():
+                response = self.sqs_client.receive_message(
+                    QueueUrl=queue_url,
+                    MaxNumberOfMessages=max_messages or self.max_messages,
+                    VisibilityTimeout=self.visibility_timeout,
+                    WaitTimeSeconds=self.wait_time if wait_time is None else wait_time,
+                    AttributeNames=["All"],
+                    MessageAttributeNames=["All"]
+                )
         except ssl.SSLError as ssl_error:
             logger.error(f"SSL ERROR: {ssl_error}")
             return []
@@ -111,8 +306,9 @@ class SqsQueueConsumer(IQueueConsumer):
             return []
 
         messages = response.get("Messages", [])
+        SQS_MESSAGES_RECEIVED.inc(len(messages))
         for message in messages:
-            logger.info(f"Received Message ID: {message.get('MessageId')}")
+            logger.info("Received Message ID: %s", message.get('MessageId'))
         return messages
 
     async def delete_message(self, queue_url: str, message: dict):
@@ -121,12 +317,13 @@ class SqsQueueConsumer(IQueueConsumer):
             logger.warning(f"No receipt handle for message {message.get('MessageId')}")
             return
         try:
-            await asyncio.to_thread(
-                self.sqs_client.delete_message,
-                QueueUrl=queue_url,
-                ReceiptHandle=receipt_handle
-            )
-            logger.info(f"Immediately deleted message {message.get('MessageId')} from {queue_url}")
+            with SQS_DELETE_SECONDS.time(), span("sqs.delete"):
+                await asyncio.to_thread(
+                    self.sqs_client.delete_message,
+                    QueueUrl=queue_url,
+                    ReceiptHandle=receipt_handle
+                )
+            logger.info("Immediately deleted message %s from %s", message.get('MessageId'), queue_url)
         except Exception as e:
             logger.error(f"Failed to delete message {message.get('MessageId')}: {e}")
 
@@ -1,10 +1,15 @@
 # trading_view_extension/queues/sqs_queue_publisher.py
 
 import json
+import math
 import uuid
 from typing import Dict
-from config import logger, input_tasks_queue, output_tasks_queue
+from config import logger, input_tasks_queue, output_tasks_queue, delay_tasks_queue
 from trading_view_extension.queue.sqs_queue_publisher_interface import IQueuePublisher
+from trading_view_extension.database.idempotency_store import deduplication_id
+from trading_view_extension.monitoring.metrics import SQS_PUBLISH_SECONDS
+from trading_view_extension.monitoring.tracing import span
+from trading_view_extension.monitoring.log_pipeline import truncate
 
 class SQSQueuePublisher(IQueuePublisher):
     def __init__(self):
@@ -56,32 +61,73 @@ class SQSQueuePublisher(IQueuePublisher):
                 # if "trade_signal" not in job and "result" in job:
                 #     job["trade_signal"] = job["result"]  # Assuming 'result' contains the AI response
 
+            elif job["status"] == "PARTIAL":
+                # Incremental batch results share the processed group so they stay ahead of the summary
+                client = self.output_sqs_client
+                queue_url = output_tasks_queue.url
+                message_group_id = "processed_tasks"
+                action_type = "partial"
+
+            elif job["status"] in ("REJECTED", "FAILED"):
+                # Jobs refused before any model call (insufficient credits) or failed fast because a
+                # dependency is down (open circuit) answer like results do
+                client = self.output_sqs_client
+                queue_url = output_tasks_queue.url
+                message_group_id = "processed_tasks"
+                action_type = job["status"].lower()
+
             elif job["status"] == "RUNNING":
                 client = self.output_sqs_client
                 queue_url = output_tasks_queue.url
                 message_group_id = "analysis_tasks"
                 action_type = "running"
 
-            # Generate a unique deduplication ID
-            message_deduplication_id = str(uuid.uuid4())
+            # Deterministic deduplication ID for idempotent jobs so SQS drops duplicate publishes
+            if job.get("idempotency_key"):
+                message_deduplication_id = deduplication_id(job["idempotency_key"], job["status"])
+            else:
+                message_deduplication_id = str(uuid.uuid4())
 
             # Convert the job to a JSON-safe format
             message_body = json.dumps(job, default=str)
-            logger.info(f"Message body: {message_body}")
+            logger.info("Message body: %s", truncate(message_body))
             # Send the message to SQS
-            response = client.send_message(
-                QueueUrl=queue_url,
-                MessageBody=message_body,
-                MessageGroupId=message_group_id,
-                MessageDeduplicationId=message_deduplication_id
-            )
-
-            logger.info(f"Message sent to SQS ({action_type}) with MessageId: {response.get('MessageId')}")
+            with SQS_PUBLISH_SECONDS.labels(status=job["status"]).time(), \
+                    span("sqs.publish", status=job["status"], payload_bytes=len(message_body)):
+                response = self._send_message(
+                    client,
+                    QueueUrl=queue_url,
+                    MessageBody=message_body,
+                    MessageGroupId=message_group_id,
+                    MessageDeduplicationId=message_deduplication_id
+                )
+
+            logger.info("Message sent to SQS (%s) with MessageId: %s", action_type, response.get('MessageId'))
 
         except Exception as e:
             logger.exception("Failed to publish message to SQS.")
             raise
 
+    async def defer_task(self, job: dict, delay_seconds: float) -> None:
+        """
+        Put a job on the delay queue (a standard queue: FIFO queues have no per-message delay)
+        so the consumer picks it up again after delay_seconds (SQS allows at most 15 minutes).
+        """
+        delay = min(900, max(1, math.ceil(delay_seconds)))
+        message_body = json.dumps(job, default=str)
+        with SQS_PUBLISH_SECONDS.labels(status="DEFERRED").time(), \
+                span("sqs.defer", delay_seconds=delay, payload_bytes=len(message_body)):
+            response = self._send_message(
+                delay_tasks_queue.client,
+                QueueUrl=delay_tasks_queue.url,
+                MessageBody=message_body,
+                DelaySeconds=delay,
+            )
+        logger.info("Job %s deferred for %ds with MessageId: %s", job.get("job_id"), delay, response.get("MessageId"))
+
+    def _send_message(self, client, **request) -> dict:
+        return client.send_message(**request)
+
 
     # async def publish_task(self, job: dict) -> None:
     #     """
@@ -121,7 +167,7 @@ class SQSQueuePublisher(IQueuePublisher):
     #             MessageDeduplicationId=message_deduplication_id
     #         )
 
-    #         logger.info(f"Message sent to SQS ({action_type}) with MessageId: {response.get('MessageId')}")
+    #         logger.info("Message sent to SQS (%s) with MessageId: %s", action_type, response.get('MessageId'))
     #     except Exception as e:
     #         logger.exception("Failed to publish message to SQS.")
     #         raise
@@ -23,6 +23,14 @@ class IQueuePublisher(ABC):
     async def publish_task(self, job: dict) -> None:
         pass
 
+    @abstractmethod
+    async def defer_task(self, job: dict, delay_seconds: float) -> None:
+        pass
+
+    async def publish_progress(self, job: dict) -> None:
+        """Progress only worth delivering to a client that is watching (RUNNING); not queued durably."""
+        pass
+
 
 class IQueueConsumer(ABC):
     @abstractmethod
@@ -1,16 +1,20 @@
 import sys
+import asyncio
 from pathlib import Path
 import concurrent.futures
 sys.path.append(str(Path(__file__).resolve().parent.parent.parent))
 from config import DEFAULT_PROMPT, DEFAULT_QUERY
 from trading_view_extension.database.db_utilities import get_conversation_by_id, add_conversation
 from trading_view_extension.services.generate_reasoning import generate_response
+from trading_view_extension.services.credit_admission import estimate_tokens
 
 async def analyze(job, image_urls: list): 
     """
     Runs a single conversation run for one stock.
     Assumes image URLs have already been captured and uploaded.
     Initializes a Reasoner with the common parameters and prints the consensus response and trade signal.
+    For new conversations the row is inserted concurrently with the model call; generate_response
+    orders its message writes behind it.
     """
     show_query = True
     if job.get("agent").lower() == "custom": 
@@ -28,10 +32,12 @@ async def analyze(job, image_urls: list):
 
         conversation_history = [
             {key: value for key, value in message.items() if key != "message_id"}
-            for message in get_conversation_by_id(job.get("job_id"))
+            for message in await asyncio.to_thread(get_conversation_by_id, job.get("job_id"))
         ]
+        job["history_length"] = len(conversation_history)
+        job["history_tokens"] = estimate_tokens(conversation_history)
         message_id =job.get("message_id")
-        response, trade_signal, response_message_id = generate_response(
+        response, trade_signal, response_message_id = await generate_response(
             job,
             system_prompt,
             query,
@@ -47,17 +53,20 @@ async def analyze(job, image_urls: list):
         else:
             show_query = False
         conversation_history = []
-        additional_info = job.get("user_instructions")
+        job["history_length"] = 0
+        job["history_tokens"] = 0
+        additional_info = job.get("user_instructions") or ""
         system_prompt = system_prompt + "\n" + additional_info
-        add_conversation(
+        conversation_ready = asyncio.create_task(asyncio.to_thread(
+            add_conversation,
             job.get("job_id"),
-            conversation_history,
+            [],
             job.get("email_id"),
             job.get("asset"),
             job.get("agent")
-        )
+        ))
 
-        response, trade_signal, response_message_id = generate_response(
+        response, trade_signal, response_message_id = await generate_response(
             job,
             system_prompt,
             query,
@@ -66,6 +75,7 @@ async def analyze(job, image_urls: list):
             image_urls,
             message_id = None,
             is_trade_signal=True,
+            conversation_ready=conversation_ready,
         )
 
     # print("=" * 80)
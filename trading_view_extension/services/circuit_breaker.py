@@ -0,0 +1,173 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from config import (
+    logger,
+    CIRCUIT_WINDOW,
+    CIRCUIT_MIN_CALLS,
+    CIRCUIT_FAILURE_RATE,
+    CIRCUIT_RESET_SECONDS,
+    CIRCUIT_HALF_OPEN_CALLS,
+)
+from trading_view_extension.monitoring.metrics import CIRCUIT_STATE, CIRCUIT_REJECTED_CALLS
+
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+
+# Gauge values of circuit_state
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpen(Exception):
+    """A call was refused because the dependency's circuit is open."""
+
+    def __init__(self, dependency: str, retry_after: float):
+        super().__init__(f"Circuit for {dependency} is open, retry in {retry_after:.0f}s")
+        self.dependency = dependency
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Stops calling a dependency that keeps failing.
+
+    Closed: calls go through and their outcomes fill a sliding window of the last `window`
+    calls. Once at least `min_calls` are in it and `failure_rate` of them failed, the circuit
+    opens. Open: every call raises CircuitOpen straight away for `reset_seconds`. Half-open:
+    afterwards up to `half_open_calls` probe calls go through; a successful probe closes the
+    circuit, a failed one opens it again.
+
+    Usage:
+        with breaker.guard():        # raises CircuitOpen
+            response = call_dependency()
+
+    Every exception counts against the dependency unless guard(is_failure=...) says otherwise,
+    e.g. for "not found" style errors that say nothing about its health.
+    """
+
+    def __init__(self, name: str, window: int = CIRCUIT_WINDOW, min_calls: int = CIRCUIT_MIN_CALLS,
+                 failure_rate: float = CIRCUIT_FAILURE_RATE, reset_seconds: float = CIRCUIT_RESET_SECONDS,
+                 half_open_calls: int = CIRCUIT_HALF_OPEN_CALLS, clock=time.monotonic):
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.reset_seconds = reset_seconds
+        self.half_open_calls = half_open_calls
+        self.clock = clock
+        self._outcomes = deque(maxlen=window)   # True for a failed call
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probes = 0                        # probe calls in flight while half-open
+        self._lock = threading.Lock()
+        self._rejected = CIRCUIT_REJECTED_CALLS.labels(dependency=name)
+        # Read at scrape time: an open circuit turns half-open by the clock alone.
+        CIRCUIT_STATE.labels(dependency=name).set_function(lambda: STATE_VALUES[self.state])
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def retry_after(self) -> float:
+        """Seconds until the circuit lets a probe through (0 unless open)."""
+        with self._lock:
+            if self._current_state() != OPEN:
+                return 0.0
+            return max(0.0, self._opened_at + self.reset_seconds - self.clock())
+
+    @contextmanager
+    def guard(self, is_failure=None):
+        self.before_call()
+        try:
+            yield
+        except CircuitOpen:
+            # A nested call was refused: no news about the dependency either way.
+            self.record(failed=None)
+            raise
+        except BaseException as e:
+            self.record(failed=isinstance(e, Exception) and (is_failure is None or is_failure(e)))
+            raise
+        self.record(failed=False)
+
+    def before_call(self) -> None:
+        with self._lock:
+            state = self._current_state()
+            if state == HALF_OPEN and self._probes < self.half_open_calls:
+                self._probes += 1
+                return
+            if state != CLOSED:
+                self._rejected.inc()
+                retry_after = max(0.0, self._opened_at + self.reset_seconds - self.clock())
+                raise CircuitOpen(self.name, retry_after)
+
+    def record(self, failed) -> None:
+        """Outcome of a call let through by before_call(); failed=None only gives back its probe slot."""
+        with self._lock:
+            state = self._current_state()
+            if state == HALF_OPEN:
+                self._probes = max(0, self._probes - 1)
+                if failed is None:
+                    return
+                if failed:
+                    self._open()
+                else:
+                    self._close()
+                return
+            if state == OPEN or failed is None:
+                return  # A call that started before the circuit opened
+            self._outcomes.append(failed)
+            failures = sum(self._outcomes)
+            if len(self._outcomes) >= self.min_calls and failures >= self.failure_rate * len(self._outcomes):
+                self._open()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._close()
+
+    def _current_state(self) -> str:
+        if self._state == OPEN and self.clock() - self._opened_at >= self.reset_seconds:
+            self._state = HALF_OPEN
+            self._probes = 0
+        return self._state
+
+    def _open(self) -> None:
+        if self._state != OPEN:
+            logger.warning("Circuit for %s opened, pausing calls for %.0fs", self.name, self.reset_seconds)
+        self._state = OPEN
+        self._opened_at = self.clock()
+
+    def _close(self) -> None:
+        if self._state != CLOSED:
+            logger.info("Circuit for %s closed", self.name)
+        self._state = CLOSED
+        self._outcomes.clear()
+        self._probes = 0
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    """The process-wide breaker of a dependency, e.g. "supabase" or "openrouter:<model>"."""
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = _breakers[name] = CircuitBreaker(name)
+        return breaker
+
+
+def open_circuits() -> list:
+    """Breakers that currently refuse every call (half-open ones let probes through)."""
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return [breaker for breaker in breakers if breaker.state == OPEN]
+
+
+def reset_all() -> None:
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    for breaker in breakers:
+        breaker.reset()
@@ -0,0 +1,113 @@
+"""
+Lazily constructed, shared clients of the worker's dependencies.
+
+Importing boto3 or supabase and building their clients takes most of a cold start, so
+modules expose a LazyClient instead: a stand-in that builds the real client on first
+use and forwards every attribute to it. Module attributes keep their names (config.sqs_client,
+db_utilities.supabase), so code and tests that use or patch them are unaffected. Private
+and special attributes (leading underscore) are not forwarded: mock.patch, inspect and
+asyncio probe them (__func__, _is_coroutine, ...), and that must not build a client.
+
+    sqs_client = registry.lazy("sqs", build_sqs_client, warm=ping_sqs)
+
+warm_up() builds every client and runs its warm function in parallel, which also opens
+a pooled connection (TCP + TLS) to the service, so the first job does not pay for it.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+logger = logging.getLogger(__name__)
+
+
+class ClientRegistry:
+    def __init__(self):
+        self._factories = {}   # name -> (factory, warm function or None)
+        self._clients = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, factory, warm=None) -> None:
+        """factory() builds the client; warm(client) should open a connection with one cheap call."""
+        with self._lock:
+            self._factories[name] = (factory, warm)
+            self._locks.setdefault(name, threading.Lock())
+
+    def lazy(self, name: str, factory, warm=None) -> "LazyClient":
+        self.register(name, factory, warm)
+        return LazyClient(self, name)
+
+    def get(self, name: str):
+        client = self._clients.get(name)
+        if client is not None:
+            return client
+        with self._locks[name]:
+            client = self._clients.get(name)
+            if client is None:
+                started = time.perf_counter()
+                client = self._factories[name][0]()
+                self._clients[name] = client
+                logger.info("Created %s client in %.0f ms", name, (time.perf_counter() - started) * 1000)
+        return client
+
+    def is_created(self, name: str) -> bool:
+        return name in self._clients
+
+    def reset(self, name: str = None) -> None:
+        """Forget built clients (all of them, or one) so the next use builds a new one."""
+        with self._lock:
+            for key in [name] if name else list(self._clients):
+                self._clients.pop(key, None)
+
+    def warm_up(self, names=None, timeout: float = 5.0) -> dict:
+        """
+        Build the clients and open their connections in parallel; returns {name: seconds}
+        for the ones that finished within timeout. Failures are logged, never raised: a
+        dependency that is down at startup is retried by the first job that needs it.
+        """
+        with self._lock:
+            names = list(names or self._factories)
+        durations = {}
+
+        def warm(name):
+            started = time.perf_counter()
+            try:
+                client = self.get(name)
+                warm_function = self._factories[name][1]
+                if warm_function is not None:
+                    warm_function(client)
+                durations[name] = time.perf_counter() - started
+            except Exception as e:
+                logger.warning("Warm-up of %s failed: %s", name, e)
+
+        started = time.perf_counter()
+        executor = ThreadPoolExecutor(max_workers=max(1, len(names)), thread_name_prefix="warm-up")
+        _, pending = wait([executor.submit(warm, name) for name in names], timeout=timeout)
+        executor.shutdown(wait=False)
+        if pending:
+            logger.warning("Warm-up still running after %.1fs, continuing without it", timeout)
+        logger.info("Warm-up finished in %.0f ms: %s", (time.perf_counter() - started) * 1000,
+                    {name: round(seconds * 1000) for name, seconds in durations.items()})
+        return durations
+
+
+class LazyClient:
+    """Stand-in for a registry client: the client is built on first attribute access."""
+    __slots__ = ("_registry", "_name")
+
+    def __init__(self, registry: ClientRegistry, name: str):
+        object.__setattr__(self, "_registry", registry)
+        object.__setattr__(self, "_name", name)
+
+    def __getattr__(self, attribute):
+        if attribute.startswith("_"):
+            raise AttributeError(attribute)
+        return getattr(self._registry.get(self._name), attribute)
+
+    def __repr__(self):
+        state = "created" if self._registry.is_created(self._name) else "not created yet"
+        return f"<LazyClient {self._name} ({state})>"
+
+
+registry = ClientRegistry()
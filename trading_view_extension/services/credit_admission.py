@@ -0,0 +1,198 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from cachetools import LRUCache
+from config import (
+    logger,
+    CREDIT_BALANCE_TTL_SECONDS,
+    CREDIT_BASE_COST,
+    CREDIT_COST_PER_IMAGE,
+    CREDIT_COST_PER_1K_HISTORY_TOKENS,
+    CREDIT_DEFAULT_HISTORY_TOKENS,
+)
+from trading_view_extension.database import db_utilities
+from trading_view_extension.monitoring.metrics import CREDIT_ADMISSIONS
+
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(messages) -> int:
+    """Rough token count of chat messages (text only, ~4 characters per token)."""
+    characters = 0
+    for message in messages or []:
+        content = message.get("content") if isinstance(message, dict) else message
+        if isinstance(content, str):
+            characters += len(content)
+            continue
+        for block in content or []:
+            if isinstance(block, dict) and block.get("type") == "text":
+                characters += len(block.get("text") or "")
+    return characters // CHARS_PER_TOKEN
+
+
+class InsufficientCredits(Exception):
+    """The user cannot afford the estimated cost of a job."""
+
+    def __init__(self, email, required: int, available: int):
+        super().__init__(f"{email} needs ~{required} credits, {available} available")
+        self.email = email
+        self.required = required
+        self.available = available
+
+
+class Reservation:
+    __slots__ = ("email", "amount", "from_extra", "from_monthly", "settled")
+
+    def __init__(self, email, amount: int, from_extra: int = 0, from_monthly: int = 0):
+        self.email = email
+        self.amount = amount
+        self.from_extra = from_extra
+        self.from_monthly = from_monthly
+        self.settled = False
+
+
+class CreditAdmission:
+    """
+    Admission control in front of the model calls.
+
+    A job is admitted when its estimated cost can be reserved from the user's balance. The
+    reservation is a conditional update of the users row (reserve_user_credits), so workers in
+    other processes see it and concurrent jobs cannot overdraw the balance between them. It is
+    given back when the job settles; the charge itself is still made by deduct_user_credits
+    once the model calls are done.
+
+    Balances are cached per user, so users who clearly cannot afford a job are rejected without
+    a database round trip. A stale balance is still used for that while a fresh one is fetched
+    in the background. If the database cannot be reached the job is admitted unchecked rather
+    than lost.
+
+    Usage:
+        reservation = await admission.admit(job)    # raises InsufficientCredits
+        try:
+            ... run the job ...
+        finally:
+            await admission.settle(reservation, job)
+    """
+
+    def __init__(self, ttl_seconds: float = CREDIT_BALANCE_TTL_SECONDS, max_users: int = 10000, clock=time.monotonic):
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self._balances = LRUCache(maxsize=max_users)        # email -> (balance, fetched at)
+        self._history_tokens = LRUCache(maxsize=max_users)  # conversation job_id -> tokens after its last turn
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        # Jobs run on short-lived event loops, so background refreshes get threads of their own.
+        self._refresher = ThreadPoolExecutor(max_workers=2, thread_name_prefix="credit-refresh")
+
+    def estimate(self, job) -> int:
+        """Expected credits of a job from its image count and conversation history size."""
+        if job.get("job_type") == "batch_scan":
+            return sum(self._estimate_turn(len(item.get("s3_urls") or []), 0) for item in job.get("items") or [])
+        history_tokens = 0
+        if job.get("is_chat"):
+            history_tokens = job.get("history_tokens") or self._history_tokens.get(
+                job.get("job_id"), CREDIT_DEFAULT_HISTORY_TOKENS
+            )
+        return self._estimate_turn(len(job.get("s3_urls") or []), history_tokens)
+
+    @staticmethod
+    def _estimate_turn(images: int, history_tokens: int) -> int:
+        return round(CREDIT_BASE_COST + images * CREDIT_COST_PER_IMAGE
+                     + history_tokens / 1000 * CREDIT_COST_PER_1K_HISTORY_TOKENS)
+
+    async def admit(self, job) -> Reservation:
+        email = job.get("email_id")
+        required = self.estimate(job)
+        if not email:
+            CREDIT_ADMISSIONS.labels(outcome="unchecked").inc()
+            return Reservation(email, 0)
+
+        cached = self._cached_balance(email)
+        if cached is not None and required > cached:
+            self._reject(email, required, cached)
+        try:
+            from_extra, from_monthly, balance = await asyncio.to_thread(self._reserve, email, required)
+        except ValueError:
+            # Unknown user: nothing to spend. deduct_user_credits would fail after the model calls anyway.
+            self._reject(email, required, 0)
+        except Exception as e:
+            logger.warning("Credits of %s could not be reserved, admitting unchecked: %s", email, e)
+            CREDIT_ADMISSIONS.labels(outcome="unchecked").inc()
+            return Reservation(email, 0)
+        if from_extra + from_monthly < required:
+            self._reject(email, required, balance)
+        CREDIT_ADMISSIONS.labels(outcome="admitted").inc()
+        return Reservation(email, required, from_extra, from_monthly)
+
+    @staticmethod
+    def _reject(email, required: int, available: int):
+        CREDIT_ADMISSIONS.labels(outcome="rejected").inc()
+        raise InsufficientCredits(email, required, max(available, 0))
+
+    async def settle(self, reservation: Reservation, job) -> None:
+        """Give the reservation back and debit the cached balance by what the job actually used."""
+        if reservation.settled:
+            return
+        reservation.settled = True
+        used = int(job.get("credits_used") or 0)
+        refunded = 0
+        if reservation.amount:
+            try:
+                await asyncio.to_thread(
+                    db_utilities.refund_user_credits, reservation.email, reservation.from_extra, reservation.from_monthly
+                )
+                refunded = reservation.amount
+            except Exception as e:
+                logger.error("Giving back %d reserved credits of %s failed: %s", reservation.amount, reservation.email, e)
+        with self._lock:
+            cached = self._balances.get(reservation.email)
+            if cached is not None and (used or refunded):
+                self._balances[reservation.email] = (cached[0] + refunded - used, cached[1])
+            if job.get("response") and job.get("job_type") != "batch_scan":
+                # The next chat turn re-sends this history plus the answer just given.
+                self._history_tokens[job.get("job_id")] = (
+                    int(job.get("history_tokens") or 0) + estimate_tokens([{"content": job["response"]}])
+                )
+        if reservation.amount and used > reservation.amount:
+            logger.info("Job %s used %d credits, %d were reserved", job.get("job_id"), used, reservation.amount)
+
+    def _cached_balance(self, email):
+        with self._lock:
+            cached = self._balances.get(email)
+        if cached is None:
+            return None
+        if self.clock() - cached[1] > self.ttl_seconds:
+            self._refresh_in_background(email)
+        return cached[0]
+
+    def _reserve(self, email, amount: int):
+        fetched_at = self.clock()
+        reserved = db_utilities.reserve_user_credits(email, amount)
+        with self._lock:
+            self._balances[email] = (reserved[2], fetched_at)
+        return reserved
+
+    def _fetch(self, email) -> int:
+        fetched_at = self.clock()
+        balance = db_utilities.get_user_credits(email)
+        with self._lock:
+            self._balances[email] = (balance, fetched_at)
+        return balance
+
+    def _refresh_in_background(self, email) -> None:
+        with self._lock:
+            if email in self._refreshing:
+                return
+            self._refreshing.add(email)
+
+        def refresh():
+            try:
+                self._fetch(email)
+            except Exception as e:
+                logger.warning("Refreshing credit balance of %s failed: %s", email, e)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(email)
+
+        self._refresher.submit(refresh)
@@ -1,63 +1,143 @@
 import asyncio
 from trading_view_extension.services.openrouter_client import query_openrouter, get_structured_trade_signal
+from trading_view_extension.services.signal_gate import check_signal
 from config import logger
-from trading_view_extension.database.db_utilities import add_message, update_trade_signal, deduct_user_credits
+from trading_view_extension.database.db_utilities import add_message, remove_messages, update_trade_signal, deduct_user_credits
 from trading_view_extension.queue.sqs_queue_publisher import SQSQueuePublisher
+from trading_view_extension.monitoring.tracing import current_span
+from trading_view_extension.services.circuit_breaker import CircuitOpen
 import uuid
 
-def generate_response(job, system_prompt, query, conversation_history, show_query,image_urls=None, message_id=None, is_trade_signal=True):
+
+def _write_messages(job_id, messages):
+    # add_message is a read-modify-write of conversation_history, so writes for one job stay ordered.
+    for message in messages:
+        add_message(job_id, message)
+
+
+async def _persist_messages(job_id, messages, after=None):
+    if after is not None:
+        await after
+    await asyncio.to_thread(_write_messages, job_id, messages)
+
+
+async def _persist_trade_signal(job_id, trade_signal, after=None):
+    if after is not None:
+        await after
+    await asyncio.to_thread(update_trade_signal, job_id, trade_signal)
+
+
+async def _remove_messages(job_id, message_ids):
+    try:
+        await asyncio.to_thread(remove_messages, job_id, message_ids)
+    except Exception as e:
+        logger.error("Could not remove the messages of job %s, its rerun will repeat them: %s", job_id, e)
+
+
+async def _join(tasks):
+    """Wait for every bookkeeping task, then re-raise the first failure."""
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+
+
+async def generate_response(job, system_prompt, query, conversation_history, show_query, image_urls=None, message_id=None, is_trade_signal=True, conversation_ready=None):
     """
     Process a reasoning conversation for the given symbol and parameters.
-    
+
+    The pipeline is stage based: the model call starts as soon as the prompt is built and
+    the database bookkeeping (prompt messages, assistant message, trade signal, credits)
+    runs concurrently with it. All writes are joined before returning, so callers can
+    publish the result as soon as this coroutine completes. A model call refused by an
+    open circuit (CircuitOpen) gets the job deferred and run again, so the messages this
+    run added are taken out of the conversation before it is raised.
+
     Args:
         job (dict): The job object.
-        symbol (str): The stock symbol for conversation history management.
         system_prompt (str): The system prompt for the AI.
         query (str): The query to ask.
+        conversation_history (list): Prior messages, extended in place.
+        show_query (bool): Whether the user message is shown in the client.
         image_urls (list, optional): List of image URLs to include.
+        message_id (str, optional): Id to store the user message under.
         is_trade_signal (bool): Whether to extract a trade signal.
-        
+        conversation_ready (awaitable, optional): Completes once the conversation row exists.
+
     Returns:
-        tuple: (response, trade_signal)
+        tuple: (response, trade_signal, response_message_id)
     """
+    job_id = job['job_id']
+    if conversation_ready is not None:
+        # Several stages wait on it, so make sure it is a future rather than a bare coroutine.
+        conversation_ready = asyncio.ensure_future(conversation_ready)
     total_credits = 0
     trade_signal_result = None
+    prompt_messages = []
+
     # Ensure the system prompt is the first message, formatted properly as text.
     if not any(msg["role"] == "system" for msg in conversation_history):
         system_message = {"role": "system", "content": [{"type": "text", "text": system_prompt}]}
-        add_message(job['job_id'], {"message_id": uuid.uuid4().hex, "role": "system", "content": [{"type": "text", "text": system_prompt}], "show_query": True})
+        prompt_messages.append({"message_id": uuid.uuid4().hex, "role": "system", "content": [{"type": "text", "text": system_prompt}], "show_query": True})
         conversation_history.insert(0, system_message)
 
     # Build content for the new user message, including text and images.
     content = [{"type": "text", "text": query}]
     if image_urls:
         content.extend([{"type": "image_url", "image_url": {"url": url}} for url in image_urls])
-    
+
     # Append the user message with both text and images.
     conversation_history.append({"role": "user", "content": content})
-    if message_id:
-        add_message(job['job_id'], {"message_id": message_id, "role": "user", "content": content, "show_query": show_query})
-    else: 
-        add_message(job['job_id'], {"message_id": uuid.uuid4().hex, "role": "user", "content": content, "show_query": show_query})
+    prompt_messages.append({"message_id": message_id or uuid.uuid4().hex, "role": "user", "content": content, "show_query": show_query})
+    current_span().set_attribute("history_messages", len(conversation_history))
+
+    # Stage 1: the model call and the prompt writes run side by side.
+    model_call = asyncio.create_task(asyncio.to_thread(query_openrouter, list(conversation_history)))
+    prompt_persisted = asyncio.create_task(_persist_messages(job_id, prompt_messages, after=conversation_ready))
+    pending = [prompt_persisted]
+    written = [message["message_id"] for message in prompt_messages]
 
-    # Get response from the API using the conversation history directly.
     try:
-        response, credits = query_openrouter(conversation_history)
+        try:
+            response, credits = await model_call
+        except CircuitOpen:
+            raise  # Not worth retrying now: the orchestrator defers or fails the job as a whole
+        except Exception as e:
+            logger.error("Error in API call for job %s: %s", job_id, e)
+            await _join(pending)
+            return "Error occurred during processing.", None, None
         total_credits = credits
+
+        # Stage 2: persist the answer behind the prompt while the trade signal is extracted.
         conversation_history.append({"role": "assistant", "content": [{"type": "text", "text": response}]})
         response_message_id = uuid.uuid4().hex
-        add_message(job['job_id'], {"message_id": response_message_id, "role": "assistant", "content": [{"type": "text", "text": response}], "show_query": True})
-    except Exception as e:
-        print(f"Error in API call: {e}")
-        response = "Error occurred during processing."
-        total_credits = 0
-        return response, None, None
-    
-    # Extract trade signal from the response if requested.
-    if is_trade_signal:
-        trade_signal_result, credits = get_structured_trade_signal(response, job["asset"])
-        update_trade_signal(job.get("job_id"), trade_signal_result)
-        total_credits = credits+total_credits
-    
-    deduct_user_credits(job.get("email_id"),total_credits)
+        written.append(response_message_id)
+        pending.append(asyncio.create_task(_persist_messages(
+            job_id,
+            [{"message_id": response_message_id, "role": "assistant", "content": [{"type": "text", "text": response}], "show_query": True}],
+            after=prompt_persisted,
+        )))
+
+        # Extract trade signal from the response if requested.
+        if is_trade_signal:
+            trade_signal_result, credits = await asyncio.to_thread(get_structured_trade_signal, response, job["asset"])
+            # Checked before it is stored, so the stored and the published signal are the same.
+            trade_signal_result = check_signal(trade_signal_result)
+            pending.append(asyncio.create_task(_persist_trade_signal(job_id, trade_signal_result, after=conversation_ready)))
+            total_credits = credits + total_credits
+
+        # Stage 3: charge the user, then join every outstanding write.
+        job["credits_used"] = job.get("credits_used", 0) + total_credits
+        pending.append(asyncio.create_task(asyncio.to_thread(deduct_user_credits, job.get("email_id"), total_credits)))
+        await _join(pending)
+    except CircuitOpen:
+        # Either model call was refused: the rerun writes its own prompt and answer.
+        await asyncio.gather(*pending, return_exceptions=True)
+        await _remove_messages(job_id, written)
+        raise
+    except BaseException:
+        # Never leave writes running on a loop that the caller is about to close.
+        await asyncio.gather(*pending, return_exceptions=True)
+        raise
+
     return response, trade_signal_result, response_message_id
@@ -0,0 +1,44 @@
+import json
+import requests
+
+PERMANENT = "permanent"
+TRANSIENT = "transient"
+
+
+class PermanentJobError(ValueError):
+    """A job that cannot succeed as submitted; retrying it only burns worker time and credits."""
+
+    def __init__(self, reason: str, message: str):
+        super().__init__(message)
+        self.reason = reason
+
+
+def classify_error(error: BaseException) -> str:
+    """
+    PERMANENT only for failures known to repeat on every attempt: a PermanentJobError (bad
+    job fields, see job_schema.validate_job, or a missing conversation) and a request
+    OpenRouter refuses with a 4xx other than 408/429. Everything else is TRANSIENT,
+    including unknown errors: a KeyError on an error body OpenRouter sent with a 200 may
+    well succeed on the next attempt.
+    """
+    if isinstance(error, PermanentJobError):
+        return PERMANENT
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        status = error.response.status_code
+        return TRANSIENT if status in (408, 429) or status >= 500 else PERMANENT
+    return TRANSIENT
+
+
+def is_permanent(error: BaseException) -> bool:
+    return classify_error(error) == PERMANENT
+
+
+def error_reason(error: BaseException) -> str:
+    """Short machine readable reason recorded with a quarantined job."""
+    if isinstance(error, PermanentJobError):
+        return error.reason
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return f"http_{error.response.status_code}"
+    if isinstance(error, json.JSONDecodeError):
+        return "invalid_json"
+    return type(error).__name__
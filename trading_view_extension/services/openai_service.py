@@ -2,19 +2,51 @@ import sys
 import os
 import json
 import time
-from pathlib import Path
-from openai import OpenAI
+import asyncio
+import random
+from openai import OpenAI, AsyncOpenAI
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
-from config import MODEL, API_KEY
 import re
-import os
 from dotenv import load_dotenv
 load_dotenv()
 MODEL = os.getenv("MODEL")
 API_KEY = os.getenv("API_KEY")
 
+TERMINAL_RUN_STATUSES = ("completed", "failed", "cancelled", "expired", "incomplete")
+RUN_WAIT_TIMEOUT = 600  # Runs expire after 10 minutes on the API side
+
+
+def poll_delays(initial: float = 0.25, factor: float = 1.5, maximum: float = 5.0):
+    """Delays between status checks of a run: short while most runs finish, then backing off, with jitter."""
+    delay = initial
+    while True:
+        yield delay * random.uniform(0.8, 1.2)
+        delay = min(maximum, delay * factor)
+
+
+def parse_assistant_message(message) -> dict:
+    """Parse an assistant message's text into JSON (the assistants answer with a JSON object)."""
+    response_text = ''.join(
+        block.text.value for block in message.content if block.type == "text"
+    ).strip()
+
+    if not response_text:
+        return {"error": "AI returned an empty response."}
+
+    # Remove markdown formatting if present
+    cleaned_text = re.sub(r'```json|```', '', response_text).strip()
+
+    # Fix invalid single quotes and parse JSON
+    cleaned_text = cleaned_text.replace("'", '"')  # Convert single quotes to double quotes
+
+    try:
+        return json.loads(cleaned_text)
+    except json.JSONDecodeError:
+        return {"error": "Invalid JSON format returned by AI.", "raw_response": cleaned_text}
+
+
 class OpenAIService:
-    
+
     def __init__(self, client=None, model=MODEL):
         self.model = model
         self.client = OpenAI(api_key=API_KEY) if client is None else client
@@ -22,7 +54,7 @@ class OpenAIService:
     def wait_for_run(self, run_id: str, thread_id: str) -> dict:
         """Wait for a run to complete and return the assistant's response in JSON format."""
         try:
-            while True:
+            for delay in poll_delays():
                 run_status = self.client.beta.threads.runs.retrieve(
                     thread_id=thread_id,
                     run_id=run_id
@@ -30,44 +62,26 @@ class OpenAIService:
 
                 if run_status.status == 'completed':
                     # Retrieve and parse the latest assistant message as JSON
-                    return self.get_latest_assistant_message(thread_id)
+                    return self.get_latest_assistant_message(thread_id, run_id)
 
-                elif run_status.status in ['failed', 'cancelled', 'expired']:
+                elif run_status.status in TERMINAL_RUN_STATUSES:
                     return {"error": f"Run failed with status '{run_status.status}'."}
 
-                time.sleep(0.25)
+                time.sleep(delay)
         except Exception as e:
             return {"error": f"Error while waiting for run: {str(e)}"}
 
-    def get_latest_assistant_message(self, thread_id: str) -> dict:
-        """Retrieve the latest assistant message and parse it into JSON format."""
-        messages = self.client.beta.threads.messages.list(thread_id=thread_id)
-
-        if messages.data:
-            assistant_messages = [
-                message for message in messages.data if message.role == "assistant"
-            ]
-
-            if assistant_messages:
-                latest_message = max(assistant_messages, key=lambda msg: msg.created_at)
-                response_content = latest_message.content
-                response_text = ''.join(
-                    block.text.value for block in response_content if block.type == "text"
-                ).strip()
-
-                if not response_text:
-                    return {"error": "AI returned an empty response."}
-
-                # Remove markdown formatting if present
-                cleaned_text = re.sub(r'```json|```', '', response_text).strip()
+    def get_latest_assistant_message(self, thread_id: str, run_id: str = None) -> dict:
+        """Retrieve the latest assistant message (of run_id, if given) and parse it into JSON format."""
+        # Newest first and only as many as needed, instead of listing the whole thread.
+        if run_id:
+            messages = self.client.beta.threads.messages.list(thread_id=thread_id, run_id=run_id, order="desc", limit=1)
+        else:
+            messages = self.client.beta.threads.messages.list(thread_id=thread_id, order="desc", limit=10)
 
-                # Fix invalid single quotes and parse JSON
-                cleaned_text = cleaned_text.replace("'", '"')  # Convert single quotes to double quotes
-
-                try:
-                    return json.loads(cleaned_text)
-                except json.JSONDecodeError:
-                    return {"error": "Invalid JSON format returned by AI.", "raw_response": cleaned_text}
+        for message in messages.data:
+            if message.role == "assistant":
+                return parse_assistant_message(message)
 
         return {"error": "No assistant response received."}
 
@@ -106,3 +120,93 @@ class OpenAIService:
             return run_status.status
         except Exception as e:
             return f"Error checking run status: {e}"
+
+
+class AsyncOpenAIService:
+    """
+    OpenAIService for the event loop: any number of runs are waited on concurrently by
+    one loop, without a thread per run.
+
+    run_text() starts a run with streaming, so completion arrives as a server event and the
+    answer comes with it (one API call per run). wait_for_run() is for runs that were
+    started elsewhere: it polls with backoff (poll_delays), so a run that takes t seconds
+    costs about log(t) status checks instead of four per second.
+    """
+
+    def __init__(self, client=None, model=MODEL, poll_initial: float = 0.25, poll_factor: float = 1.5,
+                 poll_max: float = 5.0, timeout: float = RUN_WAIT_TIMEOUT):
+        self.model = model
+        self.client = AsyncOpenAI(api_key=API_KEY) if client is None else client
+        self.poll_initial = poll_initial
+        self.poll_factor = poll_factor
+        self.poll_max = poll_max
+        self.timeout = timeout
+
+    async def send_user_message(self, thread_id: str, content, role: str = "user"):
+        if isinstance(content, dict):
+            content = json.dumps(content)
+        await self.client.beta.threads.messages.create(thread_id=thread_id, role=role, content=content)
+
+    async def create_text_run(self, thread_id: str, assistant_id: str, max_tokens: int) -> str:
+        run = await self.client.beta.threads.runs.create(
+            thread_id=thread_id,
+            assistant_id=assistant_id,
+            model=self.model,
+            max_completion_tokens=max_tokens
+        )
+        return run.id
+
+    async def run_text(self, thread_id: str, assistant_id: str, max_tokens: int) -> dict:
+        """Run the assistant on the thread and return its answer in JSON format."""
+        stream = None
+        try:
+            async with self.client.beta.threads.runs.stream(
+                thread_id=thread_id,
+                assistant_id=assistant_id,
+                model=self.model,
+                max_completion_tokens=max_tokens
+            ) as stream:
+                await asyncio.wait_for(stream.until_done(), self.timeout)
+                run = await stream.get_final_run()
+                if run.status != "completed":
+                    return {"error": f"Run failed with status '{run.status}'."}
+                for message in reversed(await stream.get_final_messages()):
+                    if message.role == "assistant":
+                        return parse_assistant_message(message)
+                return await self.get_latest_assistant_message(thread_id, run.id)
+        except Exception as e:
+            run = getattr(stream, "current_run", None) if stream is not None else None
+            if run is None:
+                return {"error": f"Error while running: {str(e)}"}
+            # The stream broke after the run started; the run itself carries on.
+            return await self.wait_for_run(run.id, thread_id)
+
+    async def wait_for_run(self, run_id: str, thread_id: str) -> dict:
+        """Wait for a run to complete and return the assistant's response in JSON format."""
+        deadline = time.monotonic() + self.timeout
+        try:
+            for delay in poll_delays(self.poll_initial, self.poll_factor, self.poll_max):
+                run = await self.client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run_id)
+                if run.status == "completed":
+                    return await self.get_latest_assistant_message(thread_id, run_id)
+                if run.status in TERMINAL_RUN_STATUSES:
+                    return {"error": f"Run failed with status '{run.status}'."}
+                if time.monotonic() + delay > deadline:
+                    return {"error": f"Run still '{run.status}' after {self.timeout:.0f}s."}
+                await asyncio.sleep(delay)
+        except Exception as e:
+            return {"error": f"Error while waiting for run: {str(e)}"}
+
+    async def wait_for_runs(self, runs) -> list:
+        """Wait for many (run_id, thread_id) pairs at once; results are in the same order."""
+        return list(await asyncio.gather(*(self.wait_for_run(run_id, thread_id) for run_id, thread_id in runs)))
+
+    async def get_latest_assistant_message(self, thread_id: str, run_id: str = None) -> dict:
+        if run_id:
+            page = await self.client.beta.threads.messages.list(thread_id=thread_id, run_id=run_id, order="desc", limit=1)
+        else:
+            page = await self.client.beta.threads.messages.list(thread_id=thread_id, order="desc", limit=10)
+        for message in page.data:
+            if message.role == "assistant":
+                return parse_assistant_message(message)
+        return {"error": "No assistant response received."}
@@ -0,0 +1,190 @@
+"""
+Record and replay of OpenRouter traffic.
+
+In "record" mode every successful chat completion is appended to a cassette file; in
+"replay" mode the responses are served from it without touching the network, so the
+analysis pipeline can be re-run offline and deterministically.
+
+A cassette is a JSON lines file. The first line is a header, every other line one
+interaction:
+
+    {"fp": "<sha256 of the request>", "model": "...", "ttfb_ms": 812.4, "total_ms": 1290.0,
+     "response": {...OpenRouter response body, including usage...}}
+
+Requests themselves (prompts, chart URLs) are not stored, only their fingerprint. On
+load the file is scanned once into an index of byte offsets per fingerprint and per
+model; response bodies are read from disk when served.
+
+Matching:
+    exact   the request (model, messages, max_tokens) must have been recorded
+    model   fall back to the recordings of the same model, in round robin; useful for
+            load tests with generated jobs or edited prompts
+
+Repeated identical requests are served their recordings in order, wrapping around.
+replay_speed 0 answers immediately, 1 reproduces the recorded time to first byte and
+total time, 2 replays twice as fast, and so on.
+"""
+import hashlib
+import json
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+import requests
+
+CASSETTE_VERSION = 1
+RECORD = "record"
+REPLAY = "replay"
+OFF = "off"
+
+
+class CassetteMiss(Exception):
+    """Replay found no recording for a request."""
+
+
+def fingerprint(payload: dict) -> str:
+    canonical = json.dumps(
+        {key: payload.get(key) for key in ("model", "messages", "max_tokens")},
+        sort_keys=True, separators=(",", ":"), ensure_ascii=False,
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class Cassette:
+    def __init__(self, path, mode: str, replay_speed: float = 0.0, match: str = "exact"):
+        if mode not in (RECORD, REPLAY):
+            raise ValueError(f"Invalid cassette mode: {mode}")
+        if match not in ("exact", "model"):
+            raise ValueError(f"Invalid cassette match: {match}")
+        self.path = Path(path)
+        self.mode = mode
+        self.replay_speed = replay_speed
+        self.match = match
+        self._lock = threading.Lock()
+        self._by_fingerprint = {}  # fingerprint -> [offsets]
+        self._by_model = {}        # model -> [offsets]
+        self._cursors = {}         # index key -> next position
+        if mode == REPLAY:
+            self._load_index()
+        elif not self.path.exists() or self.path.stat().st_size == 0:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._append({"cassette": CASSETTE_VERSION, "created": datetime.now(timezone.utc).isoformat()})
+
+    def __len__(self):
+        return sum(len(offsets) for offsets in self._by_fingerprint.values())
+
+    def _append(self, entry: dict) -> None:
+        line = json.dumps(entry, separators=(",", ":"), ensure_ascii=False) + "\n"
+        with self._lock, open(self.path, "a", encoding="utf-8") as cassette_file:
+            cassette_file.write(line)
+
+    def _load_index(self) -> None:
+        with open(self.path, "rb") as cassette_file:
+            header = json.loads(cassette_file.readline() or b"{}")
+            if header.get("cassette") != CASSETTE_VERSION:
+                raise ValueError(f"{self.path} is not a version {CASSETTE_VERSION} cassette")
+            while True:
+                offset = cassette_file.tell()
+                line = cassette_file.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                self._by_fingerprint.setdefault(entry["fp"], []).append(offset)
+                self._by_model.setdefault(entry["model"], []).append(offset)
+
+    def _read(self, offset: int) -> dict:
+        with open(self.path, "rb") as cassette_file:
+            cassette_file.seek(offset)
+            return json.loads(cassette_file.readline())
+
+    def record(self, payload: dict, response_body: dict, ttfb: float, total: float) -> None:
+        self._append({
+            "fp": fingerprint(payload),
+            "model": payload.get("model"),
+            "ttfb_ms": round(ttfb * 1000, 1),
+            "total_ms": round(total * 1000, 1),
+            "response": response_body,
+        })
+
+    def lookup(self, payload: dict) -> dict:
+        key = fingerprint(payload)
+        offsets = self._by_fingerprint.get(key)
+        if offsets is None and self.match == "model":
+            key = ("model", payload.get("model"))
+            offsets = self._by_model.get(payload.get("model"))
+        if not offsets:
+            raise CassetteMiss(f"No recording for {payload.get('model')} request {fingerprint(payload)[:12]}")
+        with self._lock:
+            position = self._cursors.get(key, 0)
+            self._cursors[key] = position + 1
+        return self._read(offsets[position % len(offsets)])
+
+
+class _ReplayedResponse(requests.Response):
+    """Response whose body takes the rest of the recorded time to arrive."""
+
+    def __init__(self, entry: dict, body_delay: float):
+        super().__init__()
+        self.status_code = 200
+        self.reason = "OK"
+        self.headers["Content-Type"] = "application/json"
+        self._content = json.dumps(entry["response"]).encode("utf-8")
+        self._body_delay = body_delay
+
+    def json(self, **kwargs):
+        if self._body_delay > 0:
+            time.sleep(self._body_delay)
+            self._body_delay = 0
+        return super().json(**kwargs)
+
+
+class CassetteSession:
+    """
+    Wraps the OpenRouter requests.Session: post() records through to the real session or
+    replays from the cassette. Everything else is delegated to the session.
+    """
+
+    def __init__(self, session: requests.Session, cassette: Cassette):
+        self.session = session
+        self.cassette = cassette
+
+    def __getattr__(self, name):
+        return getattr(self.session, name)
+
+    def post(self, url, json=None, **kwargs):
+        if self.cassette.mode == REPLAY:
+            return self._replay(json)
+
+        started = time.perf_counter()
+        response = self.session.post(url, json=json, **kwargs)
+        ttfb = time.perf_counter() - started
+        if response.ok:
+            # Reading the body here keeps the recorded total time; response.json() is then served from memory.
+            body = response.json()
+            self.cassette.record(json, body, ttfb, time.perf_counter() - started)
+        return response
+
+    def _replay(self, payload: dict):
+        entry = self.cassette.lookup(payload)
+        speed = self.cassette.replay_speed
+        ttfb = entry["ttfb_ms"] / 1000 / speed if speed > 0 else 0.0
+        body_delay = max(0.0, entry["total_ms"] / 1000 / speed - ttfb) if speed > 0 else 0.0
+        if ttfb:
+            time.sleep(ttfb)
+        return _ReplayedResponse(entry, body_delay)
+
+
+@contextmanager
+def use_cassette(path, mode: str, replay_speed: float = 0.0, match: str = "exact"):
+    """Temporarily route query_openrouter through a cassette."""
+    from trading_view_extension.services import openrouter_client
+
+    original = openrouter_client.http_session
+    openrouter_client.http_session = CassetteSession(original, Cassette(path, mode, replay_speed, match))
+    try:
+        yield openrouter_client.http_session.cassette
+    finally:
+        openrouter_client.http_session = original
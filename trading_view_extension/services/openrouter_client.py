@@ -1,9 +1,25 @@
 from pathlib import Path
 import json
+import time
 import requests
+from requests.adapters import HTTPAdapter
 import logging
-from tenacity import retry, wait_exponential, stop_after_attempt
+from tenacity import retry, wait_exponential, stop_after_attempt, retry_if_exception
 from pydantic import BaseModel, Field, ValidationError
+from trading_view_extension.monitoring.metrics import (
+    OPENROUTER_TTFB_SECONDS,
+    OPENROUTER_REQUEST_SECONDS,
+    OPENROUTER_REQUESTS,
+    TRADE_SIGNAL_EXTRACTION_SECONDS,
+)
+from trading_view_extension.monitoring.tracing import span, current_span
+from trading_view_extension.monitoring.job_telemetry import add_usage, stage
+from trading_view_extension.monitoring.log_pipeline import truncate
+from trading_view_extension.services.openrouter_cassette import Cassette, CassetteSession, CassetteMiss, OFF
+from trading_view_extension.services.circuit_breaker import get_breaker, CircuitOpen
+from trading_view_extension.services.job_errors import is_permanent
+from trading_view_extension.services.client_registry import registry
+from trading_view_extension.services.runtime_config import current as current_tuning
 logger = logging.getLogger("openrouter_client")
 import os
 from dotenv import load_dotenv
@@ -12,25 +28,76 @@ MODEL_NAME = os.getenv("MODEL_NAME")
 CONSENSUS_MODEL = os.getenv("CONSENSUS_MODEL")
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
 OPENROUTER_ENDPOINT = os.getenv("OPENROUTER_ENDPOINT")
-MAX_TOKENS = int(os.getenv("MAX_TOKENS", 1000))
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", 32))
+# Record/replay of OpenRouter traffic, see openrouter_cassette.py: off | record | replay
+OPENROUTER_CASSETTE_MODE = os.getenv("OPENROUTER_CASSETTE_MODE", OFF).lower()
+OPENROUTER_CASSETTE_PATH = os.getenv("OPENROUTER_CASSETTE_PATH", "openrouter_cassette.jsonl")
+OPENROUTER_CASSETTE_REPLAY_SPEED = float(os.getenv("OPENROUTER_CASSETTE_REPLAY_SPEED", 0))
+OPENROUTER_CASSETTE_MATCH = os.getenv("OPENROUTER_CASSETTE_MATCH", "exact")
+
+# One pooled session for every OpenRouter call so concurrent jobs reuse TCP/TLS connections.
+http_session = requests.Session()
+http_session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE))
+http_session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE))
+if OPENROUTER_CASSETTE_MODE != OFF:
+    http_session = CassetteSession(http_session, Cassette(
+        OPENROUTER_CASSETTE_PATH, OPENROUTER_CASSETTE_MODE, OPENROUTER_CASSETTE_REPLAY_SPEED, OPENROUTER_CASSETTE_MATCH
+    ))
+    logger.warning("OpenRouter cassette %s mode: %s", OPENROUTER_CASSETTE_MODE, OPENROUTER_CASSETTE_PATH)
+
+
+def _warm_openrouter(session):
+    # Any answer will do (the endpoint only takes POST): it leaves a TLS connection in the pool.
+    if OPENROUTER_ENDPOINT and OPENROUTER_CASSETTE_MODE == OFF:
+        session.head(OPENROUTER_ENDPOINT, timeout=5).close()
+
+
+registry.register("openrouter", lambda: http_session, warm=_warm_openrouter)
+
+def is_openrouter_failure(error: Exception) -> bool:
+    """Whether an error says OpenRouter (or the model behind it) is unhealthy, rather than our request being bad."""
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return error.response.status_code == 429 or error.response.status_code >= 500
+    return not isinstance(error, CassetteMiss)
+
+
+def should_retry(error: BaseException) -> bool:
+    # A missing recording will not appear on a retry, an open circuit fails fast by design and a
+    # request OpenRouter refused (4xx other than 408/429) is refused again.
+    return not isinstance(error, (CassetteMiss, CircuitOpen)) and not is_permanent(error)
+
 
 def log_retry(retry_state):
     logger.warning(f"Retrying OpenRouter API call (attempt {retry_state.attempt_number})...")
+    # Runs in the caller's context, so the retry count lands on the span that called us.
+    current_span().increment("openrouter_retries")
+
+
+# The retry schedule is read from the runtime config on every attempt, so a change applies to calls in progress.
+def retry_stop(retry_state) -> bool:
+    return stop_after_attempt(current_tuning().retry_attempts)(retry_state)
+
+
+def retry_wait(retry_state) -> float:
+    tuning = current_tuning()
+    return wait_exponential(multiplier=1, min=tuning.retry_wait_min, max=tuning.retry_wait_max)(retry_state)
 
 
 @retry(
-    wait=wait_exponential(multiplier=1, min=2, max=10),
-    stop=stop_after_attempt(5),
+    wait=retry_wait,
+    stop=retry_stop,
+    retry=retry_if_exception(should_retry),
     before_sleep=log_retry
 )
 def query_openrouter(messages, specified_model=None):
     
     model = specified_model or MODEL_NAME
+    tuning = current_tuning()
 
     payload = {
         "model": model,
         "messages": messages,
-        "max_tokens": MAX_TOKENS
+        "max_tokens": tuning.max_tokens
     }
 
     headers = {
@@ -38,21 +105,44 @@ def query_openrouter(messages, specified_model=None):
         "Authorization": f"Bearer {OPENROUTER_API_KEY}"
     }
 
-    response = requests.post(OPENROUTER_ENDPOINT, headers=headers, json=payload, timeout=15)
-    response.raise_for_status()
-
-    result = response.json()
+    # stream=True returns once the response headers arrive, which gives time to first byte;
+    # the body is read by response.json() below.
+    started = time.perf_counter()
+    with span("openrouter.request", model=model, messages=len(messages)) as request_span, \
+            get_breaker(f"openrouter:{model}").guard(is_openrouter_failure):
+        try:
+            response = http_session.post(OPENROUTER_ENDPOINT, headers=headers, json=payload, timeout=tuning.http_timeout_seconds,
+                                         stream=True)
+            ttfb = time.perf_counter() - started
+            OPENROUTER_TTFB_SECONDS.labels(model=model).observe(ttfb)
+            request_span.set_attribute("ttfb_ms", round(ttfb * 1000, 1))
+            try:
+                response.raise_for_status()
+                result = response.json()
+            finally:
+                response.close()
+        except Exception:
+            OPENROUTER_REQUESTS.labels(model=model, outcome="error").inc()
+            raise
+        finally:
+            OPENROUTER_REQUEST_SECONDS.labels(model=model).observe(time.perf_counter() - started)
+        OPENROUTER_REQUESTS.labels(model=model, outcome="ok").inc()
+        add_usage(model, result.get("usage"), time.perf_counter() - started)
+        if request_span.recording:
+            request_span.set_attribute("prompt_tokens", result.get("usage", {}).get("prompt_tokens"))
+            request_span.set_attribute("completion_tokens", result.get("usage", {}).get("completion_tokens"))
+            request_span.set_attribute("request_bytes", len(json.dumps(payload)))
     if model == MODEL_NAME:
         cost_usd = (result["usage"]["prompt_tokens"] * 0.000003 + result["usage"]["completion_tokens"] * 0.000015)
         credits = round(cost_usd*1000)
     else:
         cost_usd = (result["usage"]["prompt_tokens"]  * 0.0005 + result["usage"]["completion_tokens"] * 0.0015) / 1000
         credits = round(cost_usd * 1000)
-    logger.info(f"{model} Price: {cost_usd}  Credits: {round(cost_usd*1000)} Usage: {result['usage']}")
+    logger.info("%s Price: %s  Credits: %s Usage: %s", model, cost_usd, credits, result["usage"])
     content = result.get("choices", [{}])[0].get("message", {}).get("content")
 
     if not content:
-        logger.error(f"Received empty response from OpenRouter: {result}")
+        logger.error("Received empty response from OpenRouter: %s", truncate(result))
         return "AI Error: Empty Response", 0
 
     if isinstance(content, list):
@@ -129,7 +219,8 @@ def get_structured_trade_signal(user_text: str, asset: str, specified_model=None
         {"role": "user", "content": [{"type": "text", "text": user_text}]}
     ]
 
-    content, credits = query_openrouter(messages, specified_model="openai/o3-mini")
+    with TRADE_SIGNAL_EXTRACTION_SECONDS.time(), span("trade_signal.extract", asset=asset), stage("extract"):
+        content, credits = query_openrouter(messages, specified_model="openai/o3-mini")
 
     try:
         # Parse raw JSON string first
@@ -141,9 +232,9 @@ def get_structured_trade_signal(user_text: str, asset: str, specified_model=None
         return signal.model_dump(), credits
 
     except json.JSONDecodeError as e:
-        logger.error(f"Failed to parse content as JSON: {e}\nContent: {content}")
+        logger.error("Failed to parse content as JSON: %s\nContent: %s", e, truncate(content))
     except ValidationError as ve:
-        logger.error(f"Validation error: {ve}\nContent: {content}")
+        logger.error("Validation error: %s\nContent: %s", ve, truncate(content))
     except Exception as ex:
         logger.error(f"Unexpected error: {ex}")
 
@@ -0,0 +1,240 @@
+"""
+Tuning settings that can change while the worker runs, without a restart.
+
+TuningConfig holds the performance knobs that used to be fixed at import time. It starts
+from the environment (config.py, MAX_TOKENS) and is only ever replaced as a whole, so a
+reader sees one consistent version: take `tuning = current()` once and read it.
+
+Changes come from:
+    RUNTIME_CONFIG_FILE   a JSON object of overrides, re-read when it changes; fields not
+                          in the file are back to their startup value
+    POST /admin/config    a JSON object of the fields to change:
+                          curl -X POST localhost:8090/admin/config -d '{"max_tokens": 1500}'
+    GET /admin/config     the current values, the overrides and the recent changes
+
+The /admin routes are served by the admin listener (ADMIN_PORT, localhost unless
+ADMIN_TOKEN is set, see metrics_server.py).
+
+An update is validated as a whole (unknown fields, types, ranges, min > max) and applied
+completely or not at all; an invalid file leaves the config as it was. Every change is
+logged with its source and the old and new values.
+
+Where the settings take effect:
+    SqsQueueConsumer    receive_max_messages, visibility_timeout, receive_wait_seconds and
+                        prefetch from the next receive; min/max_concurrency bound the
+                        limiter and size the pool (running jobs finish in the old one)
+    openrouter_client   max_tokens and http_timeout_seconds per request, retry_* per attempt
+    signal_gate         confidence_threshold, r2r_threshold and signal_gate_mode per check
+
+In prefork mode only the supervisor serves the admin listener and watches the file; it
+passes the overrides on to its worker processes, which take no changes of their own.
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Literal
+from weakref import WeakMethod
+from pydantic import BaseModel, ConfigDict, Field, ValidationError, model_validator
+from config import (
+    logger,
+    WORKER_MIN_CONCURRENCY,
+    WORKER_MAX_CONCURRENCY,
+    SCHEDULER_PREFETCH,
+    CONFIDENCE_THRESHOLD,
+    R2R_THRESHOLD,
+    SIGNAL_GATE_MODE,
+    RUNTIME_CONFIG_POLL_SECONDS,
+)
+from trading_view_extension.monitoring.metrics import RUNTIME_CONFIG_UPDATES
+
+HISTORY_SIZE = 50  # Changes kept for GET /admin/config
+
+
+class InvalidConfig(ValueError):
+    pass
+
+
+class TuningConfig(BaseModel):
+    model_config = ConfigDict(frozen=True, extra="forbid", strict=True)
+
+    receive_max_messages: int = Field(10, ge=1, le=10)  # Per SQS receive call
+    visibility_timeout: int = Field(300, ge=0, le=43200)  # Seconds; keep above the longest job
+    receive_wait_seconds: int = Field(1, ge=0, le=20)  # Long poll when nothing is buffered
+    prefetch: int = Field(SCHEDULER_PREFETCH, ge=1)  # Messages held locally
+    min_concurrency: int = Field(WORKER_MIN_CONCURRENCY, ge=1)
+    max_concurrency: int = Field(WORKER_MAX_CONCURRENCY, ge=1, le=512)  # Also the pool size
+    max_tokens: int = Field(int(os.getenv("MAX_TOKENS", 1000)), ge=1)
+    http_timeout_seconds: float = Field(15, gt=0)  # OpenRouter request timeout
+    retry_attempts: int = Field(5, ge=1)  # OpenRouter attempts, including the first
+    retry_wait_min: float = Field(2, ge=0)  # Exponential backoff between attempts, in seconds
+    retry_wait_max: float = Field(10, ge=0)
+    confidence_threshold: float = Field(CONFIDENCE_THRESHOLD, ge=0)
+    r2r_threshold: float = Field(R2R_THRESHOLD, ge=0)
+    signal_gate_mode: Literal["flag", "downgrade"] = SIGNAL_GATE_MODE
+
+    @model_validator(mode="after")
+    def _check_ranges(self):
+        if self.min_concurrency > self.max_concurrency:
+            raise ValueError("min_concurrency must not exceed max_concurrency")
+        if self.retry_wait_min > self.retry_wait_max:
+            raise ValueError("retry_wait_min must not exceed retry_wait_max")
+        return self
+
+
+def _describe(error: ValidationError) -> str:
+    """e.g. "max_tokens: Input should be greater than or equal to 1; min_concurrency must not exceed ..." """
+    problems = []
+    for detail in error.errors():
+        location = ".".join(str(part) for part in detail["loc"])
+        message = detail["msg"].removeprefix("Value error, ")
+        problems.append(f"{location}: {message}" if location else message)
+    return "; ".join(problems)
+
+
+class RuntimeConfig:
+    """The current TuningConfig, its audit trail and the callbacks that apply it."""
+
+    def __init__(self, initial: TuningConfig = None, history_size: int = HISTORY_SIZE):
+        self.defaults = initial or TuningConfig()
+        self._current = self.defaults
+        # Held while subscribers run, so they see the changes in the order they were made.
+        self._lock = threading.RLock()
+        self._subscribers = []
+        self._history = deque(maxlen=history_size)
+
+    def current(self) -> TuningConfig:
+        return self._current
+
+    def overrides(self) -> dict:
+        """The fields that differ from their startup value."""
+        current = self._current
+        return {name: getattr(current, name) for name in TuningConfig.model_fields
+                if getattr(current, name) != getattr(self.defaults, name)}
+
+    def update(self, changes: dict, source: str) -> TuningConfig:
+        """Change the given fields; raises InvalidConfig, changing nothing, if the result is invalid."""
+        return self._apply(changes, source, base=None)
+
+    def replace(self, overrides: dict, source: str) -> TuningConfig:
+        """Set the given fields and every other one back to its startup value."""
+        return self._apply(overrides, source, base=self.defaults)
+
+    def _apply(self, changes: dict, source: str, base) -> TuningConfig:
+        if not isinstance(changes, dict):
+            RUNTIME_CONFIG_UPDATES.labels(outcome="rejected").inc()
+            raise InvalidConfig(f"expected a JSON object of settings, got {type(changes).__name__}")
+        with self._lock:
+            previous = self._current
+            try:
+                tuning = TuningConfig.model_validate({**(base or previous).model_dump(), **changes})
+            except ValidationError as e:
+                RUNTIME_CONFIG_UPDATES.labels(outcome="rejected").inc()
+                logger.warning("Rejected runtime config change from %s: %s", source, _describe(e))
+                raise InvalidConfig(_describe(e)) from None
+            changed = {name: [getattr(previous, name), getattr(tuning, name)] for name in TuningConfig.model_fields
+                       if getattr(previous, name) != getattr(tuning, name)}
+            if not changed:
+                return previous
+            self._current = tuning
+            self._history.append({"at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                                  "source": source, "changes": changed})
+            RUNTIME_CONFIG_UPDATES.labels(outcome="applied").inc()
+            logger.info("Runtime config changed by %s: %s", source,
+                        ", ".join(f"{name} {old} -> {new}" for name, (old, new) in changed.items()))
+            self._notify(tuning, previous)
+        return tuning
+
+    def subscribe(self, callback) -> None:
+        """
+        Call callback(tuning, previous) after every change. A bound method is held weakly,
+        so subscribing does not keep a consumer alive.
+        """
+        with self._lock:
+            self._subscribers.append(WeakMethod(callback) if hasattr(callback, "__self__") else lambda: callback)
+
+    def _notify(self, tuning: TuningConfig, previous: TuningConfig) -> None:
+        alive = []
+        for reference in self._subscribers:
+            callback = reference()
+            if callback is None:
+                continue
+            alive.append(reference)
+            try:
+                callback(tuning, previous)
+            except Exception as e:
+                logger.error("Could not apply the runtime config to %s: %s", getattr(callback, "__qualname__", callback), e)
+        self._subscribers = alive
+
+    def history(self) -> list:
+        return list(self._history)
+
+    def load_file(self, path: str) -> bool:
+        """Apply the overrides in a JSON file; an unreadable or invalid file is logged and ignored."""
+        try:
+            with open(path, encoding="utf-8") as config_file:
+                overrides = json.load(config_file)
+            self.replace(overrides, source=f"file {path}")
+            return True
+        except (OSError, ValueError) as e:  # InvalidConfig and JSONDecodeError are ValueErrors
+            logger.error("Keeping the runtime config, could not apply %s: %s", path, e)
+            return False
+
+    def watch_file(self, path: str, interval: float = RUNTIME_CONFIG_POLL_SECONDS) -> threading.Thread:
+        """Apply the file now and whenever its modification time changes, from a daemon thread."""
+        def modified():
+            try:
+                stat = os.stat(path)
+                return stat.st_mtime_ns, stat.st_size
+            except OSError:
+                return None
+
+        seen = modified()
+        if seen is not None:
+            self.load_file(path)
+        else:
+            logger.warning("Runtime config file %s does not exist yet, watching for it", path)
+
+        def run():
+            nonlocal seen
+            while True:
+                time.sleep(interval)
+                stamp = modified()
+                if stamp != seen:
+                    seen = stamp
+                    if stamp is not None:
+                        self.load_file(path)
+
+        thread = threading.Thread(target=run, name="runtime-config-watcher", daemon=True)
+        thread.start()
+        logger.info("Watching %s for runtime config changes every %.0fs", path, interval)
+        return thread
+
+
+runtime_config = RuntimeConfig()
+
+
+def current() -> TuningConfig:
+    """The tuning settings in effect now."""
+    return runtime_config.current()
+
+
+def _state() -> str:
+    return json.dumps({"config": current().model_dump(), "overrides": runtime_config.overrides(),
+                       "history": runtime_config.history()}) + "\n"
+
+
+def config_route(query, body):
+    """POST /admin/config with a JSON object of settings changes them; 400 with the reason if invalid."""
+    try:
+        runtime_config.update(json.loads(body or b"{}"), source="POST /admin/config")
+    except ValueError as e:
+        return 400, "application/json", json.dumps({"error": str(e)}) + "\n"
+    return 200, "application/json", _state()
+
+
+def config_state_route(query, body):
+    """GET /admin/config returns the settings in effect and the recent changes."""
+    return 200, "application/json", _state()
@@ -0,0 +1,153 @@
+"""
+Deterministic quality gate for extracted trade signals.
+
+The R2R and confidence of a TradeSignal are whatever the model wrote. The gate recomputes
+the reward-to-risk ratio from entry, stop and target, checks that the stop and target
+are on the right side of the entry for the action, and applies CONFIDENCE_THRESHOLD and
+R2R_THRESHOLD. Every checked signal gets a "quality" entry:
+
+    {"passed": False, "issues": ["low_r2r"], "reported_R2R": 3.0}
+
+and its R2R is replaced by the computed value. With SIGNAL_GATE_MODE=downgrade a BUY or
+SELL that fails is also turned into a WAIT (the original action is kept in quality).
+WAIT and EXIT signals carry no trade and always pass. Live jobs take the mode and the
+thresholds from the runtime config (confidence_threshold, r2r_threshold, signal_gate_mode).
+
+The checks run on NumPy arrays (evaluate), so a batch of signals is checked at once:
+check_signals() for lists of dicts, evaluate() directly for columns of a DataFrame.
+"""
+import numpy as np
+from config import logger, CONFIDENCE_THRESHOLD, R2R_THRESHOLD
+from trading_view_extension.monitoring.metrics import TRADE_SIGNALS_GATED
+from trading_view_extension.services.runtime_config import current as current_tuning
+
+FLAG = "flag"
+DOWNGRADE = "downgrade"
+
+# Issues, as bits of the mask returned by evaluate()
+MISSING_PRICES = 1        # BUY / SELL without entry, stop or target
+STOP_WRONG_SIDE = 2       # Stop not below the entry of a BUY (above for a SELL)
+TARGET_WRONG_SIDE = 4     # Target not above the entry of a BUY (below for a SELL)
+LOW_CONFIDENCE = 8        # Confidence missing or below the threshold
+LOW_R2R = 16              # Computed reward-to-risk below the threshold
+R2R_MISMATCH = 32         # Reported R2R more than REPORTED_R2R_TOLERANCE off the computed one
+
+ISSUE_NAMES = {
+    MISSING_PRICES: "missing_prices",
+    STOP_WRONG_SIDE: "stop_wrong_side",
+    TARGET_WRONG_SIDE: "target_wrong_side",
+    LOW_CONFIDENCE: "low_confidence",
+    LOW_R2R: "low_r2r",
+    R2R_MISMATCH: "r2r_mismatch",
+}
+# Issues that fail a signal; a wrong reported R2R is only flagged, the computed one replaces it.
+FAILING_ISSUES = MISSING_PRICES | STOP_WRONG_SIDE | TARGET_WRONG_SIDE | LOW_CONFIDENCE | LOW_R2R
+REPORTED_R2R_TOLERANCE = 0.25  # Relative
+
+
+def direction_of(action) -> np.ndarray:
+    """1 for BUY, -1 for SELL and 0 for anything else (WAIT, EXIT, missing)."""
+    action = np.char.upper(np.asarray(action, dtype=str))
+    return np.where(action == "BUY", 1, np.where(action == "SELL", -1, 0))
+
+
+def price_geometry(direction, entry, stop, target) -> np.ndarray:
+    """Issue mask of the price checks alone (MISSING_PRICES, STOP_WRONG_SIDE, TARGET_WRONG_SIDE)."""
+    direction = np.asarray(direction)
+    entry, stop, target = (np.asarray(values, dtype=float) for values in (entry, stop, target))
+    trade = direction != 0
+    missing = trade & ~(np.isfinite(entry) & np.isfinite(stop) & np.isfinite(target))
+    longs, shorts = direction > 0, direction < 0
+    with np.errstate(invalid="ignore"):
+        stop_wrong = trade & ~missing & ((longs & ~(stop < entry)) | (shorts & ~(stop > entry)))
+        target_wrong = trade & ~missing & ((longs & ~(target > entry)) | (shorts & ~(target < entry)))
+    return missing * MISSING_PRICES | stop_wrong * STOP_WRONG_SIDE | target_wrong * TARGET_WRONG_SIDE
+
+
+def evaluate(action, entry, stop, target, confidence, reported_r2r=None,
+             min_confidence: float = CONFIDENCE_THRESHOLD, min_r2r: float = R2R_THRESHOLD):
+    """
+    Check arrays of signals. Returns (r2r, issues): the computed reward-to-risk ratio
+    (NaN where it cannot be computed) and a mask of issue bits per signal.
+    """
+    direction = direction_of(action)
+    entry, stop, target = (np.asarray(values, dtype=float) for values in (entry, stop, target))
+    confidence = np.asarray(confidence, dtype=float)
+    issues = price_geometry(direction, entry, stop, target)
+    trade = direction != 0
+    geometry_ok = trade & (issues == 0)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        r2r = np.where(geometry_ok, np.abs(target - entry) / np.abs(entry - stop), np.nan)
+    if min_confidence is not None:
+        with np.errstate(invalid="ignore"):
+            issues |= (trade & ~(confidence >= min_confidence)) * LOW_CONFIDENCE
+    if min_r2r is not None:
+        with np.errstate(invalid="ignore"):
+            issues |= (geometry_ok & ~(r2r >= min_r2r)) * LOW_R2R
+    if reported_r2r is not None:
+        reported = np.asarray(reported_r2r, dtype=float)
+        with np.errstate(invalid="ignore"):
+            off = np.abs(reported - r2r) > REPORTED_R2R_TOLERANCE * r2r
+        issues |= (geometry_ok & np.isfinite(reported) & off) * R2R_MISMATCH
+    return r2r, issues
+
+
+def issue_names(mask: int) -> list:
+    return [name for bit, name in ISSUE_NAMES.items() if mask & bit]
+
+
+def _column(signals, key):
+    values = []
+    for signal in signals:
+        value = signal.get(key)
+        values.append(value if isinstance(value, (int, float)) and not isinstance(value, bool) else np.nan)
+    return np.array(values, dtype=float)
+
+
+def check_signals(signals: list, mode: str = None, min_confidence: float = None, min_r2r: float = None) -> list:
+    """
+    Gate a list of TradeSignal dicts at once. Returns new dicts in the same order; entries
+    that are not dicts (failed extractions) are returned as they are. Settings not given
+    are those of the runtime config.
+    """
+    tuning = current_tuning()
+    mode = tuning.signal_gate_mode if mode is None else mode
+    min_confidence = tuning.confidence_threshold if min_confidence is None else min_confidence
+    min_r2r = tuning.r2r_threshold if min_r2r is None else min_r2r
+    positions = [index for index, signal in enumerate(signals) if isinstance(signal, dict)]
+    checked = list(signals)
+    if not positions:
+        return checked
+    batch = [signals[index] for index in positions]
+    actions = [str(signal.get("action") or "") for signal in batch]
+    r2r, issues = evaluate(actions, _column(batch, "entry_price"), _column(batch, "stop_loss"),
+                           _column(batch, "take_profit"), _column(batch, "confidence"), _column(batch, "R2R"),
+                           min_confidence=min_confidence, min_r2r=min_r2r)
+    trade = direction_of(actions) != 0
+
+    for position, signal, value, mask, is_trade in zip(positions, batch, r2r.tolist(), issues.tolist(), trade.tolist()):
+        gated = dict(signal)
+        passed = not mask & FAILING_ISSUES
+        quality = {"passed": passed, "issues": issue_names(mask), "reported_R2R": signal.get("R2R")}
+        if is_trade:
+            gated["R2R"] = None if np.isnan(value) else round(value, 2)
+        if is_trade and not passed and mode == DOWNGRADE:
+            quality["original_action"] = gated["action"]
+            gated["action"] = "WAIT"
+            result = "downgraded"
+        else:
+            result = "passed" if passed else "flagged"
+        gated["quality"] = quality
+        checked[position] = gated
+        TRADE_SIGNALS_GATED.labels(result=result).inc()
+    return checked
+
+
+def check_signal(signal, mode: str = None) -> dict | None:
+    """Gate one TradeSignal dict (see check_signals)."""
+    gated = check_signals([signal], mode=mode)[0]
+    if isinstance(gated, dict) and not gated["quality"]["passed"]:
+        logger.info("Trade signal for %s failed the quality gate: %s", gated.get("asset"),
+                    ", ".join(gated["quality"]["issues"]))
+    return gated